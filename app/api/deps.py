@@ -1,11 +1,12 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.config import get_settings
 from app.db.models.user import User
-from app.db.session import get_db
+from app.db.session import get_async_db, get_db
 from app.schemas.auth import TokenPayload
 
 
@@ -17,6 +18,11 @@ def get_db_session(db: Session = Depends(get_db)) -> Session:
     return db
 
 
+def get_async_db_session(db: AsyncSession = Depends(get_async_db)) -> AsyncSession:
+    """async def のルート用（DB の待ち時間でイベントループを止めない）"""
+    return db
+
+
 def get_current_user(
     db: Session = Depends(get_db_session),
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -1,19 +1,85 @@
+import asyncio
+import json
 import logging
+from contextlib import aclosing
+from typing import Any, AsyncIterator
 
-from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 
 from app.api.deps import get_current_user, get_db_session
+from app.core.config import get_settings
+from app.core.metrics import metrics
 from app.db.models.user import User
+from app.db.session import SessionLocal
 from app.schemas.ai import AIAnalysisRequest, AIAnalysisResponse
-from app.services.extraction_service import get_extraction
+from app.services.analysis_session_service import AnalysisSession, get_session_store
+from app.services.analysis_service import (
+    NO_RESULTS_MESSAGE,
+    build_docs_for_llm,
+    cache_namespace,
+    generate_answer,
+    source_fields,
+)
+from app.services.answer_cache_service import AnswerCacheService
+from app.services.map_reduce_service import NO_RELEVANT_ANSWER, REDUCE_SYSTEM_PROMPT, MapReduceAnalyzer
 from app.services.search_service import SearchService
-from app.services.llm_service import LLMService
+from app.services.llm_providers import Completion
+from app.services.llm_service import LLMBusyError, LLMService, get_llm_service
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
 
+async def _build_docs_for_llm(request: AIAnalysisRequest, db) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """検索とコンテキスト構築（/analyze と /analyze/stream で共通）"""
+    search_service = SearchService()
+    if not search_service.is_enabled():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Azure Search is not configured.",
+        )
+    return await build_docs_for_llm(request, db, search_service)
+
+
+async def _docs_for_request(
+    request: AIAnalysisRequest, db, current_user: User
+) -> tuple[list[dict[str, Any]], dict[str, Any], AnalysisSession | None, str]:
+    """
+    session_id が有効ならセッションの文書を再利用し、それ以外は検索からコンテキストを構築して新しいセッションを作る。
+
+    Returns:
+        (docs_for_llm, context_info, session, session_status)  session_status は "reused" / "new" / "expired"
+    """
+    store = get_session_store()
+    if request.session_id:
+        session = store.get(request.session_id, current_user.id)
+        if session is not None:
+            return session.docs, session.context_info, session, "reused"
+    docs_for_llm, context_info = await _build_docs_for_llm(request, db)
+    session = store.create(current_user.id, docs_for_llm, context_info) if docs_for_llm else None
+    return docs_for_llm, context_info, session, "expired" if request.session_id else "new"
+
+
+def _set_context_headers(response: Response, context_info: dict[str, Any]) -> None:
+    response.headers["X-AI-Context-Mode"] = context_info["mode"]
+    response.headers["X-AI-Context-Summary-Count"] = str(context_info["summary_count"])
+    response.headers["X-AI-Context-Extraction-Count"] = str(context_info["extraction_count"])
+    response.headers["X-AI-Context-Content-Count"] = str(context_info["content_count"])
+
+
+def _get_enabled_llm_service() -> LLMService:
+    llm_service = get_llm_service()
+    if not llm_service.is_enabled():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="LLM service is not configured. Please configure LLM_API_KEY and related settings.",
+        )
+    return llm_service
+
+
 @router.post("/analyze", response_model=AIAnalysisResponse)
 async def analyze_with_ai(
     request: AIAnalysisRequest,
@@ -32,76 +98,25 @@ async def analyze_with_ai(
     - 「これらの資料から最適な配合比率を抽出する」
     """
     try:
-        # 1. 検索サービスで上位N件を取得（contentを含む）
-        search_service = SearchService()
-        if not search_service.is_enabled():
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Azure Search is not configured.",
-            )
+        docs_for_llm, context_info, session, session_status = await _docs_for_request(request, db, current_user)
+        _set_context_headers(response, context_info)
+        response.headers["X-AI-Session"] = session_status
 
-        search_results = search_service.search_for_rag(
-            query=request.q,
-            sort_by=request.sort_by,
-            top=request.top,
-        )
-
-        if not search_results:
-            response.headers["X-AI-Context-Mode"] = "none"
-            response.headers["X-AI-Context-Extraction-Count"] = "0"
-            response.headers["X-AI-Context-Content-Count"] = "0"
-            return AIAnalysisResponse(
-                answer="検索結果が見つかりませんでした。検索条件を変更して再度お試しください。",
-                sources=[],
-                error=None,
-            )
-
-        # 2. 抽出データを優先してLLM用コンテキストを構築（抽出が無い場合は既存contentを短くフォールバック）
-        used_ex = 0
-        used_content = 0
-        docs_for_llm = []
-        for doc in search_results:
-            file_id = doc.get("id") or doc.get("file_id")
-            original_name = doc.get("original_name") or doc.get("file_name") or file_id or "unknown"
-
-            ex = get_extraction(db, file_id) if file_id else None
-            if ex:
-                used_ex += 1
-                content = _extraction_to_text(ex)
-            else:
-                used_content += 1
-                content = (doc.get("content") or "")[:3000]
-
-            docs_for_llm.append(
-                {
-                    "file_id": str(file_id) if file_id else "",
-                    "original_name": original_name,
-                    "content": content,
-                }
-            )
-
-        if used_ex and not used_content:
-            mode = "extraction"
-        elif used_content and not used_ex:
-            mode = "content"
-        elif used_ex or used_content:
-            mode = "mixed"
-        else:
-            mode = "none"
-
-        response.headers["X-AI-Context-Mode"] = mode
-        response.headers["X-AI-Context-Extraction-Count"] = str(used_ex)
-        response.headers["X-AI-Context-Content-Count"] = str(used_content)
-
-        # 3. LLMサービスで分析
-        llm_service = LLMService()
-        if not llm_service.is_enabled():
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="LLM service is not configured. Please configure LLM_API_KEY and related settings.",
-            )
+        if not docs_for_llm:
+            return AIAnalysisResponse(answer=NO_RESULTS_MESSAGE, sources=[], error=None)
 
-        result = await llm_service.generate_response(request.question, docs_for_llm)
+        # 3. LLMサービスで分析（map_reduce は文書ごとの要点抽出 → 統合）
+        llm_service = _get_enabled_llm_service()
+        result, cache_status = await generate_answer(request, db, llm_service, docs_for_llm, session)
+        response.headers["X-AI-Cache"] = cache_status
+        if "map_cache_hits" in result:
+            response.headers["X-AI-Map-Cache-Hits"] = str(result["map_cache_hits"])
+        prompt_tokens = (result.get("usage") or {}).get("prompt_tokens")
+        if prompt_tokens:
+            response.headers["X-AI-Prompt-Tokens"] = str(prompt_tokens)
+            response.headers["X-AI-Cached-Prompt-Tokens"] = str((result.get("usage") or {}).get("cached_tokens", 0))
+        if result.get("provider"):
+            response.headers["X-AI-Provider"] = result["provider"]
 
         if result.get("error"):
             logger.error(f"LLM error: {result['error']}")
@@ -110,19 +125,23 @@ async def analyze_with_ai(
                 detail=f"LLM processing failed: {result['error']}",
             )
 
+        session.add_turn(request.question, result["answer"])
         return AIAnalysisResponse(
             answer=result["answer"],
-            sources=[d.get("original_name", "") for d in docs_for_llm if d.get("original_name")],
-            source_files=[
-                {"file_id": d.get("file_id", ""), "original_name": d.get("original_name", "")}
-                for d in docs_for_llm
-                if d.get("file_id") and d.get("original_name")
-            ],
+            **source_fields(docs_for_llm),
             error=result.get("error"),
+            session_id=session.id,
         )
 
     except HTTPException:
         raise
+    except LLMBusyError as e:
+        logger.warning("LLM busy: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="LLM is busy. Please retry later.",
+            headers={"Retry-After": "10"},
+        )
     except Exception as e:
         logger.exception("Error in AI analysis endpoint")
         raise HTTPException(
@@ -131,51 +150,137 @@ async def analyze_with_ai(
         )
 
 
-def _extraction_to_text(ex: dict) -> str:
-    meta = ex.get("meta", {}) or {}
-    logs = ex.get("log", []) or []
-    form = ex.get("formulation", {}) or {}
-
-    lines: list[str] = []
-    lines.append("【メタ】")
-    for k in [
-        "trial_id",
-        "application",
-        "issue",
-        "ingredient",
-        "customer",
-        "author",
-        "date",
-        "selected_variant",
-        "outcome",
-        "failure_tags",
-        "keywords",
-    ]:
-        if meta.get(k):
-            lines.append(f"- {k}: {meta.get(k)}")
-
-    lines.append("\n【LOG】")
-    for row in logs[:3]:
-        lines.append(
-            f"- {row.get('variant_id')} {row.get('variant_label')}: "
-            f"判定={row.get('judgement')}, "
-            f"結果={row.get('result')}, "
-            f"失敗={row.get('failure_symptoms')}, "
-            f"仮説={row.get('cause_hypothesis')}, "
-            f"次={row.get('next_action')}"
-        )
-        q = row.get("quote")
-        if q:
-            lines.append(f"  引用: {q}")
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _lookup_answer(question: str, docs: list[dict[str, Any]], namespace: str) -> tuple[str, dict[str, Any] | None]:
+    """回答キャッシュのキーとヒットしたエントリ（短いセッションで読む）"""
+    with SessionLocal() as db:
+        cache = AnswerCacheService(db)
+        key = cache.make_key(question, docs, namespace)
+        return key, cache.lookup(key)
+
+
+def _store_answer(key: str, question: str, docs: list[dict[str, Any]], result: dict[str, Any]) -> None:
+    with SessionLocal() as db:
+        AnswerCacheService(db).store(key, question, docs, result)
+
+
+@router.post("/analyze/stream")
+async def analyze_with_ai_stream(
+    request: AIAnalysisRequest,
+    http_request: Request,
+    db=Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    /analyze のストリーミング版（Server-Sent Events）。
+
+    イベント:
+    - `meta`: 参照ファイル・コンテキストモード・session_id（LLM 呼び出し前に即時送信）
+    - `progress`: mode=map_reduce のみ。文書ごとの要点抽出の進捗 `{"done": n, "total": N, "file_id": "...", "cached": bool}`
+    - `token`: 生成テキストの断片 `{"text": "..."}`
+    - `done`: 生成完了 `{"answer_length": N}`
+    - `error`: 生成途中のエラー `{"error": "..."}`
+
+    クライアントが切断した場合は上流（Azure OpenAI / Gemini）のストリームを閉じて生成を打ち切る。
+
+    生成は数十秒続くため、リクエストのセッションはコンテキストの構築後に閉じ、
+    回答キャッシュ・map の結果の読み書きはそのたびに短いセッションを使う（接続プールの接続を占有しない）。
+    """
+    try:
+        docs_for_llm, context_info, session, session_status = await _docs_for_request(request, db, current_user)
+    finally:
+        await asyncio.to_thread(db.close)
+    llm_service = _get_enabled_llm_service() if docs_for_llm else None
 
-    lines.append("\n【配合（抜粋）】")
-    rows = (form.get("rows") or [])[:10]
-    for r in rows:
-        ing = r.get("ingredient")
-        v = r.get("variants", {}) or {}
-        if ing:
-            n1 = v.get("No.1", {}) or {}
-            lines.append(f"- {ing}: {n1.get('pct')}% / {n1.get('g')}g（No.1）")
+    async def event_stream() -> AsyncIterator[str]:
+        meta = {**source_fields(docs_for_llm), "context": context_info}
+        yield _sse("meta", {**meta, "session_id": session.id if session else None})
 
-    return "\n".join(lines)
+        if llm_service is None:
+            yield _sse("token", {"text": NO_RESULTS_MESSAGE})
+            yield _sse("done", {"answer_length": len(NO_RESULTS_MESSAGE)})
+            return
+
+        history = session.prompt_history()
+        use_cache = settings.llm_answer_cache_enabled
+        cache_key = None
+        if use_cache:
+            cache_key, cached = await asyncio.to_thread(
+                _lookup_answer, request.question, docs_for_llm, cache_namespace(request, history)
+            )
+            if cached is not None:
+                session.add_turn(request.question, cached["answer"])
+                yield _sse("token", {"text": cached["answer"]})
+                yield _sse("done", {"answer_length": len(cached["answer"]), "cached": True})
+                return
+            metrics.inc("llm_answer_cache.miss")
+
+        parts: list[str] = []
+        tokens = None
+        usage = Completion(text="")
+        try:
+            if request.mode == "map_reduce":
+                analyzer = MapReduceAnalyzer(None, llm_service, session_factory=SessionLocal)
+                results = []
+                # 切断で途中終了した場合も残りの map を確実に取り消すため aclosing で閉じる
+                async with aclosing(analyzer.map_documents(request.question, docs_for_llm)) as maps:
+                    async for r in maps:
+                        results.append(r)
+                        progress = {"done": len(results), "total": len(docs_for_llm), "file_id": r.doc.get("file_id", "")}
+                        yield _sse("progress", {**progress, "cached": r.cached})
+                        if await http_request.is_disconnected():
+                            logger.info("Client disconnected during map step (%d/%d)", len(results), len(docs_for_llm))
+                            return
+                reduce_docs = analyzer.reduce_docs(sorted(results, key=lambda r: r.index))
+                if not reduce_docs:
+                    # 関係する記載が無い（または全件失敗）: 統合はせずに終える
+                    error = next((r.error for r in results if r.error), None)
+                    if error:
+                        yield _sse("error", {"error": error})
+                    else:
+                        yield _sse("token", {"text": NO_RELEVANT_ANSWER})
+                        yield _sse("done", {"answer_length": len(NO_RELEVANT_ANSWER), "cached": False})
+                    return
+                tokens = llm_service.stream_response(
+                    request.question, reduce_docs, system_prompt=REDUCE_SYSTEM_PROMPT, history=history, usage=usage
+                )
+            else:
+                # トークン数の計算・近似重複の除去を含むため、他のストリームを止めないようスレッドで行う
+                context_text = await asyncio.to_thread(session.ensure_context, llm_service, request.question)
+                tokens = llm_service.stream_response(
+                    request.question, docs_for_llm, context_text=context_text, history=history, usage=usage
+                )
+
+            async for text in tokens:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected; cancelling LLM stream after %d chars", sum(map(len, parts)))
+                    return
+                parts.append(text)
+                yield _sse("token", {"text": text})
+            answer = "".join(parts)
+            session.add_turn(request.question, answer)
+            if use_cache and answer:
+                result = {
+                    "answer": answer,
+                    "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens},
+                }
+                await asyncio.to_thread(_store_answer, cache_key, request.question, docs_for_llm, result)
+            yield _sse("done", {"answer_length": len(answer), "cached": False})
+        except Exception as e:
+            logger.exception("Error while streaming LLM response")
+            yield _sse("error", {"error": str(e)})
+        finally:
+            if tokens is not None:
+                await tokens.aclose()
 
+    stream = StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    _set_context_headers(stream, context_info)
+    stream.headers["X-AI-Session"] = session_status
+    return stream
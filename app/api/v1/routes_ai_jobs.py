@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from app.api.deps import get_current_user, get_db_session
+from app.core.config import get_settings
+from app.db.models.user import User
+from app.db.session import SessionLocal
+from app.schemas.ai import AnalysisJobCreate, AnalysisJobRead
+from app.services.analysis_job_service import FINISHED_JOB_STATUSES, AnalysisJobService, get_job_runner
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+router = APIRouter(prefix="/ai/jobs", tags=["AI Jobs"])
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+def _get_own_job(service: AnalysisJobService, job_id: str, user: User):
+    job = service.get(job_id, user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.post("", response_model=AnalysisJobRead, status_code=status.HTTP_202_ACCEPTED)
+def create_analysis_job(
+    payload: AnalysisJobCreate,
+    db=Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    バッチ分析ジョブを登録する（各項目は /analyze と同じ 質問 + 検索条件）。
+    実行はバックグラウンドのワーカーが行い、LLM の実行枠は対話的な /analyze を優先する。
+    進捗は GET /ai/jobs/{job_id} のポーリング、または GET /ai/jobs/{job_id}/events（SSE）で取得する。
+    """
+    service = AnalysisJobService(db)
+    job = service.create(current_user.id, payload.items)
+    get_job_runner().notify()
+    return service.to_dict(job)
+
+
+@router.get("/{job_id}", response_model=AnalysisJobRead)
+def read_analysis_job(
+    job_id: str,
+    db=Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+):
+    """ジョブの状態と各項目の結果（完了した項目のみ answer / source_files あり）"""
+    service = AnalysisJobService(db)
+    return service.to_dict(_get_own_job(service, job_id, current_user))
+
+
+@router.get("/{job_id}/events")
+async def stream_analysis_job_events(
+    job_id: str,
+    http_request: Request,
+    db=Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    ジョブの進捗（Server-Sent Events）。analysis_job_poll_seconds ごとに DB を確認して送信する。
+
+    イベント:
+    - `progress`: `{"status", "total_items", "done_items", "failed_items"}`（変化した時のみ）
+    - `item`: 完了した項目（GET /ai/jobs/{job_id} の items と同じ形式）
+    - `done`: ジョブ完了（以降は送信しない）
+    - `error`: ジョブが見つからなくなった（送信中に削除された）`{"error": "..."}`（以降は送信しない）
+
+    接続が長く続くため、リクエストのセッションは所有者の確認後に閉じ、確認のたびに短いセッションを使う
+    （接続プールの接続を占有しない）。
+    """
+    owner_id = current_user.id
+    try:
+        await asyncio.to_thread(_get_own_job, AnalysisJobService(db), job_id, current_user)
+    finally:
+        db.close()
+
+    def poll():
+        with SessionLocal() as session:
+            service = AnalysisJobService(session)
+            job = service.get(job_id, owner_id)
+            return service.to_dict(job) if job is not None else None
+
+    async def event_stream() -> AsyncIterator[str]:
+        sent_items: set[int] = set()
+        last_progress = None
+        while True:
+            job = await asyncio.to_thread(poll)
+            if job is None:
+                yield _sse("error", {"error": "Job not found"})
+                return
+            progress = {k: job[k] for k in ("status", "total_items", "done_items", "failed_items")}
+            if progress != last_progress:
+                last_progress = progress
+                yield _sse("progress", progress)
+            for item in job["items"]:
+                if item["finished_at"] is not None and item["item_no"] not in sent_items:
+                    sent_items.add(item["item_no"])
+                    yield _sse("item", item)
+            if job["status"] in FINISHED_JOB_STATUSES:
+                yield _sse("done", progress)
+                return
+            await asyncio.sleep(settings.analysis_job_poll_seconds)
+            if await http_request.is_disconnected():
+                return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,5 +1,8 @@
+import asyncio
 import logging
 import os
+from datetime import date
+from typing import Literal
 from uuid import uuid4
 
 from fastapi import (
@@ -12,8 +15,9 @@ from fastapi import (
     UploadFile,
     status,
 )
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_current_user, get_db_session
+from app.api.deps import get_async_db_session, get_current_user, get_db_session
 from app.db.models.user import User
 from app.schemas.file import (
     FileCreate,
@@ -23,13 +27,23 @@ from app.schemas.file import (
     FileWithLink,
 )
 from app.schemas.reference import ReferenceCreate, ReferenceRead
-from app.schemas.dashboard import DashboardResponse
+from app.schemas.dashboard import AnalyticsResponse, DashboardResponse
+from app.schemas.formulation import SimilarFormulation, SimilarFormulationResponse
 from app.services.blob_service import BlobService
-from app.services.file_service import FileService
+from app.services.file_service import AsyncFileService, FileService
+from app.services.file_summary_service import get_summary_runner
 from app.services.reference_service import ReferenceService
 from app.services.dashboard_service import DashboardService
+from app.services.analytics_service import AnalyticsQuery, AnalyticsService
 from app.services.excel_extractor_step3 import parse_step3_xlsx
-from app.services.extraction_service import upsert_extraction, get_extraction
+from app.services.extraction_service import (
+    EXTRACTION_SECTIONS,
+    get_extraction,
+    get_extraction_view,
+    upsert_extraction_async,
+)
+from app.services.formulation_similarity_service import get_formulation_index, vectorize_formulation
+from app.db.models.file import File
 
 logger = logging.getLogger(__name__)
 
@@ -132,6 +146,36 @@ def get_dashboard(
     return service.get_dashboard_data()
 
 
+@router.get("/dashboard/analytics", response_model=AnalyticsResponse)
+def get_dashboard_analytics(
+    start: date = Query(..., description="開始日（この日を含む）"),
+    end: date | None = Query(None, description="終了日（この日を含む。省略時は今日）"),
+    granularity: Literal["day", "week", "month", "quarter", "year"] = Query("month"),
+    group_by: list[Literal["application", "customer", "ingredient"]] = Query(
+        [], description="グループ化する項目（複数指定可）"
+    ),
+    application: str | None = Query(None),
+    customer: str | None = Query(None),
+    ingredient: str | None = Query(None),
+    db=Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+):
+    """任意の期間・粒度で、用途/顧客/成分ごとの登録数・ダウンロード数の推移を返す（日次の集計キューブから）"""
+    end = end or date.today()
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be on or before end")
+    query = AnalyticsQuery(
+        start=start,
+        end=end,
+        granularity=granularity,
+        group_by=tuple(dict.fromkeys(group_by)),
+        application=application,
+        customer=customer,
+        ingredient=ingredient,
+    )
+    return AnalyticsService(db).get_analytics(query)
+
+
 @router.get("/", response_model=list[FileRead])
 def list_files(
     mine_only: bool = Query(False, description="自分のファイルのみ表示する場合はtrue"),
@@ -187,20 +231,20 @@ def search_files(
 
 
 @router.post("/{file_id}/download", response_model=dict)
-def download_file(
+async def download_file(
     file_id: str,
-    db=Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db_session),
     current_user: User = Depends(get_current_user),
 ):
     """
     ファイルのダウンロードリンクを取得し、ダウンロード履歴を記録する。
     """
-    file_service = FileService(db)
+    file_service = AsyncFileService(db)
     # ファイル存在確認
-    file_obj = file_service.get(file_id)
+    file_obj = await file_service.get(file_id)
 
     # 履歴記録
-    file_service.record_download(file_id, current_user.id)
+    await file_service.record_download(file_id, current_user.id)
 
     # SAS URL生成（ダウンロードファイル名を指定）
     blob_service = BlobService()
@@ -309,7 +353,7 @@ async def upload_file(
     trial_id: str | None = Form(None),
     author: str | None = Form(None),
     is_preview_hidden: bool = Form(False),
-    db=Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db_session),
     current_user: User = Depends(get_current_user),
 ):
     if not uploaded_file.filename:
@@ -349,7 +393,8 @@ async def upload_file(
         raw = await uploaded_file.read()
         uploaded_file.file.seek(0)
         try:
-            excel_extraction = parse_step3_xlsx(raw)
+            # openpyxl の読み込みは CPU の処理のため、イベントループを止めないようスレッドで行う
+            excel_extraction = await asyncio.to_thread(parse_step3_xlsx, raw)
             excel_meta = excel_extraction.get("meta", {}) or {}
         except Exception as e:
             logger.warning("Excel extraction failed: %s", e)
@@ -398,7 +443,7 @@ async def upload_file(
                 detail=f"Blob upload failed: {exc}",
             ) from exc
 
-        file_service = FileService(db)
+        file_service = AsyncFileService(db)
         payload = FileCreate(
             id=file_id,
             blob_path=blob_path,
@@ -415,7 +460,7 @@ async def upload_file(
         )
 
         try:
-            record = file_service.create(payload)
+            record = await file_service.create(payload)
         except Exception as exc:
             await blob_service.delete_blob(blob_path)
             logger.exception("Failed to create DB record, blob deleted")
@@ -427,16 +472,26 @@ async def upload_file(
         # DB登録完了後に抽出結果を保存（抽出失敗でもアップロードは通す）
         if excel_extraction and not excel_extraction.get("error"):
             try:
-                upsert_extraction(db, file_id, excel_extraction)
+                await upsert_extraction_async(db, file_id, excel_extraction)
+                get_formulation_index().add_file(file_id, excel_extraction)
             except Exception as e:
                 logger.warning("Failed to save extraction for %s: %s", file_id, e)
 
+    # ファイル要約をバックグラウンドで生成する
+    get_summary_runner().notify()
     return record
 
 
 @router.get("/{file_id}/extraction")
 def read_extraction(
     file_id: str,
+    sections: list[str] | None = Query(
+        None, description="返すセクション（meta/log/formulation/derived、複数指定可。未指定時は全て）"
+    ),
+    log_offset: int = Query(0, ge=0),
+    log_limit: int | None = Query(None, ge=1, le=500, description="LOG 行のページサイズ"),
+    formulation_offset: int = Query(0, ge=0),
+    formulation_limit: int | None = Query(None, ge=1, le=500, description="配合行のページサイズ"),
     db=Depends(get_db_session),
     current_user: User = Depends(get_current_user),
 ):
@@ -446,41 +501,101 @@ def read_extraction(
     if file_obj.owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
-    data = get_extraction(db, file_id)
+    invalid = [s for s in sections or [] if s not in EXTRACTION_SECTIONS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(invalid)}")
+
+    if sections is None and not (log_offset or log_limit or formulation_offset or formulation_limit):
+        data = get_extraction(db, file_id)
+    else:
+        data = get_extraction_view(
+            db,
+            file_id,
+            sections=sections,
+            log_offset=log_offset,
+            log_limit=log_limit,
+            formulation_offset=formulation_offset,
+            formulation_limit=formulation_limit,
+        )
     if not data:
         raise HTTPException(status_code=404, detail="extraction not found")
     return data
 
 
+@router.get("/{file_id}/similar-formulations", response_model=SimilarFormulationResponse)
+def similar_formulations(
+    file_id: str,
+    variant_id: str | None = Query(None, description="基準にする配合案（未指定時は selected_variant → 先頭の配合案）"),
+    top_k: int = Query(10, ge=1, le=100),
+    db=Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+):
+    """配合（原材料→配合率ベクトル）のコサイン類似度が高い過去試作を返す（候補は自分のファイルのみ）"""
+    file_service = FileService(db)
+    file_obj = file_service.get(file_id)
+
+    if file_obj.owner_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    data = get_extraction(db, file_id) or {}
+    vectors = vectorize_formulation(data.get("formulation"))
+    if not vectors:
+        raise HTTPException(status_code=404, detail="formulation not found")
+
+    if variant_id is None:
+        selected = ((data.get("derived") or {}).get("selected_variant") or "").replace(" ", "")
+        variant_id = selected if selected in vectors else next(iter(vectors))
+    elif variant_id not in vectors:
+        raise HTTPException(status_code=404, detail=f"variant not found: {variant_id}")
+
+    index = get_formulation_index()
+    index.ensure_loaded(db)
+    # 閲覧できるファイル（read_extraction と同じく所有者のみ）に候補を絞る
+    names = dict(
+        db.query(File.id, File.original_name)
+        .filter(File.owner_id == current_user.id, File.status == "active")
+        .all()
+    )
+    matches = index.query(vectors[variant_id], top_k=top_k, exclude_file_id=file_id, file_ids=names)
+
+    return SimilarFormulationResponse(
+        file_id=file_id,
+        variant_id=variant_id,
+        matches=[SimilarFormulation(original_name=names.get(m["file_id"]), **m) for m in matches],
+    )
+
+
 @router.put("/{file_id}")
-def update_file_metadata(
+async def update_file_metadata(
     file_id: str,
     payload: FileMetadataUpdate,
-    db=Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db_session),
     current_user: User = Depends(get_current_user),
 ):
     """ファイルメタデータ更新（暫定的に所有者のみ許可。将来ロールで管理者限定に変更可能）"""
-    service = FileService(db)
-    file_obj = service.get(file_id)
+    service = AsyncFileService(db)
+    file_obj = await service.get(file_id)
 
     if file_obj.owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
-    updated = service.update_metadata(file_id, payload)
+    updated = await service.update_metadata(file_id, payload)
+    get_summary_runner().notify()
     return {"message": "File metadata updated successfully", "file_id": str(updated.id)}
 
 
 @router.delete("/{file_id}", status_code=204)
 async def delete_file(
     file_id: str,
-    db=Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db_session),
     current_user: User = Depends(get_current_user),
 ):
-    file_service = FileService(db)
-    file_obj = file_service.get(file_id)
+    file_service = AsyncFileService(db)
+    file_obj = await file_service.get(file_id)
     if file_obj.owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
     async with BlobService() as blob_service:
         await blob_service.delete_blob(file_obj.blob_path)
-    file_service.delete(file_id)
+    await file_service.delete(file_id)
+    get_formulation_index().remove_file(file_id)
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends
+
+from app.api.deps import get_current_user
+from app.core.metrics import metrics
+from app.db.models.user import User
+from app.db.pool import pool_status
+from app.db.session import engine, get_async_engine
+from app.services.answer_cache_service import AnswerCacheService
+from app.services.dashboard_service import get_dashboard_cache
+from app.services.llm_service import get_llm_service
+
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/", response_model=dict)
+def read_metrics(_: User = Depends(get_current_user)):
+    """プロセス内メトリクス（uvicorn ワーカー単位）"""
+    return {
+        **metrics.snapshot(),
+        "llm": get_llm_service().stats(),
+        "llm_answer_cache": AnswerCacheService.stats(),
+        "dashboard_cache": get_dashboard_cache().stats(),
+        "db_pool": pool_status(engine.pool),
+        # async ルート用のエンジンは初回利用時に作られる
+        "db_pool_async": pool_status(get_async_engine().pool) if get_async_engine.cache_info().currsize else None,
+    }
@@ -0,0 +1,101 @@
+"""
+ワーカー内（プロセス内）の LRU。件数上限と任意の TTL を持ち、スレッドセーフ。
+
+抽出結果（ExtractionCache）・語の出現数（TermStatsCache）・分析 API の応答（AnalyticsCache）・
+AI分析の会話セッション（AnalysisSessionStore）で共通に使う。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, Iterable, Mapping, TypeVar
+
+from app.core.metrics import metrics
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    max_entries を超えた分は最も長く使われていないものから破棄する。
+    ttl_seconds: 保存から（sliding=True なら最終利用から）この秒数が経ったエントリは期限切れ（None なら無期限）
+    clock: 経過時間の計測用（既定 time.monotonic）
+    metrics_prefix: 指定すると破棄・期限切れの件数を <metrics_prefix>.evicted / .expired に記録する
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float | None = None,
+        *,
+        sliding: bool = False,
+        clock: Callable[[], float] | None = None,
+        metrics_prefix: str | None = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sliding = sliding
+        self.clock = clock or time.monotonic
+        self.metrics_prefix = metrics_prefix
+        self._entries: "OrderedDict[K, tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        if self.metrics_prefix and n:
+            metrics.inc(f"{self.metrics_prefix}.{name}", n)
+
+    def get(self, key: K) -> V | None:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[K]) -> Dict[K, V]:
+        """有効なエントリだけを返す（期限切れのものは破棄する）"""
+        now = self.clock()
+        hits: Dict[K, V] = {}
+        expired = 0
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                stored_at, value = entry
+                if self.ttl_seconds is not None and now - stored_at >= self.ttl_seconds:
+                    del self._entries[key]
+                    expired += 1
+                    continue
+                if self.sliding:
+                    self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+                hits[key] = value
+        self._count("expired", expired)
+        return hits
+
+    def set(self, key: K, value: V) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, values: Mapping[K, V]) -> None:
+        now = self.clock()
+        evicted = 0
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        self._count("evicted", evicted)
+
+    def discard_where(self, predicate: Callable[[K], bool]) -> None:
+        """キーが predicate を満たすエントリを破棄する"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
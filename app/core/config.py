@@ -59,6 +59,18 @@ class Settings(BaseSettings):
             "?driver=ODBC+Driver+18+for+SQL+Server"
         )
     )
+    # async ルート用（create_async_engine）。空の場合は sqlalchemy_database_uri のドライバを
+    # async 版に置き換える（mssql+pyodbc → mssql+aioodbc、sqlite → sqlite+aiosqlite）
+    async_database_uri: str = ""
+    # DB 接続プール（uvicorn ワーカーごと。async ルート用のエンジンも同じ設定で別のプールを持つ）
+    db_pool_size: int = Field(default=5)
+    db_pool_max_overflow: int = Field(default=10)
+    # 接続の空きを待つ上限（秒）。超えると TimeoutError
+    db_pool_timeout_seconds: float = Field(default=30.0)
+    # これより古い接続は取り出し時に作り直す（Azure SQL のアイドル切断（30分）より短くする）
+    db_pool_recycle_seconds: int = Field(default=1500)
+    # 取り出しごとに接続を確認する（1往復増える。通常は recycle で足りる）
+    db_pool_pre_ping: bool = Field(default=False)
 
     azure_storage_account_name: str = "storage-account"
     azure_storage_account_key: str = "storage-key"
@@ -68,7 +80,13 @@ class Settings(BaseSettings):
     )
     azure_blob_files_container: str = "files"
     azure_blob_thumbnails_container: str = "thumbnails"
+    azure_blob_extractions_container: str = "extractions"  # 大きな抽出結果の退避先
     local_storage_path: str = Field(default="uploads")  # 開発環境用のローカルストレージパス
+    # 圧縮後のサイズがこれを超える抽出結果は DB 行ではなく Blob に保存する
+    extraction_inline_max_bytes: int = Field(default=256 * 1024)
+    # 抽出結果のプロセス内 LRU（件数 / 他ワーカーでの更新を反映するまでの最大秒数）
+    extraction_cache_size: int = Field(default=256)
+    extraction_cache_ttl_seconds: int = Field(default=300)
 
     # Azure AI Search
     search_backend: str = Field(default="azure")  # 固定でAzure Searchを利用
@@ -83,7 +101,80 @@ class Settings(BaseSettings):
     llm_model: str = Field(default="gpt-4")  # Model name (e.g., "gpt-4", "gpt-4-turbo", "gpt-35-turbo")
     azure_openai_api_version: str = Field(default="2024-02-15-preview")
     llm_max_tokens: int = Field(default=2000)
+    # モデルのコンテキスト長（入力+出力のトークン数）。プロンプトはここから llm_max_tokens を引いた範囲に詰める
+    llm_context_window: int = Field(default=8192)
+    # RAG コンテキストの近似重複除去のしきい値（段落の Jaccard 係数の推定値。1.0 で完全一致のみ）
+    rag_near_duplicate_threshold: float = Field(default=0.85)
+    # 本文（content）のパッセージ分割（file_chunks）。分析時は1ファイルあたり上位 rag_passages_per_doc 件を渡す
+    rag_chunk_chars: int = Field(default=800)
+    rag_chunk_overlap_chars: int = Field(default=150)
+    rag_passages_per_doc: int = Field(default=4)
+    # 分析時に見つかった索引が無い/古いファイルは、ワーカー内の1スレッドで索引を作る（保留の上限。0 で作らない）
+    rag_chunk_index_queue_size: int = Field(default=200)
+    # 検索で content を含まない候補を rag_rerank_candidates 件取得し、BM25 で並べ替えて上位 top 件を使う
+    rag_rerank_enabled: bool = Field(default=True)
+    rag_rerank_candidates: int = Field(default=30)
+    # 保存済みの語が無いテキストの解析結果を保持する件数（プロセス内 LRU）
+    rag_term_stats_cache_size: int = Field(default=4096)
+    # map-reduce 分析（mode="map_reduce"）。文書ごとの要約（map）を1リクエストあたり同時に rag_map_concurrency 件まで実行する
+    rag_map_concurrency: int = Field(default=4)
+    llm_map_max_tokens: int = Field(default=600)
+    # バッチ分析ジョブ（/ai/jobs）。ワーカー数 0 で実行しない（登録のみ）
+    analysis_job_workers: int = Field(default=2)
+    analysis_job_poll_seconds: float = Field(default=2.0)
+    # running のままこの秒数を超えた項目はワーカーが落ちたとみなして再実行する（最大 analysis_job_max_attempts 回）
+    analysis_job_lease_seconds: int = Field(default=900)
+    analysis_job_max_attempts: int = Field(default=3)
+    # AI分析の会話セッション（session_id による続きの質問）。ワーカーごとのメモリに保持する
+    analysis_session_ttl_seconds: int = Field(default=1800)  # 最終利用からの有効期限
+    analysis_session_max_entries: int = Field(default=500)
+    analysis_session_max_turns: int = Field(default=6)
+    # 会話履歴に使うトークン数（最初の回答時に参照ドキュメントを詰める際、この分を空けておく）
+    analysis_session_history_tokens: int = Field(default=1500)
+    # ファイル要約（file_summaries）。取り込み時にバックグラウンドで生成し、AI分析では抽出データ・本文より優先して使う
+    rag_use_file_summaries: bool = Field(default=True)
+    file_summary_workers: int = Field(default=1)  # 0 で生成しない
+    file_summary_poll_seconds: float = Field(default=10.0)
+    file_summary_max_tokens: int = Field(default=500)
+    file_summary_lease_seconds: int = Field(default=600)
+    file_summary_max_attempts: int = Field(default=3)
+    # 失敗時の再試行間隔（試行回数倍で延ばす。検索インデックスへの本文の反映待ちを含む）
+    file_summary_retry_seconds: int = Field(default=300)
     llm_temperature: float = Field(default=0.7)
+    # クライアントはワーカーごとに1つ生成し keep-alive 接続を再利用する
+    llm_timeout_seconds: float = Field(default=120.0)
+    llm_connect_timeout_seconds: float = Field(default=10.0)
+    llm_max_retries: int = Field(default=2)
+    llm_max_concurrency: int = Field(default=4)  # ワーカーあたりの同時実行数（プロバイダのクォータに合わせる）
+    llm_queue_timeout_seconds: float = Field(default=60.0)  # 実行枠の空き待ちの上限
+    # 副プロバイダ（任意）。主プロバイダが llm_hedge_delay_seconds 以内に応答しない場合（ストリーミングは最初の断片）に
+    # 同じリクエストを副プロバイダにも送り、先に返った方を使う。主プロバイダが失敗した場合は即座に副プロバイダへ送る
+    llm_secondary_provider: str = ""  # "" (無効) / "azure_openai" / "gemini"
+    llm_secondary_api_key: str = ""
+    llm_secondary_endpoint: str = ""
+    llm_secondary_model: str = ""  # 空の場合は llm_model
+    llm_hedge_delay_seconds: float = Field(default=8.0)
+    # AI分析の回答キャッシュ（llm_answer_cache テーブル）
+    llm_answer_cache_enabled: bool = Field(default=True)
+    llm_answer_cache_ttl_seconds: int = Field(default=24 * 3600)
+    # 期限切れエントリを削除する間隔（ワーカーごと。保存のたびには削除しない）
+    llm_answer_cache_prune_interval_seconds: int = Field(default=3600)
+    # ダッシュボードのキャッシュ。期限切れ後も max_stale の間は古い値を返し、バックグラウンドで再計算する
+    dashboard_cache_ttl_seconds: int = Field(default=3600)
+    dashboard_cache_max_stale_seconds: int = Field(default=24 * 3600)
+    # 定期的に先回りして再計算する間隔（0 で無効。期限切れ時のみ再計算）
+    dashboard_cache_refresh_interval_seconds: int = Field(default=0)
+    # 再計算中とみなす上限（ワーカーが落ちた場合に他のワーカーが引き継ぐまでの秒数）
+    dashboard_cache_lease_seconds: int = Field(default=300)
+    # ダッシュボードの集計を並行に実行するスレッド数（各スレッドがプールの接続を1つ使う。1 で順に実行）
+    dashboard_parallel_workers: int = Field(default=4)
+    # ダッシュボード分析 API（期間・グループ指定）の応答キャッシュ（ワーカー内。条件ごとに保持）
+    analytics_cache_ttl_seconds: int = Field(default=300)
+    analytics_cache_max_entries: int = Field(default=256)
+    # 起動時のウォームアップ（形態素解析の辞書・DB 接続プール・検索/Blob/LLM クライアント）
+    startup_warmup_enabled: bool = Field(default=True)
+    # これを超えたら待たずに起動する（未完了の分は初回リクエストで初期化される）
+    startup_warmup_timeout_seconds: float = Field(default=15.0)
 
 
 
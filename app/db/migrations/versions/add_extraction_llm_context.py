@@ -0,0 +1,31 @@
+"""add precomputed llm_context to file_extractions
+
+Revision ID: extraction_llm_context_001
+Revises: compress_extractions_001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "extraction_llm_context_001"
+down_revision: Union[str, None] = "compress_extractions_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 既存行の生成はアプリのコード（build_llm_context）に依存するため、マイグレーションでは行わない。
+    # 適用後に scripts/build_llm_contexts.py で生成する
+    op.add_column("file_extractions", sa.Column("llm_context", sa.UnicodeText(), nullable=True))
+    op.add_column("file_extractions", sa.Column("llm_context_version", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("file_extractions", "llm_context_version")
+    op.drop_column("file_extractions", "llm_context")
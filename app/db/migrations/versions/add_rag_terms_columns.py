@@ -0,0 +1,30 @@
+"""add BM25 term columns to file_chunks and file_extractions
+
+Revision ID: rag_terms_001
+Revises: file_chunks_001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "rag_terms_001"
+down_revision: Union[str, None] = "file_chunks_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 既存行は NULL のまま（参照時に計算して保存する。scripts/build_chunk_index.py でも埋まる）
+    op.add_column("file_chunks", sa.Column("terms", sa.UnicodeText(), nullable=True))
+    op.add_column("file_extractions", sa.Column("llm_context_terms", sa.UnicodeText(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("file_extractions", "llm_context_terms")
+    op.drop_column("file_chunks", "terms")
@@ -0,0 +1,132 @@
+"""compress file_extractions payload
+
+Revision ID: compress_extractions_001
+Revises: add_file_extractions_001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+import json
+import struct
+import zlib
+from typing import Any, Dict, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "compress_extractions_001"
+down_revision: Union[str, None] = "add_file_extractions_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 200
+
+file_extractions = sa.table(
+    "file_extractions",
+    sa.column("id", sa.Integer()),
+    sa.column("data", sa.JSON()),
+    sa.column("payload", sa.LargeBinary()),
+    sa.column("payload_size", sa.Integer()),
+    sa.column("blob_path", sa.String()),
+)
+
+
+# 保存形式（NCX1）の変換はこのリビジョン時点のものを固定して持つ。
+# app.services.extraction_codec を後で変更しても、このマイグレーションが書き込む内容は変わらない
+_MAGIC = b"NCX1"
+_HEADER_LEN = struct.Struct(">I")
+
+
+def _encode(data: Dict[str, Any]) -> bytes:
+    """MAGIC | header_len(uint32, big endian) | header(JSON) | トップレベルのキーごとに zlib 圧縮した JSON"""
+    offsets: Dict[str, list[int]] = {}
+    chunks: list[bytes] = []
+    pos = 0
+    for key, value in data.items():
+        raw = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        chunk = zlib.compress(raw, 6)
+        offsets[key] = [pos, len(chunk)]
+        chunks.append(chunk)
+        pos += len(chunk)
+    header = json.dumps({"sections": offsets}, separators=(",", ":")).encode("utf-8")
+    return _MAGIC + _HEADER_LEN.pack(len(header)) + header + b"".join(chunks)
+
+
+def _decode(payload: bytes) -> Dict[str, Any]:
+    if payload[:4] != _MAGIC:
+        raise ValueError("Unsupported extraction payload format")
+    (header_len,) = _HEADER_LEN.unpack_from(payload, 4)
+    body_start = 4 + _HEADER_LEN.size + header_len
+    sections = json.loads(payload[4 + _HEADER_LEN.size : body_start])["sections"]
+    return {
+        name: json.loads(zlib.decompress(payload[body_start + offset : body_start + offset + length]))
+        for name, (offset, length) in sections.items()
+    }
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("file_extractions") as batch_op:
+        batch_op.add_column(sa.Column("payload", sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column("payload_size", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("blob_path", sa.String(length=512), nullable=True))
+        batch_op.alter_column("data", existing_type=sa.JSON(), nullable=True)
+
+    # 既存行を圧縮形式に変換（Blob への退避は行わず、全て行内に保存する）
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(file_extractions.c.id, file_extractions.c.data)
+            .where(file_extractions.c.id > last_id, file_extractions.c.data.isnot(None))
+            .order_by(file_extractions.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row_id, data in rows:
+            payload = _encode(data or {})
+            bind.execute(
+                file_extractions.update()
+                .where(file_extractions.c.id == row_id)
+                .values(payload=payload, payload_size=len(payload), data=sa.null())
+            )
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    # 圧縮行・Blob に退避した行を旧形式（data の JSON）に戻してから列を削除する
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(file_extractions.c.id, file_extractions.c.payload, file_extractions.c.blob_path).where(
+            sa.or_(file_extractions.c.payload.isnot(None), file_extractions.c.blob_path.isnot(None))
+        )
+    ).all()
+    blob_service = None
+    for row_id, payload, blob_path in rows:
+        if payload is None:
+            if blob_service is None:
+                from app.core.config import get_settings
+                from app.services.blob_service import BlobService
+
+                blob_service = BlobService(container_name=get_settings().azure_blob_extractions_container)
+            try:
+                payload = blob_service.download_bytes_sync(blob_path)
+            except Exception as e:
+                # 列を削除すると抽出結果が失われるため、戻せない行がある場合は downgrade を中止する
+                raise RuntimeError(
+                    f"file_extractions.id={row_id}: spilled extraction {blob_path} could not be downloaded; "
+                    "downgrade aborted to avoid losing data"
+                ) from e
+        bind.execute(
+            file_extractions.update()
+            .where(file_extractions.c.id == row_id)
+            .values(data=_decode(payload))
+        )
+
+    with op.batch_alter_table("file_extractions") as batch_op:
+        batch_op.alter_column("data", existing_type=sa.JSON(), nullable=False)
+        batch_op.drop_column("blob_path")
+        batch_op.drop_column("payload_size")
+        batch_op.drop_column("payload")
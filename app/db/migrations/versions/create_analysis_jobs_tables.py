@@ -0,0 +1,66 @@
+"""create analysis_jobs and analysis_job_items tables
+
+Revision ID: analysis_jobs_001
+Revises: rag_terms_001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "analysis_jobs_001"
+down_revision: Union[str, None] = "rag_terms_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "analysis_jobs",
+        sa.Column("id", sa.String(length=36), primary_key=True, nullable=False),
+        sa.Column("owner_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="queued"),
+        sa.Column("total_items", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("done_items", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("failed_items", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index(op.f("ix_analysis_jobs_owner_id"), "analysis_jobs", ["owner_id"], unique=False)
+
+    op.create_table(
+        "analysis_job_items",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("job_id", sa.String(length=36), sa.ForeignKey("analysis_jobs.id"), nullable=False),
+        sa.Column("item_no", sa.Integer(), nullable=False),
+        sa.Column("request", sa.UnicodeText(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="queued"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("answer", sa.UnicodeText(), nullable=True),
+        sa.Column("source_files", sa.UnicodeText(), nullable=True),
+        sa.Column("error", sa.UnicodeText(), nullable=True),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.UniqueConstraint("job_id", "item_no", name="uq_analysis_job_items_job_id_item_no"),
+    )
+    op.create_index(op.f("ix_analysis_job_items_job_id"), "analysis_job_items", ["job_id"], unique=False)
+    op.create_index(op.f("ix_analysis_job_items_status"), "analysis_job_items", ["status"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_analysis_job_items_status"), table_name="analysis_job_items")
+    op.drop_index(op.f("ix_analysis_job_items_job_id"), table_name="analysis_job_items")
+    op.drop_table("analysis_job_items")
+    op.drop_index(op.f("ix_analysis_jobs_owner_id"), table_name="analysis_jobs")
+    op.drop_table("analysis_jobs")
@@ -0,0 +1,33 @@
+"""create cache_snapshots table
+
+Revision ID: cache_snapshots_001
+Revises: issue_terms_001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "cache_snapshots_001"
+down_revision: Union[str, None] = "issue_terms_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cache_snapshots",
+        sa.Column("key", sa.String(length=100), primary_key=True, nullable=False),
+        sa.Column("data", sa.UnicodeText(), nullable=True),
+        sa.Column("computed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("refreshing_until", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("cache_snapshots")
@@ -0,0 +1,42 @@
+"""create file_download_daily and file_registration_daily tables
+
+Revision ID: daily_rollups_001
+Revises: cache_snapshots_001
+Create Date: 2026-10-19 00:00:00.000000
+
+既存データの集計は scripts/rollup_daily_stats.py --rebuild で作成する。
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "daily_rollups_001"
+down_revision: Union[str, None] = "cache_snapshots_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "file_download_daily",
+        sa.Column("file_id", sa.String(length=36), sa.ForeignKey("files.id"), primary_key=True, nullable=False),
+        sa.Column("day", sa.Date(), primary_key=True, nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_index(op.f("ix_file_download_daily_day"), "file_download_daily", ["day"], unique=False)
+    op.create_table(
+        "file_registration_daily",
+        sa.Column("day", sa.Date(), primary_key=True, nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("file_registration_daily")
+    op.drop_index(op.f("ix_file_download_daily_day"), table_name="file_download_daily")
+    op.drop_table("file_download_daily")
@@ -0,0 +1,46 @@
+"""create file_chunks table
+
+Revision ID: file_chunks_001
+Revises: llm_answer_cache_001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "file_chunks_001"
+down_revision: Union[str, None] = "llm_answer_cache_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "file_chunks",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("file_id", sa.String(length=36), sa.ForeignKey("files.id"), nullable=False),
+        sa.Column("chunk_no", sa.Integer(), nullable=False),
+        sa.Column("page", sa.Integer(), nullable=True),
+        sa.Column("start_offset", sa.Integer(), nullable=False),
+        sa.Column("end_offset", sa.Integer(), nullable=False),
+        sa.Column("text", sa.UnicodeText(), nullable=False),
+        sa.Column("source_hash", sa.String(length=40), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.UniqueConstraint("file_id", "chunk_no", name="uq_file_chunks_file_id_chunk_no"),
+    )
+    op.create_index(op.f("ix_file_chunks_file_id"), "file_chunks", ["file_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_file_chunks_file_id"), table_name="file_chunks")
+    op.drop_table("file_chunks")
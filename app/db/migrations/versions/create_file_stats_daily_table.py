@@ -0,0 +1,38 @@
+"""create file_stats_daily table
+
+Revision ID: analytics_cube_001
+Revises: daily_rollups_001
+Create Date: 2026-10-19 00:00:00.000000
+
+既存データの集計は scripts/rollup_daily_stats.py --rebuild で作成する。
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "analytics_cube_001"
+down_revision: Union[str, None] = "daily_rollups_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "file_stats_daily",
+        sa.Column("day", sa.Date(), primary_key=True, nullable=False),
+        sa.Column("dims_hash", sa.String(length=40), primary_key=True, nullable=False),
+        sa.Column("application", sa.Unicode(length=255), nullable=False, server_default=""),
+        sa.Column("customer", sa.Unicode(length=255), nullable=False, server_default=""),
+        sa.Column("ingredient", sa.Unicode(length=255), nullable=False, server_default=""),
+        sa.Column("registrations", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("downloads", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("file_stats_daily")
@@ -0,0 +1,51 @@
+"""create file_summaries table
+
+Revision ID: file_summaries_001
+Revises: analysis_jobs_001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "file_summaries_001"
+down_revision: Union[str, None] = "analysis_jobs_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "file_summaries",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("file_id", sa.String(length=36), sa.ForeignKey("files.id"), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="pending"),
+        sa.Column("revision", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("summary", sa.UnicodeText(), nullable=True),
+        sa.Column("version", sa.Integer(), nullable=True),
+        sa.Column("model", sa.String(length=100), nullable=True),
+        sa.Column("error", sa.UnicodeText(), nullable=True),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.UniqueConstraint("file_id", name="uq_file_summaries_file_id"),
+    )
+    op.create_index(op.f("ix_file_summaries_file_id"), "file_summaries", ["file_id"], unique=False)
+    op.create_index(op.f("ix_file_summaries_status"), "file_summaries", ["status"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_file_summaries_status"), table_name="file_summaries")
+    op.drop_index(op.f("ix_file_summaries_file_id"), table_name="file_summaries")
+    op.drop_table("file_summaries")
@@ -0,0 +1,41 @@
+"""create file_issue_terms and issue_term_counts tables
+
+Revision ID: issue_terms_001
+Revises: file_summaries_001
+Create Date: 2026-10-19 00:00:00.000000
+
+既存のファイルの集計は scripts/rebuild_issue_terms.py で作成する。
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "issue_terms_001"
+down_revision: Union[str, None] = "file_summaries_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "file_issue_terms",
+        sa.Column("file_id", sa.String(length=36), sa.ForeignKey("files.id"), primary_key=True, nullable=False),
+        sa.Column("terms", sa.UnicodeText(), nullable=False),
+    )
+    op.create_table(
+        "issue_term_counts",
+        sa.Column("term", sa.Unicode(length=255), primary_key=True, nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_index(op.f("ix_issue_term_counts_count"), "issue_term_counts", ["count"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_issue_term_counts_count"), table_name="issue_term_counts")
+    op.drop_table("issue_term_counts")
+    op.drop_table("file_issue_terms")
@@ -0,0 +1,45 @@
+"""create llm_answer_cache table
+
+Revision ID: llm_answer_cache_001
+Revises: extraction_llm_context_001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "llm_answer_cache_001"
+down_revision: Union[str, None] = "extraction_llm_context_001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "llm_answer_cache",
+        sa.Column("cache_key", sa.String(length=64), primary_key=True, nullable=False),
+        sa.Column("question", sa.UnicodeText(), nullable=False),
+        sa.Column("source_file_ids", sa.UnicodeText(), nullable=False),
+        sa.Column("answer", sa.UnicodeText(), nullable=False),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("completion_tokens", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("hit_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index(op.f("ix_llm_answer_cache_expires_at"), "llm_answer_cache", ["expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_llm_answer_cache_expires_at"), table_name="llm_answer_cache")
+    op.drop_table("llm_answer_cache")
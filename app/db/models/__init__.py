@@ -3,5 +3,12 @@ from app.db.models.user import User
 from app.db.models.file_reference import FileReference
 from app.db.models.file_download import FileDownload
 from app.db.models.file_extraction import FileExtraction
+from app.db.models.llm_answer_cache import LLMAnswerCache
+from app.db.models.file_chunk import FileChunk
+from app.db.models.analysis_job import AnalysisJob, AnalysisJobItem
+from app.db.models.file_summary import FileSummary
+from app.db.models.issue_term import FileIssueTerms, IssueTermCount
+from app.db.models.cache_snapshot import CacheSnapshot
+from app.db.models.daily_rollup import FileDownloadDaily, FileRegistrationDaily, FileStatsDaily
 
-__all__ = ["User", "File", "FileReference", "FileDownload", "FileExtraction"]
+__all__ = ["User", "File", "FileReference", "FileDownload", "FileExtraction", "LLMAnswerCache", "FileChunk", "AnalysisJob", "AnalysisJobItem", "FileSummary", "FileIssueTerms", "IssueTermCount", "CacheSnapshot", "FileDownloadDaily", "FileRegistrationDaily", "FileStatsDaily"]
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import DateTime, ForeignKey, Integer, String, UnicodeText, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.db.base import Base
+
+
+class AnalysisJob(Base):
+    """
+    バッチ分析ジョブ（複数の 質問 + 検索条件 をまとめてバックグラウンドで分析する）。
+    status: queued / running / completed / failed（全項目が失敗した場合のみ failed）
+    """
+
+    __tablename__ = "analysis_jobs"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid4()))
+    owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False, index=True)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="queued")
+    total_items: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    done_items: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed_items: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+    )
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    items = relationship("AnalysisJobItem", back_populates="job", order_by="AnalysisJobItem.item_no")
+
+
+class AnalysisJobItem(Base):
+    """
+    バッチ分析ジョブの1項目。request は AIAnalysisRequest の JSON。
+    status: queued / running / succeeded / failed
+    running のまま started_at から analysis_job_lease_seconds を超えた項目は、ワーカーが落ちたとみなして再実行する。
+    """
+
+    __tablename__ = "analysis_job_items"
+    __table_args__ = (UniqueConstraint("job_id", "item_no", name="uq_analysis_job_items_job_id_item_no"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    job_id: Mapped[str] = mapped_column(String(36), ForeignKey("analysis_jobs.id"), nullable=False, index=True)
+    item_no: Mapped[int] = mapped_column(Integer, nullable=False)
+    request: Mapped[str] = mapped_column(UnicodeText, nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="queued", index=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    answer: Mapped[str | None] = mapped_column(UnicodeText, nullable=True)
+    source_files: Mapped[str | None] = mapped_column(UnicodeText, nullable=True)  # AIAnalysisSourceFile の JSON 配列
+    error: Mapped[str | None] = mapped_column(UnicodeText, nullable=True)
+
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    job = relationship("AnalysisJob", back_populates="items")
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, String, UnicodeText
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class CacheSnapshot(Base):
+    """
+    集計結果のスナップショット（ダッシュボードなど。app.services.snapshot_cache）。
+    uvicorn のワーカー間で計算結果を共有し、refreshing_until（リース）で再計算を1ワーカーに限る。
+    """
+
+    __tablename__ = "cache_snapshots"
+
+    key: Mapped[str] = mapped_column(String(100), primary_key=True)
+    data: Mapped[str | None] = mapped_column(UnicodeText, nullable=True)  # JSON
+    computed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    refreshing_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
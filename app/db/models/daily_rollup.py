@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from datetime import date
+
+from sqlalchemy import Date, ForeignKey, Integer, String, Unicode
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class FileDownloadDaily(Base):
+    """
+    ファイル・日ごとのダウンロード数（file_downloads の日次集計）。ダウンロードの記録と同じトランザクションで加算する。
+    古い file_downloads の行は集計済みのため削除できる（scripts/rollup_daily_stats.py --compact-days）。
+    """
+
+    __tablename__ = "file_download_daily"
+
+    file_id: Mapped[str] = mapped_column(String(36), ForeignKey("files.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class FileRegistrationDaily(Base):
+    """登録日ごとの有効な（status = active）ファイル数。登録・状態変更・削除時に加減する"""
+
+    __tablename__ = "file_registration_daily"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class FileStatsDaily(Base):
+    """
+    日 × 用途 × 顧客 × 成分ごとの登録数・ダウンロード数（ダッシュボード分析 API の集計キューブ）。
+    未設定の項目は空文字で持つ。キーが長くなるため主キーは (day, dims_hash) とする（dims_hash は 3 項目のハッシュ）。
+    ダウンロード数はファイルの現在の用途・顧客・成分に計上する（メタデータ変更時は移し替える）。
+    """
+
+    __tablename__ = "file_stats_daily"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    dims_hash: Mapped[str] = mapped_column(String(40), primary_key=True)
+    application: Mapped[str] = mapped_column(Unicode(255), nullable=False, default="")
+    customer: Mapped[str] = mapped_column(Unicode(255), nullable=False, default="")
+    ingredient: Mapped[str] = mapped_column(Unicode(255), nullable=False, default="")
+    registrations: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    downloads: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
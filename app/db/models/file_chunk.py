@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Integer, String, UnicodeText, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class FileChunk(Base):
+    """
+    RAG 用のパッセージ（本文を重なり付きで分割したもの）。
+    source_hash は分割元の本文（検索インデックスの content）のハッシュで、本文が変わったら作り直す。
+    """
+
+    __tablename__ = "file_chunks"
+    __table_args__ = (UniqueConstraint("file_id", "chunk_no", name="uq_file_chunks_file_id_chunk_no"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    file_id: Mapped[str] = mapped_column(String(36), ForeignKey("files.id"), nullable=False, index=True)
+    chunk_no: Mapped[int] = mapped_column(Integer, nullable=False)
+    page: Mapped[int | None] = mapped_column(Integer, nullable=True)  # 本文に改ページ（\f）がある場合のみ
+    start_offset: Mapped[int] = mapped_column(Integer, nullable=False)
+    end_offset: Mapped[int] = mapped_column(Integer, nullable=False)
+    text: Mapped[str] = mapped_column(UnicodeText, nullable=False)
+    # BM25 用の語（app.services.bm25.tokenize の結果を空白区切り）。未計算の行は NULL
+    terms: Mapped[str | None] = mapped_column(UnicodeText, nullable=True)
+    source_hash: Mapped[str] = mapped_column(String(40), nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+    )
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, UniqueConstraint, func
+from sqlalchemy import DateTime, ForeignKey, Integer, LargeBinary, String, UnicodeText, UniqueConstraint, func
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.types import JSON
 
@@ -20,7 +20,18 @@ class FileExtraction(Base):
     )
 
     # 抽出結果（meta/log/formulation/derivedなど）
-    data: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # 旧形式（非圧縮JSON）。移行済みの行では NULL
+    data: Mapped[dict | None] = mapped_column(JSON(none_as_null=True), nullable=True)
+    # 圧縮形式（app.services.extraction_codec）。サイズが大きい場合は Blob に退避し payload は NULL
+    payload: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    payload_size: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    blob_path: Mapped[str | None] = mapped_column(String(512), nullable=True)
+
+    # LLM 用の短いコンテキスト（抽出時に生成。extraction_service.LLM_CONTEXT_VERSION で版管理）
+    llm_context: Mapped[str | None] = mapped_column(UnicodeText, nullable=True)
+    llm_context_version: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # llm_context の BM25 用の語（app.services.bm25.tokenize の結果を空白区切り）
+    llm_context_terms: Mapped[str | None] = mapped_column(UnicodeText, nullable=True)
 
     created_at: Mapped[object] = mapped_column(
         DateTime(timezone=True),
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Integer, String, UnicodeText, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class FileSummary(Base):
+    """
+    ファイルごとの要約（主な結果・失敗原因・採用した配合案）。取り込み時にバックグラウンドで LLM により生成する。
+    status: pending / running / ready / failed
+
+    ファイル・抽出結果が更新されると revision を上げて pending に戻す。
+    生成中に revision が変わった場合、その生成結果は保存しない（古い内容で ready にならない）。
+    """
+
+    __tablename__ = "file_summaries"
+    __table_args__ = (UniqueConstraint("file_id", name="uq_file_summaries_file_id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    file_id: Mapped[str] = mapped_column(String(36), ForeignKey("files.id"), nullable=False, index=True)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="pending", index=True)
+    revision: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    summary: Mapped[str | None] = mapped_column(UnicodeText, nullable=True)
+    # 生成時の file_summary_service.SUMMARY_VERSION とモデル名（版が古い要約は使わない）
+    version: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    model: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    error: Mapped[str | None] = mapped_column(UnicodeText, nullable=True)
+
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    next_attempt_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from sqlalchemy import ForeignKey, Integer, String, Unicode, UnicodeText
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class FileIssueTerms(Base):
+    """
+    ファイルの課題（files.issue）から取り出した語（空白区切り。同じ語は出現回数分並ぶ）。
+    issue_term_counts に加算済みの内容を覚えておき、更新・削除時はこれとの差分だけを反映する。
+    集計対象外（status が active でない・課題が空）のファイルは行を持たない。
+    """
+
+    __tablename__ = "file_issue_terms"
+
+    file_id: Mapped[str] = mapped_column(String(36), ForeignKey("files.id"), primary_key=True)
+    terms: Mapped[str] = mapped_column(UnicodeText, nullable=False, default="")
+
+
+class IssueTermCount(Base):
+    """有効なファイル（status = active）の課題に含まれる語ごとの出現回数（ダッシュボードのワードクラウド用）"""
+
+    __tablename__ = "issue_term_counts"
+
+    term: Mapped[str] = mapped_column(Unicode(255), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, index=True)
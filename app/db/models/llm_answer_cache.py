@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, String, UnicodeText, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class LLMAnswerCache(Base):
+    """
+    AI分析の回答キャッシュ。
+    キーは「正規化した質問 + 参照ファイルIDの並び + 各ファイルの版（更新日時・抽出更新日時・本文ハッシュ）」の SHA-256。
+    ファイル更新/再抽出で版が変わると別キーになるため、古いエントリは参照されなくなり TTL で削除される。
+    """
+
+    __tablename__ = "llm_answer_cache"
+
+    cache_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    question: Mapped[str] = mapped_column(UnicodeText, nullable=False)
+    source_file_ids: Mapped[str] = mapped_column(UnicodeText, nullable=False)  # カンマ区切り（参照順）
+    answer: Mapped[str] = mapped_column(UnicodeText, nullable=False)
+    prompt_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    completion_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    hit_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,127 @@
+"""
+DB 接続プールの設定とメトリクス。
+
+- 接続の生存確認: 取り出しごとの ping（pool_pre_ping。1往復増える）の代わりに、db_pool_recycle_seconds より古い接続を
+  取り出し時に作り直す（Azure SQL などがアイドルの接続を切る時間より短くしておく）。
+  それでも切れていた接続（フェイルオーバーなど）は、使用時の切断エラーでプール全体の接続が作り直される
+- メトリクス（<name> は同期版 db_pool、async 版 db_pool_async）:
+  ヒストグラム <name>.wait_ms（接続の取り出しにかかった時間。空き待ち・新規接続を含む）・<name>.hold_ms（取り出してから返すまでの時間）、
+  カウンタ <name>.checkouts / overflow_checkouts（pool_size を超えて overflow の接続を使った回数）/
+  exhausted_checkouts（最後の空きを使った回数。以降のリクエストは空きを待つ）/ timeouts（空き待ちのタイムアウト）/ connects（新規接続）。
+  wait_ms・timeouts は engine_options() のプールのクラスが connect() を計測して、それ以外は instrument_engine() で登録するイベントで記録する
+- pool_status(): 現在のプールの size / checked_out / idle / overflow（GET /api/v1/metrics の db_pool）
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from app.core.config import get_settings
+from app.core.metrics import metrics
+
+settings = get_settings()
+
+
+class _InstrumentedPoolMixin:
+    """
+    接続の取り出し（空き待ち・新規接続を含む）の時間とタイムアウトを記録し、設定した max_overflow を覚えておく。
+    dispose() などの recreate() では同じクラスが同じ max_overflow で作り直される。
+    イベントは登録しない（instrument_engine() でエンジンに1回だけ登録する）。
+    """
+
+    metrics_name = "db_pool"
+
+    def __init__(self, creator: Any, *args: Any, max_overflow: int = 10, **kwargs: Any) -> None:
+        self._configured_max_overflow = max_overflow
+        super().__init__(creator, *args, max_overflow=max_overflow, **kwargs)  # type: ignore[call-arg]
+
+    def max_overflow(self) -> int:
+        """pool_size を超えて作れる接続の数（-1 は無制限）"""
+        return self._configured_max_overflow
+
+    def connect(self):  # type: ignore[no-untyped-def]
+        started = time.perf_counter()
+        try:
+            return super().connect()  # type: ignore[misc]
+        except exc.TimeoutError:
+            metrics.inc(f"{self.metrics_name}.timeouts")
+            raise
+        finally:
+            metrics.observe(f"{self.metrics_name}.wait_ms", (time.perf_counter() - started) * 1000)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    metrics_name = "db_pool"
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_name = "db_pool_async"
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """
+    エンジンのプールにメトリクス用のイベントを登録する（エンジンの作成直後に1回だけ呼ぶ）。
+    dispose() などでプールが作り直されてもイベントは引き継がれる。async エンジンは sync_engine を渡す。
+    """
+
+    def on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+        # pool_recycle や切断後の作り直しも含めて数える
+        metrics.inc(f"{name}.connects")
+
+    def on_checkout(dbapi_connection: Any, connection_record: Any, connection_proxy: Any) -> None:
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        metrics.inc(f"{name}.checkouts")
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            if pool.checkedout() > pool.size():
+                metrics.inc(f"{name}.overflow_checkouts")
+        # max_overflow はエンジンごとに異なりうるため、設定値ではなくプールが覚えている値を使う
+        if isinstance(pool, _InstrumentedPoolMixin) and pool.max_overflow() > -1:
+            if pool.checkedout() >= pool.size() + pool.max_overflow():
+                metrics.inc(f"{name}.exhausted_checkouts")
+
+    def on_checkin(dbapi_connection: Any, connection_record: Any) -> None:
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            metrics.observe(f"{name}.hold_ms", (time.perf_counter() - started) * 1000)
+
+    event.listen(engine, "connect", on_connect)
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+
+
+def engine_options(uri: str, *, use_async: bool = False) -> Dict[str, Any]:
+    """create_engine / create_async_engine に渡すプールの設定"""
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # インメモリの SQLite は接続ごとに別の DB になるため、既定のプール（接続を共有する）のままにする
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if use_async else InstrumentedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_pool_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def pool_status(pool: Pool) -> Dict[str, Any]:
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    status: Dict[str, Any] = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        # pool_size を超えて作った接続の数（負の値は pool_size に満たない分）
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, _InstrumentedPoolMixin):
+        status["max_overflow"] = pool.max_overflow()  # -1 は無制限
+    return status
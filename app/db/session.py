@@ -1,10 +1,14 @@
 import logging
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
+from functools import lru_cache
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import get_settings
+from app.db.pool import engine_options, instrument_engine
 
 logger = logging.getLogger(__name__)
 
@@ -12,9 +16,11 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 engine = create_engine(
     settings.sqlalchemy_database_uri,
-    pool_pre_ping=True,
     future=True,
+    # プールの大きさ・生存確認（recycle）・メトリクスは app.db.pool を参照
+    **engine_options(settings.sqlalchemy_database_uri),
 )
+instrument_engine(engine, "db_pool")
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -35,5 +41,63 @@ def get_db() -> Generator[Session, None, None]:
         raise
 
 
-__all__ = ["engine", "SessionLocal", "get_db"]
+# 同期ドライバ → async ドライバ（async_database_uri が未設定の場合に sqlalchemy_database_uri から置き換える）
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "mssql": "mssql+aioodbc",
+    "mssql+pyodbc": "mssql+aioodbc",
+}
+
+
+def to_async_database_uri(uri: str) -> str:
+    url = make_url(uri)
+    driver = _ASYNC_DRIVERS.get(url.drivername)
+    if driver is None:
+        # 既に async ドライバの場合など
+        return uri
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+@lru_cache
+def get_async_engine() -> AsyncEngine:
+    """
+    async ルート用のエンジン（MSSQL は aioodbc、SQLite は aiosqlite）。
+    ドライバが必要になるのは async ルートを使うときだけなので、初回利用時に作る（スクリプト・マイグレーションは同期版のみ使う）。
+    インメモリの SQLite（sqlite://）では同期版のエンジンと別の DB になる点に注意。
+    """
+    uri = settings.async_database_uri or to_async_database_uri(settings.sqlalchemy_database_uri)
+    async_engine = create_async_engine(uri, **engine_options(uri, use_async=True))
+    instrument_engine(async_engine.sync_engine, "db_pool_async")
+    return async_engine
+
+
+@lru_cache
+def get_async_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    # commit 後に属性を読み直さない（async では暗黙の読み込みができないため）
+    return async_sessionmaker(bind=get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    """作成済みの場合だけ async エンジンの接続を閉じる（lifespan の終了時に呼ぶ）"""
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+        get_async_sessionmaker.cache_clear()
+        get_async_engine.cache_clear()
+
+
+__all__ = [
+    "engine",
+    "SessionLocal",
+    "get_db",
+    "get_async_engine",
+    "get_async_sessionmaker",
+    "get_async_db",
+    "dispose_async_engine",
+]
 
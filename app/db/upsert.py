@@ -0,0 +1,23 @@
+"""
+集計行への加算（行が無ければ作る）。日次集計・分析キューブ・課題の語の出現回数で共通に使う。
+"""
+
+from typing import Any, Callable, Dict
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Query, Session
+
+
+def update_or_insert(db: Session, query: Query, values: Dict[str, Any], new_row: Callable[[], Any] | None) -> None:
+    """
+    query の行を values で更新し、行が無ければ new_row() を追加する（None なら追加しない）。commit は呼び出し側で行う。
+    values は SQL 側での加算（Model.count + delta など）にし、読み出さずに更新して同時更新でも失われないようにする。
+    追加は SAVEPOINT 内で行い、同じキーの行を別のリクエストが先に作った（IntegrityError）場合は更新し直す。
+    """
+    if query.update(values, synchronize_session=False) or new_row is None:
+        return
+    try:
+        with db.begin_nested():
+            db.add(new_row())
+    except IntegrityError:
+        query.update(values, synchronize_session=False)
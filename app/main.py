@@ -7,8 +7,16 @@ from app.api.v1.routes_auth import router as auth_router
 from app.api.v1.routes_files import router as files_router
 from app.api.v1.routes_users import router as users_router
 from app.api.v1.routes_ai import router as ai_router
+from app.api.v1.routes_ai_jobs import router as ai_jobs_router
+from app.api.v1.routes_metrics import router as metrics_router
 from app.core.config import get_settings
 from app.core.logging_config import configure_logging
+from app.db.session import dispose_async_engine
+from app.services.analysis_job_service import get_job_runner
+from app.services.dashboard_service import get_dashboard_cache
+from app.services.file_summary_service import get_summary_runner
+from app.services.llm_service import get_llm_service
+from app.services.warmup_service import freeze_startup_objects, warm_up
 
 
 settings = get_settings()
@@ -17,8 +25,32 @@ configure_logging()
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    # ここで将来的に DB 接続確認やキャッシュウォームアップを実行できる
+    # LLM クライアントはワーカーごとに1つ生成し、リクエスト間で接続を再利用する
+    llm_service = get_llm_service()
+    # 形態素解析の辞書・DB 接続プール・検索/Blob/LLM クライアントを初回リクエスト前に初期化しておく
+    if settings.startup_warmup_enabled:
+        await warm_up()
+        freeze_startup_objects()
+    # バッチ分析ジョブのワーカー（analysis_job_workers 件）。停止時に実行中の項目は実行待ちに戻す
+    job_runner = get_job_runner()
+    job_runner.start()
+    # ファイル要約の生成（file_summary_workers 件）。LLM が未設定の場合は起動しない
+    summary_runner = get_summary_runner()
+    if llm_service.is_enabled():
+        summary_runner.start()
+    # ダッシュボードの集計を定期的に先回りして再計算する（dashboard_cache_refresh_interval_seconds。0 で無効）
+    dashboard_cache = get_dashboard_cache()
+    if settings.dashboard_cache_refresh_interval_seconds > 0:
+        dashboard_cache.start(settings.dashboard_cache_refresh_interval_seconds)
     yield
+    await dashboard_cache.stop()
+    await summary_runner.stop()
+    get_summary_runner.cache_clear()
+    await job_runner.stop()
+    get_job_runner.cache_clear()
+    await llm_service.aclose()
+    get_llm_service.cache_clear()
+    await dispose_async_engine()
 
 
 def create_app() -> FastAPI:
@@ -44,6 +76,8 @@ def create_app() -> FastAPI:
     api_router.include_router(users_router)
     api_router.include_router(files_router)
     api_router.include_router(ai_router)
+    api_router.include_router(ai_jobs_router)
+    api_router.include_router(metrics_router)
 
     application.include_router(api_router, prefix=settings.api_v1_str)
 
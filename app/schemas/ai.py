@@ -1,19 +1,51 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from datetime import datetime
+
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
+
+# 1つのプロンプトに詰める通常モードの上限（それ以上は mode="map_reduce" を使う）
+SINGLE_PROMPT_MAX_TOP = 10
 
 
 class AIAnalysisRequest(BaseModel):
     """AI分析リクエスト"""
     question: str = Field(..., description="分析したい質問（例: このファイルから失敗の原因について考察している内容をまとめる）")
     q: Optional[str] = Field(None, description="検索キーワード")
+    application: Optional[str] = Field(None, description="用途で絞り込み")
+    issue: Optional[str] = Field(None, description="課題（検索語として使用）")
+    ingredient: Optional[str] = Field(None, description="原料で絞り込み")
+    customer: Optional[str] = Field(None, description="顧客で絞り込み")
+    trial_id: Optional[str] = Field(None, description="試作IDで絞り込み")
+    author: Optional[str] = Field(None, description="作成者で絞り込み")
     sort_by: str = Field("updated_at_desc", description="ソートキー")
-    top: int = Field(3, ge=1, le=10, description="分析に使用する上位N件（デフォルト: 3）")
+    top: int = Field(3, ge=1, le=50, description="分析に使用する上位N件（デフォルト: 3。mode=single は10件まで）")
+    mode: Literal["single", "map_reduce"] = Field(
+        "single",
+        description="single: 全文書を1つのプロンプトで分析 / map_reduce: 文書ごとに要点を抜き出してから統合（多数の文書向け）",
+    )
+
+    use_summaries: bool = Field(
+        True,
+        description="取り込み時に生成したファイル要約があれば抽出データ・本文の代わりに使う（細部を問う質問では false）",
+    )
+
+    session_id: Optional[str] = Field(
+        None,
+        description="前回のレスポンスの session_id。指定すると同じ文書に対する続きの質問として検索を省く（検索条件・top は無視）",
+    )
+
+    @model_validator(mode="after")
+    def check_top_for_mode(self) -> "AIAnalysisRequest":
+        if self.mode == "single" and self.top > SINGLE_PROMPT_MAX_TOP:
+            raise ValueError(f'top must be <= {SINGLE_PROMPT_MAX_TOP} unless mode is "map_reduce"')
+        return self
 
 
 class AIAnalysisSourceFile(BaseModel):
     """AI分析で参照したファイル（ダウンロード等に利用する識別子付き）"""
     file_id: str = Field(..., description="参照したファイルID")
     original_name: str = Field(..., description="参照したファイル名")
+    pages: List[int] = Field(default_factory=list, description="参照したパッセージのページ番号（本文に改ページがある場合のみ）")
 
 
 class AIAnalysisResponse(BaseModel):
@@ -25,4 +57,35 @@ class AIAnalysisResponse(BaseModel):
         description="参照したファイル（file_id付き）。フロント側のダウンロード用途。",
     )
     error: Optional[str] = Field(None, description="エラーメッセージ（エラー時のみ）")
+    session_id: Optional[str] = Field(None, description="続きの質問で指定するセッションID")
+
+
+
+class AnalysisJobCreate(BaseModel):
+    """バッチ分析ジョブの登録リクエスト（各項目は /analyze と同じ 質問 + 検索条件）"""
+    items: List[AIAnalysisRequest] = Field(..., min_length=1, max_length=100, description="分析する 質問 + 検索条件 の一覧")
+
+
+class AnalysisJobItemRead(BaseModel):
+    """バッチ分析ジョブの1項目の状態・結果"""
+    item_no: int
+    status: str = Field(..., description="queued / running / succeeded / failed")
+    request: AIAnalysisRequest
+    answer: Optional[str] = None
+    source_files: List[AIAnalysisSourceFile] = Field(default_factory=list)
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 
+class AnalysisJobRead(BaseModel):
+    """バッチ分析ジョブの状態"""
+    id: str
+    status: str = Field(..., description="queued / running / completed / failed（全項目が失敗した場合のみ failed）")
+    total_items: int
+    done_items: int = Field(..., description="完了した項目数（失敗を含む）")
+    failed_items: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    items: List[AnalysisJobItemRead] = Field(default_factory=list)
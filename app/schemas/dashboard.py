@@ -1,3 +1,5 @@
+from datetime import date
+
 from pydantic import BaseModel
 
 
@@ -15,4 +17,21 @@ class DashboardResponse(BaseModel):
     registration_trend: list[dict[str, int | str]] = []  # 登録件数推移（日付と件数のペア）
 
 
+class AnalyticsRow(BaseModel):
+    period: str  # 日: 2026-01-31 / 週: 月曜日の日付 / 月: 2026-01 / 四半期: 2026-Q1 / 年: 2026
+    # group_by に指定した項目だけが入る（未設定のファイルの分は null）
+    application: str | None = None
+    customer: str | None = None
+    ingredient: str | None = None
+    registrations: int  # 登録数（有効なファイル）
+    downloads: int  # ダウンロード数
+
 
+class AnalyticsResponse(BaseModel):
+    start: date
+    end: date
+    granularity: str
+    group_by: list[str]
+    rows: list[AnalyticsRow]
+    total_registrations: int
+    total_downloads: int
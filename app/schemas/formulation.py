@@ -0,0 +1,16 @@
+from pydantic import BaseModel, Field
+
+
+class SimilarFormulation(BaseModel):
+    """類似配合の1件（variant 単位）"""
+    file_id: str = Field(..., description="類似配合を含むファイルID")
+    original_name: str | None = Field(None, description="ファイル名")
+    variant_id: str = Field(..., description="配合案ID（例: No.1）")
+    score: float = Field(..., description="コサイン類似度（0〜1）")
+
+
+class SimilarFormulationResponse(BaseModel):
+    """類似配合検索レスポンス"""
+    file_id: str
+    variant_id: str = Field(..., description="検索に使用した基準の配合案ID")
+    matches: list[SimilarFormulation] = Field(default_factory=list)
@@ -0,0 +1,252 @@
+"""
+バッチ分析ジョブ（/ai/jobs）。
+
+複数の 質問 + 検索条件 を1つのジョブとして登録し、各項目を analysis_job_items に保存する。
+項目はワーカープール（AnalysisJobRunner。app.main の lifespan で起動）が DB から1件ずつ取得して実行する。
+
+- 取得は条件付き UPDATE（status='queued' の行のみ running にする）で行うため、
+  uvicorn のワーカーが複数あっても同じ項目を二重に実行しない
+- running のまま analysis_job_lease_seconds を超えた項目は、ワーカーが落ちたとみなして再実行する
+- LLM の実行枠は対話的な /ai/analyze と共有し、空き待ちでは対話的なリクエストを優先する（background_priority）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.db.models.analysis_job import AnalysisJob, AnalysisJobItem
+from app.db.session import SessionLocal
+from app.schemas.ai import AIAnalysisRequest
+from app.services.analysis_service import run_analysis
+from app.services.llm_service import get_llm_service
+from app.services.search_service import SearchService
+from app.services.worker_pool import PollingWorkerPool, to_thread_to_completion
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+FINISHED_JOB_STATUSES = ("completed", "failed")
+
+AnalyzeFunc = Callable[[AIAnalysisRequest, Session], Awaitable[Dict[str, Any]]]
+
+
+class AnalysisJobService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def create(self, owner_id: int, requests: Iterable[AIAnalysisRequest]) -> AnalysisJob:
+        job = AnalysisJob(owner_id=owner_id, status="queued")
+        self.db.add(job)
+        self.db.flush()
+        for item_no, request in enumerate(requests):
+            self.db.add(AnalysisJobItem(job_id=job.id, item_no=item_no, request=request.model_dump_json()))
+            job.total_items = item_no + 1
+        self.db.commit()
+        self.db.refresh(job)
+        metrics.inc("analysis_jobs.created")
+        metrics.inc("analysis_jobs.items_created", job.total_items)
+        return job
+
+    def get(self, job_id: str, owner_id: int) -> AnalysisJob | None:
+        return (
+            self.db.query(AnalysisJob)
+            .filter(AnalysisJob.id == job_id, AnalysisJob.owner_id == owner_id)
+            .one_or_none()
+        )
+
+    def items(self, job_id: str) -> List[AnalysisJobItem]:
+        return (
+            self.db.query(AnalysisJobItem)
+            .filter(AnalysisJobItem.job_id == job_id)
+            .order_by(AnalysisJobItem.item_no)
+            .all()
+        )
+
+    # --- ワーカー用 ---
+
+    def claim_next(self) -> AnalysisJobItem | None:
+        """実行待ち（またはリース切れ）の項目を1件 running にして返す。無ければ None"""
+        now = datetime.now(timezone.utc)
+        expired = and_(
+            AnalysisJobItem.status == "running",
+            AnalysisJobItem.started_at < now - timedelta(seconds=settings.analysis_job_lease_seconds),
+        )
+        self._fail_exhausted(expired, now)
+
+        claimable = or_(AnalysisJobItem.status == "queued", expired)
+        candidates = [
+            item_id
+            for (item_id,) in self.db.query(AnalysisJobItem.id).filter(claimable).order_by(AnalysisJobItem.id).limit(5)
+        ]
+        for item_id in candidates:
+            claimed = (
+                self.db.query(AnalysisJobItem)
+                .filter(AnalysisJobItem.id == item_id, claimable)
+                .update(
+                    {"status": "running", "started_at": now, "attempts": AnalysisJobItem.attempts + 1},
+                    synchronize_session=False,
+                )
+            )
+            self.db.commit()
+            if claimed:
+                item = self.db.get(AnalysisJobItem, item_id)
+                self.db.refresh(item)
+                job = self.db.get(AnalysisJob, item.job_id)
+                if job.status == "queued":
+                    job.status = "running"
+                    job.started_at = now
+                    self.db.commit()
+                return item
+        return None
+
+    def _fail_exhausted(self, expired, now: datetime) -> None:
+        """再実行の上限に達したリース切れの項目を失敗にする"""
+        rows = (
+            self.db.query(AnalysisJobItem)
+            .filter(expired, AnalysisJobItem.attempts >= settings.analysis_job_max_attempts)
+            .all()
+        )
+        for item in rows:
+            item.status = "failed"
+            item.error = f"worker did not finish the item after {item.attempts} attempt(s)"
+            item.finished_at = now
+        if rows:
+            self.db.commit()
+            for job_id in {item.job_id for item in rows}:
+                self.refresh_job(job_id)
+
+    def finish_item(self, item_id: int, result: Dict[str, Any] | None = None, error: str | None = None) -> None:
+        item = self.db.get(AnalysisJobItem, item_id)
+        item.status = "failed" if error else "succeeded"
+        item.answer = result.get("answer") if result else None
+        item.source_files = json.dumps(result.get("source_files") or [], ensure_ascii=False) if result else None
+        item.error = error
+        item.finished_at = datetime.now(timezone.utc)
+        self.db.commit()
+        metrics.inc("analysis_jobs.items_failed" if error else "analysis_jobs.items_succeeded")
+        self.refresh_job(item.job_id)
+
+    def requeue_item(self, item_id: int) -> None:
+        """シャットダウンで中断した項目を実行待ちに戻す（試行回数には数えない）。中断した処理の変更は捨てる"""
+        self.db.rollback()
+        self.db.query(AnalysisJobItem).filter(AnalysisJobItem.id == item_id, AnalysisJobItem.status == "running").update(
+            {"status": "queued", "started_at": None, "attempts": AnalysisJobItem.attempts - 1},
+            synchronize_session=False,
+        )
+        self.db.commit()
+
+    def refresh_job(self, job_id: str) -> None:
+        """項目の状態からジョブの件数・状態を更新する"""
+        counts = dict(
+            self.db.query(AnalysisJobItem.status, func.count())
+            .filter(AnalysisJobItem.job_id == job_id)
+            .group_by(AnalysisJobItem.status)
+            .all()
+        )
+        job = self.db.get(AnalysisJob, job_id)
+        job.failed_items = counts.get("failed", 0)
+        job.done_items = counts.get("succeeded", 0) + job.failed_items
+        if job.done_items >= job.total_items:
+            job.status = "failed" if job.failed_items == job.total_items else "completed"
+            job.finished_at = job.finished_at or datetime.now(timezone.utc)
+        self.db.commit()
+
+    # --- 表示用 ---
+
+    @staticmethod
+    def item_to_dict(item: AnalysisJobItem) -> Dict[str, Any]:
+        return {
+            "item_no": item.item_no,
+            "status": item.status,
+            "request": json.loads(item.request),
+            "answer": item.answer,
+            "source_files": json.loads(item.source_files) if item.source_files else [],
+            "error": item.error,
+            "started_at": item.started_at,
+            "finished_at": item.finished_at,
+        }
+
+    def to_dict(self, job: AnalysisJob, include_items: bool = True) -> Dict[str, Any]:
+        return {
+            "id": job.id,
+            "status": job.status,
+            "total_items": job.total_items,
+            "done_items": job.done_items,
+            "failed_items": job.failed_items,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "items": [self.item_to_dict(item) for item in self.items(job.id)] if include_items else [],
+        }
+
+
+async def _default_analyze(request: AIAnalysisRequest, db: Session) -> Dict[str, Any]:
+    search_service = SearchService()
+    if not search_service.is_enabled():
+        raise RuntimeError("Azure Search is not configured.")
+    llm_service = get_llm_service()
+    if not llm_service.is_enabled():
+        raise RuntimeError("LLM service is not configured.")
+    return await run_analysis(request, db, search_service, llm_service)
+
+
+class AnalysisJobRunner(PollingWorkerPool):
+    """バッチ分析ジョブのワーカープール。登録直後は notify() で即時に起こす"""
+
+    name = "analysis-job-worker"
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        analyze: AnalyzeFunc = _default_analyze,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        super().__init__(
+            settings.analysis_job_workers if workers is None else workers,
+            settings.analysis_job_poll_seconds,
+            session_factory,
+        )
+        self.analyze = analyze
+
+    def claim(self) -> tuple[int, str] | None:
+        db = self.session_factory()
+        try:
+            item = AnalysisJobService(db).claim_next()
+            return (item.id, item.request) if item else None
+        finally:
+            db.close()
+
+    async def run_item(self, claimed: tuple[int, str]) -> None:
+        item_id, request_json = claimed
+        db = self.session_factory()
+        service = AnalysisJobService(db)
+        try:
+            request = AIAnalysisRequest.model_validate_json(request_json)
+            result = await self.analyze(request, db)
+        except asyncio.CancelledError:
+            await to_thread_to_completion(service.requeue_item, item_id)
+            raise
+        except Exception as e:
+            logger.warning("Analysis job item %d failed: %s", item_id, e)
+            db.rollback()
+            await asyncio.to_thread(service.finish_item, item_id, None, str(e) or type(e).__name__)
+        else:
+            await asyncio.to_thread(service.finish_item, item_id, result)
+        finally:
+            db.close()
+
+
+@lru_cache
+def get_job_runner() -> AnalysisJobRunner:
+    """ワーカー内で共有する AnalysisJobRunner を返す"""
+    return AnalysisJobRunner()
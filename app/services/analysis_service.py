@@ -0,0 +1,210 @@
+"""
+AI分析のパイプライン（検索 → 再ランキング → LLM 用コンテキスト構築（要約 / 抽出データ / 本文） → 回答生成）。
+
+/ai/analyze・/ai/analyze/stream（routes_ai）とバッチ分析ジョブ（analysis_job_service）で共通に使う。
+HTTP のエラー変換（503 など）は呼び出し側で行う。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.schemas.ai import AIAnalysisRequest
+from app.services.analysis_session_service import AnalysisSession
+from app.services.answer_cache_service import AnswerCacheService
+from app.services.chunking_service import ChunkService, format_passages, get_chunk_index_queue, passage_pages
+from app.services.extraction_service import get_llm_contexts
+from app.services.file_summary_service import FileSummaryService
+from app.services.llm_service import LLMService
+from app.services.map_reduce_service import MapReduceAnalyzer
+from app.services.rerank_service import rerank_candidates
+from app.services.search_service import SearchService
+
+settings = get_settings()
+
+NO_RESULTS_MESSAGE = "検索結果が見つかりませんでした。検索条件を変更して再度お試しください。"
+
+
+async def build_docs_for_llm(
+    request: AIAnalysisRequest, db: Session, search_service: SearchService
+) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    検索とコンテキスト構築
+
+    Returns:
+        (docs_for_llm, context_info)  context_info は mode / summary_count / extraction_count / content_count
+    """
+    # 1. 検索サービスで上位N件を取得
+    #    再ランキングが有効な場合は content を含まない候補を多めに取得し、BM25 で上位N件に絞ってから content を取得する
+    rerank = settings.rag_rerank_enabled
+    search_results = await asyncio.to_thread(
+        search_service.search_for_rag,
+        query=request.q,
+        application=request.application,
+        issue=request.issue,
+        ingredient=request.ingredient,
+        customer=request.customer,
+        trial_id=request.trial_id,
+        author=request.author,
+        sort_by=request.sort_by,
+        top=max(settings.rag_rerank_candidates, request.top) if rerank else request.top,
+        include_content=not rerank,
+    )
+
+    # 取り込み時に生成したファイル要約（ready のもの）があれば最優先で使う（content の取得も不要）
+    summaries: Dict[str, str] = {}
+    if settings.rag_use_file_summaries and request.use_summaries and search_results:
+        candidate_ids = [str(fid) for doc in search_results if (fid := doc.get("id") or doc.get("file_id"))]
+        summaries = await asyncio.to_thread(FileSummaryService(db).get_summaries, candidate_ids)
+
+    if rerank and search_results:
+        search_results = await asyncio.to_thread(
+            rerank_candidates,
+            db,
+            f"{request.question} {request.q or ''}",
+            search_results,
+            request.top,
+            search_service.get_contents,
+            summaries.keys(),
+        )
+
+    # 2. 要約 → 抽出データ → 本文 の順にLLM用コンテキストを構築
+    #    抽出が無い場合は本文（content）をパッセージに分割し、質問に関係の深い部分だけをページ番号付きで渡す
+    #    文書ごとの長さはプロンプト生成時にトークン予算（llm_context_window）に合わせて調整する
+    used_summary = 0
+    used_ex = 0
+    used_content = 0
+    docs_for_llm = []
+    file_ids = [
+        str(fid) for doc in search_results if (fid := doc.get("id") or doc.get("file_id")) and str(fid) not in summaries
+    ]
+    # 同期DBアクセスはイベントループを塞がないようスレッドで実行
+    contexts = await asyncio.to_thread(get_llm_contexts, db, file_ids) if file_ids else {}
+    fallback = {
+        str(fid): doc.get("content") or ""
+        for doc in search_results
+        if (fid := doc.get("id") or doc.get("file_id")) and str(fid) not in contexts and str(fid) not in summaries
+    }
+    # 索引が無い/古いファイルの索引の作成はリクエストとは別のスレッドに任せる（分析時は保存しない）
+    chunk_service = ChunkService(db, index_queue=get_chunk_index_queue())
+    passages = (
+        await asyncio.to_thread(chunk_service.best_passages, f"{request.question} {request.q or ''}", fallback)
+        if fallback
+        else {}
+    )
+    for doc in search_results:
+        file_id = doc.get("id") or doc.get("file_id")
+        original_name = doc.get("original_name") or doc.get("file_name") or file_id or "unknown"
+
+        summary = summaries.get(str(file_id)) if file_id else None
+        ex_text = contexts.get(str(file_id)) if file_id else None
+        pages: list[int] = []
+        if summary:
+            used_summary += 1
+            content = summary
+        elif ex_text:
+            used_ex += 1
+            content = ex_text
+        elif file_id and passages.get(str(file_id)):
+            used_content += 1
+            content = format_passages(passages[str(file_id)])
+            pages = passage_pages(passages[str(file_id)])
+        else:
+            used_content += 1
+            content = doc.get("content") or ""
+
+        docs_for_llm.append(
+            {
+                "file_id": str(file_id) if file_id else "",
+                "original_name": original_name,
+                "content": content,
+                "score": doc.get("score"),
+                "pages": pages,
+            }
+        )
+
+    used = {"summary": used_summary, "extraction": used_ex, "content": used_content}
+    kinds = [kind for kind, count in used.items() if count]
+    mode = kinds[0] if len(kinds) == 1 else "mixed" if kinds else "none"
+
+    return docs_for_llm, {
+        "mode": mode,
+        "summary_count": used_summary,
+        "extraction_count": used_ex,
+        "content_count": used_content,
+    }
+
+
+def source_fields(docs_for_llm: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "sources": [d.get("original_name", "") for d in docs_for_llm if d.get("original_name")],
+        "source_files": [
+            {"file_id": d.get("file_id", ""), "original_name": d.get("original_name", ""), "pages": d.get("pages") or []}
+            for d in docs_for_llm
+            if d.get("file_id") and d.get("original_name")
+        ],
+    }
+
+
+def cache_namespace(request: AIAnalysisRequest, history: List[tuple[str, str]] | None = None) -> str:
+    namespace = "map_reduce" if request.mode == "map_reduce" else "analyze"
+    if history:
+        # 会話の続きは過去のやり取りによって回答が変わるため、履歴ごとに別のキーにする
+        digest = hashlib.sha1(json.dumps(history, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        namespace = f"{namespace}:{digest}"
+    return namespace
+
+
+async def generate_answer(
+    request: AIAnalysisRequest,
+    db: Session,
+    llm_service: LLMService,
+    docs_for_llm: List[Dict[str, Any]],
+    session: AnalysisSession | None = None,
+) -> tuple[Dict[str, Any], str]:
+    """
+    回答キャッシュを通して回答を生成する（map_reduce は文書ごとの要点抽出 → 統合）
+    session を渡した場合は保存済みの参照ドキュメントと会話履歴を使う。
+
+    Returns:
+        (result, cache_status)  result は generate_response と同じ形式
+    """
+    history = session.prompt_history() if session else []
+    if request.mode == "map_reduce":
+        analyzer = MapReduceAnalyzer(db, llm_service)
+        generate = lambda: analyzer.analyze(request.question, docs_for_llm, history=history)  # noqa: E731
+    else:
+        # トークン数の計算・近似重複の除去を含むため、イベントループを止めないようスレッドで行う
+        context_text = (
+            await asyncio.to_thread(session.ensure_context, llm_service, request.question) if session else None
+        )
+        generate = lambda: llm_service.generate_response(  # noqa: E731
+            request.question, docs_for_llm, context_text=context_text, history=history
+        )
+    return await AnswerCacheService(db).get_or_generate(
+        request.question, docs_for_llm, generate, namespace=cache_namespace(request, history)
+    )
+
+
+async def run_analysis(
+    request: AIAnalysisRequest, db: Session, search_service: SearchService, llm_service: LLMService
+) -> Dict[str, Any]:
+    """
+    検索から回答生成までを通して実行する（バッチ分析ジョブ用）。LLM のエラーは RuntimeError で送出する。
+
+    Returns:
+        {"answer": str, "sources": [...], "source_files": [...]}
+    """
+    docs_for_llm, _ = await build_docs_for_llm(request, db, search_service)
+    if not docs_for_llm:
+        return {"answer": NO_RESULTS_MESSAGE, "sources": [], "source_files": []}
+    result, _ = await generate_answer(request, db, llm_service, docs_for_llm)
+    if result.get("error"):
+        raise RuntimeError(f"LLM processing failed: {result['error']}")
+    return {"answer": result["answer"], **source_fields(docs_for_llm)}
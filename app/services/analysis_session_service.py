@@ -0,0 +1,105 @@
+"""
+AI分析の会話セッション（同じ文書に対する続きの質問）。
+
+最初の /ai/analyze で検索・コンテキスト構築した文書と、トークン予算に詰めて整形した参照ドキュメント部分を
+セッションに保存し、session_id を指定した続きの質問では検索・抽出データの読み込み・詰め込みを省く。
+プロンプトの先頭（システムプロンプト + 参照ドキュメント）が毎回同じになるため、
+プロバイダ側のプロンプトキャッシュ（Azure OpenAI / Gemini の先頭一致キャッシュ）も効く。
+
+セッションはワーカーごとのメモリに保持し、最終利用から analysis_session_ttl_seconds で期限切れ、
+analysis_session_max_entries を超えた分は最も長く使われていないものから破棄する。
+別ワーカーに振り分けられた・期限切れの場合は新しいセッションとして検索からやり直す。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List
+from uuid import uuid4
+
+from app.core.cache import LRUCache
+from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.services.context_packer import estimate_tokens, truncate_to_tokens
+from app.services.llm_service import LLMService
+
+settings = get_settings()
+
+
+@dataclass
+class AnalysisSession:
+    id: str
+    owner_id: int
+    docs: List[Dict[str, Any]]
+    context_info: Dict[str, Any]
+    # render_context 済みの参照ドキュメント（mode="single" の最初の回答時に作る）
+    context_text: str | None = None
+    history: List[tuple[str, str]] = field(default_factory=list)
+
+    def ensure_context(self, llm: LLMService, question: str) -> str:
+        """参照ドキュメントを詰めて保存する。会話履歴の分（analysis_session_history_tokens）は空けておく"""
+        if self.context_text is None:
+            packed = llm.pack_context(question, self.docs, reserve_tokens=settings.analysis_session_history_tokens)
+            self.context_text = llm.render_context(packed)
+        return self.context_text
+
+    def prompt_history(self) -> List[tuple[str, str]]:
+        """プロンプトに含める直近の会話（analysis_session_history_tokens に収まる分。古いものから落とす）"""
+        budget = settings.analysis_session_history_tokens
+        per_answer = max(budget // 3, 1)
+        turns: List[tuple[str, str]] = []
+        used = 0
+        for question, answer in reversed(self.history):
+            answer = truncate_to_tokens(answer, per_answer)
+            cost = estimate_tokens(question) + estimate_tokens(answer)
+            if used + cost > budget:
+                break
+            turns.append((question, answer))
+            used += cost
+        return turns[::-1]
+
+    def add_turn(self, question: str, answer: str) -> None:
+        self.history.append((question, answer))
+        del self.history[: -settings.analysis_session_max_turns]
+
+
+class AnalysisSessionStore:
+    """LRU + TTL（最終利用から）のセッション置き場。スレッドセーフ。clock は経過時間の計測用（既定 time.monotonic）"""
+
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        ttl_seconds: float | None = None,
+        clock: Callable[[], float] | None = None,
+    ) -> None:
+        self._sessions: "LRUCache[str, AnalysisSession]" = LRUCache(
+            settings.analysis_session_max_entries if max_entries is None else max_entries,
+            settings.analysis_session_ttl_seconds if ttl_seconds is None else ttl_seconds,
+            sliding=True,
+            clock=clock,
+            metrics_prefix="analysis_sessions",
+        )
+
+    def create(self, owner_id: int, docs: List[Dict[str, Any]], context_info: Dict[str, Any]) -> AnalysisSession:
+        session = AnalysisSession(id=str(uuid4()), owner_id=owner_id, docs=docs, context_info=context_info)
+        self._sessions.set(session.id, session)
+        metrics.inc("analysis_sessions.created")
+        return session
+
+    def get(self, session_id: str, owner_id: int) -> AnalysisSession | None:
+        """有効なセッションを返す（他のユーザーのセッションは None）"""
+        session = self._sessions.get(session_id)
+        if session is None or session.owner_id != owner_id:
+            return None
+        metrics.inc("analysis_sessions.reused")
+        return session
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+@lru_cache
+def get_session_store() -> AnalysisSessionStore:
+    """ワーカー内で共有するセッション置き場を返す"""
+    return AnalysisSessionStore()
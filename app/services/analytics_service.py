@@ -0,0 +1,273 @@
+"""
+ダッシュボード分析 API（任意の期間・粒度で、用途/顧客/成分ごとの登録数・ダウンロード数の推移を返す）。
+
+集計は日 × 用途 × 顧客 × 成分のキューブ（file_stats_daily）から読むため、四半期・年単位の期間でも
+読む行数は「日数 × 該当する組み合わせ数」で済み、files / file_downloads の行数に依存しない。
+キューブはファイルの登録・メタデータ変更・削除とダウンロードの記録と同じトランザクションで更新する
+（導入時・集計がずれた場合は scripts/rollup_daily_stats.py --rebuild で作り直す）。
+同じ条件の問い合わせはワーカー内で analytics_cache_ttl_seconds の間キャッシュする。
+
+メトリクス: analytics_cache.hit / miss、ヒストグラム analytics.query_ms（キャッシュに無い場合の集計時間）。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.cache import LRUCache
+from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.db.models.daily_rollup import FileDownloadDaily, FileStatsDaily
+from app.db.models.file import File
+from app.db.upsert import update_or_insert
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+DIMENSIONS = ("application", "customer", "ingredient")
+GRANULARITIES = ("day", "week", "month", "quarter", "year")
+
+Dims = Tuple[str, str, str]
+
+
+def dims_of(file_obj: Any) -> Dims:
+    """ファイルの (用途, 顧客, 成分)。未設定は空文字"""
+    return tuple(getattr(file_obj, name) or "" for name in DIMENSIONS)  # type: ignore[return-value]
+
+
+def dims_hash(dims: Dims) -> str:
+    return hashlib.sha1("\x1f".join(dims).encode("utf-8")).hexdigest()
+
+
+def period_of(day: date, granularity: str) -> str:
+    """集計期間のラベル（週は月曜日の日付、四半期は 2026-Q1 の形式）。文字列の順序が期間の順序になる"""
+    if granularity == "day":
+        return day.isoformat()
+    if granularity == "week":
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if granularity == "month":
+        return f"{day.year}-{day.month:02d}"
+    if granularity == "quarter":
+        return f"{day.year}-Q{(day.month - 1) // 3 + 1}"
+    if granularity == "year":
+        return str(day.year)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+@dataclass(frozen=True)
+class FileStatsState:
+    """キューブに計上しているファイルの状態（変更前後の差分を求めるために使う）"""
+
+    file_id: str
+    active: bool
+    created_day: date | None
+    dims: Dims
+
+
+@dataclass(frozen=True)
+class AnalyticsQuery:
+    """分析 API の条件（応答キャッシュのキーにもなる）。start・end は両端を含む"""
+
+    start: date
+    end: date
+    granularity: str = "month"
+    group_by: Tuple[str, ...] = ()
+    application: str | None = None
+    customer: str | None = None
+    ingredient: str | None = None
+
+
+class AnalyticsCache:
+    """条件ごとの応答キャッシュ（ワーカー内。TTL と件数上限つき）"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._entries: "LRUCache[AnalyticsQuery, Dict[str, Any]]" = LRUCache(max_entries, ttl_seconds)
+
+    def get_or_compute(self, key: AnalyticsQuery, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        value = self._entries.get(key)
+        if value is not None:
+            metrics.inc("analytics_cache.hit")
+            return value
+        metrics.inc("analytics_cache.miss")
+        value = compute()
+        self._entries.set(key, value)
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@lru_cache
+def get_analytics_cache() -> AnalyticsCache:
+    return AnalyticsCache(settings.analytics_cache_max_entries, settings.analytics_cache_ttl_seconds)
+
+
+class AnalyticsService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _increment(self, day: date, dims: Dims, registrations: int = 0, downloads: int = 0) -> None:
+        """キューブの行に加算する（行が無ければ作る）。commit は呼び出し側で行う"""
+        if not registrations and not downloads:
+            return
+        key = dims_hash(dims)
+        query = self.db.query(FileStatsDaily).filter(FileStatsDaily.day == day, FileStatsDaily.dims_hash == key)
+        values = {
+            "registrations": FileStatsDaily.registrations + registrations,
+            "downloads": FileStatsDaily.downloads + downloads,
+        }
+
+        def new_row() -> FileStatsDaily:
+            return FileStatsDaily(
+                day=day,
+                dims_hash=key,
+                application=dims[0],
+                customer=dims[1],
+                ingredient=dims[2],
+                registrations=registrations,
+                downloads=downloads,
+            )
+
+        update_or_insert(self.db, query, values, new_row if registrations > 0 or downloads > 0 else None)
+
+    # --- 更新時のフック（commit は呼び出し側で行う） ---
+
+    @staticmethod
+    def file_state(file_obj: File) -> FileStatsState:
+        created_at = file_obj.created_at
+        return FileStatsState(
+            file_id=file_obj.id,
+            active=file_obj.status == "active",
+            created_day=created_at.date() if isinstance(created_at, datetime) else created_at,
+            dims=dims_of(file_obj),
+        )
+
+    def sync_file(self, old: FileStatsState | None, file_obj: File | None) -> None:
+        """
+        ファイルの登録（old=None）・変更・削除（file_obj=None）をキューブに反映する。
+        用途・顧客・成分が変わった場合や削除時は、そのファイルの過去のダウンロード数も移し替える（引く）。
+        """
+        new = self.file_state(file_obj) if file_obj is not None else None
+        if old == new:
+            return
+        for state, sign in ((old, -1), (new, 1)):
+            if state is not None and state.active and state.created_day is not None:
+                self._increment(state.created_day, state.dims, registrations=sign)
+
+        if old is None or (new is not None and new.dims == old.dims):
+            return
+        rows = (
+            self.db.query(FileDownloadDaily.day, FileDownloadDaily.count)
+            .filter(FileDownloadDaily.file_id == old.file_id)
+            .all()
+        )
+        for day, count in rows:
+            self._increment(day, old.dims, downloads=-count)
+            if new is not None:
+                self._increment(day, new.dims, downloads=count)
+
+    def record_download(self, file_obj: File, downloaded_at: datetime | date) -> None:
+        day = downloaded_at.date() if isinstance(downloaded_at, datetime) else downloaded_at
+        self._increment(day, dims_of(file_obj), downloads=1)
+
+    # --- 問い合わせ ---
+
+    def get_analytics(self, query: AnalyticsQuery) -> Dict[str, Any]:
+        """応答キャッシュを通して集計する"""
+        return get_analytics_cache().get_or_compute(query, lambda: self.compute(query))
+
+    def compute(self, query: AnalyticsQuery) -> Dict[str, Any]:
+        """キューブを期間・グループで集計する（日ごとに SQL で合計し、期間の粒度へのまとめは Python で行う）"""
+        started = time.perf_counter()
+        columns = [getattr(FileStatsDaily, name) for name in query.group_by]
+        q = self.db.query(
+            FileStatsDaily.day,
+            *columns,
+            func.sum(FileStatsDaily.registrations),
+            func.sum(FileStatsDaily.downloads),
+        ).filter(FileStatsDaily.day >= query.start, FileStatsDaily.day <= query.end)
+        for name in DIMENSIONS:
+            value = getattr(query, name)
+            if value is not None:
+                q = q.filter(getattr(FileStatsDaily, name) == value)
+
+        buckets: Dict[tuple, List[int]] = {}
+        for row in q.group_by(FileStatsDaily.day, *columns).all():
+            key = (period_of(row[0], query.granularity), *row[1 : 1 + len(columns)])
+            acc = buckets.setdefault(key, [0, 0])
+            acc[0] += int(row[-2] or 0)
+            acc[1] += int(row[-1] or 0)
+
+        rows = []
+        for key in sorted(buckets):
+            registrations, downloads = buckets[key]
+            if not registrations and not downloads:
+                continue
+            row: Dict[str, Any] = {"period": key[0]}
+            row.update({name: value or None for name, value in zip(query.group_by, key[1:])})
+            row.update(registrations=registrations, downloads=downloads)
+            rows.append(row)
+        metrics.observe("analytics.query_ms", (time.perf_counter() - started) * 1000)
+        return {
+            "start": query.start.isoformat(),
+            "end": query.end.isoformat(),
+            "granularity": query.granularity,
+            "group_by": list(query.group_by),
+            "rows": rows,
+            "total_registrations": sum(r["registrations"] for r in rows),
+            "total_downloads": sum(r["downloads"] for r in rows),
+        }
+
+    # --- 作り直し ---
+
+    def rebuild(self, batch_size: int = 5000) -> int:
+        """files と file_download_daily からキューブを作り直す（ダウンロードは圧縮済みの日も含む）。行数を返す"""
+        cube: Dict[tuple[date, Dims], List[int]] = {}
+        file_dims: Dict[str, Dims] = {}
+        for file_obj in (
+            self.db.query(File.id, File.status, File.created_at, File.application, File.customer, File.ingredient)
+            .yield_per(batch_size)
+        ):
+            state = self.file_state(file_obj)
+            file_dims[state.file_id] = state.dims
+            if state.active and state.created_day is not None:
+                cube.setdefault((state.created_day, state.dims), [0, 0])[0] += 1
+        for file_id, day, count in (
+            self.db.query(FileDownloadDaily.file_id, FileDownloadDaily.day, FileDownloadDaily.count)
+            .yield_per(batch_size)
+        ):
+            dims = file_dims.get(str(file_id))
+            if dims is not None:
+                cube.setdefault((day, dims), [0, 0])[1] += count
+
+        self.db.query(FileStatsDaily).delete(synchronize_session=False)
+        items = [
+            {
+                "day": day,
+                "dims_hash": dims_hash(dims),
+                "application": dims[0],
+                "customer": dims[1],
+                "ingredient": dims[2],
+                "registrations": registrations,
+                "downloads": downloads,
+            }
+            for (day, dims), (registrations, downloads) in cube.items()
+        ]
+        for i in range(0, len(items), batch_size):
+            self.db.bulk_insert_mappings(FileStatsDaily, items[i : i + batch_size])
+        self.db.commit()
+        get_analytics_cache().clear()
+        logger.info("Rebuilt analytics cube: %d rows from %d files", len(items), len(file_dims))
+        return len(items)
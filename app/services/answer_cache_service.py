@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.db.models.file import File
+from app.db.models.file_extraction import FileExtraction
+from app.db.models.llm_answer_cache import LLMAnswerCache
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def normalize_question(question: str) -> str:
+    """全角/半角・大文字小文字・空白の違いを吸収する"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", question)).strip().lower()
+
+
+class AnswerCacheService:
+    """
+    AI分析の回答キャッシュ（llm_answer_cache テーブル）。
+
+    - キー: 正規化した質問 + 参照ファイルIDの並び + 各ファイルの版 + モデル名
+    - 版: files.updated_at / file_extractions.updated_at / LLM に渡す本文のハッシュ
+      （ファイル更新・再抽出で版が変わるため、古い回答は自動的に使われなくなる）
+    - 同一キーの同時リクエストはプロセス内で1回の LLM 呼び出しにまとめる
+      （先行リクエストが取り消された場合は、待っていたリクエストの1つが生成し直す）
+    - ヒット時は書き込まない。hit_count はプロセス内で数えておき、次の store でまとめて加算する（ベストエフォート）
+    - 期限切れエントリの削除は llm_answer_cache_prune_interval_seconds に1回（ワーカーごと）。保存は1件の upsert のみ
+    """
+
+    _inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+    _pending_hits: Counter = Counter()
+    _pending_hits_lock = threading.Lock()
+    _last_pruned = float("-inf")  # time.monotonic()
+    _prune_lock = threading.Lock()
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    # --- キー生成 ---
+
+    def source_versions(self, docs: List[Dict[str, Any]]) -> List[str]:
+        file_ids = [d["file_id"] for d in docs if d.get("file_id")]
+        rows = (
+            self.db.query(File.id, File.updated_at, FileExtraction.updated_at)
+            .outerjoin(FileExtraction, FileExtraction.file_id == File.id)
+            .filter(File.id.in_(file_ids))
+            .all()
+            if file_ids
+            else []
+        )
+        updated = {str(fid): f"{f_at}|{ex_at}" for fid, f_at, ex_at in rows}
+
+        versions = []
+        for d in docs:
+            digest = hashlib.sha1((d.get("content") or "").encode("utf-8")).hexdigest()[:16]
+            versions.append(f"{d.get('file_id', '')}@{updated.get(d.get('file_id', ''), '-')}#{digest}")
+        return versions
+
+    def make_key(self, question: str, docs: List[Dict[str, Any]], namespace: str = "analyze") -> str:
+        material = json.dumps(
+            [namespace, settings.llm_provider, settings.llm_model, normalize_question(question), self.source_versions(docs)],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    # --- 読み書き ---
+
+    def lookup(self, key: str) -> Dict[str, Any] | None:
+        """有効なエントリがあれば {"answer", "prompt_tokens", "completion_tokens"} を返す（ヒットとして記録する）"""
+        now = datetime.now(timezone.utc)
+        row = (
+            self.db.query(LLMAnswerCache)
+            .filter(LLMAnswerCache.cache_key == key, LLMAnswerCache.expires_at > now)
+            .one_or_none()
+        )
+        if row is None:
+            return None
+        entry = {
+            "answer": row.answer,
+            "prompt_tokens": row.prompt_tokens,
+            "completion_tokens": row.completion_tokens,
+        }
+        with self._pending_hits_lock:
+            self._pending_hits[key] += 1
+        metrics.inc("llm_answer_cache.hit")
+        metrics.inc("llm_answer_cache.saved_prompt_tokens", entry["prompt_tokens"])
+        metrics.inc("llm_answer_cache.saved_completion_tokens", entry["completion_tokens"])
+        return entry
+
+    def store(self, key: str, question: str, docs: List[Dict[str, Any]], result: Dict[str, Any]) -> None:
+        now = datetime.now(timezone.utc)
+        usage = result.get("usage") or {}
+        row = self.db.get(LLMAnswerCache, key) or LLMAnswerCache(cache_key=key)
+        row.question = question
+        row.source_file_ids = ",".join(d.get("file_id", "") for d in docs)
+        row.answer = result.get("answer") or ""
+        row.prompt_tokens = usage.get("prompt_tokens", 0)
+        row.completion_tokens = usage.get("completion_tokens", 0)
+        row.hit_count = 0
+        row.expires_at = now + timedelta(seconds=settings.llm_answer_cache_ttl_seconds)
+        self.db.merge(row)
+        self._flush_hits(exclude=key)
+        self.db.commit()
+        if self._prune_due():
+            self.prune_expired()
+
+    @classmethod
+    def _prune_due(cls) -> bool:
+        """前回の削除から llm_answer_cache_prune_interval_seconds 経っていれば True（このワーカーで1回だけ）"""
+        now = time.monotonic()
+        with cls._prune_lock:
+            if now - cls._last_pruned < settings.llm_answer_cache_prune_interval_seconds:
+                return False
+            cls._last_pruned = now
+            return True
+
+    def prune_expired(self) -> int:
+        """期限切れエントリを削除する（expires_at はインデックス付き）。削除した件数を返す"""
+        try:
+            deleted = (
+                self.db.query(LLMAnswerCache)
+                .filter(LLMAnswerCache.expires_at <= datetime.now(timezone.utc))
+                .delete(synchronize_session=False)
+            )
+            self.db.commit()
+        except Exception as e:
+            # 保存は済んでいる。次の間隔で再試行する
+            self.db.rollback()
+            logger.warning("Failed to prune LLM answer cache: %s", e)
+            return 0
+        metrics.inc("llm_answer_cache.pruned", deleted)
+        return deleted
+
+    def _flush_hits(self, exclude: str | None = None) -> None:
+        """溜まったヒット数を加算する（コミットは呼び出し側）。exclude は作り直すエントリ"""
+        with self._pending_hits_lock:
+            pending = dict(self._pending_hits)
+            self._pending_hits.clear()
+        pending.pop(exclude, None)
+        for key, hits in pending.items():
+            self.db.execute(
+                update(LLMAnswerCache)
+                .where(LLMAnswerCache.cache_key == key)
+                .values(hit_count=LLMAnswerCache.hit_count + hits)
+            )
+
+    # --- 取得 or 生成 ---
+
+    async def get_or_generate(
+        self,
+        question: str,
+        docs: List[Dict[str, Any]],
+        generate: Callable[[], Awaitable[Dict[str, Any]]],
+        namespace: str = "analyze",
+    ) -> tuple[Dict[str, Any], str]:
+        """
+        Returns:
+            (result, status)  status は "hit" / "miss" / "coalesced" / "disabled"
+        """
+        if not settings.llm_answer_cache_enabled:
+            return await generate(), "disabled"
+
+        key = await asyncio.to_thread(self.make_key, question, docs, namespace)
+
+        while (inflight := self._inflight.get(key)) is not None:
+            try:
+                result = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # 先行リクエストだけが取り消された（クライアントの切断など）場合は、このリクエストが生成し直す
+                if inflight.cancelled() and not asyncio.current_task().cancelling():
+                    metrics.inc("llm_answer_cache.leader_cancelled")
+                    continue
+                raise
+            metrics.inc("llm_answer_cache.coalesced")
+            usage = result.get("usage") or {}
+            metrics.inc("llm_answer_cache.saved_prompt_tokens", usage.get("prompt_tokens", 0))
+            metrics.inc("llm_answer_cache.saved_completion_tokens", usage.get("completion_tokens", 0))
+            return result, "coalesced"
+
+        future: asyncio.Future[Dict[str, Any]] = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            cached = await asyncio.to_thread(self.lookup, key)
+            if cached is not None:
+                result = {"answer": cached["answer"], "usage": {}, "error": None}
+                future.set_result(result)
+                return result, "hit"
+
+            metrics.inc("llm_answer_cache.miss")
+            result = await generate()
+            if not result.get("error"):
+                try:
+                    await asyncio.to_thread(self.store, key, question, docs, result)
+                except Exception as e:
+                    logger.warning("Failed to store LLM answer cache: %s", e)
+                    self.db.rollback()
+            future.set_result(result)
+            return result, "miss"
+        except BaseException as e:
+            if not future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    future.exception()  # 待ち手がいない場合の未取得警告を抑止
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def stats() -> Dict[str, float]:
+        hit = metrics.counter("llm_answer_cache.hit")
+        coalesced = metrics.counter("llm_answer_cache.coalesced")
+        miss = metrics.counter("llm_answer_cache.miss")
+        total = hit + coalesced + miss
+        return {
+            "requests": total,
+            "hit": hit,
+            "coalesced": coalesced,
+            "miss": miss,
+            "hit_rate": (hit + coalesced) / total if total else 0.0,
+            "saved_prompt_tokens": metrics.counter("llm_answer_cache.saved_prompt_tokens"),
+            "saved_completion_tokens": metrics.counter("llm_answer_cache.saved_completion_tokens"),
+        }
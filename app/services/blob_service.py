@@ -1,6 +1,7 @@
 import asyncio
 import logging
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, Tuple
 
@@ -20,6 +21,12 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+@lru_cache
+def _shared_sync_client(connection_string: str) -> SyncBlobServiceClient:
+    """同期クライアントはプロセス共通（スレッドセーフ・接続プールを再利用する）"""
+    return SyncBlobServiceClient.from_connection_string(connection_string)
+
+
 class BlobService:
     def __init__(self, container_name: str | None = None):
         self.use_local_storage = settings.app_env == "development"
@@ -29,8 +36,8 @@ class BlobService:
             self.storage_path.mkdir(parents=True, exist_ok=True)
 
         self._connection_string = settings.azure_storage_connection_string
+        # 非同期クライアントはイベントループに紐づくため BlobService ごとに作って close() で閉じる
         self._async_client: AsyncBlobServiceClient | None = None
-        self._sync_client: SyncBlobServiceClient | None = None
         self._container_initialized = False
 
     async def __aenter__(self):
@@ -42,8 +49,6 @@ class BlobService:
     async def close(self) -> None:
         if self._async_client:
             await self._async_client.close()
-        if self._sync_client:
-            self._sync_client.close()
 
     def _get_async_client(self) -> AsyncBlobServiceClient:
         if not self._async_client:
@@ -51,9 +56,7 @@ class BlobService:
         return self._async_client
 
     def _get_sync_client(self) -> SyncBlobServiceClient:
-        if not self._sync_client:
-            self._sync_client = SyncBlobServiceClient.from_connection_string(self._connection_string)
-        return self._sync_client
+        return _shared_sync_client(self._connection_string)
 
     def make_blob_path(self, blob_name: str) -> str:
         return f"{self.container_name}/{blob_name}"
@@ -159,6 +162,45 @@ class BlobService:
         stream = await blob_client.download_blob()
         return await stream.readall()
 
+    def upload_bytes_sync(self, blob_name: str, data: bytes, *, content_type: str | None = None) -> str:
+        """同期版アップロード（同期サービス層から小さなバイト列を保存する用途）"""
+        if self.use_local_storage:
+            (self.storage_path / blob_name).write_bytes(data)
+            return self.make_blob_path(blob_name)
+
+        container_client = self._get_sync_client().get_container_client(self.container_name)
+        if not self._container_initialized:
+            if not container_client.exists():
+                logger.info("Creating container '%s'", self.container_name)
+                container_client.create_container()
+            self._container_initialized = True
+        container_client.upload_blob(
+            blob_name,
+            data,
+            overwrite=True,
+            content_settings=ContentSettings(content_type=content_type),
+        )
+        return self.make_blob_path(blob_name)
+
+    def download_bytes_sync(self, blob_identifier: str) -> bytes:
+        _, blob_name = self._split_blob_identifier(blob_identifier)
+
+        if self.use_local_storage:
+            return (self.storage_path / blob_name).read_bytes()
+
+        blob_client = self._get_sync_client().get_blob_client(self.container_name, blob_name)
+        return blob_client.download_blob().readall()
+
+    def delete_blob_sync(self, blob_identifier: str) -> None:
+        _, blob_name = self._split_blob_identifier(blob_identifier)
+
+        if self.use_local_storage:
+            (self.storage_path / blob_name).unlink(missing_ok=True)
+            return
+
+        blob_client = self._get_sync_client().get_blob_client(self.container_name, blob_name)
+        blob_client.delete_blob(delete_snapshots="include")
+
     async def blob_exists(self, blob_identifier: str) -> bool:
         _, blob_name = self._split_blob_identifier(blob_identifier)
 
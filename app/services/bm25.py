@@ -0,0 +1,124 @@
+"""
+日本語テキストの BM25 スコアリング（janome で形態素解析）。
+
+janome の解析は遅い（数万文字/秒）ため、文書側の語（terms）は保存時に計算して
+file_chunks.terms / file_extractions.llm_context_terms に空白区切りで保存しておき、
+検索時は保存済みの語を使う。保存されていないテキストはプロセス内 LRU（TermStatsCache）に載せる。
+
+idf は候補集合（再ランキング対象の文書・パッセージ）内で計算する。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+import unicodedata
+from collections import Counter
+from typing import Iterable, List, Sequence
+
+from app.core.cache import LRUCache
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# 検索語として使う品詞（名詞・動詞・形容詞の基本形）
+_CONTENT_POS = ("名詞", "動詞", "形容詞")
+_STOP_WORDS = {
+    "ある", "いる", "する", "なる", "れる", "られる", "こと", "もの", "よう", "ため", "それ",
+    "これ", "あれ", "さん", "ます", "です", "など", "等", "おる", "できる", "思う",
+}
+
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """
+    プロセス共通の janome Tokenizer を返す（初回呼び出し時に辞書を読み込む）。
+    辞書の読み込みは数百ms・数十MBかかるため、リクエストごとに作らずこれを使う。
+    app.main の lifespan（app.services.warmup_service）で起動時に読み込んでおく。
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                from janome.tokenizer import Tokenizer
+
+                _tokenizer = Tokenizer()
+    return _tokenizer
+
+
+def tokenize(text: str) -> List[str]:
+    """検索用の語（名詞・動詞・形容詞の基本形、全角/半角・大文字小文字を正規化）に分割する"""
+    if not text:
+        return []
+    terms = []
+    for token in get_tokenizer().tokenize(unicodedata.normalize("NFKC", text).lower()):
+        pos = token.part_of_speech.split(",", 2)
+        if pos[0] not in _CONTENT_POS or pos[1] in ("非自立", "接尾", "代名詞", "数"):
+            continue
+        word = token.base_form if token.base_form != "*" else token.surface
+        word = word.strip()
+        if word and word not in _STOP_WORDS and not (len(word) == 1 and word.isascii()):
+            terms.append(word)
+    return terms
+
+
+def terms_to_text(terms: Iterable[str]) -> str:
+    return " ".join(terms)
+
+
+def parse_terms(text: str | None) -> List[str]:
+    return text.split() if text else []
+
+
+class TermStatsCache:
+    """保存済みの語が無いテキストの解析結果（語の出現数）のプロセス内 LRU。キーは本文のハッシュ"""
+
+    _entries: "LRUCache[str, Counter[str]]" = LRUCache(settings.rag_term_stats_cache_size)
+
+    @classmethod
+    def counts(cls, text: str) -> Counter[str]:
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        counts = cls._entries.get(key)
+        if counts is None:
+            counts = Counter(tokenize(text))
+            cls._entries.set(key, counts)
+        return counts
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._entries.clear()
+
+
+def bm25_scores(
+    query_terms: Sequence[str],
+    docs: Sequence[Counter[str] | Sequence[str]],
+    *,
+    k1: float = 1.2,
+    b: float = 0.75,
+) -> List[float]:
+    """
+    query_terms に対する各文書の BM25 スコア。
+    docs は語の出現数（Counter）または語のリスト。
+    """
+    if not docs:
+        return []
+    counts = [d if isinstance(d, Counter) else Counter(d) for d in docs]
+    terms = set(query_terms)
+    if not terms:
+        return [0.0] * len(counts)
+
+    lengths = [sum(c.values()) for c in counts]
+    avgdl = (sum(lengths) / len(lengths)) or 1.0
+    n = len(counts)
+    df = Counter(t for c in counts for t in terms if t in c)
+    idf = {t: math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in df}
+
+    scores = []
+    for c, dl in zip(counts, lengths):
+        norm = k1 * (1 - b + b * dl / avgdl)
+        scores.append(sum(idf[t] * c[t] * (k1 + 1) / (c[t] + norm) for t in idf if t in c))
+    return scores
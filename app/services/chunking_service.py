@@ -0,0 +1,321 @@
+"""
+RAG 用のパッセージ分割・パッセージ索引（file_chunks テーブル）。
+
+検索インデックスの content（PDF 等の本文全体）を重なり付きのパッセージに分割して保存し、
+分析時は質問に関係の深いパッセージだけをページ番号付きで LLM に渡す。
+本文に改ページ（\\f）が含まれる場合はページ単位で分割し、パッセージにページ番号を付ける。
+
+パッセージ索引は取り込み時（ファイル要約のワーカーが検索インデックスの本文を取得した時）に作成する
+（scripts/build_chunk_index.py で一括作成も可能）。分析時は読み出しのみで、未作成/本文が変わったファイルは
+その場で分割して使い（語は TermStatsCache から）、索引の作成は ChunkIndexQueue（リクエストとは別のスレッド）に任せる。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List
+
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.db.models.file_chunk import FileChunk
+from app.db.session import SessionLocal
+from app.services.bm25 import TermStatsCache, bm25_scores, parse_terms, terms_to_text, tokenize
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+PAGE_BREAK = "\f"
+# パッセージの区切りに使う位置（改行・句点の直後）
+_BOUNDARY_RE = re.compile(r"[\n。．！？!?]")
+
+
+@dataclass
+class Passage:
+    chunk_no: int
+    page: int | None
+    start: int
+    end: int
+    text: str
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _last_boundary(text: str, start: int, end: int) -> int:
+    """text[start:end] 内の最後の区切りの直後の位置（無ければ -1）"""
+    last = -1
+    for m in _BOUNDARY_RE.finditer(text, start, end):
+        last = m.end()
+    return last
+
+
+def split_passages(content: str, size: int | None = None, overlap: int | None = None) -> List[Passage]:
+    """
+    本文を size 文字程度・overlap 文字の重なり付きパッセージに分割する。
+    区切りはなるべく改行・句点の直後にそろえる。
+    """
+    size = size or settings.rag_chunk_chars
+    overlap = settings.rag_chunk_overlap_chars if overlap is None else overlap
+    pages = content.split(PAGE_BREAK)
+    has_pages = len(pages) > 1
+
+    passages: List[Passage] = []
+    offset = 0
+    for page_no, page in enumerate(pages, 1):
+        start = 0
+        while start < len(page):
+            end = min(start + size, len(page))
+            if end < len(page):
+                boundary = _last_boundary(page, start + size // 2, end)
+                if boundary > 0:
+                    end = boundary
+            text = page[start:end].strip()
+            if text:
+                passages.append(
+                    Passage(
+                        chunk_no=len(passages),
+                        page=page_no if has_pages else None,
+                        start=offset + start,
+                        end=offset + end,
+                        text=text,
+                    )
+                )
+            if end >= len(page):
+                break
+            # 次のパッセージは overlap 文字手前から（その後に区切りがあれば区切りの直後から）始める
+            next_start = max(end - overlap, start + 1)
+            m = _BOUNDARY_RE.search(page, next_start, end - 1)
+            start = m.end() if m else next_start
+        offset += len(page) + len(PAGE_BREAK)
+    return passages
+
+
+def format_passages(passages: List[Dict[str, Any]]) -> str:
+    """選んだパッセージを本文順に並べ、ページ番号（あれば）を付けて連結する"""
+    parts = []
+    for p in sorted(passages, key=lambda p: p["chunk_no"]):
+        label = f"[p.{p['page']}]" if p.get("page") else f"[#{p['chunk_no'] + 1}]"
+        parts.append(f"{label}\n{p['text']}")
+    return "\n\n".join(parts)
+
+
+class ChunkService:
+    def __init__(self, db: Session, index_queue: "ChunkIndexQueue | None" = None):
+        self.db = db
+        # passages_for() で見つかった索引が無い/古いファイルを渡す先（None なら索引は作らない）
+        self.index_queue = index_queue
+
+    def load_chunks(self, file_ids: Iterable[str]) -> tuple[Dict[str, List[Dict[str, Any]]], Dict[str, str]]:
+        """
+        保存済みのパッセージを1クエリで読む（書き込みはしない）。語（terms）が未計算の行は TermStatsCache から得る。
+
+        Returns:
+            (file_id → パッセージのリスト, file_id → source_hash)
+        """
+        chunks, hashes, _ = self._load(file_ids)
+        return chunks, hashes
+
+    def _load(
+        self, file_ids: Iterable[str]
+    ) -> tuple[Dict[str, List[Dict[str, Any]]], Dict[str, str], set[str]]:
+        """load_chunks の本体。3つ目は語が未計算の行を含むファイル"""
+        ids = list(dict.fromkeys(file_ids))
+        if not ids:
+            return {}, {}, set()
+        rows = (
+            self.db.query(
+                FileChunk.file_id,
+                FileChunk.chunk_no,
+                FileChunk.page,
+                FileChunk.text,
+                FileChunk.terms,
+                FileChunk.source_hash,
+            )
+            .filter(FileChunk.file_id.in_(ids))
+            .order_by(FileChunk.file_id, FileChunk.chunk_no)
+            .all()
+        )
+        chunks: Dict[str, List[Dict[str, Any]]] = {}
+        hashes: Dict[str, str] = {}
+        missing_terms: set[str] = set()
+        for row in rows:
+            if row.terms is None:
+                missing_terms.add(str(row.file_id))
+            terms = Counter(parse_terms(row.terms)) if row.terms is not None else TermStatsCache.counts(row.text)
+            chunks.setdefault(str(row.file_id), []).append(
+                {"chunk_no": row.chunk_no, "page": row.page, "text": row.text, "terms": terms}
+            )
+            hashes[str(row.file_id)] = row.source_hash
+        return chunks, hashes, missing_terms
+
+    def passages_for(self, contents: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        file_id → 本文 から、各ファイルのパッセージを返す（分析用。書き込みはしない）。
+        索引が未作成・本文が変わったファイルはその場で分割し（語は TermStatsCache から）、index_queue に索引の作成を任せる。
+        """
+        ids = [fid for fid, content in contents.items() if content]
+        chunks, hashes = self.load_chunks(ids)
+
+        stale = [fid for fid in ids if hashes.get(fid) != content_hash(contents[fid])]
+        if stale:
+            metrics.inc("chunk_index.missing", len(stale))
+            for fid in stale:
+                chunks[fid] = [
+                    {"chunk_no": p.chunk_no, "page": p.page, "text": p.text, "terms": TermStatsCache.counts(p.text)}
+                    for p in split_passages(contents[fid])
+                ]
+            if self.index_queue is not None:
+                self.index_queue.enqueue({fid: contents[fid] for fid in stale})
+        return chunks
+
+    def ensure_chunks(self, contents: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        file_id → 本文 から、各ファイルのパッセージ索引を作成して返す（取り込み時・一括作成用）。
+        未作成・本文が変わったファイル、語（terms）が未計算のファイルのみ分割して保存し直す（読み出しは1クエリ）。
+        """
+        ids = [fid for fid, content in contents.items() if content]
+        chunks, hashes, missing_terms = self._load(ids)
+
+        stale = [fid for fid in ids if hashes.get(fid) != content_hash(contents[fid]) or fid in missing_terms]
+        if stale:
+            for fid in stale:
+                chunks[fid] = self._rebuild(fid, contents[fid])
+            self._commit("passage index for %d file(s)" % len(stale))
+        return chunks
+
+    def _commit(self, what: str) -> None:
+        try:
+            self.db.commit()
+            logger.info("Stored %s", what)
+        except Exception as e:
+            # 保存に失敗しても計算結果はそのまま返す（次回また保存を試みる）
+            logger.warning("Failed to store %s: %s", what, e)
+            self.db.rollback()
+
+    def _rebuild(self, file_id: str, content: str) -> List[Dict[str, Any]]:
+        self.db.query(FileChunk).filter(FileChunk.file_id == file_id).delete(synchronize_session=False)
+        source_hash = content_hash(content)
+        result = []
+        for p, passage in _passages_with_terms(content):
+            self.db.add(
+                FileChunk(
+                    file_id=file_id,
+                    chunk_no=p.chunk_no,
+                    page=p.page,
+                    start_offset=p.start,
+                    end_offset=p.end,
+                    text=p.text,
+                    terms=terms_to_text(passage["terms"]),
+                    source_hash=source_hash,
+                )
+            )
+            result.append({**passage, "terms": Counter(passage["terms"])})
+        return result
+
+    def delete_for_file(self, file_id: str) -> None:
+        self.db.query(FileChunk).filter(FileChunk.file_id == file_id).delete(synchronize_session=False)
+
+    def best_passages(
+        self, query: str, contents: Dict[str, str], per_doc: int | None = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        各ファイルから質問に関係の深いパッセージを per_doc 件まで選ぶ（BM25。idf はファイルをまたいで計算）。
+        どのパッセージも質問と重ならないファイルは先頭のパッセージを返す。
+        """
+        per_doc = per_doc or settings.rag_passages_per_doc
+        chunks = self.passages_for(contents)
+        flat = [(fid, c) for fid, items in chunks.items() for c in items]
+        scores = bm25_scores(tokenize(query), [c["terms"] for _, c in flat])
+
+        ranked: Dict[str, List[tuple[float, Dict[str, Any]]]] = {}
+        for (fid, chunk), score in zip(flat, scores):
+            ranked.setdefault(fid, []).append((score, chunk))
+
+        selected: Dict[str, List[Dict[str, Any]]] = {}
+        for fid, items in ranked.items():
+            hits = sorted((x for x in items if x[0] > 0), key=lambda x: -x[0])[:per_doc]
+            picked = [c for _, c in hits] or [c for _, c in items[:per_doc]]
+            selected[fid] = sorted(picked, key=lambda c: c["chunk_no"])
+        return selected
+
+
+def _passages_with_terms(content: str) -> List[tuple[Passage, Dict[str, Any]]]:
+    return [
+        (p, {"chunk_no": p.chunk_no, "page": p.page, "text": p.text, "terms": tokenize(p.text)})
+        for p in split_passages(content)
+    ]
+
+
+class ChunkIndexQueue:
+    """
+    分析時に見つかった索引が無い/古いファイルのパッセージ索引を、ワーカー内の1スレッドで作成する。
+    同じファイルは作成が終わるまで重ねて登録しない。保留が max_pending 件を超えた分は捨てる（次の分析で再登録される）。
+    """
+
+    def __init__(
+        self, session_factory: Callable[[], Session] = SessionLocal, max_pending: int | None = None
+    ) -> None:
+        self.session_factory = session_factory
+        self.max_pending = settings.rag_chunk_index_queue_size if max_pending is None else max_pending
+        self._pending: Dict[str, str] = {}
+        self._in_progress: set[str] = set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def enqueue(self, contents: Dict[str, str]) -> None:
+        with self._lock:
+            for fid, content in contents.items():
+                if fid in self._pending or fid in self._in_progress:
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    metrics.inc("chunk_index.queue_dropped")
+                    continue
+                self._pending[fid] = content
+            if self._pending and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chunk-index", daemon=True)
+                self._thread.start()
+
+    def join(self, timeout: float | None = None) -> None:
+        """保留中の索引の作成が終わるまで待つ（テスト・シャットダウン用）"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                batch, self._pending = self._pending, {}
+                self._in_progress = set(batch)
+            db = self.session_factory()
+            try:
+                ChunkService(db).ensure_chunks(batch)
+                metrics.inc("chunk_index.queued_built", len(batch))
+            except Exception as e:
+                logger.warning("Building passage index for %d file(s) failed: %s", len(batch), e)
+                db.rollback()
+            finally:
+                db.close()
+                with self._lock:
+                    self._in_progress = set()
+
+
+@lru_cache
+def get_chunk_index_queue() -> ChunkIndexQueue:
+    """ワーカー内で共有する ChunkIndexQueue を返す"""
+    return ChunkIndexQueue()
+
+
+def passage_pages(passages: Iterable[Dict[str, Any]]) -> List[int]:
+    return sorted({p["page"] for p in passages if p.get("page")})
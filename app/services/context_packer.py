@@ -0,0 +1,201 @@
+"""
+RAG プロンプト用のコンテキスト詰め込み（トークン予算の配分）。
+
+モデルのコンテキスト長（llm_context_window）から出力用の llm_max_tokens と
+システムプロンプト・質問・タグ等の固定部分を差し引いた残りを「文書用の予算」とし、
+検索順位（または検索スコア）に応じた重みで各文書に配分する。
+予算より短い文書の余りは残りの文書に再配分する（water-filling）。
+
+配分の前に、文書をまたいで近似重複する段落（LOG 行・配合行など）を除去する（near_duplicate 参照）。
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List
+
+from app.core.config import get_settings
+from app.services.near_duplicate import collapse_near_duplicates
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+TRUNCATION_MARKER = "\n[... 以下省略 ...]"
+
+# <document index=..><source>..</source><content>..</content></document> の枠の分
+_DOC_OVERHEAD_TOKENS = 24
+# 見積もり誤差の吸収分（予算の割合）
+_SAFETY_MARGIN = 0.05
+# これより短い段落（見出し「【LOG】」など）は重複除去の対象にしない
+_MIN_DEDUP_CHARS = 16
+
+
+@lru_cache
+def _tiktoken_encoding():
+    """tiktoken があれば cl100k_base を使う（オフラインでエンコーディングが取得できない場合は None）"""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の見積もり。tiktoken が無い環境では文字種から近似する
+    （日本語などの非 ASCII 文字は 1 文字 ≒ 1 トークン、ASCII は 4 文字 ≒ 1 トークン）。
+    近似は多めに出るように倒している。
+    """
+    if not text:
+        return 0
+    enc = _tiktoken_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    wide = len(text) - len(text.encode("ascii", "ignore"))
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, counter: Callable[[str], int] = estimate_tokens) -> str:
+    """見積もりで max_tokens に収まるよう末尾を切り詰める（切り詰めた場合は省略マーカーを付ける）"""
+    if counter(text) <= max_tokens:
+        return text
+    budget = max_tokens - counter(TRUNCATION_MARKER)
+    if budget <= 0:
+        return ""
+
+    # 見積もりは文字数に対して単調なので二分探索で切り位置を決める
+    # （1トークンが8文字を超えることはまず無いため、探索範囲を budget * 8 文字に絞る）
+    lo, hi = 0, min(len(text), budget * 8)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if counter(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    # 行の途中で切れた場合は直前の改行まで戻す（行がほとんど残らない場合はそのまま）
+    newline = cut.rfind("\n")
+    if newline > len(cut) // 2:
+        cut = cut[:newline]
+    return cut + TRUNCATION_MARKER
+
+
+def allocate_budget(sizes: List[int], weights: List[float], budget: int) -> List[int]:
+    """
+    重み付き water-filling。各文書に重みに比例した予算を割り当て、必要量（sizes）を
+    超えた分は未充足の文書へ再配分する。合計は budget を超えない。
+    """
+    alloc = [0] * len(sizes)
+    active = [i for i, s in enumerate(sizes) if s > 0]
+    remaining = budget
+    while active and remaining > 0:
+        total_weight = sum(weights[i] for i in active) or float(len(active))
+        satisfied = []
+        for i in active:
+            share = remaining * (weights[i] or 1.0) / total_weight
+            if sizes[i] - alloc[i] <= share:
+                satisfied.append(i)
+        if not satisfied:
+            # 全員が取り分を使い切る: 比例配分して終了
+            shares = [int(remaining * (weights[i] or 1.0) / total_weight) for i in active]
+            for i, share in zip(active, shares):
+                alloc[i] += share
+            break
+        for i in satisfied:
+            remaining -= sizes[i] - alloc[i]
+            alloc[i] = sizes[i]
+        active = [i for i in active if i not in satisfied]
+    return alloc
+
+
+def relevance_weights(docs: List[Dict[str, Any]]) -> List[float]:
+    """検索スコアがあればそれを、無ければ順位の逆数を重みにする"""
+    scores = [d.get("score") for d in docs]
+    if docs and all(isinstance(s, (int, float)) and s > 0 for s in scores):
+        return [float(s) for s in scores]
+    return [1.0 / (rank + 1) for rank in range(len(docs))]
+
+
+@dataclass
+class PackedContext:
+    docs: List[Dict[str, Any]]
+    prompt_tokens: int  # システムプロンプト + ユーザーメッセージの見積もり
+    budget: int  # 文書に使えたトークン数
+    duplicates_removed: int = 0
+    truncated: List[str] = field(default_factory=list)  # 切り詰めた文書の file_id
+    dropped: List[str] = field(default_factory=list)  # 予算不足で入らなかった文書の file_id
+
+
+class ContextPacker:
+    def __init__(
+        self,
+        *,
+        context_window: int | None = None,
+        reserved_output_tokens: int | None = None,
+        counter: Callable[[str], int] = estimate_tokens,
+    ) -> None:
+        self.context_window = context_window or settings.llm_context_window
+        self.reserved_output_tokens = (
+            settings.llm_max_tokens if reserved_output_tokens is None else reserved_output_tokens
+        )
+        self.count = counter
+
+    def pack(self, fixed_text: str, docs: List[Dict[str, Any]]) -> PackedContext:
+        """
+        Args:
+            fixed_text: システムプロンプト・質問など文書以外の固定部分
+            docs: 関連度順の文書（file_id / original_name / content、任意で score）
+        """
+        fixed_tokens = self.count(fixed_text)
+        available = self.context_window - self.reserved_output_tokens - fixed_tokens
+        budget = int(available * (1 - _SAFETY_MARGIN)) - _DOC_OVERHEAD_TOKENS * len(docs)
+        if budget <= 0:
+            logger.warning(
+                "No room for documents: window=%d output=%d fixed=%d",
+                self.context_window,
+                self.reserved_output_tokens,
+                fixed_tokens,
+            )
+            return PackedContext(
+                docs=[], prompt_tokens=fixed_tokens, budget=0, dropped=[d.get("file_id", "") for d in docs]
+            )
+
+        # 1文書が予算全体を使っても入りきらない部分は先に落としておく（重複除去・見積もりの対象を減らす）
+        max_chars = budget * 8
+        docs = [
+            {**d, "content": d["content"][:max_chars]} if len(d.get("content") or "") > max_chars else d for d in docs
+        ]
+        deduped, removed = collapse_near_duplicates(
+            docs, threshold=settings.rag_near_duplicate_threshold, min_chars=_MIN_DEDUP_CHARS
+        )
+        sizes = [self.count(d.get("content") or "") for d in deduped]
+        alloc = allocate_budget(sizes, relevance_weights(deduped), budget)
+
+        packed: List[Dict[str, Any]] = []
+        truncated: List[str] = []
+        dropped: List[str] = []
+        used = 0
+        for doc, size, tokens in zip(deduped, sizes, alloc):
+            if size == 0:
+                continue
+            if tokens < self.count(TRUNCATION_MARKER) + 1:
+                dropped.append(doc.get("file_id", ""))
+                continue
+            if tokens < size:
+                doc = {**doc, "content": truncate_to_tokens(doc["content"], tokens, self.count)}
+                truncated.append(doc.get("file_id", ""))
+            used += self.count(doc["content"]) + _DOC_OVERHEAD_TOKENS
+            packed.append(doc)
+
+        return PackedContext(
+            docs=packed,
+            prompt_tokens=fixed_tokens + used,
+            budget=budget,
+            duplicates_removed=removed,
+            truncated=truncated,
+            dropped=dropped,
+        )
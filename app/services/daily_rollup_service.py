@@ -0,0 +1,176 @@
+"""
+ダウンロード数・登録数の日次集計（file_download_daily / file_registration_daily）。
+
+ダッシュボードのランキング・推移や検索結果のダウンロード数は、file_downloads / files の行を期間で数える代わりに
+この小さな集計を読む（CAST(created_at AS DATE) での GROUP BY も不要になる）。
+
+集計はダウンロードの記録・ファイルの登録/状態変更/削除と同じトランザクションで加減する。
+導入時・集計がずれた場合は scripts/rollup_daily_stats.py --rebuild で作り直し、
+古い file_downloads の行は --compact-days で削除できる（集計には残る）。
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from datetime import date, datetime, time
+from typing import Any, Dict, Iterable, List, Sequence
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.db.models.daily_rollup import FileDownloadDaily, FileRegistrationDaily
+from app.db.models.file import File
+from app.db.models.file_download import FileDownload
+from app.db.upsert import update_or_insert
+
+logger = logging.getLogger(__name__)
+
+
+def _day(value: datetime | date) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+class DailyRollupService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _increment(self, model: Any, keys: Dict[str, Any], delta: int) -> None:
+        """集計行に delta を加える（行が無ければ作る）。commit は呼び出し側で行う"""
+        update_or_insert(
+            self.db,
+            self.db.query(model).filter_by(**keys),
+            {"count": model.count + delta},
+            (lambda: model(**keys, count=delta)) if delta > 0 else None,
+        )
+
+    # --- 更新時のフック（commit は呼び出し側で行う） ---
+
+    def record_download(self, file_id: str, downloaded_at: datetime | date) -> None:
+        self._increment(FileDownloadDaily, {"file_id": file_id, "day": _day(downloaded_at)}, 1)
+
+    def file_status_changed(self, file_obj: File, old_status: str | None) -> None:
+        """登録・状態変更・削除時に登録数を加減する（登録は old_status=None、削除は file_obj.status を変えずに old_status に渡す）"""
+        delta = int(file_obj.status == "active") - int(old_status == "active")
+        if delta and file_obj.created_at is not None:
+            self._increment(FileRegistrationDaily, {"day": _day(file_obj.created_at)}, delta)
+
+    def file_deleted(self, file_obj: File) -> None:
+        if file_obj.status == "active" and file_obj.created_at is not None:
+            self._increment(FileRegistrationDaily, {"day": _day(file_obj.created_at)}, -1)
+        self.db.query(FileDownloadDaily).filter(FileDownloadDaily.file_id == file_obj.id).delete(
+            synchronize_session=False
+        )
+
+    # --- 読み出し ---
+
+    def download_counts(self, file_ids: Iterable[str]) -> Dict[str, int]:
+        """ファイルごとの累計ダウンロード数"""
+        ids = list(dict.fromkeys(file_ids))
+        if not ids:
+            return {}
+        rows = (
+            self.db.query(FileDownloadDaily.file_id, func.sum(FileDownloadDaily.count))
+            .filter(FileDownloadDaily.file_id.in_(ids))
+            .group_by(FileDownloadDaily.file_id)
+            .all()
+        )
+        return {str(fid): int(n or 0) for fid, n in rows}
+
+    def total_downloads(self, start: date, end: date | None = None) -> int:
+        """start 〜 end（両端を含む）のダウンロード数"""
+        query = self.db.query(func.sum(FileDownloadDaily.count)).filter(FileDownloadDaily.day >= start)
+        if end is not None:
+            query = query.filter(FileDownloadDaily.day <= end)
+        return int(query.scalar() or 0)
+
+    def total_downloads_since(self, starts: Sequence[date]) -> List[int]:
+        """各開始日から今日までのダウンロード数（1クエリでまとめて集計する）"""
+        if not starts:
+            return []
+        row = (
+            self.db.query(
+                *[func.sum(case((FileDownloadDaily.day >= start, FileDownloadDaily.count), else_=0)) for start in starts]
+            )
+            .filter(FileDownloadDaily.day >= min(starts))
+            .one()
+        )
+        return [int(n or 0) for n in row]
+
+    def download_ranking(self, start: date, end: date | None = None, limit: int = 5) -> List[Dict[str, Any]]:
+        """start 〜 end（両端を含む）のダウンロード数上位のファイル（name はファイル名）"""
+        total = func.sum(FileDownloadDaily.count)
+        query = (
+            self.db.query(File.original_name, total.label("count"))
+            .join(FileDownloadDaily, File.id == FileDownloadDaily.file_id)
+            .filter(FileDownloadDaily.day >= start)
+        )
+        if end is not None:
+            query = query.filter(FileDownloadDaily.day <= end)
+        rows = query.group_by(File.id, File.original_name).order_by(total.desc()).limit(limit).all()
+        return [{"name": name, "count": int(count)} for name, count in rows]
+
+    def registration_trend(self, start: date) -> List[Dict[str, Any]]:
+        rows = (
+            self.db.query(FileRegistrationDaily.day, FileRegistrationDaily.count)
+            .filter(FileRegistrationDaily.day >= start, FileRegistrationDaily.count > 0)
+            .order_by(FileRegistrationDaily.day.asc())
+            .all()
+        )
+        return [{"date": day.strftime("%Y-%m-%d"), "count": count} for day, count in rows]
+
+    # --- 作り直し・圧縮 ---
+
+    def rebuild(self, batch_size: int = 5000) -> Dict[str, int]:
+        """
+        file_downloads / files から集計を作り直す。
+        ダウンロードは file_downloads に行が残っている最初の日以降だけを作り直す（圧縮済みの日の集計は残す）。
+        """
+        registrations: Counter[date] = Counter()
+        for (created_at,) in (
+            self.db.query(File.created_at).filter(File.status == "active").yield_per(batch_size)
+        ):
+            if created_at is not None:
+                registrations[_day(created_at)] += 1
+
+        downloads: Counter[tuple[str, date]] = Counter()
+        first = self.db.query(func.min(FileDownload.downloaded_at)).scalar()
+        start_day = _day(first) if first is not None else None
+        if start_day is not None:
+            for file_id, downloaded_at in (
+                self.db.query(FileDownload.file_id, FileDownload.downloaded_at)
+                .filter(FileDownload.downloaded_at >= datetime.combine(start_day, time.min))
+                .yield_per(batch_size)
+            ):
+                downloads[(str(file_id), _day(downloaded_at))] += 1
+
+        self.db.query(FileRegistrationDaily).delete(synchronize_session=False)
+        self.db.bulk_insert_mappings(
+            FileRegistrationDaily, [{"day": day, "count": n} for day, n in registrations.items()]
+        )
+        if start_day is not None:
+            self.db.query(FileDownloadDaily).filter(FileDownloadDaily.day >= start_day).delete(
+                synchronize_session=False
+            )
+            items = [{"file_id": fid, "day": day, "count": n} for (fid, day), n in downloads.items()]
+            for i in range(0, len(items), batch_size):
+                self.db.bulk_insert_mappings(FileDownloadDaily, items[i : i + batch_size])
+        self.db.commit()
+        logger.info(
+            "Rebuilt daily rollups: %d registration days, %d file-days of downloads since %s",
+            len(registrations),
+            len(downloads),
+            start_day,
+        )
+        return {"registration_days": len(registrations), "download_file_days": len(downloads)}
+
+    def compact(self, before: date) -> int:
+        """before より前の日の file_downloads の行を削除する（集計には残る）。削除した行数を返す"""
+        deleted = (
+            self.db.query(FileDownload)
+            .filter(FileDownload.downloaded_at < datetime.combine(before, time.min))
+            .delete(synchronize_session=False)
+        )
+        self.db.commit()
+        logger.info("Compacted %d file_downloads rows before %s", deleted, before)
+        return deleted
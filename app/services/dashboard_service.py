@@ -1,96 +1,98 @@
-from collections import Counter
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from functools import lru_cache
-import time
+from typing import Any, Callable
 
-from sqlalchemy import func
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
-from janome.tokenizer import Tokenizer
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
 
+from app.core.config import get_settings
+from app.core.metrics import metrics
 from app.db.models.file import File
+from app.db.session import SessionLocal
 from app.schemas.dashboard import DashboardResponse
+from app.services.daily_rollup_service import DailyRollupService
+from app.services.issue_term_service import IssueTermService
+from app.services.snapshot_cache import SnapshotCache
 
-# 簡易的なキャッシュ機構（本番ではRedis等が望ましいが、今回はメモリキャッシュで実装）
-class DashboardCache:
-    _cache: dict = {}
-    _last_updated: float = 0
-    _ttl: int = 3600  # 1時間
-
-    @classmethod
-    def get(cls):
-        if time.time() - cls._last_updated < cls._ttl:
-            return cls._cache
-        return None
+logger = logging.getLogger(__name__)
+settings = get_settings()
 
-    @classmethod
-    def set(cls, data: dict):
-        cls._cache = data
-        cls._last_updated = time.time()
 
 class DashboardService:
     def __init__(self, db: Session):
         self.db = db
-        self.tokenizer = Tokenizer()
-        # ストップワードの定義
-        self.stop_words = {
-            'て', 'に', 'を', 'は', 'の', 'が', 'と', 'で', 'も', 'な', 'や', 'し', 'か', 'た', 'だ', 
-            'ある', 'いる', 'する', 'なる', 'れる', 'られる', 'こと', 'もの', 'よう', 'ため', 'それ', 
-            'これ', 'あれ', 'さん', 'さま', 'くん', 'ちゃん', 'ます', 'です', 'など', '等', '・', '、', '。'
-        }
 
     def get_dashboard_data(self) -> DashboardResponse:
-        # キャッシュ確認
-        cached = DashboardCache.get()
-        if cached:
-            return DashboardResponse(**cached)
-
-        # データ集計
-        total_files = self.db.query(func.count(File.id)).filter(File.status == 'active').scalar()
-        
+        # 期限切れの場合も古い値を返し、再計算はバックグラウンドの1スレッドで行う（get_dashboard_cache）
+        return DashboardResponse(**get_dashboard_cache().get(self.db))
+
+    def compute_dashboard_data(
+        self, session_factory: Callable[[], Session] | None = None, max_workers: int = 1
+    ) -> dict:
+        """
+        ダッシュボードの全項目を集計する（キャッシュを通さない）。
+        項目（セクション）は互いに独立しているため、session_factory を渡し max_workers > 1 の場合は
+        セクションごとに別のセッション（プールの別の接続）で並行に実行する。それ以外は self.db で順に実行する。
+        セクションごとの所要時間はログと dashboard.section_ms.<セクション> に記録する。
+        """
+        # 接続を1つしか持たないプール（インメモリの SQLite など）では別の接続で実行できない
+        parallel = (
+            session_factory is not None
+            and max_workers > 1
+            and not isinstance(self.db.get_bind().pool, (StaticPool, SingletonThreadPool))
+        )
+        started = time.perf_counter()
+        results: dict[str, tuple[dict, float]] = {}
+        if parallel:
+            with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(DASHBOARD_SECTIONS)), thread_name_prefix="dashboard"
+            ) as executor:
+                futures = {
+                    name: executor.submit(_run_section_in_session, session_factory, section)
+                    for name, section in DASHBOARD_SECTIONS.items()
+                }
+                results = {name: future.result() for name, future in futures.items()}
+        else:
+            results = {name: _run_section(self, section) for name, section in DASHBOARD_SECTIONS.items()}
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        response_data: dict[str, Any] = {}
+        for name, (values, section_ms) in results.items():
+            response_data.update(values)
+            metrics.observe(f"dashboard.section_ms.{name}", section_ms)
+        metrics.observe("dashboard.compute_ms", elapsed_ms)
+        logger.info(
+            "Computed dashboard in %.1fms (%s): %s",
+            elapsed_ms,
+            "parallel" if parallel else "sequential",
+            ", ".join(f"{name}={ms:.1f}ms" for name, (_, ms) in sorted(results.items(), key=lambda r: -r[1][1])),
+        )
+        return response_data
+
+    def _get_file_counts(self) -> dict:
+        """有効なファイル数と直近1ヶ月の新規登録数（1クエリ）"""
         last_month = datetime.now() - timedelta(days=30)
-        new_files = self.db.query(func.count(File.id)).filter(
-            File.status == 'active',
-            File.created_at >= last_month
-        ).scalar()
-
-        usage_ranking = self._get_ranking(File.application)
-        ingredient_ranking = self._get_ranking(File.ingredient)
-        download_ranking = self._get_download_ranking()
-        
-        # 総ダウンロード数（直近1ヶ月）
-        from app.db.models.file_download import FileDownload
-        total_downloads_last_month = self.db.query(func.count(FileDownload.id)).filter(
-            FileDownload.downloaded_at >= last_month
-        ).scalar() or 0
-        
-        # 新規追加: 今月のダウンロード数
-        downloads_this_month = self._get_downloads_this_month()
-        
-        # 新規追加: 先週のダウンロード数Top3
-        top_downloads_last_week = self._get_top_downloads_last_week()
-        
-        # 新規追加: 登録件数推移
-        registration_trend = self._get_registration_trend()
-        
-        word_cloud = self._generate_word_cloud()
-
-        response_data = {
-            "total_files": total_files,
-            "new_files_last_month": new_files,
-            "usage_ranking": usage_ranking,
-            "ingredient_ranking": ingredient_ranking,
-            "download_ranking": download_ranking,
-            "total_downloads_last_month": total_downloads_last_month,
-            "downloads_this_month": downloads_this_month,
-            "top_downloads_last_week": top_downloads_last_week,
-            "registration_trend": registration_trend,
-            "issue_word_cloud": word_cloud
-        }
-
-        # キャッシュ更新
-        DashboardCache.set(response_data)
-
-        return DashboardResponse(**response_data)
+        total_files, new_files = (
+            self.db.query(
+                func.count(File.id),
+                func.sum(case((File.created_at >= last_month, 1), else_=0)),
+            )
+            .filter(File.status == 'active')
+            .one()
+        )
+        return {"total_files": total_files or 0, "new_files_last_month": int(new_files or 0)}
+
+    def _get_download_totals(self) -> dict:
+        """直近1ヶ月・今月のダウンロード数（日次集計から1クエリ）"""
+        today = datetime.now().date()
+        last_month, this_month = DailyRollupService(self.db).total_downloads_since(
+            [today - timedelta(days=30), today.replace(day=1)]
+        )
+        return {"total_downloads_last_month": last_month, "downloads_this_month": this_month}
 
     def _get_ranking(self, column, limit: int = 5) -> list[dict]:
         results = (
@@ -104,107 +106,66 @@ class DashboardService:
         return [{"name": r[0], "count": r[1]} for r in results]
 
     def _get_download_ranking(self, limit: int = 5) -> list[dict]:
-        from app.db.models.file_download import FileDownload
-        
-        last_month = datetime.now() - timedelta(days=30)
-        
-        results = (
-            self.db.query(File.original_name, func.count(FileDownload.id).label('count'))
-            .join(FileDownload, File.id == FileDownload.file_id)
-            .filter(FileDownload.downloaded_at >= last_month)
-            .group_by(File.id, File.original_name)
-            .order_by(func.count(FileDownload.id).desc())
-            .limit(limit)
-            .all()
-        )
-        return [{"name": r[0], "count": r[1]} for r in results]
-
-    def _get_downloads_this_month(self) -> int:
-        """今月のダウンロード数を取得（今月1日00:00:00から今日23:59:59まで）"""
-        from app.db.models.file_download import FileDownload
-        
-        now = datetime.now()
-        # 今月1日の00:00:00
-        start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        count = self.db.query(func.count(FileDownload.id)).filter(
-            FileDownload.downloaded_at >= start_of_month
-        ).scalar() or 0
-        
-        return count
+        # ダウンロード数は日次集計（file_download_daily）から読む。期間は日単位（30日前の日から）
+        last_month = (datetime.now() - timedelta(days=30)).date()
+        return DailyRollupService(self.db).download_ranking(last_month, limit=limit)
 
     def _get_top_downloads_last_week(self, limit: int = 3) -> list[dict]:
-        """先週のダウンロード数Top3を取得（先週月曜日00:00:00から先週日曜日23:59:59まで）"""
-        from app.db.models.file_download import FileDownload
-        
-        now = datetime.now()
-        # 今日が何曜日か（0=月曜日、6=日曜日）
-        days_since_monday = now.weekday()
-        # 先週の月曜日を計算（今日から7日前の週の月曜日）
-        days_to_last_monday = days_since_monday + 7
-        last_monday = now - timedelta(days=days_to_last_monday)
-        last_monday = last_monday.replace(hour=0, minute=0, second=0, microsecond=0)
-        # 先週の日曜日（先週月曜日から6日後）
+        """先週のダウンロード数Top3を取得（先週月曜日から先週日曜日まで）"""
+        today = datetime.now().date()
+        # 先週の月曜日（今日の曜日 0=月曜日 から計算）と日曜日
+        last_monday = today - timedelta(days=today.weekday() + 7)
         last_sunday = last_monday + timedelta(days=6)
-        last_sunday = last_sunday.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        results = (
-            self.db.query(File.original_name, func.count(FileDownload.id).label('count'))
-            .join(FileDownload, File.id == FileDownload.file_id)
-            .filter(
-                FileDownload.downloaded_at >= last_monday,
-                FileDownload.downloaded_at <= last_sunday
-            )
-            .group_by(File.id, File.original_name)
-            .order_by(func.count(FileDownload.id).desc())
-            .limit(limit)
-            .all()
-        )
-        return [{"name": r[0], "count": r[1]} for r in results]
+        return DailyRollupService(self.db).download_ranking(last_monday, last_sunday, limit=limit)
 
     def _get_registration_trend(self, days: int = 30) -> list[dict]:
-        """登録件数推移を取得（過去N日間の日付ごとの集計）"""
-        from sqlalchemy import cast, Date
-        
-        # 過去N日間の開始日時
-        start_date = datetime.now() - timedelta(days=days)
-        start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # 日付ごとに集計
-        results = (
-            self.db.query(
-                cast(File.created_at, Date).label('date'),
-                func.count(File.id).label('count')
-            )
-            .filter(
-                File.status == 'active',
-                File.created_at >= start_date
-            )
-            .group_by(cast(File.created_at, Date))
-            .order_by(cast(File.created_at, Date).asc())
-            .all()
-        )
-        
-        # 日付を文字列形式（YYYY-MM-DD）に変換
-        return [
-            {"date": r[0].strftime("%Y-%m-%d"), "count": r[1]}
-            for r in results
-            if r[0] is not None
-        ]
+        """登録件数推移を取得（過去N日間の日付ごとの件数。日次集計 file_registration_daily から読む）"""
+        start_date = (datetime.now() - timedelta(days=days)).date()
+        return DailyRollupService(self.db).registration_trend(start_date)
 
     def _generate_word_cloud(self, limit: int = 50) -> dict[str, int]:
-        # issueフィールドのテキストを全取得
-        issues = self.db.query(File.issue).filter(File.status == 'active').all()
-        text_data = " ".join([i[0] for i in issues if i[0]])
-
-        words = []
-        for token in self.tokenizer.tokenize(text_data):
-            # 名詞のみ抽出
-            if token.part_of_speech.split(',')[0] == '名詞':
-                word = token.base_form
-                if word not in self.stop_words and len(word) > 1 and not word.isdigit():
-                    words.append(word)
-
-        counter = Counter(words)
-        return dict(counter.most_common(limit))
-
+        # 課題（issue）の語の出現回数はファイルの登録・更新・削除時に集計済み（issue_term_counts）
+        return IssueTermService(self.db).top_terms(limit)
+
+
+def _run_section(service: DashboardService, section: Callable[[DashboardService], dict]) -> tuple[dict, float]:
+    started = time.perf_counter()
+    values = section(service)
+    return values, (time.perf_counter() - started) * 1000
+
+
+def _run_section_in_session(
+    session_factory: Callable[[], Session], section: Callable[[DashboardService], dict]
+) -> tuple[dict, float]:
+    db = session_factory()
+    try:
+        return _run_section(DashboardService(db), section)
+    finally:
+        db.close()
+
+
+# ダッシュボードのセクション（互いに独立した集計）。値はレスポンスの項目の dict
+DASHBOARD_SECTIONS: dict[str, Callable[[DashboardService], dict]] = {
+    "file_counts": lambda s: s._get_file_counts(),
+    "usage_ranking": lambda s: {"usage_ranking": s._get_ranking(File.application)},
+    "ingredient_ranking": lambda s: {"ingredient_ranking": s._get_ranking(File.ingredient)},
+    "download_ranking": lambda s: {"download_ranking": s._get_download_ranking()},
+    "download_totals": lambda s: s._get_download_totals(),
+    "top_downloads_last_week": lambda s: {"top_downloads_last_week": s._get_top_downloads_last_week()},
+    "registration_trend": lambda s: {"registration_trend": s._get_registration_trend()},
+    "issue_word_cloud": lambda s: {"issue_word_cloud": s._generate_word_cloud()},
+}
+
+
+@lru_cache
+def get_dashboard_cache() -> SnapshotCache:
+    """ワーカー内で共有するダッシュボードのキャッシュ（cache_snapshots でワーカー間でも共有する）"""
+    return SnapshotCache(
+        "dashboard",
+        lambda db: DashboardService(db).compute_dashboard_data(
+            session_factory=SessionLocal, max_workers=settings.dashboard_parallel_workers
+        ),
+        ttl_seconds=settings.dashboard_cache_ttl_seconds,
+        max_stale_seconds=settings.dashboard_cache_max_stale_seconds,
+        lease_seconds=settings.dashboard_cache_lease_seconds,
+    )
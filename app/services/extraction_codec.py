@@ -0,0 +1,66 @@
+"""
+抽出結果（meta/log/formulation/derived...）の保存用バイナリ形式。
+
+レイアウト:
+    MAGIC(4) | header_len(uint32, big endian) | header(JSON) | section_0 | section_1 | ...
+
+header は {"sections": {name: [offset, length], ...}} で、offset は本体（header 直後）からの位置。
+トップレベルのキーごとに JSON を zlib 圧縮して独立に格納するため、
+必要なセクションだけを展開できる（meta だけ読む場合に log/formulation を展開しない）。
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+import zlib
+from typing import Any, Dict, Iterable
+
+MAGIC = b"NCX1"
+_HEADER_LEN = struct.Struct(">I")
+_COMPRESS_LEVEL = 6
+
+
+def is_encoded(payload: bytes | None) -> bool:
+    return bool(payload) and payload[:4] == MAGIC
+
+
+def encode_extraction(data: Dict[str, Any]) -> bytes:
+    offsets: Dict[str, list[int]] = {}
+    chunks: list[bytes] = []
+    pos = 0
+    for key, value in data.items():
+        raw = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        chunk = zlib.compress(raw, _COMPRESS_LEVEL)
+        offsets[key] = [pos, len(chunk)]
+        chunks.append(chunk)
+        pos += len(chunk)
+
+    header = json.dumps({"sections": offsets}, separators=(",", ":")).encode("utf-8")
+    return MAGIC + _HEADER_LEN.pack(len(header)) + header + b"".join(chunks)
+
+
+def read_header(payload: bytes) -> tuple[Dict[str, list[int]], int]:
+    """(sections, body_start) を返す"""
+    if not is_encoded(payload):
+        raise ValueError("Unsupported extraction payload format")
+    (header_len,) = _HEADER_LEN.unpack_from(payload, 4)
+    body_start = 4 + _HEADER_LEN.size + header_len
+    header = json.loads(payload[4 + _HEADER_LEN.size : body_start])
+    return header["sections"], body_start
+
+
+def decode_extraction(payload: bytes, sections: Iterable[str] | None = None) -> Dict[str, Any]:
+    """
+    payload を dict に戻す。sections を指定した場合はそのセクションのみ展開する
+    （存在しないセクションは結果に含めない）。
+    """
+    offsets, body_start = read_header(payload)
+    names = list(offsets) if sections is None else [s for s in sections if s in offsets]
+
+    result: Dict[str, Any] = {}
+    for name in names:
+        offset, length = offsets[name]
+        start = body_start + offset
+        result[name] = json.loads(zlib.decompress(payload[start : start + length]))
+    return result
@@ -1,23 +1,345 @@
 from __future__ import annotations
 
+import asyncio
+import copy
+import logging
+from typing import Any, Iterable
+
+from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.core.cache import LRUCache
+from app.core.config import get_settings
+from app.core.metrics import metrics
 from app.db.models.file_extraction import FileExtraction
+from app.services.blob_service import BlobService
+from app.services.bm25 import parse_terms, terms_to_text, tokenize
+from app.services.extraction_codec import decode_extraction, encode_extraction
 
+logger = logging.getLogger(__name__)
+settings = get_settings()
 
-def upsert_extraction(db: Session, file_id: str, data: dict) -> None:
+# 部分取得で指定可能なセクション（template_version は小さいため常に返す）
+EXTRACTION_SECTIONS = ("meta", "log", "formulation", "derived")
+
+# build_llm_context の出力形式を変えたら上げる（保存済みの古い版は読み出し時に再生成される）
+LLM_CONTEXT_VERSION = 1
+
+
+class ExtractionCache:
+    """
+    最近使った抽出結果・LLM コンテキストのプロセス内 LRU。
+    upsert_extraction で該当ファイル分を破棄する。他ワーカーでの更新は TTL で反映される。
+    値は保存時・取得時にコピーする（呼び出し側が加工しても、後のリクエストが使うエントリは変わらない）。
+    """
+
+    _entries: "LRUCache[tuple[str, str], Any]" = LRUCache(
+        settings.extraction_cache_size, settings.extraction_cache_ttl_seconds
+    )
+
+    @classmethod
+    def get_many(cls, kind: str, file_ids: Iterable[str]) -> dict[str, Any]:
+        hits = cls._entries.get_many([(kind, file_id) for file_id in file_ids])
+        return {file_id: copy.deepcopy(value) for (_, file_id), value in hits.items()}
+
+    @classmethod
+    def set_many(cls, kind: str, values: dict[str, Any]) -> None:
+        cls._entries.set_many({(kind, file_id): copy.deepcopy(value) for file_id, value in values.items()})
+
+    @classmethod
+    def invalidate(cls, file_id: str) -> None:
+        cls._entries.discard_where(lambda key: key[1] == file_id)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._entries.clear()
+
+
+def _extraction_blob_service() -> BlobService:
+    return BlobService(container_name=settings.azure_blob_extractions_container)
+
+
+def _prepare_extraction(file_id: str, data: dict) -> dict[str, Any]:
+    """抽出結果を行の値にする（エンコード・LLM コンテキストの生成。大きい場合は Blob に退避する）。DB は使わない"""
+    payload = encode_extraction(data)
+    values: dict[str, Any] = {"data": None, **_llm_context_values(data), "payload_size": len(payload)}
+    if len(payload) > settings.extraction_inline_max_bytes:
+        # 大きな抽出結果は Blob に退避し、行にはポインタのみ残す
+        values["blob_path"] = _extraction_blob_service().upload_bytes_sync(
+            f"{file_id}.ncx", payload, content_type="application/octet-stream"
+        )
+        values["payload"] = None
+    else:
+        values["blob_path"] = None
+        values["payload"] = payload
+    return values
+
+
+def _llm_context_values(data: dict) -> dict[str, Any]:
+    """LLM 用コンテキストと BM25 用の語（行の値）"""
+    llm_context = build_llm_context(data)
+    return {
+        "llm_context": llm_context,
+        "llm_context_version": LLM_CONTEXT_VERSION,
+        "llm_context_terms": terms_to_text(tokenize(llm_context)),
+    }
+
+
+def _save_extraction(db: Session, file_id: str, values: dict[str, Any]) -> str | None:
+    """行を保存して commit する。不要になった退避先（Blob）があればそのパスを返す"""
     row = db.query(FileExtraction).filter(FileExtraction.file_id == file_id).one_or_none()
     if row is None:
-        row = FileExtraction(file_id=file_id, data=data)
+        row = FileExtraction(file_id=file_id)
         db.add(row)
-    else:
-        row.data = data
+
+    old_blob_path = row.blob_path
+    for name, value in values.items():
+        setattr(row, name, value)
+    # 抽出結果が変わったのでファイル要約を作り直す（循環 import を避けるため関数内で import）
+    from app.services.file_summary_service import FileSummaryService
+
+    FileSummaryService(db).mark_stale(file_id)
     db.commit()
+    ExtractionCache.invalidate(file_id)
+    return old_blob_path if old_blob_path and not row.blob_path else None
+
+
+def delete_spilled_extraction(blob_path: str) -> None:
+    """Blob に退避した抽出結果を削除する（DB の commit 後に呼ぶ。失敗しても警告ログのみ）"""
+    try:
+        _extraction_blob_service().delete_blob_sync(blob_path)
+    except Exception as e:
+        logger.warning("Failed to delete spilled extraction %s: %s", blob_path, e)
+
+
+def upsert_extraction(db: Session, file_id: str, data: dict) -> None:
+    stale_blob_path = _save_extraction(db, file_id, _prepare_extraction(file_id, data))
+    if stale_blob_path:
+        delete_spilled_extraction(stale_blob_path)
+
+
+def delete_extraction(db: Session, file_id: str) -> str | None:
+    """ファイル削除時に抽出結果の行を削除する（commit は呼び出し側）。Blob に退避していた場合はそのパスを返す"""
+    row = db.query(FileExtraction).filter(FileExtraction.file_id == file_id).one_or_none()
+    ExtractionCache.invalidate(file_id)
+    if row is None:
+        return None
+    blob_path = row.blob_path
+    db.delete(row)
+    return blob_path
+
+
+async def upsert_extraction_async(db: AsyncSession, file_id: str, data: dict) -> None:
+    """async ルート用の upsert_extraction。エンコード・Blob への退避はスレッドで、DB の更新は AsyncSession で行う"""
+    values = await asyncio.to_thread(_prepare_extraction, file_id, data)
+    stale_blob_path = await db.run_sync(_save_extraction, file_id, values)
+    if stale_blob_path:
+        await asyncio.to_thread(delete_spilled_extraction, stale_blob_path)
 
 
-def get_extraction(db: Session, file_id: str) -> dict | None:
+def decode_row(row: FileExtraction, sections: Iterable[str] | None = None) -> dict[str, Any]:
+    """FileExtraction 行を dict に戻す（旧形式の JSON 行 / 圧縮行 / Blob 退避行に対応）"""
+    if row.data is not None:
+        if sections is None:
+            return row.data
+        return {k: row.data[k] for k in sections if k in row.data}
+
+    payload = row.payload
+    if payload is None and row.blob_path:
+        payload = _extraction_blob_service().download_bytes_sync(row.blob_path)
+    if payload is None:
+        return {}
+    return decode_extraction(payload, sections)
+
+
+def get_extraction(db: Session, file_id: str, sections: Iterable[str] | None = None) -> dict | None:
+    if sections is None:
+        return get_extractions(db, [file_id]).get(file_id)
     row = db.query(FileExtraction).filter(FileExtraction.file_id == file_id).one_or_none()
-    return row.data if row else None
+    return decode_row(row, sections) if row else None
+
+
+def get_extractions(db: Session, file_ids: Iterable[str]) -> dict[str, dict]:
+    """複数ファイルの抽出結果をまとめて取得する（キャッシュに無い分のみ1クエリで読む）"""
+    ids = list(dict.fromkeys(file_ids))
+    result = ExtractionCache.get_many("data", ids)
+    missing = [fid for fid in ids if fid not in result]
+    if missing:
+        rows = db.query(FileExtraction).filter(FileExtraction.file_id.in_(missing)).all()
+        loaded = {str(row.file_id): decode_row(row) for row in rows}
+        ExtractionCache.set_many("data", loaded)
+        result.update(loaded)
+    return result
+
+
+def get_extraction_view(
+    db: Session,
+    file_id: str,
+    *,
+    sections: Iterable[str] | None = None,
+    log_offset: int = 0,
+    log_limit: int | None = None,
+    formulation_offset: int = 0,
+    formulation_limit: int | None = None,
+) -> dict | None:
+    """
+    抽出結果の部分取得。指定セクションのみを展開し、LOG 行・配合行はページングして返す。
+    ページングした場合は "paging" に {"offset", "limit", "total"} を付与する。
+    """
+    names = list(EXTRACTION_SECTIONS if sections is None else sections) + ["template_version"]
+    data = get_extraction(db, file_id, names)
+    if data is None:
+        return None
+
+    paging: dict[str, dict[str, int | None]] = {}
+    if "log" in data and (log_offset or log_limit is not None):
+        logs = data["log"] or []
+        data["log"] = logs[log_offset : None if log_limit is None else log_offset + log_limit]
+        paging["log"] = {"offset": log_offset, "limit": log_limit, "total": len(logs)}
+
+    form = data.get("formulation")
+    if form and (formulation_offset or formulation_limit is not None):
+        rows = form.get("rows") or []
+        end = None if formulation_limit is None else formulation_offset + formulation_limit
+        data["formulation"] = {**form, "rows": rows[formulation_offset:end]}
+        paging["formulation"] = {"offset": formulation_offset, "limit": formulation_limit, "total": len(rows)}
+
+    if paging:
+        data["paging"] = paging
+    return data
+
+
+def build_llm_context(ex: dict, log_rows: int | None = 3, formulation_rows: int | None = 10) -> str:
+    """抽出結果から LLM に渡す短いコンテキスト文字列を組み立てる（既定は LOG 3行・配合10行に切り詰め。None は全行）"""
+    meta = ex.get("meta", {}) or {}
+    logs = ex.get("log", []) or []
+    form = ex.get("formulation", {}) or {}
+
+    lines: list[str] = []
+    lines.append("【メタ】")
+    for k in [
+        "trial_id",
+        "application",
+        "issue",
+        "ingredient",
+        "customer",
+        "author",
+        "date",
+        "selected_variant",
+        "outcome",
+        "failure_tags",
+        "keywords",
+    ]:
+        if meta.get(k):
+            lines.append(f"- {k}: {meta.get(k)}")
+
+    lines.append("\n【LOG】")
+    for row in logs[:log_rows]:
+        lines.append(
+            f"- {row.get('variant_id')} {row.get('variant_label')}: "
+            f"判定={row.get('judgement')}, "
+            f"結果={row.get('result')}, "
+            f"失敗={row.get('failure_symptoms')}, "
+            f"仮説={row.get('cause_hypothesis')}, "
+            f"次={row.get('next_action')}"
+        )
+        q = row.get("quote")
+        if q:
+            lines.append(f"  引用: {q}")
+
+    lines.append("\n【配合（抜粋）】")
+    rows = (form.get("rows") or [])[:formulation_rows]
+    for r in rows:
+        ing = r.get("ingredient")
+        v = r.get("variants", {}) or {}
+        if ing:
+            n1 = v.get("No.1", {}) or {}
+            lines.append(f"- {ing}: {n1.get('pct')}% / {n1.get('g')}g（No.1）")
+
+    return "\n".join(lines)
+
+
+def get_llm_contexts(db: Session, file_ids: Iterable[str]) -> dict[str, str]:
+    """
+    抽出時に保存済みの LLM 用コンテキストを1クエリでまとめて取得する（書き込みはしない）。
+    版が古い/未生成の行は抽出結果からその場で生成する（保存は scripts/build_llm_contexts.py で行う）。
+    """
+    ids = list(dict.fromkeys(file_ids))
+    contexts = ExtractionCache.get_many("context", ids)
+    missing = [fid for fid in ids if fid not in contexts]
+    if not missing:
+        return contexts
+
+    rows = (
+        db.query(FileExtraction.file_id, FileExtraction.llm_context, FileExtraction.llm_context_version)
+        .filter(FileExtraction.file_id.in_(missing))
+        .all()
+    )
+    loaded = {str(fid): text for fid, text, version in rows if version == LLM_CONTEXT_VERSION and text}
+
+    stale = [str(fid) for fid, _, version in rows if str(fid) not in loaded]
+    if stale:
+        metrics.inc("extraction.stale_llm_context", len(stale))
+        for row in db.query(FileExtraction).filter(FileExtraction.file_id.in_(stale)).all():
+            loaded[str(row.file_id)] = build_llm_context(decode_row(row, ["meta", "log", "formulation"]))
+
+    ExtractionCache.set_many("context", loaded)
+    contexts.update(loaded)
+    return contexts
+
+
+def get_llm_context_terms(db: Session, file_ids: Iterable[str]) -> dict[str, list[str]]:
+    """
+    LLM 用コンテキストの BM25 用の語を1クエリでまとめて取得する（抽出が無いファイルは含まない。書き込みはしない）。
+    未計算・版が古い行は、コンテキストからその場で計算する。
+    """
+    ids = list(dict.fromkeys(file_ids))
+    result = ExtractionCache.get_many("terms", ids)
+    missing = [fid for fid in ids if fid not in result]
+    if not missing:
+        return result
+
+    rows = (
+        db.query(FileExtraction.file_id, FileExtraction.llm_context_terms, FileExtraction.llm_context_version)
+        .filter(FileExtraction.file_id.in_(missing))
+        .all()
+    )
+    loaded = {
+        str(fid): parse_terms(terms) for fid, terms, version in rows if version == LLM_CONTEXT_VERSION and terms is not None
+    }
+
+    stale = [str(fid) for fid, _, _ in rows if str(fid) not in loaded]
+    if stale:
+        contexts = get_llm_contexts(db, stale)
+        for fid in stale:
+            loaded[fid] = tokenize(contexts.get(fid) or "")
 
+    ExtractionCache.set_many("terms", loaded)
+    result.update(loaded)
+    return result
 
 
+def refresh_llm_contexts(db: Session, *, batch_size: int = 200, force: bool = False) -> int:
+    """
+    LLM 用コンテキスト・BM25 用の語が未生成、または版が古い行を作り直す（scripts/build_llm_contexts.py）。
+    force=True の場合は全行を作り直す。作り直した行数を返す。
+    """
+    query = db.query(FileExtraction.id)
+    if not force:
+        query = query.filter(
+            or_(
+                FileExtraction.llm_context_version.is_(None),
+                FileExtraction.llm_context_version != LLM_CONTEXT_VERSION,
+                FileExtraction.llm_context_terms.is_(None),
+            )
+        )
+    ids = [row_id for (row_id,) in query.order_by(FileExtraction.id)]
+    for start in range(0, len(ids), batch_size):
+        rows = db.query(FileExtraction).filter(FileExtraction.id.in_(ids[start : start + batch_size])).all()
+        for row in rows:
+            for name, value in _llm_context_values(decode_row(row, ["meta", "log", "formulation"])).items():
+                setattr(row, name, value)
+            ExtractionCache.invalidate(str(row.file_id))
+        db.commit()
+    return len(ids)
@@ -1,12 +1,20 @@
+import asyncio
 import logging
 from datetime import datetime
 from typing import List, Tuple
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.db.models.file import File
 from app.db.models.file_download import FileDownload
 from app.schemas.file import FileCreate, FileMetadataUpdate
+from app.services.analytics_service import AnalyticsService
+from app.services.chunking_service import ChunkService
+from app.services.daily_rollup_service import DailyRollupService
+from app.services.extraction_service import delete_extraction, delete_spilled_extraction
+from app.services.file_summary_service import FileSummaryService
+from app.services.issue_term_service import IssueTermService, issue_terms
 from app.services.search_service import SearchService
 
 logger = logging.getLogger(__name__)
@@ -34,9 +42,17 @@ class FileService:
             .all()
         )
 
-    def create(self, payload: FileCreate) -> File:
+    def create(self, payload: FileCreate, terms: List[str] | None = None) -> File:
+        """terms: 解析済みの課題の語（省略時はここで解析する）"""
         file_obj = File(**payload.model_dump())
         self.db.add(file_obj)
+        self.db.flush()
+        FileSummaryService(self.db).mark_stale(file_obj.id)
+        IssueTermService(self.db).sync_file(file_obj, terms)
+        # 登録日（サーバー側の既定値）を読み直してから日次集計に加える
+        self.db.refresh(file_obj, ["created_at"])
+        DailyRollupService(self.db).file_status_changed(file_obj, None)
+        AnalyticsService(self.db).sync_file(None, file_obj)
         self.db.commit()
         self.db.refresh(file_obj)
         return file_obj
@@ -53,9 +69,23 @@ class FileService:
         return file_obj
 
     def delete(self, file_id: str) -> None:
+        spilled_path = self.delete_rows(file_id)
+        if spilled_path:
+            delete_spilled_extraction(spilled_path)
+
+    def delete_rows(self, file_id: str) -> str | None:
+        """ファイルと派生テーブルの行を削除して commit する。Blob に退避していた抽出結果があればそのパスを返す"""
         file_obj = self.get(file_id)
+        spilled_path = delete_extraction(self.db, file_id)
+        ChunkService(self.db).delete_for_file(file_id)
+        FileSummaryService(self.db).delete_for_file(file_id)
+        IssueTermService(self.db).remove_file(file_id)
+        # 分析キューブはファイルのダウンロード数（file_download_daily）を引くため、その削除より前に反映する
+        AnalyticsService(self.db).sync_file(AnalyticsService.file_state(file_obj), None)
+        DailyRollupService(self.db).file_deleted(file_obj)
         self.db.delete(file_obj)
         self.db.commit()
+        return spilled_path
 
     def search(
         self,
@@ -93,20 +123,11 @@ class FileService:
             page_size=page_size,
         )
 
-        # 検索結果にダウンロード数を付与（DBから集計）
+        # 検索結果にダウンロード数を付与（日次集計から。圧縮済みの古いダウンロードも含む）
         if files:
             file_ids = [f.get("id") for f in files if f.get("id")]
             if file_ids:
-                from sqlalchemy import func
-                from app.db.models.file_download import FileDownload
-
-                counts = (
-                    self.db.query(FileDownload.file_id, func.count(FileDownload.id))
-                    .filter(FileDownload.file_id.in_(file_ids))
-                    .group_by(FileDownload.file_id)
-                    .all()
-                )
-                count_map = {str(c[0]): c[1] for c in counts}
+                count_map = DailyRollupService(self.db).download_counts(file_ids)
 
                 # プレビュー不可フラグを取得
                 preview_flags = (
@@ -123,11 +144,15 @@ class FileService:
 
         return total_count, files
 
-    def update_metadata(self, file_id: str, payload: FileMetadataUpdate) -> File:
-        """メタデータの部分更新"""
+    def update_metadata(
+        self, file_id: str, payload: FileMetadataUpdate, terms: List[str] | None = None
+    ) -> File:
+        """メタデータの部分更新。terms: 更新後の課題の解析済みの語（省略時はここで解析する）"""
         file_obj = self.get(file_id)
 
         data = payload.model_dump(exclude_unset=True)
+        old_status = file_obj.status
+        old_state = AnalyticsService.file_state(file_obj)
         for field, value in data.items():
             setattr(file_obj, field, value)
 
@@ -135,6 +160,14 @@ class FileService:
         if hasattr(file_obj, "updated_at"):
             file_obj.updated_at = datetime.utcnow()
 
+        # 要約にはメタデータ（用途・顧客など）も含めるため作り直す
+        FileSummaryService(self.db).mark_stale(file_id)
+        # ワードクラウドの語の集計は課題・状態が変わった場合だけ更新する
+        if "issue" in data or "status" in data:
+            IssueTermService(self.db).sync_file(file_obj, terms)
+        if file_obj.status != old_status:
+            DailyRollupService(self.db).file_status_changed(file_obj, old_status)
+        AnalyticsService(self.db).sync_file(old_state, file_obj)
         self.db.add(file_obj)
         self.db.commit()
         self.db.refresh(file_obj)
@@ -144,7 +177,47 @@ class FileService:
     def record_download(self, file_id: str, user_id: int) -> FileDownload:
         download = FileDownload(file_id=file_id, user_id=user_id)
         self.db.add(download)
+        self.db.flush()
+        # ダウンロード日時（サーバー側の既定値）を読み直してから同じトランザクションで日次集計に加える
+        self.db.refresh(download, ["downloaded_at"])
+        DailyRollupService(self.db).record_download(file_id, download.downloaded_at)
+        file_obj = self.db.get(File, file_id)
+        if file_obj is not None:
+            AnalyticsService(self.db).record_download(file_obj, download.downloaded_at)
         self.db.commit()
         self.db.refresh(download)
         return download
 
+
+class AsyncFileService:
+    """
+    async def のルート用の FileService（AsyncSession: MSSQL は aioodbc、SQLite は aiosqlite）。
+    集計の更新などを含む処理は同期版と共通にするため、同期版を AsyncSession.run_sync で実行する。
+    DB の待ち時間ではイベントループを止めない。課題の形態素解析（janome）は run_sync の前にスレッドで行い、結果を渡す。
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get(self, file_id: str) -> File:
+        return await self.db.run_sync(lambda db: FileService(db).get(file_id))
+
+    async def create(self, payload: FileCreate) -> File:
+        terms = await asyncio.to_thread(issue_terms, payload.issue)
+        return await self.db.run_sync(lambda db: FileService(db).create(payload, terms))
+
+    async def delete(self, file_id: str) -> None:
+        spilled_path = await self.db.run_sync(lambda db: FileService(db).delete_rows(file_id))
+        if spilled_path:
+            await asyncio.to_thread(delete_spilled_extraction, spilled_path)
+
+    async def update_metadata(self, file_id: str, payload: FileMetadataUpdate) -> File:
+        data = payload.model_dump(exclude_unset=True)
+        terms = None
+        if "issue" in data or "status" in data:
+            issue = data["issue"] if "issue" in data else (await self.get(file_id)).issue
+            terms = await asyncio.to_thread(issue_terms, issue)
+        return await self.db.run_sync(lambda db: FileService(db).update_metadata(file_id, payload, terms))
+
+    async def record_download(self, file_id: str, user_id: int) -> FileDownload:
+        return await self.db.run_sync(lambda db: FileService(db).record_download(file_id, user_id))
@@ -0,0 +1,313 @@
+"""
+ファイル要約（file_summaries）。
+
+取り込み時（アップロード・再抽出・メタデータ更新）に要約を pending にし、
+バックグラウンドのワーカープール（FileSummaryRunner。app.main の lifespan で起動）が LLM で
+「概要 / 主な結果 / 失敗原因 / 採用した配合案」の短い要約を作って保存する。
+抽出データが無いファイルは、要約の元として取得した検索インデックスの本文からパッセージ索引（file_chunks）も作る。
+
+AI分析では ready の要約があるファイルは抽出データ・本文の代わりに要約を LLM に渡す
+（AIAnalysisRequest.use_summaries=false または rag_use_file_summaries=false で無効）。
+幅広い質問で多数の文書を扱う場合に、プロンプトのトークン数と LLM の待ち時間を大きく減らせる。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.db.models.file import File
+from app.db.models.file_summary import FileSummary
+from app.db.session import SessionLocal
+from app.services.chunking_service import ChunkService
+from app.services.extraction_service import build_llm_context, get_extraction
+from app.services.llm_service import get_llm_service
+from app.services.search_service import SearchService
+from app.services.worker_pool import PollingWorkerPool, to_thread_to_completion
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# 要約のプロンプト・形式を変えたら上げる（古い版の要約は使わず、scripts/build_file_summaries.py で作り直す）
+SUMMARY_VERSION = 1
+
+SUMMARY_QUESTION = "この資料を要約してください。"
+
+SUMMARY_SYSTEM_PROMPT = """あなたは熟練の食品開発アドバイザーです。
+提供された `<document>` タグ内の資料（1件）を、後から多数の資料をまとめて比較できるよう、以下の形式で日本語で簡潔に要約してください。
+資料に書かれていることだけを書き、推測は書かないでください。記載が無い項目は「記載なし」と書いてください。
+
+【概要】用途・課題・原料・顧客など（1〜2行）
+【主な結果】
+- 判定・結果（数値があれば数値も）
+【失敗原因】
+- 失敗の症状と原因の仮説
+【採用した配合案】
+- 採用した配合案とその理由"""
+
+_METADATA_LABELS = {
+    "application": "用途",
+    "issue": "課題",
+    "ingredient": "原料",
+    "customer": "顧客",
+    "trial_id": "試作ID",
+    "author": "作成者",
+}
+
+SummarizeFunc = Callable[[Session, str], Awaitable[Dict[str, Any]]]
+
+
+def build_summary_source(
+    db: Session,
+    file_id: str,
+    fetch_contents: Callable[[list[str]], Dict[str, str]] | None,
+    index_passages: bool = False,
+) -> Dict[str, Any] | None:
+    """
+    要約の元になる文書（generate_response に渡す形式）を作る。ファイルが無い場合は None。
+    抽出データがあれば LOG・配合を切り詰めずに使い、無ければ検索インデックスの本文を使う。
+    index_passages=True の場合、取得した本文からパッセージ索引も作成する（分析時は読み出しのみのため）。
+    """
+    file_obj = db.get(File, file_id)
+    if file_obj is None:
+        return None
+
+    lines = ["【ファイル情報】"]
+    for field, label in _METADATA_LABELS.items():
+        if getattr(file_obj, field, None):
+            lines.append(f"- {label}: {getattr(file_obj, field)}")
+
+    extraction = get_extraction(db, file_id, ["meta", "log", "formulation"])
+    if extraction:
+        body = build_llm_context(extraction, log_rows=None, formulation_rows=30)
+    elif fetch_contents is not None:
+        body = fetch_contents([file_id]).get(file_id) or ""
+        if index_passages and body:
+            ChunkService(db).ensure_chunks({file_id: body})
+    else:
+        body = ""
+
+    return {
+        "file_id": file_id,
+        "original_name": file_obj.original_name,
+        "content": "\n".join(lines) + "\n\n" + body if body.strip() else "",
+    }
+
+
+class FileSummaryService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    # --- 更新時のフック ---
+
+    def mark_stale(self, file_id: str) -> None:
+        """要約を作り直す（pending に戻す）。commit は呼び出し側で行う"""
+        row = self.db.query(FileSummary).filter(FileSummary.file_id == file_id).one_or_none()
+        if row is None:
+            row = FileSummary(file_id=file_id)
+            self.db.add(row)
+        row.status = "pending"
+        row.revision = (row.revision or 0) + 1
+        row.attempts = 0
+        row.error = None
+        row.started_at = None
+        row.next_attempt_at = None
+
+    def delete_for_file(self, file_id: str) -> None:
+        self.db.query(FileSummary).filter(FileSummary.file_id == file_id).delete(synchronize_session=False)
+
+    def enqueue_missing(self, rebuild: bool = False) -> int:
+        """要約が無い・失敗した・版が古いファイル（rebuild=True は全ファイル）を pending にする。件数を返す"""
+        states = {
+            str(fid): (status, version)
+            for fid, status, version in self.db.query(FileSummary.file_id, FileSummary.status, FileSummary.version)
+        }
+        count = 0
+        for (file_id,) in self.db.query(File.id):
+            status, version = states.get(str(file_id), (None, None))
+            if status in ("pending", "running"):
+                continue
+            if rebuild or status in (None, "failed") or version != SUMMARY_VERSION:
+                self.mark_stale(str(file_id))
+                count += 1
+        self.db.commit()
+        return count
+
+    # --- AI分析用 ---
+
+    def get_summaries(self, file_ids: Iterable[str]) -> Dict[str, str]:
+        """ready かつ現在の版の要約を1クエリでまとめて取得する"""
+        ids = list(dict.fromkeys(file_ids))
+        if not ids:
+            return {}
+        rows = (
+            self.db.query(FileSummary.file_id, FileSummary.summary)
+            .filter(
+                FileSummary.file_id.in_(ids),
+                FileSummary.status == "ready",
+                FileSummary.version == SUMMARY_VERSION,
+            )
+            .all()
+        )
+        return {str(fid): summary for fid, summary in rows if summary}
+
+    # --- ワーカー用 ---
+
+    def claim_next(self) -> tuple[int, str, int] | None:
+        """生成待ち（またはリース切れ）の要約を1件 running にして (id, file_id, revision) を返す。無ければ None"""
+        now = datetime.now(timezone.utc)
+        expired = and_(
+            FileSummary.status == "running",
+            FileSummary.started_at < now - timedelta(seconds=settings.file_summary_lease_seconds),
+        )
+        exhausted = (
+            self.db.query(FileSummary)
+            .filter(expired, FileSummary.attempts >= settings.file_summary_max_attempts)
+            .update({"status": "failed", "error": "worker did not finish the summary"}, synchronize_session=False)
+        )
+        if exhausted:
+            self.db.commit()
+
+        claimable = or_(
+            and_(
+                FileSummary.status == "pending",
+                or_(FileSummary.next_attempt_at.is_(None), FileSummary.next_attempt_at <= now),
+            ),
+            expired,
+        )
+        candidates = [
+            row_id for (row_id,) in self.db.query(FileSummary.id).filter(claimable).order_by(FileSummary.id).limit(5)
+        ]
+        for row_id in candidates:
+            claimed = (
+                self.db.query(FileSummary)
+                .filter(FileSummary.id == row_id, claimable)
+                .update(
+                    {"status": "running", "started_at": now, "attempts": FileSummary.attempts + 1},
+                    synchronize_session=False,
+                )
+            )
+            self.db.commit()
+            if claimed:
+                row = self.db.get(FileSummary, row_id)
+                self.db.refresh(row)
+                return row.id, str(row.file_id), row.revision
+        return None
+
+    def finish(
+        self, summary_id: int, revision: int, summary: str | None = None, model: str | None = None, error: str | None = None
+    ) -> bool:
+        """
+        生成結果を保存する。生成中にファイルが更新された（revision が変わった）場合は保存せず False を返す。
+        失敗は file_summary_max_attempts 回まで間隔を空けて再試行する。
+        """
+        now = datetime.now(timezone.utc)
+        if error is None:
+            values = {"status": "ready", "summary": summary, "version": SUMMARY_VERSION, "model": model, "error": None}
+        else:
+            attempts = self.db.query(FileSummary.attempts).filter(FileSummary.id == summary_id).scalar() or 0
+            if attempts >= settings.file_summary_max_attempts:
+                values = {"status": "failed", "error": error}
+            else:
+                retry_at = now + timedelta(seconds=settings.file_summary_retry_seconds * attempts)
+                values = {"status": "pending", "error": error, "next_attempt_at": retry_at}
+        updated = (
+            self.db.query(FileSummary)
+            .filter(FileSummary.id == summary_id, FileSummary.revision == revision, FileSummary.status == "running")
+            .update(values, synchronize_session=False)
+        )
+        self.db.commit()
+        if not updated:
+            metrics.inc("file_summaries.discarded")
+            return False
+        metrics.inc("file_summaries.failed" if error else "file_summaries.ready")
+        return True
+
+    def requeue(self, summary_id: int, revision: int) -> None:
+        """シャットダウンで中断した要約を生成待ちに戻す（試行回数には数えない）。中断した処理の変更は捨てる"""
+        self.db.rollback()
+        self.db.query(FileSummary).filter(
+            FileSummary.id == summary_id, FileSummary.revision == revision, FileSummary.status == "running"
+        ).update(
+            {"status": "pending", "started_at": None, "attempts": FileSummary.attempts - 1},
+            synchronize_session=False,
+        )
+        self.db.commit()
+
+
+async def _default_summarize(db: Session, file_id: str) -> Dict[str, Any]:
+    llm_service = get_llm_service()
+    if not llm_service.is_enabled():
+        raise RuntimeError("LLM service is not configured.")
+    search_service = SearchService()
+    fetch_contents = search_service.get_contents if search_service.is_enabled() else None
+    doc = await asyncio.to_thread(build_summary_source, db, file_id, fetch_contents, True)
+    if doc is None:
+        raise RuntimeError("file not found")
+    if not doc["content"]:
+        # 抽出データが無く、検索インデックスにも本文がまだ無い（インデクサの反映待ち）
+        raise RuntimeError("file content is not available yet")
+    result = await llm_service.generate_response(
+        SUMMARY_QUESTION, [doc], system_prompt=SUMMARY_SYSTEM_PROMPT, max_tokens=settings.file_summary_max_tokens
+    )
+    if result.get("error"):
+        raise RuntimeError(result["error"])
+    return {"summary": (result.get("answer") or "").strip(), "model": result.get("provider") or settings.llm_model}
+
+
+class FileSummaryRunner(PollingWorkerPool):
+    """ファイル要約を生成するワーカープール。アップロード・更新の直後は notify() で即時に起こす"""
+
+    name = "file-summary-worker"
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        summarize: SummarizeFunc = _default_summarize,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        super().__init__(
+            settings.file_summary_workers if workers is None else workers,
+            settings.file_summary_poll_seconds,
+            session_factory,
+        )
+        self.summarize = summarize
+
+    def claim(self) -> tuple[int, str, int] | None:
+        db = self.session_factory()
+        try:
+            return FileSummaryService(db).claim_next()
+        finally:
+            db.close()
+
+    async def run_item(self, claimed: tuple[int, str, int]) -> None:
+        summary_id, file_id, revision = claimed
+        db = self.session_factory()
+        service = FileSummaryService(db)
+        try:
+            result = await self.summarize(db, file_id)
+        except asyncio.CancelledError:
+            await to_thread_to_completion(service.requeue, summary_id, revision)
+            raise
+        except Exception as e:
+            logger.warning("Summary for file %s failed: %s", file_id, e)
+            db.rollback()
+            await asyncio.to_thread(service.finish, summary_id, revision, None, None, str(e) or type(e).__name__)
+        else:
+            await asyncio.to_thread(service.finish, summary_id, revision, result["summary"], result.get("model"))
+        finally:
+            db.close()
+
+
+@lru_cache
+def get_summary_runner() -> FileSummaryRunner:
+    """ワーカー内で共有する FileSummaryRunner を返す"""
+    return FileSummaryRunner()
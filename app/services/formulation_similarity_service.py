@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Any, Collection, Dict, Iterable, List
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Query, Session
+
+from app.db.models.file import File
+from app.db.models.file_extraction import FileExtraction
+from app.services.extraction_service import decode_row
+
+logger = logging.getLogger(__name__)
+
+_PCT_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _normalize_ingredient(name: str) -> str:
+    """表記ゆれ（全角/半角・大文字小文字・空白）を吸収した原材料キー"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", name)).strip().lower()
+
+
+def _to_pct(value: Any) -> float | None:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = _PCT_RE.search(unicodedata.normalize("NFKC", str(value)))
+    return float(m.group(0)) if m else None
+
+
+def vectorize_formulation(formulation: Dict[str, Any] | None) -> Dict[str, Dict[str, float]]:
+    """
+    `_parse_formulation` の出力を variant ごとの疎ベクトル（原材料→配合率）に変換する。
+
+    Returns:
+        {"No.1": {"砂糖": 12.5, ...}, ...}（配合率が0/未入力の原材料は含めない）
+    """
+    if not formulation:
+        return {}
+
+    vectors: Dict[str, Dict[str, float]] = {v: {} for v in formulation.get("variants") or []}
+    for row in formulation.get("rows") or []:
+        ing = _normalize_ingredient(str(row.get("ingredient") or ""))
+        if not ing:
+            continue
+        for variant_id, cell in (row.get("variants") or {}).items():
+            pct = _to_pct((cell or {}).get("pct"))
+            if pct:
+                vec = vectors.setdefault(variant_id, {})
+                vec[ing] = vec.get(ing, 0.0) + pct
+    return {k: v for k, v in vectors.items() if v}
+
+
+class FormulationIndex:
+    """
+    配合ベクトルのプロセス内インデックス。
+
+    各 variant を L2 正規化した疎ベクトルとして COO 形式（row/col/val の numpy 配列）で保持し、
+    クエリ時は np.bincount による疎行列×ベクトル積で全件のコサイン類似度を一括計算する。
+    アップロード/削除時は行の追加・無効化のみで更新し、無効行が増えたら詰め直す。
+    他のワーカーでの追加・更新・削除は ensure_loaded() の版の確認（件数と file_extractions.updated_at の最大値）で取り込む。
+    """
+
+    _COMPACT_RATIO = 0.5
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._loaded = False
+        # 取り込み済みの版: (件数, updated_at の最大値) と、取り込み済みのファイル（配合が無いものを含む）
+        self._version: tuple[int, Any] | None = None
+        self._indexed: set[str] = set()
+        self._vocab: Dict[str, int] = {}
+        self._keys: List[tuple[str, str]] = []  # row -> (file_id, variant_id)
+        self._rows_by_file: Dict[str, List[int]] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._row = np.zeros(0, dtype=np.int32)
+        self._col = np.zeros(0, dtype=np.int32)
+        self._val = np.zeros(0, dtype=np.float32)
+        self._nnz = 0
+        self._dead = 0
+
+    # --- 構築・更新 ---
+
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def ensure_loaded(self, db: Session) -> None:
+        """
+        初回はDB上の全抽出結果から構築し、以降は版が変わっていれば差分を取り込む。
+        updated_at が取り込み済みの最大値以降の行を読み直し、件数が合わなければ削除・非アクティブ化された分を外す。
+        """
+        version = self._db_version(db)
+        if self._loaded and version == self._version:
+            return
+        with self._lock:
+            if self._loaded and version == self._version:
+                return
+            since = self._version[1] if self._loaded and self._version else None
+            count = self._load_rows(db, since=since)
+            if len(self._indexed) != version[0]:
+                active = {str(fid) for (fid,) in self._active_extractions(db, FileExtraction.file_id)}
+                for file_id in self._indexed - active:
+                    self._remove(file_id)
+                    self._indexed.discard(file_id)
+                missing = active - self._indexed
+                if missing:
+                    count += self._load_rows(db, file_ids=missing)
+                self._maybe_compact()
+            self._version = version
+            if not self._loaded:
+                logger.info("FormulationIndex loaded: %d variants, %d ingredients", count, len(self._vocab))
+            self._loaded = True
+
+    @staticmethod
+    def _active_extractions(db: Session, *columns: Any) -> Query:
+        return db.query(*columns).join(File, File.id == FileExtraction.file_id).filter(File.status == "active")
+
+    def _db_version(self, db: Session) -> tuple[int, Any]:
+        count, updated_at = self._active_extractions(
+            db, func.count(FileExtraction.id), func.max(FileExtraction.updated_at)
+        ).one()
+        return int(count or 0), updated_at
+
+    def _load_rows(self, db: Session, *, since: Any = None, file_ids: Collection[str] | None = None) -> int:
+        query = self._active_extractions(db, FileExtraction)
+        if since is not None:
+            # updated_at の精度（SQLite は秒）で取りこぼさないよう、同じ時刻の行も読み直す
+            query = query.filter(FileExtraction.updated_at >= since)
+        if file_ids is not None:
+            query = query.filter(FileExtraction.file_id.in_(list(file_ids)))
+        count = 0
+        for row in query.yield_per(500):
+            file_id = str(row.file_id)
+            self._remove(file_id)
+            count += self._add(file_id, decode_row(row, ["formulation"]).get("formulation"))
+            self._indexed.add(file_id)
+        return count
+
+    def add_file(self, file_id: str, extraction: Dict[str, Any] | None) -> None:
+        """アップロード時の差分更新（未構築の場合は初回構築時にDBから読まれるため何もしない）"""
+        if not self._loaded:
+            return
+        with self._lock:
+            self._remove(file_id)
+            self._add(file_id, (extraction or {}).get("formulation"))
+            self._indexed.add(file_id)
+            self._maybe_compact()
+
+    def remove_file(self, file_id: str) -> None:
+        if not self._loaded:
+            return
+        with self._lock:
+            self._remove(file_id)
+            self._indexed.discard(file_id)
+            self._maybe_compact()
+
+    def bulk_load(self, items: Iterable[tuple[str, Dict[str, Dict[str, float]]]]) -> None:
+        """ベクトル化済みデータの一括投入（ベンチマーク・テスト用）"""
+        with self._lock:
+            for file_id, vectors in items:
+                self._add_vectors(file_id, vectors)
+                self._indexed.add(file_id)
+            self._loaded = True
+
+    def _add(self, file_id: str, formulation: Dict[str, Any] | None) -> int:
+        return self._add_vectors(file_id, vectorize_formulation(formulation))
+
+    def _add_vectors(self, file_id: str, vectors: Dict[str, Dict[str, float]]) -> int:
+        for variant_id, vec in vectors.items():
+            cols = np.fromiter((self._term_id(k) for k in vec), dtype=np.int32, count=len(vec))
+            vals = np.fromiter(vec.values(), dtype=np.float32, count=len(vec))
+            norm = float(np.linalg.norm(vals))
+            if norm == 0.0:
+                continue
+
+            row_id = len(self._keys)
+            self._keys.append((file_id, variant_id))
+            self._rows_by_file.setdefault(file_id, []).append(row_id)
+            self._append(row_id, cols, vals / norm)
+        return len(vectors)
+
+    def _term_id(self, term: str) -> int:
+        idx = self._vocab.get(term)
+        if idx is None:
+            idx = self._vocab[term] = len(self._vocab)
+        return idx
+
+    def _append(self, row_id: int, cols: np.ndarray, vals: np.ndarray) -> None:
+        n = len(cols)
+        if self._nnz + n > len(self._val):
+            capacity = max(1024, (self._nnz + n) * 2)
+            self._row = np.resize(self._row, capacity)
+            self._col = np.resize(self._col, capacity)
+            self._val = np.resize(self._val, capacity)
+        self._row[self._nnz : self._nnz + n] = row_id
+        self._col[self._nnz : self._nnz + n] = cols
+        self._val[self._nnz : self._nnz + n] = vals
+        self._nnz += n
+
+        if row_id >= len(self._alive):
+            self._alive = np.resize(self._alive, max(1024, (row_id + 1) * 2))
+            self._alive[row_id:] = False
+        self._alive[row_id] = True
+
+    def _remove(self, file_id: str) -> None:
+        for row_id in self._rows_by_file.pop(file_id, []):
+            self._alive[row_id] = False
+            self._dead += 1
+
+    def _maybe_compact(self) -> None:
+        if not self._keys or self._dead / len(self._keys) < self._COMPACT_RATIO:
+            return
+
+        n_rows = len(self._keys)
+        alive = self._alive[:n_rows]
+        new_ids = np.cumsum(alive) - 1
+        keep = alive[self._row[: self._nnz]]
+
+        self._row = new_ids[self._row[: self._nnz][keep]].astype(np.int32)
+        self._col = self._col[: self._nnz][keep]
+        self._val = self._val[: self._nnz][keep]
+        self._nnz = len(self._val)
+        self._keys = [k for k, a in zip(self._keys, alive) if a]
+        self._alive = np.ones(len(self._keys), dtype=bool)
+        self._rows_by_file = {}
+        for row_id, (file_id, _) in enumerate(self._keys):
+            self._rows_by_file.setdefault(file_id, []).append(row_id)
+        self._dead = 0
+
+    # --- 検索 ---
+
+    def variants_of(self, file_id: str) -> List[str]:
+        with self._lock:
+            return [self._keys[r][1] for r in self._rows_by_file.get(file_id, [])]
+
+    def query(
+        self,
+        vector: Dict[str, float],
+        *,
+        top_k: int = 10,
+        exclude_file_id: str | None = None,
+        file_ids: Collection[str] | None = None,
+    ) -> List[Dict[str, Any]]:
+        """疎ベクトルに対するコサイン類似度の上位 top_k 件を返す（file_ids 指定時はそのファイルの配合案のみ）"""
+        with self._lock:
+            n_rows = len(self._keys)
+            if n_rows == 0 or not vector:
+                return []
+
+            q = np.zeros(len(self._vocab), dtype=np.float32)
+            for term, pct in vector.items():
+                idx = self._vocab.get(term)
+                if idx is not None:
+                    q[idx] = pct
+            q_norm = float(np.linalg.norm(np.fromiter(vector.values(), dtype=np.float32)))
+            if q_norm == 0.0:
+                return []
+
+            nnz = self._nnz
+            scores = np.bincount(
+                self._row[:nnz],
+                weights=self._val[:nnz] * q[self._col[:nnz]],
+                minlength=n_rows,
+            ) / q_norm
+
+            scores[~self._alive[:n_rows]] = -np.inf
+            if file_ids is not None:
+                allowed = np.zeros(n_rows, dtype=bool)
+                for file_id in file_ids:
+                    allowed[self._rows_by_file.get(file_id, [])] = True
+                scores[~allowed] = -np.inf
+            if exclude_file_id:
+                scores[self._rows_by_file.get(exclude_file_id, [])] = -np.inf
+
+            k = min(top_k, n_rows)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [
+                {"file_id": self._keys[i][0], "variant_id": self._keys[i][1], "score": float(scores[i])}
+                for i in top
+                if np.isfinite(scores[i]) and scores[i] > 0
+            ]
+
+
+@lru_cache
+def get_formulation_index() -> FormulationIndex:
+    return FormulationIndex()
@@ -0,0 +1,153 @@
+"""
+ダッシュボードのワードクラウド用の語の集計（issue_term_counts）。
+
+以前はキャッシュ切れのたびに有効な全ファイルの課題（files.issue）を連結して janome で解析していたため、
+ファイル数に比例して時間とメモリが増えていた。
+現在はファイルの登録・メタデータ更新・削除時にそのファイルの課題だけを解析し、
+前回の語（file_issue_terms）との差分を語ごとの出現回数に加減する。ワードクラウドは上位 N 件を取得するだけになる。
+
+集計がずれた場合（導入前のファイル・同じ新語の同時登録の競合など）は scripts/rebuild_issue_terms.py で作り直す。
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List
+
+from sqlalchemy.orm import Session
+
+from app.db.models.file import File
+from app.db.models.issue_term import FileIssueTerms, IssueTermCount
+from app.db.upsert import update_or_insert
+from app.services.bm25 import get_tokenizer, parse_terms, terms_to_text
+
+logger = logging.getLogger(__name__)
+
+# ストップワードの定義
+ISSUE_STOP_WORDS = {
+    'て', 'に', 'を', 'は', 'の', 'が', 'と', 'で', 'も', 'な', 'や', 'し', 'か', 'た', 'だ',
+    'ある', 'いる', 'する', 'なる', 'れる', 'られる', 'こと', 'もの', 'よう', 'ため', 'それ',
+    'これ', 'あれ', 'さん', 'さま', 'くん', 'ちゃん', 'ます', 'です', 'など', '等', '・', '、', '。'
+}
+
+
+def issue_terms(text: str | None) -> List[str]:
+    """課題のテキストからワードクラウド用の語（名詞の基本形。2文字以上・数字のみを除く）を取り出す"""
+    if not text:
+        return []
+    words = []
+    for token in get_tokenizer().tokenize(text):
+        # 名詞のみ抽出
+        if token.part_of_speech.split(',')[0] == '名詞':
+            word = token.base_form
+            if word not in ISSUE_STOP_WORDS and len(word) > 1 and not word.isdigit():
+                words.append(word)
+    return words
+
+
+def _counted_terms(file_obj: File, terms: List[str] | None = None) -> List[str]:
+    """集計に含める語（有効なファイルのみ）。terms は解析済みの file_obj.issue の語"""
+    if file_obj.status != "active":
+        return []
+    return issue_terms(file_obj.issue) if terms is None else terms
+
+
+class IssueTermService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    # --- 更新時のフック（commit は呼び出し側で行う） ---
+
+    def sync_file(self, file_obj: File, terms: List[str] | None = None) -> None:
+        """
+        ファイルの課題・状態の変更を集計に反映する（前回の語との差分だけを加減する）。
+        terms: 解析済みの課題の語（issue_terms(file_obj.issue)）。async ルートではイベントループの外で解析して渡す
+        """
+        row = self.db.get(FileIssueTerms, file_obj.id)
+        old_terms = parse_terms(row.terms) if row is not None else []
+        new_terms = _counted_terms(file_obj, terms)
+
+        deltas = Counter(new_terms)
+        deltas.subtract(Counter(old_terms))
+        self._apply_deltas({term: d for term, d in deltas.items() if d})
+
+        if new_terms:
+            if row is None:
+                self.db.add(FileIssueTerms(file_id=file_obj.id, terms=terms_to_text(new_terms)))
+            else:
+                row.terms = terms_to_text(new_terms)
+        elif row is not None:
+            self.db.delete(row)
+        self.db.flush()
+
+    def remove_file(self, file_id: str) -> None:
+        """削除するファイルの語を集計から引く"""
+        row = self.db.get(FileIssueTerms, file_id)
+        if row is None:
+            return
+        self._apply_deltas({term: -n for term, n in Counter(parse_terms(row.terms)).items()})
+        self.db.delete(row)
+        self.db.flush()
+
+    def _apply_deltas(self, deltas: Dict[str, int]) -> None:
+        for term, delta in deltas.items():
+            update_or_insert(
+                self.db,
+                self.db.query(IssueTermCount).filter(IssueTermCount.term == term),
+                {"count": IssueTermCount.count + delta},
+                (lambda term=term, delta=delta: IssueTermCount(term=term, count=delta)) if delta > 0 else None,
+            )
+        removed = [term for term, delta in deltas.items() if delta < 0]
+        if removed:
+            self.db.query(IssueTermCount).filter(
+                IssueTermCount.term.in_(removed), IssueTermCount.count <= 0
+            ).delete(synchronize_session=False)
+
+    # --- ワードクラウド ---
+
+    def top_terms(self, limit: int = 50) -> Dict[str, int]:
+        """出現回数の多い語を上位 limit 件返す"""
+        rows = (
+            self.db.query(IssueTermCount.term, IssueTermCount.count)
+            .filter(IssueTermCount.count > 0)
+            .order_by(IssueTermCount.count.desc(), IssueTermCount.term)
+            .limit(limit)
+            .all()
+        )
+        return {term: count for term, count in rows}
+
+    # --- 作り直し ---
+
+    def rebuild(self, batch_size: int = 1000) -> int:
+        """全ファイルの課題を解析し直して集計を作り直す。集計に含めたファイル数を返す"""
+        per_text: Dict[str, List[str]] = {}  # 同じ課題の文は1回だけ解析する
+        totals: Counter[str] = Counter()
+        file_terms: List[tuple[str, str]] = []
+        rows: Iterable = (
+            self.db.query(File.id, File.issue)
+            .filter(File.status == "active", File.issue.is_not(None))
+            .yield_per(batch_size)
+        )
+        for file_id, issue in rows:
+            terms = per_text.get(issue)
+            if terms is None:
+                terms = per_text[issue] = issue_terms(issue)
+            if terms:
+                totals.update(terms)
+                file_terms.append((str(file_id), terms_to_text(terms)))
+
+        self.db.query(FileIssueTerms).delete(synchronize_session=False)
+        self.db.query(IssueTermCount).delete(synchronize_session=False)
+        for i in range(0, len(file_terms), batch_size):
+            self.db.bulk_insert_mappings(
+                FileIssueTerms, [{"file_id": fid, "terms": t} for fid, t in file_terms[i : i + batch_size]]
+            )
+        items = list(totals.items())
+        for i in range(0, len(items), batch_size):
+            self.db.bulk_insert_mappings(
+                IssueTermCount, [{"term": term, "count": n} for term, n in items[i : i + batch_size]]
+            )
+        self.db.commit()
+        logger.info("Rebuilt issue term counts: %d files, %d terms", len(file_terms), len(totals))
+        return len(file_terms)
@@ -0,0 +1,236 @@
+"""
+LLM プロバイダ（Azure OpenAI / Gemini）の呼び出し部分。
+
+LLMService はプロンプト構築・同時実行数の制御・ヘッジ（主/副プロバイダの併用）を担当し、
+実際の API 呼び出しはここのプロバイダクラスに任せる。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_STREAM_END = object()
+
+
+@dataclass
+class Completion:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # プロバイダ側のプロンプトキャッシュで再利用された入力トークン数（先頭一致。対応モデルのみ）
+    cached_tokens: int = 0
+
+
+class LLMProvider(ABC):
+    """プロバイダの共通インターフェース。name はメトリクス名・ログに使う（例: "azure_openai:gpt-4"）"""
+
+    name: str = ""
+
+    @abstractmethod
+    async def complete(self, system_prompt: str, user_message: str, max_tokens: int, temperature: float) -> Completion:
+        """回答全体を生成する。取り消し（ヘッジで負けた場合）で上流の呼び出しも打ち切ること"""
+
+    @abstractmethod
+    def stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        temperature: float,
+        usage: Completion | None = None,
+    ) -> AsyncIterator[str]:
+        """生成テキストの断片を返す。usage を渡すと、最後まで読み切った時点でトークン数を書き込む"""
+
+    async def warm_up(self) -> None:
+        """起動時に接続（DNS・TLS）を確立しておく。既定では何もしない"""
+
+    async def aclose(self) -> None:
+        pass
+
+
+class AzureOpenAIProvider(LLMProvider):
+    def __init__(self, api_key: str, endpoint: str, model: str) -> None:
+        import httpx
+        from openai import AsyncAzureOpenAI
+
+        self.name = f"azure_openai:{model}"
+        self.model = model
+        # keep-alive 接続をリクエスト間で再利用する
+        self._http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.llm_timeout_seconds, connect=settings.llm_connect_timeout_seconds),
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_concurrency * 2,
+                max_keepalive_connections=settings.llm_max_concurrency,
+                keepalive_expiry=60,
+            ),
+        )
+        self.client = AsyncAzureOpenAI(
+            api_key=api_key,
+            api_version=getattr(settings, "azure_openai_api_version", "2024-02-15-preview"),
+            azure_endpoint=endpoint,
+            timeout=settings.llm_timeout_seconds,
+            max_retries=settings.llm_max_retries,
+            http_client=self._http_client,
+        )
+
+    def _messages(self, system_prompt: str, user_message: str) -> list[dict[str, str]]:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message},
+        ]
+
+    async def complete(self, system_prompt: str, user_message: str, max_tokens: int, temperature: float) -> Completion:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(system_prompt, user_message),
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        return Completion(
+            text=response.choices[0].message.content or "",
+            prompt_tokens=getattr(response.usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(response.usage, "completion_tokens", 0) or 0,
+            cached_tokens=getattr(getattr(response.usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0,
+        )
+
+    async def stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        temperature: float,
+        usage: Completion | None = None,
+    ) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(system_prompt, user_message),
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            # 最後のチャンク（choices は空）にトークン数が付く
+            stream_options={"include_usage": True},
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if usage is not None and getattr(chunk, "usage", None) is not None:
+                    usage.prompt_tokens = chunk.usage.prompt_tokens or 0
+                    usage.completion_tokens = chunk.usage.completion_tokens or 0
+                    usage.cached_tokens = (
+                        getattr(getattr(chunk.usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+                    )
+        finally:
+            await stream.close()
+
+    async def aclose(self) -> None:
+        await self._http_client.aclose()
+
+    async def warm_up(self) -> None:
+        # 軽い API を呼んで keep-alive 接続をプールに入れておく（トークンは消費しない）
+        await self.client.models.list()
+
+
+class GeminiProvider(LLMProvider):
+    def __init__(self, api_key: str, model: str) -> None:
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.name = f"gemini:{model}"
+        self.model = model
+        self.client = genai.GenerativeModel(model)
+
+    async def warm_up(self) -> None:
+        import google.generativeai as genai
+
+        await asyncio.to_thread(genai.get_model, f"models/{self.model}")
+
+    async def complete(self, system_prompt: str, user_message: str, max_tokens: int, temperature: float) -> Completion:
+        # 非同期 API を使う（スレッド実行だとヘッジで負けた呼び出しを取り消せない）
+        response = await self.client.generate_content_async(
+            f"{system_prompt}\n\n{user_message}",
+            generation_config={"max_output_tokens": max_tokens, "temperature": temperature},
+            request_options={"timeout": settings.llm_timeout_seconds},
+        )
+        usage_metadata = getattr(response, "usage_metadata", None)
+        return Completion(
+            text=response.text or "",
+            prompt_tokens=getattr(usage_metadata, "prompt_token_count", 0) or 0,
+            completion_tokens=getattr(usage_metadata, "candidates_token_count", 0) or 0,
+            cached_tokens=getattr(usage_metadata, "cached_content_token_count", 0) or 0,
+        )
+
+    async def stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        temperature: float,
+        usage: Completion | None = None,
+    ) -> AsyncIterator[str]:
+        response = await self.client.generate_content_async(
+            f"{system_prompt}\n\n{user_message}",
+            stream=True,
+            generation_config={"max_output_tokens": max_tokens, "temperature": temperature},
+            request_options={"timeout": settings.llm_timeout_seconds},
+        )
+        # 応答の読み出しは専用のタスクで行う。途中で打ち切られた場合はそのタスクを取り消し、
+        # SDK が待っている上流の呼び出し（gRPC / HTTP）ごと止める（SDK の応答オブジェクトには公開の close が無い）
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+        async def read() -> None:
+            try:
+                async for chunk in response:
+                    await chunks.put(chunk)
+            except Exception as e:
+                await chunks.put(e)
+            else:
+                await chunks.put(_STREAM_END)
+
+        reader = asyncio.create_task(read())
+        try:
+            while (chunk := await chunks.get()) is not _STREAM_END:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                text = getattr(chunk, "text", "")
+                if text:
+                    yield text
+                # usage_metadata はそれまでの累計なので、最後のチャンクの値が全体のトークン数になる
+                usage_metadata = getattr(chunk, "usage_metadata", None)
+                if usage is not None and usage_metadata is not None:
+                    usage.prompt_tokens = getattr(usage_metadata, "prompt_token_count", 0) or 0
+                    usage.completion_tokens = getattr(usage_metadata, "candidates_token_count", 0) or 0
+                    usage.cached_tokens = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+        finally:
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+
+
+def create_provider(kind: str, api_key: str, endpoint: str, model: str) -> LLMProvider | None:
+    """設定からプロバイダを生成する。未設定・パッケージ未導入・未知のプロバイダは None（ログに理由を出す）"""
+    kind = (kind or "").lower()
+    if not api_key:
+        return None
+    if kind == "azure_openai":
+        try:
+            return AzureOpenAIProvider(api_key, endpoint, model)
+        except ImportError:
+            logger.error("openai package not installed. Install with: pip install openai")
+            return None
+    if kind == "gemini":
+        try:
+            return GeminiProvider(api_key, model)
+        except ImportError:
+            logger.error("google-generativeai package not installed. Install with: pip install google-generativeai")
+            return None
+    logger.warning(f"Unknown LLM provider: {kind}")
+    return None
@@ -1,74 +1,207 @@
 import asyncio
+import heapq
+import itertools
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
 
 from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.services.context_packer import ContextPacker, PackedContext
+from app.services.llm_providers import Completion, LLMProvider, create_provider
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+T = TypeVar("T")
+
+
+class LLMBusyError(RuntimeError):
+    """同時実行数の上限に達し、待ち時間（llm_queue_timeout_seconds）内に実行枠を確保できなかった"""
+
+
+# 実行枠の優先度（値が小さいほど先に割り当てる）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def background_priority():
+    """
+    このコンテキスト（およびここから作成したタスク）の LLM 呼び出しを低優先度にする。
+    バッチ分析ジョブ用: 実行枠の空き待ちでは対話的なリクエストが先に割り当てられ、待ち時間の上限も無い。
+    """
+    token = _priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class PriorityLimiter:
+    """同時実行数の上限付きの実行枠。空きを待つ場合は優先度の高い（値の小さい）順、同じ優先度は到着順に割り当てる"""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_use = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def waiting(self, priority: int | None = None) -> int:
+        return sum(1 for p, _, f in self._waiters if not f.done() and (priority is None or p == priority))
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> None:
+        # 待ち手がいる間は in_use == limit（release は空いた枠を待ち手に直接渡す）
+        if self.in_use < self.limit:
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # 枠を受け取った直後に取り消された: 次の待ち手に渡す
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # タイムアウト・取り消し済みの待ち手は飛ばす
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
 
 class LLMService:
-    """LLM統合サービス（Azure OpenAI / Gemini対応）"""
+    """
+    LLM統合サービス（Azure OpenAI / Gemini対応）
+
+    クライアント（HTTP コネクションプール）の生成はコストが高いため、ワーカーごとに
+    get_llm_service() で1つだけ生成して使い回す（app.main の lifespan で生成・破棄する）。
+    同時実行数は llm_max_concurrency で制限し、超過分は実行枠が空くまで待機させる
+    （空き待ちは対話的なリクエストを優先し、バッチ分析ジョブは background_priority() で後回しにする）。
+    """
+
+    SYSTEM_PROMPT = """あなたは熟練の食品開発アドバイザーです。
+提供された `<document>` タグ内の情報**のみ**に基づいて、ユーザーの質問に回答してください。
+情報がない場合は「提供された資料には記載がありません」と答えてください。
+回答の際は、根拠となったファイル名（source）を必ず明記してください。
+回答は日本語で、わかりやすく構造化された形式で提供してください。"""
 
     def __init__(self) -> None:
         self.provider = getattr(settings, "llm_provider", "azure_openai").lower()
-        self.api_key = getattr(settings, "llm_api_key", "")
-        self.endpoint = getattr(settings, "llm_endpoint", "")
         self.model = getattr(settings, "llm_model", "gpt-4")
         self.max_tokens = getattr(settings, "llm_max_tokens", 2000)
         self.temperature = getattr(settings, "llm_temperature", 0.7)
+        self.timeout = settings.llm_timeout_seconds
+        self.queue_timeout = settings.llm_queue_timeout_seconds
+        self.hedge_delay = settings.llm_hedge_delay_seconds
+        self._limiter = PriorityLimiter(settings.llm_max_concurrency)
 
-        if not self.api_key:
+        if not settings.llm_api_key:
             logger.warning("LLM API key not configured. LLM features will be disabled.")
-            self.enabled = False
-        else:
-            self.enabled = True
-
-            if self.provider == "azure_openai":
-                try:
-                    from openai import AsyncAzureOpenAI
-                    self.client = AsyncAzureOpenAI(
-                        api_key=self.api_key,
-                        api_version=getattr(settings, "azure_openai_api_version", "2024-02-15-preview"),
-                        azure_endpoint=self.endpoint,
-                    )
-                except ImportError:
-                    logger.error("openai package not installed. Install with: pip install openai")
-                    self.enabled = False
-            elif self.provider == "gemini":
-                try:
-                    import google.generativeai as genai
-                    genai.configure(api_key=self.api_key)
-                    self.client = genai.GenerativeModel(self.model)
-                except ImportError:
-                    logger.error("google-generativeai package not installed. Install with: pip install google-generativeai")
-                    self.enabled = False
-            else:
-                logger.warning(f"Unknown LLM provider: {self.provider}")
-                self.enabled = False
+        self.primary: Optional[LLMProvider] = create_provider(
+            self.provider, settings.llm_api_key, settings.llm_endpoint, self.model
+        )
+        # 副プロバイダ（任意）: 設定されている場合のみヘッジする
+        self.secondary: Optional[LLMProvider] = (
+            create_provider(
+                settings.llm_secondary_provider,
+                settings.llm_secondary_api_key,
+                settings.llm_secondary_endpoint,
+                settings.llm_secondary_model or self.model,
+            )
+            if self.primary is not None and settings.llm_secondary_provider
+            else None
+        )
+        self.enabled = self.primary is not None
 
     def is_enabled(self) -> bool:
         return self.enabled
 
-    def create_prompt_with_search_results(
-        self, user_question: str, search_results: List[Dict[str, Any]], max_content_length: int = 10000
-    ) -> tuple[str, str]:
+    async def aclose(self) -> None:
+        for provider in (self.primary, self.secondary):
+            if provider is not None:
+                await provider.aclose()
+
+    async def warm_up(self) -> None:
+        """各プロバイダへの接続を確立しておく（起動時。副プロバイダも並行して）"""
+        providers = [p for p in (self.primary, self.secondary) if p is not None]
+        results = await asyncio.gather(*(p.warm_up() for p in providers), return_exceptions=True)
+        for provider, result in zip(providers, results):
+            if isinstance(result, Exception):
+                logger.warning("LLM warm-up for %s failed: %s", provider.name, result)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self._limiter.in_use,
+            "waiting": self._limiter.waiting(),
+            "waiting_background": self._limiter.waiting(PRIORITY_BACKGROUND),
+        }
+
+    @asynccontextmanager
+    async def _slot(self):
         """
-        検索結果からプロンプトを作成する
-        
-        Returns:
-            (system_prompt, user_message) のタプル
+        実行枠を確保する。上限到達時は待機し、queue_timeout を超えたら LLMBusyError
+        （background_priority() 内の呼び出しは待ち時間の上限なし）
+        """
+        priority = _priority.get()
+        try:
+            async with asyncio.timeout(self.queue_timeout if priority == PRIORITY_INTERACTIVE else None):
+                await self._limiter.acquire(priority)
+        except TimeoutError:
+            raise LLMBusyError(
+                f"LLM is busy: no slot within {self.queue_timeout}s "
+                f"(in_flight={self._limiter.in_use}, waiting={self._limiter.waiting()})"
+            ) from None
+
+        try:
+            yield
+        finally:
+            self._limiter.release()
+
+    def pack_context(
+        self,
+        user_question: str,
+        search_results: List[Dict[str, Any]],
+        *,
+        system_prompt: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        history: Optional[List[tuple[str, str]]] = None,
+        reserve_tokens: int = 0,
+    ) -> PackedContext:
+        """
+        コンテキスト長と出力用トークン（max_tokens）に収まるよう文書を詰める。
+        reserve_tokens は後から追加する会話履歴などのために空けておくトークン数。
         """
-        # 1. 検索結果をLLMが読みやすいテキスト形式に整形
+        started = time.perf_counter()
+        packed = ContextPacker(reserved_output_tokens=(max_tokens or self.max_tokens) + reserve_tokens).pack(
+            f"{system_prompt or self.SYSTEM_PROMPT}\n{self._user_message(user_question, '', history)}", search_results
+        )
+        metrics.observe("context_packer.pack_ms", (time.perf_counter() - started) * 1000)
+        metrics.observe("llm.prompt_tokens_estimated", packed.prompt_tokens)
+        metrics.inc("context_packer.duplicate_passages", packed.duplicates_removed)
+        metrics.inc("context_packer.truncated_docs", len(packed.truncated))
+        metrics.inc("context_packer.dropped_docs", len(packed.dropped))
+        return packed
+
+    @staticmethod
+    def render_context(packed: PackedContext) -> str:
+        """詰めた文書をLLMが読みやすいテキスト形式に整形する"""
         context_text = ""
-        for index, item in enumerate(search_results, 1):
+        for index, item in enumerate(packed.docs, 1):
             file_name = item.get("original_name", "不明なファイル")
             content = item.get("content", "")
-
-            # 文字数制限対策
-            if len(content) > max_content_length:
-                content = content[:max_content_length] + "\n[... 以下省略 ...]"
+            if item.get("citations"):
+                # 近似重複として統合した文書も出典として示す
+                file_name = f"{file_name}（同内容: {', '.join(item['citations'])}）"
 
             # XMLタグ風に囲むとAIが区切りを認識しやすい
             context_text += f"""
@@ -79,33 +212,66 @@ class LLMService:
 </content>
 </document>
 """
+        return context_text
 
-        # 2. プロンプトの組み立て
-        system_prompt = """あなたは熟練の食品開発アドバイザーです。
-提供された `<document>` タグ内の情報**のみ**に基づいて、ユーザーの質問に回答してください。
-情報がない場合は「提供された資料には記載がありません」と答えてください。
-回答の際は、根拠となったファイル名（source）を必ず明記してください。
-回答は日本語で、わかりやすく構造化された形式で提供してください。"""
-
-        user_message = f"""質問: {user_question}
-
-以下の参照ドキュメントを使用して回答を作成してください:
+    @staticmethod
+    def _user_message(user_question: str, context_text: str, history: Optional[List[tuple[str, str]]] = None) -> str:
+        # 参照ドキュメントを先頭に置き、会話履歴・質問を後ろに付ける。
+        # 同じ文書に対する質問ではプロンプトの先頭が一致するため、プロバイダ側のプロンプトキャッシュが効く
+        turns = "".join(f"\n過去の質問: {q}\n過去の回答: {a}\n" for q, a in history or [])
+        return f"""以下の参照ドキュメントを使用して回答を作成してください:
 
 {context_text}
+{turns}
+質問: {user_question}
 """
 
-        return system_prompt, user_message
+    def create_prompt_with_search_results(
+        self,
+        user_question: str,
+        search_results: List[Dict[str, Any]],
+        *,
+        system_prompt: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        context_text: Optional[str] = None,
+        history: Optional[List[tuple[str, str]]] = None,
+    ) -> tuple[str, str]:
+        """
+        検索結果からプロンプトを作成する（文書は pack_context でトークン予算内に詰める）
+        system_prompt / max_tokens を省略した場合は SYSTEM_PROMPT / llm_max_tokens を使う。
+        context_text（render_context 済みの文書）を渡した場合は詰め直さずにそのまま使う（会話の続き）。
+
+        Returns:
+            (system_prompt, user_message) のタプル
+        """
+        system_prompt = system_prompt or self.SYSTEM_PROMPT
+        if context_text is None:
+            context_text = self.render_context(
+                self.pack_context(
+                    user_question, search_results, system_prompt=system_prompt, max_tokens=max_tokens, history=history
+                )
+            )
+        return system_prompt, self._user_message(user_question, context_text, history)
 
     async def generate_response(
-        self, user_question: str, search_results: List[Dict[str, Any]]
+        self,
+        user_question: str,
+        search_results: List[Dict[str, Any]],
+        *,
+        system_prompt: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        context_text: Optional[str] = None,
+        history: Optional[List[tuple[str, str]]] = None,
     ) -> Dict[str, Any]:
         """
         LLMを使って検索結果から回答を生成する
-        
+        会話の続きでは context_text（詰め済みの文書）と history（過去の 質問, 回答）を渡す。
+
         Returns:
             {
                 "answer": str,
                 "sources": List[str],  # 参照したファイル名のリスト
+                "usage": {"prompt_tokens": int, "completion_tokens": int, "cached_tokens": int},  # 成功時のみ
                 "error": Optional[str]
             }
         """
@@ -116,40 +282,54 @@ class LLMService:
                 "error": "LLM service is not configured or enabled.",
             }
 
+        async with self._slot():
+            return await self._generate_response(
+                user_question,
+                search_results,
+                system_prompt=system_prompt,
+                max_tokens=max_tokens,
+                context_text=context_text,
+                history=history,
+            )
+
+    async def _generate_response(
+        self,
+        user_question: str,
+        search_results: List[Dict[str, Any]],
+        *,
+        system_prompt: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        context_text: Optional[str] = None,
+        history: Optional[List[tuple[str, str]]] = None,
+    ) -> Dict[str, Any]:
+        max_tokens = max_tokens or self.max_tokens
         try:
-            system_prompt, user_message = self.create_prompt_with_search_results(user_question, search_results)
-
-            if self.provider == "azure_openai":
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_message},
-                    ],
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                )
-                answer = response.choices[0].message.content
-                sources = [item.get("original_name", "") for item in search_results if item.get("original_name")]
-
-            elif self.provider == "gemini":
-                # Geminiは同期APIなので、asyncio.to_threadで実行
-                prompt = f"{system_prompt}\n\n{user_message}"
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(None, self.client.generate_content, prompt)
-                answer = response.text
-                sources = [item.get("original_name", "") for item in search_results if item.get("original_name")]
-
-            else:
-                return {
-                    "answer": "",
-                    "sources": [],
-                    "error": f"Unsupported provider: {self.provider}",
-                }
+            system_prompt, user_message = self.create_prompt_with_search_results(
+                user_question,
+                search_results,
+                system_prompt=system_prompt,
+                max_tokens=max_tokens,
+                context_text=context_text,
+                history=history,
+            )
 
+            completion, provider_name = await self._complete_hedged(system_prompt, user_message, max_tokens)
+            answer = completion.text
+            sources = [item.get("original_name", "") for item in search_results if item.get("original_name")]
+            usage = {
+                "prompt_tokens": completion.prompt_tokens,
+                "completion_tokens": completion.completion_tokens,
+                "cached_tokens": completion.cached_tokens,
+            }
+
+            metrics.observe("llm.prompt_tokens", usage["prompt_tokens"])
+            metrics.observe("llm.completion_tokens", usage["completion_tokens"])
+            metrics.inc("llm.cached_prompt_tokens", usage["cached_tokens"])
             return {
                 "answer": answer or "",
                 "sources": sources,
+                "usage": usage,
+                "provider": provider_name,
                 "error": None,
             }
 
@@ -161,3 +341,187 @@ class LLMService:
                 "error": str(e),
             }
 
+    async def stream_response(
+        self,
+        user_question: str,
+        search_results: List[Dict[str, Any]],
+        *,
+        system_prompt: Optional[str] = None,
+        context_text: Optional[str] = None,
+        history: Optional[List[tuple[str, str]]] = None,
+        usage: Optional[Completion] = None,
+    ) -> AsyncIterator[str]:
+        """
+        generate_response のストリーミング版。生成されたテキスト断片を到着順に返す。
+
+        呼び出し側がイテレーションを中断（aclose / キャンセル）した場合は、上流のストリームを閉じて
+        以降のトークン生成を打ち切る。usage を渡すと、最後まで読み切った時点でトークン数を書き込む。
+        """
+        if not self.enabled:
+            raise RuntimeError("LLM service is not configured or enabled.")
+
+        system_prompt, user_message = self.create_prompt_with_search_results(
+            user_question, search_results, system_prompt=system_prompt, context_text=context_text, history=history
+        )
+        usage = usage if usage is not None else Completion(text="")
+        async with self._slot():
+            async for text in self._stream_hedged(system_prompt, user_message, self.max_tokens, usage):
+                yield text
+        metrics.observe("llm.prompt_tokens", usage.prompt_tokens)
+        metrics.observe("llm.completion_tokens", usage.completion_tokens)
+        metrics.inc("llm.cached_prompt_tokens", usage.cached_tokens)
+
+    # --- ヘッジ（主/副プロバイダの併用） ---
+
+    async def _timed_complete(
+        self, provider: LLMProvider, system_prompt: str, user_message: str, max_tokens: int
+    ) -> Completion:
+        started = time.perf_counter()
+        completion = await provider.complete(system_prompt, user_message, max_tokens, self.temperature)
+        metrics.observe(f"llm.latency_ms.{provider.name}", (time.perf_counter() - started) * 1000)
+        return completion
+
+    async def _first_token(
+        self,
+        provider: LLMProvider,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        usage: Optional[Completion] = None,
+    ) -> tuple[str, Optional[AsyncIterator[str]]]:
+        """ストリームを開始して最初の断片を待つ。(最初の断片, 残りのストリーム) を返す"""
+        started = time.perf_counter()
+        tokens = provider.stream(system_prompt, user_message, max_tokens, self.temperature, usage)
+        try:
+            first = await tokens.__anext__()
+        except StopAsyncIteration:
+            return "", None
+        except BaseException:
+            # 取り消し（ヘッジで負けた）・エラーの場合は上流のストリームを閉じる
+            await tokens.aclose()
+            raise
+        metrics.observe(f"llm.first_token_ms.{provider.name}", (time.perf_counter() - started) * 1000)
+        return first, tokens
+
+    async def _race(
+        self,
+        start: Callable[[LLMProvider], Awaitable[T]],
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> tuple[T, LLMProvider]:
+        """
+        主プロバイダで開始し、hedge_delay 以内に終わらなければ（または失敗したら）副プロバイダでも開始する。
+        先に成功した方の結果を返し、もう一方は取り消す（同時に成功した場合、使わない方の結果は discard に渡す）。
+        両方失敗した場合は後に失敗した方の例外を送出する。
+        """
+        if self.secondary is None:
+            return await start(self.primary), self.primary
+
+        primary_task = asyncio.create_task(start(self.primary))
+        owners = {primary_task: self.primary}
+        pending: set[asyncio.Task] = {primary_task}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay)
+            if done and primary_task.exception() is None:
+                return primary_task.result(), self.primary
+
+            metrics.inc("llm.hedge.fired")
+            logger.info(
+                "Hedging LLM request to %s (primary %s)",
+                self.secondary.name,
+                "failed" if done else f"slower than {self.hedge_delay}s",
+            )
+            secondary_task = asyncio.create_task(start(self.secondary))
+            owners[secondary_task] = self.secondary
+            pending.add(secondary_task)
+            error: BaseException | None = primary_task.exception() if done else None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    # 主プロバイダを優先（owners の挿入順）
+                    winner_task = min(succeeded, key=list(owners).index)
+                    for task in succeeded:
+                        if task is not winner_task and discard is not None:
+                            await discard(task.result())
+                    winner = owners[winner_task]
+                    metrics.inc(f"llm.hedge.won.{winner.name}")
+                    return winner_task.result(), winner
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _complete_hedged(
+        self, system_prompt: str, user_message: str, max_tokens: int
+    ) -> tuple[Completion, str]:
+        """
+        非ストリーミング版のヘッジ。回答全体の完了時間は回答の長さで大きく変わるため、
+        内部でストリーミングして最初の断片の到着で判定し、勝った側のストリームを最後まで読んで返す。
+        副プロバイダが無い場合はヘッジしないので通常の呼び出しを使う。
+        """
+        if self.secondary is None:
+            completion = await self._timed_complete(self.primary, system_prompt, user_message, max_tokens)
+            return completion, self.primary.name
+
+        started = time.perf_counter()
+        (first, rest, usage), provider = await self._race(
+            lambda p: self._start_stream(p, system_prompt, user_message, max_tokens), discard=self._close_unused
+        )
+        parts = [first]
+        if rest is not None:
+            try:
+                async for text in rest:
+                    parts.append(text)
+            finally:
+                await rest.aclose()
+        metrics.observe(f"llm.latency_ms.{provider.name}", (time.perf_counter() - started) * 1000)
+        usage.text = "".join(parts)
+        return usage, provider.name
+
+    async def _stream_hedged(
+        self, system_prompt: str, user_message: str, max_tokens: int, usage: Optional[Completion] = None
+    ) -> AsyncIterator[str]:
+        """
+        ストリーミング版のヘッジ。最初の断片が先に届いたプロバイダのストリームを使う。
+        llm.stream.first_token_ms / total_ms.<勝ったプロバイダ> には、ヘッジの待ち時間を含めた開始からの時間を記録する
+        （total_ms は最後まで読み切った場合のみ。hedge_delay の調整用）。
+        """
+        started = time.perf_counter()
+        (first, rest, winner_usage), provider = await self._race(
+            lambda p: self._start_stream(p, system_prompt, user_message, max_tokens), discard=self._close_unused
+        )
+        metrics.observe(f"llm.stream.first_token_ms.{provider.name}", (time.perf_counter() - started) * 1000)
+        if first:
+            yield first
+        if rest is not None:
+            try:
+                async for text in rest:
+                    yield text
+            finally:
+                await rest.aclose()
+        metrics.observe(f"llm.stream.total_ms.{provider.name}", (time.perf_counter() - started) * 1000)
+        if usage is not None:
+            usage.prompt_tokens = winner_usage.prompt_tokens
+            usage.completion_tokens = winner_usage.completion_tokens
+            usage.cached_tokens = winner_usage.cached_tokens
+
+    async def _start_stream(
+        self, provider: LLMProvider, system_prompt: str, user_message: str, max_tokens: int
+    ) -> tuple[str, Optional[AsyncIterator[str]], Completion]:
+        """_first_token にプロバイダごとの使用量の受け皿を付ける（ヘッジで負けた側の値が混ざらないように）"""
+        usage = Completion(text="")
+        first, rest = await self._first_token(provider, system_prompt, user_message, max_tokens, usage)
+        return first, rest, usage
+
+    @staticmethod
+    async def _close_unused(started: tuple[str, Optional[AsyncIterator[str]], Completion]) -> None:
+        if started[1] is not None:
+            await started[1].aclose()
+
+
+@lru_cache
+def get_llm_service() -> LLMService:
+    """ワーカー内で共有する LLMService を返す"""
+    return LLMService()
@@ -0,0 +1,198 @@
+"""
+多数の文書を対象にした map-reduce 分析（mode="map_reduce"）。
+
+1つのプロンプトに収まらない件数（最大 50 件）の文書について、
+- map: 文書ごとに質問に関係する事実を箇条書きで抜き出す（1リクエストあたり rag_map_concurrency 件ずつ並行。
+  LLM の同時実行数の上限 llm_max_concurrency も共有する）
+- reduce: map の結果（関係する記載があった文書のみ）を統合して最終回答を作る
+
+map の結果は回答キャッシュ（namespace="map"）に文書単位で保存するため、
+同じ質問で対象文書が一部重なる場合は重なった分の LLM 呼び出しを省ける。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List
+
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.db.session import SessionLocal
+from app.services.answer_cache_service import AnswerCacheService
+from app.services.llm_service import LLMService
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+NOT_RELEVANT = "該当なし"
+# どの文書にも関係する記載が無かった場合の回答（reduce は行わない）
+NO_RELEVANT_ANSWER = "提供された資料には記載がありません"
+
+MAP_SYSTEM_PROMPT = f"""あなたは熟練の食品開発アドバイザーです。
+提供された `<document>` タグ内の資料から、ユーザーの質問に関係する事実（結果・原因・条件・数値など）**のみ**を
+日本語の箇条書きで簡潔に抜き出してください。推測や一般論は書かないでください。
+関係する記載が無い場合は「{NOT_RELEVANT}」とだけ答えてください。"""
+
+REDUCE_SYSTEM_PROMPT = """あなたは熟練の食品開発アドバイザーです。
+`<document>` タグ内は、各資料からユーザーの質問に関係する記載を抜き出したメモです。
+これらのメモ**のみ**に基づいて、資料をまたいだ共通点・相違点がわかるように質問に回答してください。
+回答の際は、根拠となったファイル名（source）を必ず明記してください。
+回答は日本語で、わかりやすく構造化された形式で提供してください。"""
+
+
+@dataclass
+class MapResult:
+    index: int  # 元の文書の順位
+    doc: Dict[str, Any]
+    summary: str
+    cached: bool
+    key: str | None = None
+    error: str | None = None
+
+    @property
+    def relevant(self) -> bool:
+        return not self.error and bool(self.summary) and not self.summary.startswith(NOT_RELEVANT)
+
+
+class MapReduceAnalyzer:
+    """
+    db を渡さない場合は、map の結果のキャッシュの読み書きのたびに session_factory の短いセッションを使う
+    （ストリーミング中に接続プールの接続を占有しない）
+    """
+
+    def __init__(
+        self, db: Session | None, llm: LLMService, session_factory: Callable[[], Session] = SessionLocal
+    ) -> None:
+        self.db = db
+        self.llm = llm
+        self.session_factory = session_factory
+        self.cache_enabled = settings.llm_answer_cache_enabled
+
+    @contextmanager
+    def _cache(self) -> Iterator[AnswerCacheService]:
+        if self.db is not None:
+            yield AnswerCacheService(self.db)
+            return
+        with self.session_factory() as db:
+            yield AnswerCacheService(db)
+
+    def _lookup_all(self, question: str, docs: List[Dict[str, Any]]) -> tuple[List[str | None], List[Dict | None]]:
+        if not self.cache_enabled:
+            return [None] * len(docs), [None] * len(docs)
+        with self._cache() as cache:
+            keys = [cache.make_key(question, [doc], namespace="map") for doc in docs]
+            return keys, [cache.lookup(key) for key in keys]
+
+    def _store(self, key: str, question: str, doc: Dict[str, Any], summary: str) -> None:
+        with self._cache() as cache:
+            try:
+                cache.store(key, question, [doc], {"answer": summary})
+            except Exception:
+                cache.db.rollback()
+                raise
+
+    async def _map_one(
+        self, index: int, question: str, doc: Dict[str, Any], key: str | None, limit: asyncio.Semaphore
+    ) -> MapResult:
+        async with limit:
+            started = time.perf_counter()
+            result = await self.llm.generate_response(
+                question, [doc], system_prompt=MAP_SYSTEM_PROMPT, max_tokens=settings.llm_map_max_tokens
+            )
+            metrics.observe("llm.map_ms", (time.perf_counter() - started) * 1000)
+        return MapResult(
+            index=index,
+            doc=doc,
+            summary=(result.get("answer") or "").strip(),
+            cached=False,
+            key=key,
+            error=result.get("error"),
+        )
+
+    async def map_documents(self, question: str, docs: List[Dict[str, Any]]) -> AsyncIterator[MapResult]:
+        """
+        各文書の map 結果を完了順に返す（キャッシュ済みの文書が先）。
+        LLM の同時実行枠が取れない場合は LLMBusyError を送出する。
+        """
+        # DB セッションはスレッド間で共有できないため、キャッシュの読み書きは1件ずつ順に行う
+        keys, cached = await asyncio.to_thread(self._lookup_all, question, docs)
+        pending: List[asyncio.Task] = []
+        limit = asyncio.Semaphore(settings.rag_map_concurrency)
+        try:
+            for index, (key, hit, doc) in enumerate(zip(keys, cached, docs)):
+                if hit is not None:
+                    yield MapResult(index=index, doc=doc, summary=hit["answer"], cached=True, key=key)
+                else:
+                    pending.append(asyncio.create_task(self._map_one(index, question, doc, key, limit)))
+
+            for next_done in asyncio.as_completed(pending):
+                result = await next_done
+                if result.error:
+                    logger.warning("Map step failed for %s: %s", result.doc.get("file_id"), result.error)
+                elif self.cache_enabled:
+                    try:
+                        await asyncio.to_thread(self._store, result.key, question, result.doc, result.summary)
+                    except Exception as e:
+                        logger.warning("Failed to store map result: %s", e)
+                yield result
+        finally:
+            # 途中で打ち切られた場合（切断など）は残りの map を取り消し、上流のストリームが閉じるまで待つ
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    @staticmethod
+    def reduce_docs(results: List[MapResult]) -> List[Dict[str, Any]]:
+        """関係する記載があった文書の map 結果を reduce 用の文書にする（results の順）"""
+        return [
+            {
+                "file_id": r.doc.get("file_id", ""),
+                "original_name": r.doc.get("original_name", ""),
+                "content": r.summary,
+                "score": r.doc.get("score"),
+            }
+            for r in results
+            if r.relevant
+        ]
+
+    async def analyze(
+        self, question: str, docs: List[Dict[str, Any]], history: List[tuple[str, str]] | None = None
+    ) -> Dict[str, Any]:
+        """
+        history（会話の続きの過去の 質問, 回答）は reduce にのみ渡す。
+
+        Returns:
+            generate_response と同じ形式に、map のキャッシュヒット件数（map_cache_hits）と
+            関係する記載があった文書数（relevant_count）を加えたもの
+        """
+        started = time.perf_counter()
+        results = sorted([r async for r in self.map_documents(question, docs)], key=lambda r: r.index)
+        hits = sum(r.cached for r in results)
+        metrics.inc("llm.map_cache_hit", hits)
+
+        failed = [r for r in results if r.error]
+        if failed and len(failed) == len(results):
+            return {"answer": "", "sources": [], "error": failed[0].error}
+
+        reduce_docs = self.reduce_docs(results)
+        if not reduce_docs:
+            result = {"answer": NO_RELEVANT_ANSWER, "usage": {}, "error": None}
+        else:
+            result = await self.llm.generate_response(
+                question, reduce_docs, system_prompt=REDUCE_SYSTEM_PROMPT, history=history
+            )
+        logger.info(
+            "Map-reduce: %d docs (%d cached, %d failed, %d relevant) in %.0fms",
+            len(docs),
+            hits,
+            len(failed),
+            len(reduce_docs),
+            (time.perf_counter() - started) * 1000,
+        )
+        return {**result, "map_cache_hits": hits, "relevant_count": len(reduce_docs)}
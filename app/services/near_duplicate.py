@@ -0,0 +1,176 @@
+"""
+RAG コンテキストの近似重複除去（MinHash + LSH）。
+
+試作報告書は版違い・流用が多く、上位の文書同士で LOG 行や配合表がほぼ同じ内容で繰り返される。
+段落（行）を文字 n-gram の集合とみなして MinHash 署名を作り、LSH（バンド分割）で候補を絞ってから
+署名の一致率（Jaccard 係数の推定値）がしきい値以上のものを重複とみなす。
+
+重複した段落は上位の文書にのみ残し、除去された側の文書名は残した文書の citations に統合する。
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List
+
+import numpy as np
+
+_SHIFT = np.uint64(32)
+_GRAM_BASE = np.uint64(1_000_003)
+_SEP = "\x00"
+_PAD = "\x01"
+# 一度に展開する文字数（≒ shingle 数。shingles × num_perm の作業領域を抑える）
+_CHUNK = 32768
+
+# 改行以外の空白の連続・タブ等（単独の半角スペースは置換不要なので対象外）
+_SPACES_RE = re.compile(r"[^\S\n]{2,}|[^\S \n]")
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1) -> None:
+        rnd = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # multiply-shift 方式のハッシュ族 h(x) = ((a * x + b) mod 2^64) >> 32（a は奇数）
+        self._a = rnd.integers(0, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rnd.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """texts の MinHash 署名（len(texts) × num_perm）をまとめて計算する"""
+        sigs = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        start = 0
+        while start < len(texts):
+            # shingles × num_perm の作業領域を抑えるため、_CHUNK 文字程度ずつ処理する
+            end, size = start, 0
+            while end < len(texts) and (end == start or size + len(texts[end]) <= _CHUNK):
+                size += len(texts[end]) + 1
+                end += 1
+            sigs[start:end] = self._signatures(texts[start:end])
+            start = end
+        return sigs
+
+    def _signatures(self, texts: List[str]) -> np.ndarray:
+        k = self.shingle_size
+        texts = [t.ljust(k, _PAD) for t in texts]
+        # 文字コード列上で k-gram の多項式ハッシュを一括計算し、区切り文字をまたぐ k-gram を除く
+        codes = np.frombuffer(_SEP.join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        n = len(codes) - k + 1
+        grams = codes[:n].copy()
+        is_sep = codes == ord(_SEP)
+        crosses = is_sep[:n].copy()
+        for j in range(1, k):
+            grams *= _GRAM_BASE
+            grams += codes[j : j + n]
+            crosses |= is_sep[j : j + n]
+        grams = grams[~crosses]
+
+        counts = np.fromiter((len(t) - k + 1 for t in texts), dtype=np.int64, count=len(texts))
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        # (num_perm × shingles) の向きで計算すると reduceat が連続領域を走査できて速い
+        permuted = self._a[:, None] * grams[None, :]
+        permuted += self._b[:, None]
+        permuted >>= _SHIFT
+        return np.minimum.reduceat(permuted.astype(np.uint32), offsets, axis=1).T
+
+
+class LSHIndex:
+    """署名を bands 個に分割し、いずれかのバンドが一致したものを候補にする"""
+
+    def __init__(self, num_perm: int, bands: int) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.rows = num_perm // bands
+        self.bands = bands
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._mix = np.random.default_rng(0).integers(1, 2**63, size=self.rows, dtype=np.uint64)
+
+    def band_keys(self, sigs: np.ndarray) -> List[List[int]]:
+        """各署名のバンドごとのキー（バンド内の値を1つの整数に畳み込む）をまとめて計算する"""
+        bands = sigs.reshape(len(sigs), self.bands, self.rows).astype(np.uint64)
+        return (bands * self._mix).sum(axis=2, dtype=np.uint64).tolist()
+
+    def candidates(self, keys: List[int]) -> List[int]:
+        found: List[int] = []
+        for bucket, key in zip(self._buckets, keys):
+            found.extend(bucket.get(key, ()))
+        return list(dict.fromkeys(found))
+
+    def add(self, idx: int, keys: List[int]) -> None:
+        for bucket, key in zip(self._buckets, keys):
+            bucket.setdefault(key, []).append(idx)
+
+
+def collapse_near_duplicates(
+    docs: List[Dict[str, Any]],
+    *,
+    threshold: float = 0.85,
+    min_chars: int = 16,
+    num_perm: int = 64,
+    bands: int = 8,
+) -> tuple[List[Dict[str, Any]], int]:
+    """
+    上位の文書から順に段落（行）を見て、既出の段落と近似重複するものを除去する。
+    min_chars 未満の行（見出し「【LOG】」など）は対象外。長い段落がすべて除去された文書は結果から外す。
+
+    Returns:
+        (docs, removed_count)  docs は content / citations を差し替えたコピー。
+        citations は重複を統合した文書名のリスト（出典表示用）
+    """
+    lines_per_doc = [(d.get("content") or "").split("\n") for d in docs]
+    targets: List[tuple[int, int]] = []  # (doc_index, line_index)
+    texts: List[str] = []
+    for di, lines in enumerate(lines_per_doc):
+        # 正規化（空白の畳み込み・小文字化）は文書単位で1回だけ行う
+        keys = _SPACES_RE.sub(" ", docs[di].get("content") or "").lower().split("\n")
+        for li, key in enumerate(keys):
+            key = key.strip()
+            if len(key) >= min_chars:
+                targets.append((di, li))
+                texts.append(key)
+
+    # 完全一致の行は署名を1回だけ計算する
+    unique = list(dict.fromkeys(texts))
+    unique_sigs = MinHasher(num_perm=num_perm).signatures(unique)
+    position = {text: i for i, text in enumerate(unique)}
+    sigs = unique_sigs[[position[text] for text in texts]] if texts else unique_sigs
+    index = LSHIndex(num_perm, bands)
+    band_keys = index.band_keys(sigs)
+    exact: Dict[str, int] = {}
+    owner: List[int] = []  # targets の各要素が残った文書（除去された場合は重複元の文書）
+    dropped: set[tuple[int, int]] = set()
+    citations: Dict[int, List[str]] = {}
+
+    for t, ((di, li), text) in enumerate(zip(targets, texts)):
+        match = exact.get(text)
+        if match is None:
+            candidates = index.candidates(band_keys[t])
+            if candidates:
+                agree = (sigs[candidates] == sigs[t]).sum(axis=1)
+                best = int(agree.argmax())
+                if agree[best] >= threshold * num_perm:
+                    match = candidates[best]
+        if match is None:
+            exact[text] = t
+            index.add(t, band_keys[t])
+            owner.append(di)
+            continue
+
+        owner.append(owner[match])
+        dropped.add((di, li))
+        kept_doc = owner[match]
+        name = docs[di].get("original_name") or docs[di].get("file_id") or ""
+        if kept_doc != di and name and name != docs[kept_doc].get("original_name"):
+            names = citations.setdefault(kept_doc, [])
+            if name not in names:
+                names.append(name)
+
+    has_body = {di for (di, li) in targets if (di, li) not in dropped}
+    with_targets = {di for di, _ in targets}
+    result = []
+    for di, (doc, lines) in enumerate(zip(docs, lines_per_doc)):
+        if di in with_targets and di not in has_body:
+            continue
+        kept = [line for li, line in enumerate(lines) if (di, li) not in dropped]
+        merged = list(doc.get("citations") or []) + [n for n in citations.get(di, []) if n not in (doc.get("citations") or [])]
+        result.append({**doc, "content": "\n".join(kept), "citations": merged})
+    return result, len(dropped)
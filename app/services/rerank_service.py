@@ -0,0 +1,91 @@
+"""
+RAG 候補の再ランキング（BM25）。
+
+Azure AI Search からは content を含まない軽量な候補を多めに（rag_rerank_candidates 件）取得し、
+各候補の保存済みテキストを BM25 で採点して上位 top 件だけを LLM に渡す。
+
+- 抽出データがあるファイル: LLM 用コンテキスト（file_extractions.llm_context_terms）
+- パッセージ索引があるファイル: 各パッセージ（file_chunks.terms）の最高スコア
+- どちらも無いファイル: 検索結果のメタデータ（ファイル名・用途・課題など）
+
+採用したファイルのうち抽出データ・要約（has_text）が無いものだけ content を取得する。
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Callable, Collection, Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.core.metrics import metrics
+from app.services.bm25 import TermStatsCache, bm25_scores, tokenize
+from app.services.chunking_service import ChunkService
+from app.services.extraction_service import get_llm_context_terms
+
+logger = logging.getLogger(__name__)
+
+_METADATA_FIELDS = ("original_name", "application", "issue", "ingredient", "customer", "trial_id", "author")
+
+
+def _file_id(doc: Dict[str, Any]) -> str:
+    return str(doc.get("id") or doc.get("file_id") or "")
+
+
+def _metadata_text(doc: Dict[str, Any]) -> str:
+    return " ".join(str(doc[k]) for k in _METADATA_FIELDS if doc.get(k))
+
+
+def rerank_candidates(
+    db: Session,
+    query: str,
+    candidates: List[Dict[str, Any]],
+    top: int,
+    fetch_contents: Callable[[List[str]], Dict[str, str]],
+    has_text: Collection[str] = (),
+) -> List[Dict[str, Any]]:
+    """
+    候補を BM25 スコア順に並べ替えて上位 top 件を返す（同点は検索結果の順）。
+    返す候補には score（BM25）を設定し、抽出データも has_text（要約があるファイルID）にも無いものには content を補う。
+    """
+    started = time.perf_counter()
+    query_terms = tokenize(query)
+    ids = [fid for fid in map(_file_id, candidates) if fid]
+
+    context_terms = get_llm_context_terms(db, ids)
+    chunks, _ = ChunkService(db).load_chunks([fid for fid in ids if fid not in context_terms])
+
+    units: List[Any] = []
+    owners: List[int] = []
+    for i, doc in enumerate(candidates):
+        fid = _file_id(doc)
+        if fid in context_terms:
+            texts = [context_terms[fid]]
+        elif chunks.get(fid):
+            texts = [c["terms"] for c in chunks[fid]]
+        else:
+            texts = [TermStatsCache.counts(_metadata_text(doc))]
+        units.extend(texts)
+        owners.extend([i] * len(texts))
+
+    doc_scores = [0.0] * len(candidates)
+    for owner, score in zip(owners, bm25_scores(query_terms, units)):
+        doc_scores[owner] = max(doc_scores[owner], score)
+
+    order = sorted(range(len(candidates)), key=lambda i: (-doc_scores[i], i))[:top]
+    chosen = [{**candidates[i], "score": doc_scores[i]} for i in order]
+
+    need_content = [fid for fid in map(_file_id, chosen) if fid and fid not in context_terms and fid not in has_text]
+    if need_content:
+        contents = fetch_contents(need_content)
+        for doc in chosen:
+            if _file_id(doc) in contents:
+                doc["content"] = contents[_file_id(doc)]
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    metrics.observe("rag.rerank_ms", elapsed_ms)
+    logger.info(
+        "Reranked %d candidates -> %d (%d passages) in %.1fms", len(candidates), len(chosen), len(units), elapsed_ms
+    )
+    return chosen
@@ -1,5 +1,6 @@
 import logging
 from datetime import datetime
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 
 from azure.core.credentials import AzureKeyCredential
@@ -11,22 +12,44 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+@lru_cache
+def get_search_client() -> SearchClient | None:
+    """
+    プロセス共通の SearchClient を返す（未設定の場合は None）。
+    SearchService はリクエストごとに作られるため、クライアント（HTTP 接続プール）はここで共有して再利用する。
+    """
+    endpoint = settings.azure_search_endpoint
+    api_key = settings.azure_search_api_key
+    index_name = settings.azure_search_index_name
+
+    if not endpoint or not api_key or not index_name:
+        logger.warning("Azure Search configuration missing. Search is disabled.")
+        return None
+
+    credential = AzureKeyCredential(api_key)
+    logger.info(f"Initializing SearchClient with index: {index_name}, endpoint: {endpoint}")
+    return SearchClient(endpoint=endpoint, index_name=index_name, credential=credential)
+
+
 class SearchService:
     SEARCH_FIELDS = ["content", "original_name", "application", "customer", "trial_id", "ingredient", "author", "issue"]
+    # search_for_rag(include_content=False) で取得するフィールド
+    RAG_LIGHT_FIELDS = [
+        "file_id",
+        "file_name",
+        "original_name",
+        "application",
+        "issue",
+        "ingredient",
+        "customer",
+        "trial_id",
+        "author",
+        "status",
+        "updated_at",
+    ]
 
     def __init__(self) -> None:
-        endpoint = settings.azure_search_endpoint
-        api_key = settings.azure_search_api_key
-        index_name = settings.azure_search_index_name
-
-        if not endpoint or not api_key or not index_name:
-            logger.warning("Azure Search configuration missing. Search is disabled.")
-            self.client = None
-            return
-
-        credential = AzureKeyCredential(api_key)
-        logger.info(f"Initializing SearchService with index: {index_name}, endpoint: {endpoint}")
-        self.client = SearchClient(endpoint=endpoint, index_name=index_name, credential=credential)
+        self.client = get_search_client()
 
     def is_enabled(self) -> bool:
         return self.client is not None
@@ -163,6 +186,7 @@ class SearchService:
         status: str | None = None,
         sort_by: str = "updated_at_desc",
         top: int = 3,
+        include_content: bool = True,
     ) -> List[Dict[str, Any]]:
         """
         RAG（Retrieval-Augmented Generation）用の検索メソッド（PoC用）
@@ -170,6 +194,8 @@ class SearchService:
         
         注意: contentフィールドは大きいため、通常の検索APIでは使用しない。
         このメソッドはLLM分析などのPoC用途専用。
+        include_content=False の場合は content を取得しない（再ランキング用に多めに候補を取る場合。
+        本文が必要になったファイルのみ get_contents で取得する）。
         """
         if not self.client:
             raise RuntimeError("Azure Search client is not configured.")
@@ -232,6 +258,7 @@ class SearchService:
             order_by=order_by,
             top=top,
             include_total_count=False,
+            select=None if include_content else self.RAG_LIGHT_FIELDS,
         )
 
         files: List[Dict[str, Any]] = []
@@ -247,6 +274,7 @@ class SearchService:
                     "original_name": original_name,
                     "display_name": original_name or file_name,
                     "content": content,
+                    "score": doc.get("@search.score"),
                     "application": doc.get("application"),
                     "issue": doc.get("issue"),
                     "ingredient": doc.get("ingredient"),
@@ -260,6 +288,21 @@ class SearchService:
 
         return files
 
+    def get_contents(self, file_ids: List[str]) -> Dict[str, str]:
+        """指定ファイルの content のみを1回の検索で取得する"""
+        if not self.client:
+            raise RuntimeError("Azure Search client is not configured.")
+        if not file_ids:
+            return {}
+        ids = ",".join(self._escape(fid) for fid in file_ids)
+        results = self.client.search(
+            search_text="*",
+            filter=f"search.in(file_id, '{ids}', ',')",
+            select=["file_id", "content"],
+            top=len(file_ids),
+        )
+        return {str(doc["file_id"]): doc.get("content") or "" for doc in results if doc.get("file_id")}
+
     @staticmethod
     def _serialize_datetime(value: Any) -> Any:
         if isinstance(value, datetime):
@@ -0,0 +1,295 @@
+"""
+集計結果のキャッシュ（stale-while-revalidate）。ダッシュボードなど、重い集計をまとめて返す API で使う。
+
+- ttl_seconds 以内の値はそのまま返す
+- 期限切れの値は（max_stale_seconds までは）そのまま返し、バックグラウンドの1スレッドで再計算する
+- 値が無い場合だけリクエスト内で計算する。同時に来たリクエストは1回の計算の完了を待つ（single-flight）
+- 計算結果は cache_snapshots テーブルにも保存し、他の uvicorn ワーカーは再計算せずにそれを使う。
+  refreshing_until（リース）により、再計算は同時に1ワーカーだけが行う
+- start(interval) で定期的に先回りして再計算する（期限切れを待たない）
+
+メトリクス: snapshot_cache.<key>.hit / stale / miss / coalesced / adopted / refreshed / refresh_failed / lease_busy、
+ヒストグラム snapshot_cache.<key>.refresh_ms（計算時間）・snapshot_cache.<key>.age_seconds（返した値の経過秒数）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.metrics import metrics
+from app.db.models.cache_snapshot import CacheSnapshot
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ComputeFunc = Callable[[Session], Dict[str, Any]]
+
+
+def _utc(value: datetime | None) -> datetime | None:
+    # SQLite はタイムゾーンを保存しないため UTC とみなす
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class SnapshotCache:
+    def __init__(
+        self,
+        key: str,
+        compute: ComputeFunc,
+        *,
+        ttl_seconds: float,
+        max_stale_seconds: float,
+        lease_seconds: float,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        self.key = key
+        self.compute = compute
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.lease_seconds = lease_seconds
+        self.session_factory = session_factory
+
+        self._value: Dict[str, Any] | None = None
+        self._computed_at: datetime | None = None
+        self._lock = threading.Lock()
+        self._refreshing: threading.Event | None = None
+        self._last_refresh_ms: float | None = None
+        self._last_error: str | None = None
+        self._task: asyncio.Task | None = None
+
+    def _metric(self, name: str) -> str:
+        return f"snapshot_cache.{self.key}.{name}"
+
+    def _current(self) -> tuple[Dict[str, Any] | None, float]:
+        """(値, 経過秒数)。値が無い場合の経過秒数は inf"""
+        with self._lock:
+            if self._value is None or self._computed_at is None:
+                return None, float("inf")
+            return self._value, (datetime.now(timezone.utc) - self._computed_at).total_seconds()
+
+    def _serve(self, value: Dict[str, Any], age: float, outcome: str) -> Dict[str, Any]:
+        metrics.inc(self._metric(outcome))
+        metrics.observe(self._metric("age_seconds"), age)
+        return value
+
+    # --- 取得 ---
+
+    def get(self, db: Session) -> Dict[str, Any]:
+        value, age = self._current()
+        if age < self.ttl_seconds:
+            return self._serve(value, age, "hit")
+
+        # 他のワーカーが計算した新しい値があれば使う（このワーカーで再計算中の場合は確認しない）
+        if self._refreshing is None and self._adopt_shared(db):
+            value, age = self._current()
+            if age < self.ttl_seconds:
+                return self._serve(value, age, "hit")
+
+        if value is not None and age < self.ttl_seconds + self.max_stale_seconds:
+            self.refresh_in_background()
+            return self._serve(value, age, "stale")
+
+        # 値が無い（古すぎる）場合はこのリクエストで計算する。同時に来たリクエストは完了を待つ
+        metrics.inc(self._metric("miss"))
+        self.refresh(db, wait=True)
+        value, age = self._current()
+        if value is None:
+            raise RuntimeError(f"{self.key} snapshot is not available: {self._last_error}")
+        metrics.observe(self._metric("age_seconds"), age)
+        return value
+
+    # --- 再計算 ---
+
+    def refresh(self, db: Session | None = None, *, wait: bool = False, min_age: float | None = None) -> bool:
+        """
+        再計算する（プロセス内で同時に1回だけ）。既に再計算中の場合は wait=True ならその完了を待つ。
+        min_age: 値（他のワーカーの計算結果を含む）がこの秒数より新しければ計算しない（既定 ttl_seconds）
+        計算した場合は True を返す。
+        """
+        with self._lock:
+            event = self._refreshing
+            leader = event is None
+            if leader:
+                event = self._refreshing = threading.Event()
+        if not leader:
+            metrics.inc(self._metric("coalesced"))
+            if wait:
+                event.wait(self.lease_seconds)
+            return False
+
+        own_session = db is None
+        db = self.session_factory() if own_session else db
+        try:
+            return self._refresh(db, self.ttl_seconds if min_age is None else min_age)
+        finally:
+            if own_session:
+                db.close()
+            with self._lock:
+                self._refreshing = None
+            event.set()
+
+    def refresh_in_background(self, min_age: float | None = None) -> None:
+        if self._refreshing is not None:
+            return
+        threading.Thread(
+            target=self._refresh_quietly, args=(min_age,), name=f"{self.key}-cache-refresh", daemon=True
+        ).start()
+
+    def _refresh_quietly(self, min_age: float | None = None) -> None:
+        try:
+            self.refresh(min_age=min_age)
+        except Exception:
+            # 失敗は記録済み。古い値を返し続け、次の機会に再試行する
+            pass
+
+    def _refresh(self, db: Session, min_age: float) -> bool:
+        self._adopt_shared(db)
+        value, age = self._current()
+        if age < min_age:
+            return False
+
+        leased = self._acquire_lease(db)
+        if not leased and value is not None:
+            # 他のワーカーが計算中（完了後に cache_snapshots から取り込む）
+            metrics.inc(self._metric("lease_busy"))
+            return False
+
+        started = time.perf_counter()
+        try:
+            data = self.compute(db)
+        except Exception as e:
+            db.rollback()
+            # リースを返してから失敗を記録する（stats() で失敗が見えた時点でリースは空いている）
+            if leased:
+                self._store_shared(db, None, None)
+            self._last_error = str(e) or type(e).__name__
+            metrics.inc(self._metric("refresh_failed"))
+            logger.warning("Refreshing %s snapshot failed: %s", self.key, e)
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        computed_at = datetime.now(timezone.utc)
+        with self._lock:
+            self._value = data
+            self._computed_at = computed_at
+        self._last_refresh_ms = elapsed_ms
+        self._last_error = None
+        metrics.inc(self._metric("refreshed"))
+        metrics.observe(self._metric("refresh_ms"), elapsed_ms)
+        logger.info("Refreshed %s snapshot in %.1fms", self.key, elapsed_ms)
+        self._store_shared(db, data, computed_at, release=leased)
+        return True
+
+    # --- ワーカー間の共有（cache_snapshots） ---
+
+    def _adopt_shared(self, db: Session) -> bool:
+        """
+        cache_snapshots の値がメモリの値より新しければ取り込む。
+        期限切れ後の get() のたびに呼ばれるため、まず computed_at だけを読み、新しい場合だけ data を読む
+        """
+        snapshot = db.query(CacheSnapshot).filter(CacheSnapshot.key == self.key)
+        try:
+            computed_at = _utc(snapshot.with_entities(CacheSnapshot.computed_at).scalar())
+            if computed_at is None:
+                return False
+            with self._lock:
+                if self._computed_at is not None and computed_at <= self._computed_at:
+                    return False
+            row = snapshot.with_entities(CacheSnapshot.data, CacheSnapshot.computed_at).one_or_none()
+        except SQLAlchemyError as e:
+            logger.warning("Failed to read %s snapshot: %s", self.key, e)
+            db.rollback()
+            return False
+        if row is None or row.data is None or row.computed_at is None:
+            return False
+        # 2回の読み出しの間に他のワーカーが更新した場合は、読んだ data の computed_at を使う
+        computed_at = _utc(row.computed_at)
+        data = json.loads(row.data)
+        with self._lock:
+            if self._computed_at is not None and computed_at <= self._computed_at:
+                return False
+            self._value = data
+            self._computed_at = computed_at
+        metrics.inc(self._metric("adopted"))
+        return True
+
+    def _acquire_lease(self, db: Session) -> bool:
+        """再計算のリースを取る。DB が使えない場合は True（各ワーカーで計算する）"""
+        now = datetime.now(timezone.utc)
+        try:
+            if db.get(CacheSnapshot, self.key) is None:
+                try:
+                    db.add(CacheSnapshot(key=self.key))
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+            leased = (
+                db.query(CacheSnapshot)
+                .filter(
+                    CacheSnapshot.key == self.key,
+                    or_(CacheSnapshot.refreshing_until.is_(None), CacheSnapshot.refreshing_until < now),
+                )
+                .update({"refreshing_until": now + timedelta(seconds=self.lease_seconds)}, synchronize_session=False)
+            )
+            db.commit()
+            return bool(leased)
+        except SQLAlchemyError as e:
+            logger.warning("Failed to lease %s snapshot: %s", self.key, e)
+            db.rollback()
+            return True
+
+    def _store_shared(
+        self, db: Session, data: Dict[str, Any] | None, computed_at: datetime | None, release: bool = True
+    ) -> None:
+        """計算結果を保存し、release=True ならリースを返す（data=None はリースを返すだけ）"""
+        values: Dict[str, Any] = {"refreshing_until": None} if release else {}
+        if data is not None:
+            values.update(data=json.dumps(data, ensure_ascii=False), computed_at=computed_at)
+        try:
+            db.query(CacheSnapshot).filter(CacheSnapshot.key == self.key).update(values, synchronize_session=False)
+            db.commit()
+        except SQLAlchemyError as e:
+            logger.warning("Failed to store %s snapshot: %s", self.key, e)
+            db.rollback()
+
+    # --- 定期的な再計算 ---
+
+    def start(self, interval_seconds: float) -> None:
+        """interval_seconds ごとに先回りして再計算する（起動直後にも1回）。イベントループ上で呼ぶ"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._schedule(interval_seconds))
+
+    async def _schedule(self, interval_seconds: float) -> None:
+        while True:
+            # 他のワーカーが直近に再計算していれば取り込むだけにする
+            await asyncio.to_thread(self._refresh_quietly, interval_seconds / 2)
+            await asyncio.sleep(interval_seconds)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        _, age = self._current()
+        return {
+            "age_seconds": None if age == float("inf") else round(age, 1),
+            "refreshing": self._refreshing is not None,
+            "last_refresh_ms": None if self._last_refresh_ms is None else round(self._last_refresh_ms, 1),
+            "last_error": self._last_error,
+        }
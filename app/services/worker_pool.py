@@ -0,0 +1,123 @@
+"""
+DB をキューにしたバックグラウンドのワーカープール（asyncio タスク）。
+
+バッチ分析ジョブ（analysis_job_service）とファイル要約の生成（file_summary_service）で共通に使う。
+各 uvicorn ワーカーの lifespan で起動し、項目の取得（claim）は条件付き UPDATE などで重複しないようにする前提。
+LLM の実行枠の空き待ちでは対話的なリクエストを優先する（background_priority）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Callable, List
+
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.services.llm_service import background_priority
+
+logger = logging.getLogger(__name__)
+
+
+async def to_thread_to_completion(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    func をスレッドで実行し、待機中にキャンセルされても完了まで待つ（その後 CancelledError を送出する）。
+    シャットダウン時の差し戻しなど、stop() のキャンセルで途中のまま捨てたくない DB 更新に使う
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    cancelled = False
+    while not future.done():
+        try:
+            await asyncio.wait({future})
+        except asyncio.CancelledError:
+            cancelled = True
+    if cancelled:
+        raise asyncio.CancelledError
+    return future.result()
+
+
+class PollingWorkerPool(ABC):
+    """
+    claim() で DB から1件取得して run_item() で実行するワーカーを workers 件動かす。
+    取得できる項目が無い間は notify() されるか poll_seconds 経つまで待つ
+    （他の uvicorn ワーカーで登録された項目や、再起動前に残った項目も拾う）。
+    """
+
+    name = "worker"
+
+    def __init__(
+        self, workers: int, poll_seconds: float, session_factory: Callable[[], Session] = SessionLocal
+    ) -> None:
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.session_factory = session_factory
+        self._tasks: List[asyncio.Task] = []
+        self._wake = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self) -> None:
+        if self._tasks or self.workers <= 0:
+            return
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"{self.name}-{n}") for n in range(self.workers)]
+        logger.info("Started %d %s(s)", self.workers, self.name)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def notify(self) -> None:
+        """
+        待機中のワーカーを起こす。sync のルート（スレッドプール）からも呼べる
+        （asyncio.Event はスレッドセーフではないため、イベントループのスレッド以外からは call_soon_threadsafe で渡す）
+        """
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wake.set()
+            return
+        try:
+            loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError:
+            # stop() の後にループが閉じられた（起こすワーカーはもう無い）
+            pass
+
+    @abstractmethod
+    def claim(self) -> Any | None:
+        """実行する項目を1件取得する（スレッドで実行される）。無ければ None"""
+
+    @abstractmethod
+    async def run_item(self, claimed: Any) -> None:
+        """claim() で取得した項目を実行する。失敗の記録（状態の更新など）はここで行う"""
+
+    async def _worker(self) -> None:
+        with background_priority():
+            while True:
+                try:
+                    claimed = await asyncio.to_thread(self.claim)
+                except Exception:
+                    logger.exception("%s failed to claim an item", self.name)
+                    claimed = None
+                if claimed is None:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                    except TimeoutError:
+                        pass
+                    continue
+                try:
+                    await self.run_item(claimed)
+                except Exception:
+                    # 1件の失敗でワーカーを止めない（状態の更新は run_item 側の責任）
+                    logger.exception("%s failed to run %r", self.name, claimed)
@@ -0,0 +1,129 @@
+"""
+起動（コールドスタート）と最初のリクエストの所要時間のベンチマーク。
+
+1. janome Tokenizer の生成コスト（変更前はダッシュボードのリクエストごとに生成していた）と、
+   プロセス共通の Tokenizer（get_tokenizer）を使う場合の比較
+2. 新しいプロセスで app を起動（lifespan 実行）し、起動時間と /files/dashboard の1回目・2回目の応答時間を
+   ウォームアップあり / なし（STARTUP_WARMUP_ENABLED）で比較する
+
+DB は一時ファイルの SQLite（--files 件のファイルを登録）を使う。検索・Blob・LLM は環境変数の設定に従う
+（未設定の場合はウォームアップ対象外になる）。ダッシュボードはキャッシュされるため 2回目はキャッシュ応答になる。
+
+Usage:
+    python scripts/bench_cold_start.py [--runs 3] [--files 200]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# 子プロセスで実行する計測（起動 → ダッシュボード 2回）
+CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+from fastapi.testclient import TestClient
+import app.db.models
+from app.api.deps import get_current_user
+from app.db.base import Base
+from app.db.models.cache_snapshot import CacheSnapshot
+from app.db.models.file import File
+from app.db.session import SessionLocal, engine
+from app.main import app
+
+Base.metadata.create_all(engine)
+db = SessionLocal()
+if db.query(File).count() == 0:
+    issues = ["生地が硬くなる", "焼成後にひび割れが発生する", "保存中に風味が劣化する", "離水が多い"]
+    for i in range(int(sys.argv[1])):
+        db.add(File(id=f"f{i}", blob_path=f"files/f{i}.pdf", original_name=f"f{i}.pdf",
+                    issue=issues[i % len(issues)] + f"（試作{i}）", application="パン"))
+    db.commit()
+# 前の計測で保存されたダッシュボードのスナップショットは使わない（初回の集計を計測する）
+db.query(CacheSnapshot).delete()
+db.commit()
+db.close()
+app.dependency_overrides[get_current_user] = lambda: None
+imported = time.perf_counter()
+with TestClient(app) as client:
+    ready = time.perf_counter()
+    timings = []
+    for _ in range(2):
+        t = time.perf_counter()
+        response = client.get("/api/v1/files/dashboard")
+        response.raise_for_status()
+        timings.append((time.perf_counter() - t) * 1000)
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "first_ms": timings[0],
+    "second_ms": timings[1],
+}))
+"""
+
+
+def bench_tokenizer(iterations: int) -> None:
+    from janome.tokenizer import Tokenizer
+
+    from app.services.bm25 import get_tokenizer
+
+    text = "焼成後にひび割れが発生する。生地が硬くなる。"
+    started = time.perf_counter()
+    for _ in range(iterations):
+        list(Tokenizer().tokenize(text))
+    per_request = (time.perf_counter() - started) * 1000 / iterations
+
+    get_tokenizer()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        list(get_tokenizer().tokenize(text))
+    shared = (time.perf_counter() - started) * 1000 / iterations
+    print(f"Tokenizer per request (before): {per_request:8.1f} ms/request")
+    print(f"Shared tokenizer      (after) : {shared:8.1f} ms/request")
+
+
+def run_child(warmup: bool, files: int, db_path: str) -> dict:
+    env = {
+        **os.environ,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "APP_ENV": os.environ.get("APP_ENV", "development"),
+        "STARTUP_WARMUP_ENABLED": "true" if warmup else "false",
+        "ANALYSIS_JOB_WORKERS": "0",
+    }
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, str(files)], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--tokenizer-iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    bench_tokenizer(args.tokenizer_iterations)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        run_child(False, args.files, db_path)  # DB の作成・データ登録（計測しない）
+        for warmup in (False, True):
+            runs = [run_child(warmup, args.files, db_path) for _ in range(args.runs)]
+            label = "warm-up on " if warmup else "warm-up off"
+            med = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+            print(
+                f"{label}: import {med['import_ms']:7.1f} ms | startup {med['startup_ms']:7.1f} ms | "
+                f"first dashboard {med['first_ms']:7.1f} ms | second {med['second_ms']:6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+コンテキスト詰め込み（ContextPacker）のベンチマーク。
+
+合成した抽出コンテキスト / 本文（既定: 10 文書 × 約 20,000 文字、LOG 行の一部が文書間で重複）に対して
+pack の所要時間と、詰め込み後のトークン数・重複除去数・切り詰め数を計測する。
+
+Usage:
+    python scripts/bench_context_packer.py [--docs 10] [--chars 20000] [--window 8192] [--iterations 50]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.context_packer import ContextPacker, estimate_tokens  # noqa: E402
+
+
+def synthetic_docs(n_docs: int, chars: int, dup_ratio: float, seed: int = 0):
+    rnd = random.Random(seed)
+    shared = [f"- No.{i} 試作{i}: 判定=NG, 結果=生地が硬い, 失敗=ひび割れ, 仮説=水分不足{i}" for i in range(200)]
+    docs = []
+    for d in range(n_docs):
+        lines: list[str] = []
+        while sum(map(len, lines)) < chars:
+            if rnd.random() < dup_ratio:
+                lines.append(rnd.choice(shared))
+            else:
+                lines.append(f"- 文書{d} 記録{len(lines)}: 焼成温度 {rnd.randint(150, 220)}℃ / 時間 {rnd.randint(5, 30)}分")
+        docs.append({"file_id": f"file-{d}", "original_name": f"file-{d}.xlsx", "content": "\n".join(lines)})
+    return docs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--chars", type=int, default=20_000)
+    parser.add_argument("--dup-ratio", type=float, default=0.3)
+    parser.add_argument("--window", type=int, default=8192)
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    docs = synthetic_docs(args.docs, args.chars, args.dup_ratio)
+    total = sum(estimate_tokens(d["content"]) for d in docs)
+    packer = ContextPacker(context_window=args.window, reserved_output_tokens=args.max_tokens)
+
+    latencies = []
+    packed = None
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        packed = packer.pack("システムプロンプト\n質問: 失敗の原因は？", docs)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    print(f"input: {args.docs} docs, ~{total} tokens (window={args.window}, max_tokens={args.max_tokens})")
+    print(
+        f"packed: {packed.prompt_tokens} prompt tokens / budget {packed.budget}, "
+        f"duplicates removed={packed.duplicates_removed}, truncated={len(packed.truncated)}, dropped={len(packed.dropped)}"
+    )
+    print(
+        f"pack latency: p50={latencies[len(latencies) // 2]:.2f}ms "
+        f"p90={latencies[int(len(latencies) * 0.9)]:.2f}ms max={latencies[-1]:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+ダッシュボードの集計（DashboardService.compute_dashboard_data）のベンチマーク。
+
+セクションを1つのセッションで順に実行する場合と、セクションごとに別のセッション（プールの別の接続）で
+並行に実行する場合（--workers）の所要時間を、セクションごとの内訳とともに比較する。
+
+既定では一時ファイルの SQLite に --files 件のファイルと --downloads 件のダウンロードを登録し、日次集計と
+ワードクラウドの集計を作成してから計測する。--database-url を指定した場合は既存の DB をそのまま使う（登録しない）。
+SQLite は同じプロセス内で動くため通信の往復が無い。--latency-ms を指定すると、SQL の実行ごとにその時間だけ待ち、
+DB サーバーとの往復（ネットワーク遅延）を模擬する。
+
+Usage:
+    python scripts/bench_dashboard.py [--files 20000] [--downloads 200000] [--runs 5] [--workers 4] [--latency-ms 5]
+    python scripts/bench_dashboard.py --database-url "mssql+pyodbc://..." [--runs 5] [--workers 4]
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import app.db.models  # noqa: E402,F401
+from app.core.metrics import metrics  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.db.models.file import File  # noqa: E402
+from app.db.models.file_download import FileDownload  # noqa: E402
+from app.services.daily_rollup_service import DailyRollupService  # noqa: E402
+from app.services.dashboard_service import DASHBOARD_SECTIONS, DashboardService  # noqa: E402
+from app.services.issue_term_service import IssueTermService  # noqa: E402
+
+_APPLICATIONS = ["パン", "麺", "菓子", "飲料", "惣菜", "乳製品"]
+_INGREDIENTS = ["砂糖", "澱粉", "乳化剤", "増粘剤", "酵素", "香料", "油脂"]
+_ISSUES = ["生地が硬くなる", "焼成後にひび割れが発生する", "保存中に風味が劣化する", "離水が多い", "食感がパサつく"]
+
+
+def seed(factory, files: int, downloads: int) -> None:
+    rnd = random.Random(0)
+    now = datetime.now()
+    db = factory()
+    try:
+        rows = [
+            {"id": f"f{i}", "blob_path": f"files/f{i}.pdf", "original_name": f"f{i}.pdf",
+             "application": rnd.choice(_APPLICATIONS), "ingredient": rnd.choice(_INGREDIENTS),
+             "issue": rnd.choice(_ISSUES), "status": "active", "created_at": now - timedelta(days=rnd.randrange(730))}
+            for i in range(files)
+        ]
+        for i in range(0, len(rows), 5000):
+            db.bulk_insert_mappings(File, rows[i : i + 5000])
+        rows = [
+            {"id": f"d{i}", "file_id": f"f{rnd.randrange(files)}", "user_id": 1,
+             "downloaded_at": now - timedelta(minutes=rnd.randrange(365 * 24 * 60))}
+            for i in range(downloads)
+        ]
+        for i in range(0, len(rows), 5000):
+            db.bulk_insert_mappings(FileDownload, rows[i : i + 5000])
+        db.commit()
+        DailyRollupService(db).rebuild()
+        IssueTermService(db).rebuild()
+    finally:
+        db.close()
+
+
+def run(factory, runs: int, workers: int) -> tuple[list[float], dict[str, list[float]]]:
+    totals: list[float] = []
+    sections: dict[str, list[float]] = defaultdict(list)
+    for _ in range(runs):
+        metrics.reset()
+        db = factory()
+        try:
+            start = time.perf_counter()
+            DashboardService(db).compute_dashboard_data(session_factory=factory, max_workers=workers)
+            totals.append((time.perf_counter() - start) * 1000)
+        finally:
+            db.close()
+        histograms = metrics.snapshot()["histograms"]
+        for name in DASHBOARD_SECTIONS:
+            sections[name].append(histograms[f"dashboard.section_ms.{name}"]["avg"])
+    return totals, sections
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default=None, help="既存の DB を使う（データは登録しない）")
+    parser.add_argument("--files", type=int, default=20_000)
+    parser.add_argument("--downloads", type=int, default=200_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="SQL の実行ごとに待つ時間（往復の遅延の模擬）")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    tmpdir = None
+    url = args.database_url
+    if url is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmpdir.name, 'dashboard.db')}"
+    engine = create_engine(url, pool_size=max(5, args.workers + 1))
+    factory = sessionmaker(bind=engine)
+    if args.database_url is None:
+        Base.metadata.create_all(engine)
+        start = time.perf_counter()
+        seed(factory, args.files, args.downloads)
+        print(f"seeded files={args.files} downloads={args.downloads} in {time.perf_counter() - start:.1f}s")
+
+    if args.latency_ms > 0:
+        @event.listens_for(engine, "before_cursor_execute")
+        def _delay(*_):
+            time.sleep(args.latency_ms / 1000)
+
+    run(factory, 1, 1)  # 接続・キャッシュのウォームアップ
+    print(f"latency per statement: {args.latency_ms}ms, runs={args.runs}")
+    results = {"sequential": run(factory, args.runs, 1), f"parallel x{args.workers}": run(factory, args.runs, args.workers)}
+    for label, (totals, _) in results.items():
+        print(f"{label:>14}: median {statistics.median(totals):8.1f} ms  (min {min(totals):.1f}, max {max(totals):.1f})")
+    print("per-section median (ms):")
+    print(f"{'section':>24} " + " ".join(f"{label:>14}" for label in results))
+    for name in DASHBOARD_SECTIONS:
+        cells = " ".join(f"{statistics.median(sections[name]):14.1f}" for _, sections in results.values())
+        print(f"{name:>24} {cells}")
+    engine.dispose()
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
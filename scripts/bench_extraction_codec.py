@@ -0,0 +1,103 @@
+"""
+抽出結果の保存形式（非圧縮JSON vs extraction_codec）のサイズ・デコード時間を計測する。
+
+既定では Step3 テンプレ相当の合成データ（LOG 500行 / 配合 80原材料×10案）を使用する。
+--from-db を付けると file_extractions の実データを対象に集計する。
+
+Usage:
+    python scripts/bench_extraction_codec.py [--from-db] [--repeat 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.extraction_codec import decode_extraction, encode_extraction  # noqa: E402
+
+
+def synthetic_extraction(log_rows: int = 500, ingredients: int = 80, variants: int = 10) -> dict:
+    variant_ids = [f"No.{i}" for i in range(1, variants + 1)]
+    return {
+        "meta": {"trial_id": "TR-2025-001", "application": "ベーカリー", "issue": "食感の改善", "outcome": "良"},
+        "log": [
+            {
+                "variant_id": f"No.{i % variants + 1}",
+                "variant_label": f"試作{i}",
+                "purpose": "保水性を高めてしっとり感を維持する",
+                "change": "増粘剤を0.2%増量",
+                "result": f"水分 {30 + i % 7}%、硬さ {120 + i % 13}g。翌日の硬化がやや抑制された。",
+                "judgement": "良" if i % 3 else "要再検",
+                "failure_symptoms": "なし" if i % 4 else "パサつき",
+                "cause_hypothesis": "焼成時間が長く水分が飛んだ可能性",
+                "next_action": "焼成時間を2分短縮して再評価",
+                "quote": "しっとり感は向上したが翌日の硬化は残る",
+                "keywords": "保水, 老化, 増粘剤",
+                "note": "",
+            }
+            for i in range(log_rows)
+        ],
+        "formulation": {
+            "variants": variant_ids,
+            "rows": [
+                {
+                    "row_no": r,
+                    "ingredient": f"原材料{r:03d}",
+                    "variants": {v: {"pct": round(0.5 + (r * 7 + j) % 40 / 3, 2), "g": r * 10 + j} for j, v in enumerate(variant_ids)},
+                }
+                for r in range(1, ingredients + 1)
+            ],
+        },
+        "derived": {"failure_tags": ["パサつき"], "selected_variant": "No.3", "outcome": "良", "keywords": ["保水"]},
+        "template_version": "step3",
+    }
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def report(name: str, data: dict, repeat: int) -> None:
+    raw = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    payload = encode_extraction(data)
+    print(f"[{name}] json={len(raw):,}B encoded={len(payload):,}B ratio={len(payload) / len(raw):.2%}")
+    print(f"  decode json (full)     : {timed(lambda: json.loads(raw), repeat):.3f}ms")
+    print(f"  decode codec (full)    : {timed(lambda: decode_extraction(payload), repeat):.3f}ms")
+    print(f"  decode codec (meta)    : {timed(lambda: decode_extraction(payload, ['meta']), repeat):.3f}ms")
+    print(f"  encode codec           : {timed(lambda: encode_extraction(data), repeat):.3f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--from-db", action="store_true")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if not args.from_db:
+        report("synthetic", synthetic_extraction(), args.repeat)
+        return
+
+    from app.db.session import SessionLocal
+    from app.db.models.file_extraction import FileExtraction
+    from app.services.extraction_service import decode_row
+
+    db = SessionLocal()
+    try:
+        total_json = total_encoded = 0
+        for row in db.query(FileExtraction).yield_per(100):
+            data = decode_row(row)
+            total_json += len(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+            total_encoded += row.payload_size or len(encode_extraction(data))
+        print(f"rows total: json={total_json:,}B encoded={total_encoded:,}B")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
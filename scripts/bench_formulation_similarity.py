@@ -0,0 +1,67 @@
+"""
+類似配合検索（FormulationIndex）のベンチマーク。
+
+合成データ（既定: 100k variants / 原材料語彙 2,000 / variant あたり 8〜20 原材料）で
+構築時間・1件追加時間・クエリレイテンシを計測する。
+
+Usage:
+    python scripts/bench_formulation_similarity.py [--variants 100000] [--queries 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.formulation_similarity_service import FormulationIndex  # noqa: E402
+
+
+def synthetic_vectors(n_variants: int, vocab_size: int, seed: int = 0):
+    rnd = random.Random(seed)
+    vocab = [f"原材料{i:04d}" for i in range(vocab_size)]
+    per_file = 4
+    for f in range(n_variants // per_file):
+        yield f"file-{f}", {
+            f"No.{v + 1}": {ing: round(rnd.uniform(0.1, 40.0), 2) for ing in rnd.sample(vocab, rnd.randint(8, 20))}
+            for v in range(per_file)
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variants", type=int, default=100_000)
+    parser.add_argument("--vocab", type=int, default=2_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    data = list(synthetic_vectors(args.variants, args.vocab))
+
+    index = FormulationIndex()
+    start = time.perf_counter()
+    index.bulk_load(data)
+    build = time.perf_counter() - start
+    print(f"build: {args.variants} variants in {build:.2f}s ({index._nnz} non-zeros)")
+
+    start = time.perf_counter()
+    index._add_vectors("file-new", data[0][1])
+    print(f"incremental add (1 file): {(time.perf_counter() - start) * 1000:.3f}ms")
+
+    queries = [vec for _, vectors in data[: args.queries] for vec in list(vectors.values())[:1]]
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        index.query(q, top_k=args.top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(
+        f"query top-{args.top_k}: p50={latencies[len(latencies) // 2]:.2f}ms "
+        f"p95={latencies[int(len(latencies) * 0.95)]:.2f}ms max={latencies[-1]:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+RAG コンテキストの近似重複除去（collapse_near_duplicates）のベンチマーク。
+
+合成コーパス: 元の報告書（LOG 行 / 配合行）から版違いを作り、
+各行を dup_ratio の確率でコピー（edit_ratio の確率で1文字だけ書き換え）、残りを新規行にする。
+コピー行が除去された割合（再現率）、新規行が誤って除去された割合、削減トークン数、所要時間を出力する。
+
+Usage:
+    python scripts/bench_near_duplicate.py [--docs 10] [--lines 200] [--dup-ratio 0.5] [--edit-ratio 0.3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.context_packer import estimate_tokens  # noqa: E402
+from app.services.near_duplicate import collapse_near_duplicates  # noqa: E402
+
+_WORDS = ["生地が硬い", "ひび割れ", "しっとり", "水分不足", "焼成過多", "保水性改善", "甘味が強い", "離水", "粘度上昇", "色むら"]
+
+
+def _row(rnd: random.Random, n: int) -> str:
+    return (
+        f"- No.{n} 試作{rnd.randint(1, 999)}: 判定={rnd.choice(['OK', 'NG'])}, 結果={rnd.choice(_WORDS)}, "
+        f"失敗={rnd.choice(_WORDS)}, 仮説={rnd.choice(_WORDS)}（温度{rnd.randint(150, 220)}℃・{rnd.randint(5, 30)}分）"
+    )
+
+
+def synthetic_corpus(n_docs: int, n_lines: int, dup_ratio: float, edit_ratio: float, seed: int = 0):
+    rnd = random.Random(seed)
+    base = [_row(rnd, i) for i in range(n_lines)]
+    docs = [{"file_id": "file-0", "original_name": "file-0.xlsx", "content": "\n".join(base)}]
+    copies = 0
+    fresh = 0
+    for d in range(1, n_docs):
+        lines = []
+        for i in range(n_lines):
+            if rnd.random() < dup_ratio:
+                line = base[i]
+                if rnd.random() < edit_ratio:
+                    pos = rnd.randrange(len(line))
+                    line = line[:pos] + "＊" + line[pos + 1 :]
+                copies += 1
+            else:
+                line = _row(rnd, i)
+                fresh += 1
+            lines.append(line)
+        docs.append({"file_id": f"file-{d}", "original_name": f"file-{d}.xlsx", "content": "\n".join(lines)})
+    return docs, copies, fresh
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--dup-ratio", type=float, default=0.5)
+    parser.add_argument("--edit-ratio", type=float, default=0.3)
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    docs, copies, fresh = synthetic_corpus(args.docs, args.lines, args.dup_ratio, args.edit_ratio)
+    before = sum(estimate_tokens(d["content"]) for d in docs)
+
+    latencies = []
+    collapsed, removed = docs, 0
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        collapsed, removed = collapse_near_duplicates(docs, threshold=args.threshold)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    after = sum(estimate_tokens(d["content"]) for d in collapsed)
+
+    # 新規行同士が偶然重複することはほぼ無いため、removed - copies の超過分を誤検出とみなす
+    print(f"corpus: {args.docs} docs x {args.lines} lines, copies={copies} (edited {args.edit_ratio:.0%}), fresh={fresh}")
+    print(f"removed={removed} recall~{min(removed, copies) / max(copies, 1):.3f} false_positives~{max(0, removed - copies)}")
+    print(f"tokens: {before} -> {after} ({1 - after / before:.1%} saved)")
+    print(
+        f"latency: p50={latencies[len(latencies) // 2]:.2f}ms "
+        f"p90={latencies[int(len(latencies) * 0.9)]:.2f}ms max={latencies[-1]:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+RAG 候補の BM25 再ランキング（rerank_candidates）のレイテンシのベンチマーク。
+
+インメモリ SQLite に K 件の合成ファイル（1件あたり --passages 個のパッセージ）を作り、
+K 件の候補から top 件を選ぶ時間を計測する。
+- cold: 保存済みの語（file_chunks.terms）が無く、毎回 janome で解析する場合
+- warm: 保存済みの語を使う場合（通常の運用）
+
+Usage:
+    python scripts/bench_rerank.py [--candidates 30 100] [--passages 8] [--top 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, update  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import app.db.models  # noqa: E402, F401
+from app.db.base import Base  # noqa: E402
+from app.db.models.file import File  # noqa: E402
+from app.db.models.file_chunk import FileChunk  # noqa: E402
+from app.services.chunking_service import ChunkService  # noqa: E402
+from app.services.rerank_service import rerank_candidates  # noqa: E402
+
+_WORDS = ["生地が硬い", "ひび割れ", "しっとり", "水分不足", "焼成過多", "保水性改善", "甘味が強い", "離水", "粘度上昇", "色むら"]
+_QUERY = "焼成後のひび割れの原因と保水性の改善策"
+
+
+def _content(rnd: random.Random, n_passages: int) -> str:
+    rows = [
+        f"試作{rnd.randint(1, 999)}は{rnd.choice(_WORDS)}。{rnd.choice(_WORDS)}のため温度{rnd.randint(150, 220)}℃で再試験した。"
+        for _ in range(n_passages * 12)
+    ]
+    return "\n".join(rows)
+
+
+def _percentiles(latencies: list[float]) -> str:
+    latencies = sorted(latencies)
+    return f"p50={latencies[len(latencies) // 2]:.1f}ms p90={latencies[int(len(latencies) * 0.9)]:.1f}ms"
+
+
+def bench(k: int, n_passages: int, top: int, iterations: int) -> None:
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    rnd = random.Random(k)
+    contents = {}
+    for i in range(k):
+        fid = f"file-{i}"
+        db.add(File(id=fid, blob_path=f"files/{fid}.pdf", original_name=f"{fid}.pdf"))
+        contents[fid] = _content(rnd, n_passages)
+    db.commit()
+    ChunkService(db).ensure_chunks(contents)
+    db.commit()
+    passages = db.query(FileChunk).count()
+
+    candidates = [{"id": fid, "original_name": f"{fid}.pdf"} for fid in contents]
+    fetch = lambda ids: {fid: contents[fid] for fid in ids}  # noqa: E731
+
+    results = {}
+    for mode in ("cold", "warm"):
+        latencies = []
+        for _ in range(iterations):
+            if mode == "cold":
+                db.execute(update(FileChunk).values(terms=None))
+                db.commit()
+            start = time.perf_counter()
+            rerank_candidates(db, _QUERY, candidates, top, fetch)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[mode] = _percentiles(latencies)
+    print(f"K={k} ({passages} passages) top={top}: cold {results['cold']} / warm {results['warm']}")
+    db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, nargs="+", default=[30, 100])
+    parser.add_argument("--passages", type=int, default=8)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    for k in args.candidates:
+        bench(k, args.passages, args.top, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
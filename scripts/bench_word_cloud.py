@@ -0,0 +1,124 @@
+"""
+ダッシュボードのワードクラウド集計のベンチマーク。
+
+合成した課題（files.issue）を持つファイル（既定 100,000 件）に対して、
+変更前の方式（有効な全ファイルの課題を連結して毎回 janome で解析）と、
+差分で更新する集計（issue_term_counts の上位 N 件取得）の所要時間（--memory でピークメモリも）、
+作り直し（scripts/rebuild_issue_terms.py 相当）とファイル1件の更新の所要時間を計測する。
+100,000 件では変更前の方式の解析に数分かかる（--memory はさらに tracemalloc 下でもう一度実行する）。
+
+Usage:
+    python scripts/bench_word_cloud.py [--files 100000] [--updates 200] [--memory]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import app.db.models  # noqa: E402,F401
+from app.db.base import Base  # noqa: E402
+from app.db.models.file import File  # noqa: E402
+from app.schemas.file import FileMetadataUpdate  # noqa: E402
+from app.services.bm25 import get_tokenizer  # noqa: E402
+from app.services.file_service import FileService  # noqa: E402
+from app.services.issue_term_service import ISSUE_STOP_WORDS, IssueTermService  # noqa: E402
+
+_SUBJECTS = ["生地", "クリーム", "スポンジ", "クッキー", "ゼリー", "ソース", "チョコレート", "パン", "麺", "ドレッシング"]
+_SYMPTOMS = [
+    "硬くなる", "ひび割れが発生する", "離水が多い", "風味が劣化する", "焼き色にムラがある",
+    "食感がパサつく", "乳化が不安定", "保形性が低下する", "色が退色する", "粘度が上がる",
+]
+_CONTEXTS = ["保存中に", "焼成後に", "冷凍解凍後に", "輸送時に", "", "高温条件で", "量産時に"]
+
+
+def synthetic_issue(rnd: random.Random, i: int) -> str:
+    return f"{rnd.choice(_CONTEXTS)}{rnd.choice(_SUBJECTS)}が{rnd.choice(_SYMPTOMS)}（試作{i % 5000}）"
+
+
+def legacy_word_cloud(db, limit: int = 50) -> dict[str, int]:
+    """変更前の DashboardService._generate_word_cloud と同じ処理"""
+    issues = db.query(File.issue).filter(File.status == "active").all()
+    text_data = " ".join([i[0] for i in issues if i[0]])
+    words = []
+    for token in get_tokenizer().tokenize(text_data):
+        if token.part_of_speech.split(",")[0] == "名詞":
+            word = token.base_form
+            if word not in ISSUE_STOP_WORDS and len(word) > 1 and not word.isdigit():
+                words.append(word)
+    return dict(Counter(words).most_common(limit))
+
+
+def measure(func, *args, memory: bool = False):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = (time.perf_counter() - start) * 1000
+    if not memory:
+        return result, elapsed, ""
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, f"  peak {peak / 1024 / 1024:7.1f} MiB"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--memory", action="store_true", help="tracemalloc でピークメモリも計測する")
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    rnd = random.Random(0)
+    rows = [
+        {"id": f"f{i}", "blob_path": f"files/f{i}.pdf", "original_name": f"f{i}.pdf", "issue": synthetic_issue(rnd, i),
+         "status": "active"}
+        for i in range(args.files)
+    ]
+    for i in range(0, len(rows), 5000):
+        db.bulk_insert_mappings(File, rows[i : i + 5000])
+    db.commit()
+    get_tokenizer()
+    service = IssueTermService(db)
+
+    start = time.perf_counter()
+    service.rebuild()
+    print(f"files={args.files}", flush=True)
+    print(f"rebuild (scripts/rebuild_issue_terms.py): {time.perf_counter() - start:8.2f} s")
+
+    legacy, legacy_ms, legacy_mem = measure(legacy_word_cloud, db, memory=args.memory)
+    top, top_ms, top_mem = measure(service.top_terms, memory=args.memory)
+    print(f"word cloud, legacy (tokenize all issues): {legacy_ms:10.1f} ms{legacy_mem}")
+    print(f"word cloud, top-N from issue_term_counts: {top_ms:10.1f} ms{top_mem}")
+    # 変更前の方式は連結した長文を janome が分割する境目で語が切れるため、出現回数がわずかにずれる
+    print(f"top-{len(top)} terms in common with legacy: {len(set(legacy) & set(top))}", flush=True)
+
+    file_service = FileService(db)
+    latencies = []
+    for _ in range(args.updates):
+        fid = f"f{rnd.randrange(args.files)}"
+        start = time.perf_counter()
+        file_service.update_metadata(fid, FileMetadataUpdate(issue=synthetic_issue(rnd, rnd.randrange(10_000))))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(
+        f"update_metadata(issue) incl. term deltas: p50={latencies[len(latencies) // 2]:.2f}ms "
+        f"p90={latencies[int(len(latencies) * 0.9)]:.2f}ms"
+    )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
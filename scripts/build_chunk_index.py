@@ -0,0 +1,71 @@
+"""
+パッセージ索引（file_chunks）を検索インデックスの content から一括作成する。
+
+取り込み時にはファイル要約のワーカーが作成するが、既存ファイル・FILE_SUMMARY_WORKERS=0 の場合や
+RAG_CHUNK_CHARS / RAG_CHUNK_OVERLAP_CHARS を変更した場合（--rebuild）に実行する（分析時は保存しない）。
+既存のパッセージで再ランキング用の語（terms）が未計算のものも計算して保存する。
+
+Usage:
+    python scripts/build_chunk_index.py [--batch-size 50] [--rebuild]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.models.file import File  # noqa: E402
+from app.db.models.file_chunk import FileChunk  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.services.chunking_service import ChunkService  # noqa: E402
+from app.services.search_service import SearchService  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build(batch_size: int, rebuild: bool) -> None:
+    search_service = SearchService()
+    if not search_service.is_enabled():
+        raise RuntimeError("Azure Search is not configured.")
+
+    db = SessionLocal()
+    try:
+        if rebuild:
+            deleted = db.query(FileChunk).delete(synchronize_session=False)
+            db.commit()
+            logger.info("Deleted %d existing chunks", deleted)
+
+        known = {str(fid) for (fid,) in db.query(File.id).filter(File.status == "active")}
+        service = ChunkService(db)
+        batch: dict[str, str] = {}
+        files = 0
+        for doc in search_service.client.search(search_text="*", select=["file_id", "content"]):
+            file_id = doc.get("file_id")
+            if not file_id or str(file_id) not in known or not doc.get("content"):
+                continue
+            batch[str(file_id)] = doc["content"]
+            if len(batch) >= batch_size:
+                service.ensure_chunks(batch)
+                files += len(batch)
+                batch = {}
+                logger.info("Processed %d files", files)
+        if batch:
+            service.ensure_chunks(batch)
+            files += len(batch)
+        logger.info("Done: %d files, %d chunks", files, db.query(FileChunk).count())
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build passage index (file_chunks) from search index content.")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--rebuild", action="store_true", help="既存のパッセージを削除して作り直す")
+    args = parser.parse_args()
+    start = time.time()
+    build(args.batch_size, args.rebuild)
+    logger.info("Elapsed: %.2fs", time.time() - start)
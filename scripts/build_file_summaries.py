@@ -0,0 +1,85 @@
+"""
+ファイル要約（file_summaries）を既存ファイル分まとめて作成する。
+
+新しくアップロード・更新されたファイルはサーバーのバックグラウンドで自動的に要約されるが、
+導入前からあるファイル・失敗したファイル・SUMMARY_VERSION を上げた後の古い要約（--rebuild は全ファイル）は
+このスクリプトで生成待ちに登録する。--run を付けるとサーバーを待たずにこのプロセスで生成する。
+
+Usage:
+    python scripts/build_file_summaries.py [--rebuild] [--run] [--workers 2]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func  # noqa: E402
+
+from app.db.models.file_summary import FileSummary  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.services.file_summary_service import FileSummaryRunner, FileSummaryService  # noqa: E402
+from app.services.llm_service import get_llm_service  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def status_counts() -> dict[str, int]:
+    db = SessionLocal()
+    try:
+        return dict(db.query(FileSummary.status, func.count()).group_by(FileSummary.status).all())
+    finally:
+        db.close()
+
+
+async def run(workers: int) -> None:
+    """生成待ちが無くなるまで要約を生成する（再試行待ちの項目は残る）"""
+    runner = FileSummaryRunner(workers=workers)
+    runner.start()
+    try:
+        while True:
+            await asyncio.sleep(5)
+            counts = status_counts()
+            logger.info("Summaries: %s", counts)
+            db = SessionLocal()
+            try:
+                waiting = (
+                    db.query(FileSummary)
+                    .filter(FileSummary.status.in_(("pending", "running")), FileSummary.next_attempt_at.is_(None))
+                    .count()
+                )
+            finally:
+                db.close()
+            if not waiting:
+                break
+    finally:
+        await runner.stop()
+        await get_llm_service().aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enqueue (and optionally generate) per-file summaries.")
+    parser.add_argument("--rebuild", action="store_true", help="すべてのファイルの要約を作り直す")
+    parser.add_argument("--run", action="store_true", help="このプロセスで要約を生成する")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    start = time.time()
+
+    db = SessionLocal()
+    try:
+        enqueued = FileSummaryService(db).enqueue_missing(rebuild=args.rebuild)
+    finally:
+        db.close()
+    logger.info("Enqueued %d files", enqueued)
+
+    if args.run:
+        if not get_llm_service().is_enabled():
+            raise RuntimeError("LLM service is not configured.")
+        asyncio.run(run(args.workers))
+    logger.info("Summaries: %s", status_counts())
+    logger.info("Elapsed: %.2fs", time.time() - start)
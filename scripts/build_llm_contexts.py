@@ -0,0 +1,38 @@
+"""
+抽出結果（file_extractions）の LLM 用コンテキストと BM25 用の語を一括生成する。
+
+マイグレーション extraction_llm_context_001 / rag_terms_001 の適用後と、
+extraction_service.LLM_CONTEXT_VERSION を上げた後に実行する（未生成・版が古い行だけを作り直す）。
+
+Usage:
+    python scripts/build_llm_contexts.py [--batch-size 200] [--all]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.session import SessionLocal  # noqa: E402
+from app.services.extraction_service import LLM_CONTEXT_VERSION, refresh_llm_contexts  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build LLM contexts for file_extractions.")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--all", action="store_true", help="版に関係なく全行を作り直す")
+    args = parser.parse_args()
+    start = time.time()
+    db = SessionLocal()
+    try:
+        count = refresh_llm_contexts(db, batch_size=args.batch_size, force=args.all)
+    finally:
+        db.close()
+    logger.info("Built %d LLM contexts (version %d)", count, LLM_CONTEXT_VERSION)
+    logger.info("Elapsed: %.2fs", time.time() - start)
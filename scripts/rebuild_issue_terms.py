@@ -0,0 +1,39 @@
+"""
+ダッシュボードのワードクラウド用の語の集計（file_issue_terms / issue_term_counts）を作り直す。
+
+集計はファイルの登録・更新・削除時に差分で更新されるため、通常は不要。
+導入時（マイグレーション issue_terms_001 の適用後）と、集計がずれた場合に実行する。
+
+Usage:
+    python scripts/rebuild_issue_terms.py [--batch-size 1000]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.session import SessionLocal  # noqa: E402
+from app.services.issue_term_service import IssueTermService  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the word-cloud term counts from files.issue.")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    start = time.time()
+
+    db = SessionLocal()
+    try:
+        files = IssueTermService(db).rebuild(batch_size=args.batch_size)
+        top = IssueTermService(db).top_terms(limit=10)
+    finally:
+        db.close()
+    logger.info("Rebuilt term counts from %d files. Top terms: %s", files, top)
+    logger.info("Elapsed: %.2fs", time.time() - start)
@@ -0,0 +1,57 @@
+"""
+ダッシュボードのダウンロード数・登録数の日次集計（file_download_daily / file_registration_daily）と
+分析 API の集計キューブ（file_stats_daily）の作り直し、古いダウンロード履歴（file_downloads）の圧縮。
+
+集計はダウンロード・ファイルの登録/状態変更/削除時に更新されるため、作り直しは
+導入時（マイグレーション daily_rollups_001 / analytics_cube_001 の適用後）と集計がずれた場合だけ行う。
+--compact-days N は N 日より前の file_downloads の行を削除する（集計には残る）。cron などで定期実行する。
+
+Usage:
+    python scripts/rollup_daily_stats.py --rebuild
+    python scripts/rollup_daily_stats.py --compact-days 365
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.session import SessionLocal  # noqa: E402
+from app.services.analytics_service import AnalyticsService  # noqa: E402
+from app.services.daily_rollup_service import DailyRollupService  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild daily download/registration rollups and compact old downloads.")
+    parser.add_argument("--rebuild", action="store_true", help="file_downloads / files から集計とキューブを作り直す")
+    parser.add_argument("--compact-days", type=int, default=None, help="この日数より前の file_downloads の行を削除する")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    if not args.rebuild and args.compact_days is None:
+        parser.error("--rebuild と --compact-days の少なくとも一方を指定してください")
+    if args.compact_days is not None and args.compact_days < 1:
+        parser.error("--compact-days は 1 以上を指定してください")
+    start = time.time()
+
+    db = SessionLocal()
+    try:
+        service = DailyRollupService(db)
+        if args.rebuild:
+            result = service.rebuild(batch_size=args.batch_size)
+            logger.info("Rebuilt rollups: %s", result)
+            # キューブのダウンロード数は file_download_daily から作るため、その後に作り直す
+            rows = AnalyticsService(db).rebuild(batch_size=args.batch_size)
+            logger.info("Rebuilt analytics cube: %d rows", rows)
+        if args.compact_days is not None:
+            deleted = service.compact(date.today() - timedelta(days=args.compact_days))
+            logger.info("Deleted %d raw download rows older than %d days", deleted, args.compact_days)
+    finally:
+        db.close()
+    logger.info("Elapsed: %.2fs", time.time() - start)
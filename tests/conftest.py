@@ -0,0 +1,54 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.db.models  # noqa: F401
+from app.api.deps import get_current_user, get_db_session
+from app.db.base import Base
+from app.db.models.user import User
+from app.main import app
+
+
+@pytest.fixture()
+def engine():
+    """インメモリの SQLite（接続を共有する StaticPool）。テーブルは作成済み"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture()
+def db(engine):
+    """engine のセッション。データを入れる場合はモジュール側で db(db) として上書きする"""
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    """ファイルの SQLite のセッションファクトリ（別スレッド・別セッションで DB を使うテスト用）"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture()
+def user(db):
+    user = User(id=1, email="owner@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture()
+def client(db, user):
+    """db・user を使う API クライアント（lifespan は実行しない）"""
+    app.dependency_overrides[get_db_session] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield TestClient(app)
+    app.dependency_overrides.clear()
@@ -0,0 +1,176 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app.api.v1 import routes_ai
+from app.db.models.file import File
+from app.db.models.llm_answer_cache import LLMAnswerCache
+from app.services.llm_providers import Completion, LLMProvider
+from app.services.llm_service import LLMService
+from app.services.map_reduce_service import NOT_RELEVANT
+
+DOCS = [
+    {"file_id": "f0", "original_name": "f0.xlsx", "content": "焼成後に割れが発生した", "score": 2.0},
+    {"file_id": "f1", "original_name": "f1.pdf", "content": "問題なし", "score": 1.0},
+]
+CONTEXT = {"mode": "content", "summary_count": 0, "extraction_count": 0, "content_count": 2}
+
+
+class FakeProvider(LLMProvider):
+    name = "fake"
+
+    def __init__(self, parts=("割れの", "原因は", "水分です")):
+        self.parts = parts
+        self.streams = 0
+        self.yielded = 0
+        self.closed = 0
+        self.maps: list[str] = []
+
+    async def complete(self, system_prompt, user_message, max_tokens, temperature):
+        # map_reduce の map（文書ごとの要点抽出）
+        self.maps.append(user_message)
+        text = "- 焼成後に割れ" if "割れ" in user_message else NOT_RELEVANT
+        return Completion(text=text, prompt_tokens=10, completion_tokens=3)
+
+    async def stream(self, system_prompt, user_message, max_tokens, temperature, usage=None):
+        self.streams += 1
+        try:
+            for part in self.parts:
+                await asyncio.sleep(0)
+                self.yielded += 1
+                yield part
+            if usage is not None:
+                usage.prompt_tokens, usage.completion_tokens = 120, len(self.parts)
+        finally:
+            self.closed += 1
+
+
+@pytest.fixture()
+def provider(client, db, engine, monkeypatch):
+    for doc in DOCS:
+        db.add(File(id=doc["file_id"], blob_path=f"files/{doc['original_name']}", original_name=doc["original_name"]))
+    db.commit()
+
+    provider = FakeProvider()
+    service = LLMService()
+    service.primary, service.secondary, service.enabled = provider, None, True
+    monkeypatch.setattr(routes_ai, "get_llm_service", lambda: service)
+
+    async def build_docs(request, db):
+        return [dict(doc) for doc in DOCS], dict(CONTEXT)
+
+    monkeypatch.setattr(routes_ai, "_build_docs_for_llm", build_docs)
+    monkeypatch.setattr(routes_ai.settings, "llm_answer_cache_enabled", True)
+    monkeypatch.setattr(routes_ai, "SessionLocal", sessionmaker(bind=engine))
+    return provider
+
+
+def _stream(client, **body) -> list[tuple[str, dict]]:
+    response = client.post("/api/v1/ai/analyze/stream", json={"question": "割れの原因は？", **body})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def _answer(events) -> str:
+    return "".join(data["text"] for name, data in events if name == "token")
+
+
+def test_stream_sends_meta_then_tokens_then_done(client, provider):
+    events = _stream(client)
+
+    assert [name for name, _ in events] == ["meta", "token", "token", "token", "done"]
+    meta = events[0][1]
+    assert meta["sources"] == ["f0.xlsx", "f1.pdf"]
+    assert meta["context"] == CONTEXT
+    assert meta["session_id"]
+    assert _answer(events) == "割れの原因は水分です"
+    assert events[-1][1] == {"answer_length": len("割れの原因は水分です"), "cached": False}
+    assert provider.closed == 1
+
+
+def test_cached_answer_is_sent_without_calling_the_llm(client, db, provider):
+    first = _stream(client)
+    entry = db.query(LLMAnswerCache).one()
+    assert (entry.prompt_tokens, entry.completion_tokens) == (120, 3)
+
+    second = _stream(client)
+    third = _stream(client)
+
+    assert provider.streams == 1
+    assert [name for name, _ in second] == ["meta", "token", "done"]
+    assert _answer(second) == _answer(third) == _answer(first)
+    assert second[-1][1]["cached"] is True
+    # ヒットでは書き込まない（ヒット数は次の保存でまとめて加算する）
+    assert db.query(LLMAnswerCache).one().hit_count == 0
+
+
+def test_map_reduce_reports_progress_before_streaming_the_reduce(client, provider):
+    events = _stream(client, mode="map_reduce")
+
+    names = [name for name, _ in events]
+    assert names[:3] == ["meta", "progress", "progress"]
+    assert names[3:] == ["token", "token", "token", "done"]
+    progress = [data for name, data in events if name == "progress"]
+    assert [p["done"] for p in progress] == [1, 2]
+    assert {p["file_id"] for p in progress} == {"f0", "f1"}
+    assert all(p["total"] == 2 and p["cached"] is False for p in progress)
+    assert len(provider.maps) == 2 and provider.streams == 1
+
+    # map の結果はキャッシュされ、2回目は cached=True の進捗になる
+    events = _stream(client, mode="map_reduce")
+    assert all(data["cached"] for name, data in events if name == "progress")
+    assert len(provider.maps) == 2
+
+
+def test_client_disconnect_closes_the_upstream_stream(client, provider, monkeypatch):
+    async def disconnected(self):
+        return True
+
+    with monkeypatch.context() as m:
+        m.setattr(Request, "is_disconnected", disconnected)
+        events = _stream(client)
+
+    # 最初の断片を受け取った時点で切断を検知し、残りの生成を打ち切る
+    assert [name for name, _ in events] == ["meta"]
+    assert provider.yielded == 1
+    assert provider.closed == 1
+
+    # 途中で打ち切った回答はキャッシュしない
+    _stream(client)
+    assert provider.streams == 2
+
+
+@pytest.mark.parametrize("mode", ["single", "map_reduce"])
+def test_stream_releases_the_request_session_before_generating(client, db, engine, provider, monkeypatch, mode):
+    opened: list = []
+    factory = sessionmaker(bind=engine)
+
+    def session_local():
+        opened.append(factory())
+        return opened[-1]
+
+    monkeypatch.setattr(routes_ai, "SessionLocal", session_local)
+    in_transaction: list[bool] = []
+    original = FakeProvider.stream
+
+    async def stream(self, *args, **kwargs):
+        in_transaction.append(db.in_transaction())
+        async for part in original(self, *args, **kwargs):
+            yield part
+
+    monkeypatch.setattr(FakeProvider, "stream", stream)
+    events = _stream(client, mode=mode)
+
+    assert events[-1][0] == "done"
+    # 生成中はリクエストのセッションが接続を持たず、キャッシュの読み書きは閉じた短いセッションで行う
+    assert in_transaction == [False]
+    assert opened and all(not s.in_transaction() for s in opened)
+    assert db.query(LLMAnswerCache).count() == (3 if mode == "map_reduce" else 1)
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.api.v1 import routes_ai_jobs
+from app.db.models.analysis_job import AnalysisJobItem
+from app.db.models.user import User
+from app.schemas.ai import AIAnalysisRequest
+from app.services.analysis_job_service import AnalysisJobRunner, AnalysisJobService
+
+
+@pytest.fixture()
+def session_factory(session_factory):
+    # ワーカーは別スレッド・別セッションで DB を使うため、接続を共有する StaticPool ではなくファイルの DB を使う
+    db = session_factory()
+    db.add(User(id=1, email="a@example.com", hashed_password="x"))
+    db.commit()
+    db.close()
+    return session_factory
+
+
+def _requests(*applications):
+    return [AIAnalysisRequest(question="失敗の原因は？", application=a) for a in applications]
+
+
+def test_runner_executes_items_and_records_results(session_factory):
+    db = session_factory()
+    job = AnalysisJobService(db).create(1, _requests("パン", "菓子", "麺"))
+
+    async def analyze(request, _db):
+        await asyncio.sleep(0.01)
+        if request.application == "麺":
+            raise RuntimeError("LLM processing failed: quota")
+        return {"answer": f"{request.application}の回答", "source_files": [{"file_id": "f1", "original_name": "f1.pdf"}]}
+
+    async def scenario():
+        runner = AnalysisJobRunner(workers=2, analyze=analyze, session_factory=session_factory)
+        runner.start()
+        runner.notify()
+        for _ in range(200):
+            db.expire_all()
+            if AnalysisJobService(db).get(job.id, 1).status in ("completed", "failed"):
+                break
+            await asyncio.sleep(0.01)
+        await runner.stop()
+
+    asyncio.run(scenario())
+
+    result = AnalysisJobService(db).to_dict(AnalysisJobService(db).get(job.id, 1))
+    assert result["status"] == "completed"
+    assert (result["total_items"], result["done_items"], result["failed_items"]) == (3, 3, 1)
+    items = result["items"]
+    assert [i["status"] for i in items] == ["succeeded", "succeeded", "failed"]
+    assert items[0]["answer"] == "パンの回答"
+    assert items[0]["request"]["application"] == "パン"
+    assert items[2]["error"] == "LLM processing failed: quota"
+    # 他のユーザーのジョブは見えない
+    assert AnalysisJobService(db).get(job.id, 2) is None
+
+
+def test_claim_skips_running_items_until_lease_expires(session_factory):
+    db = session_factory()
+    service = AnalysisJobService(db)
+    job = service.create(1, _requests("パン"))
+
+    first = service.claim_next()
+    assert first is not None and first.attempts == 1
+    assert service.claim_next() is None  # 実行中の項目は他のワーカーに渡さない
+
+    first.started_at = datetime.now(timezone.utc) - timedelta(hours=1)
+    db.commit()
+    again = service.claim_next()
+    assert again.id == first.id and again.attempts == 2
+
+    service.finish_item(again.id, {"answer": "ok", "source_files": []})
+    assert service.get(job.id, 1).status == "completed"
+    assert db.query(AnalysisJobItem).one().status == "succeeded"
+
+
+def test_job_events_poll_with_short_lived_sessions(client, db, engine, monkeypatch):
+    service = AnalysisJobService(db)
+    job = service.create(1, _requests("パン", "菓子"))
+    for item in service.items(job.id):
+        service.finish_item(item.id, {"answer": f"{item.item_no}の回答", "source_files": []})
+
+    opened: list = []
+    factory = sessionmaker(bind=engine)
+
+    def session_local():
+        opened.append(factory())
+        return opened[-1]
+
+    monkeypatch.setattr(routes_ai_jobs, "SessionLocal", session_local)
+    response = client.get(f"/api/v1/ai/jobs/{job.id}/events")
+
+    assert response.status_code == 200
+    events = [block.split("\n")[0].removeprefix("event: ") for block in response.text.strip().split("\n\n")]
+    assert events == ["progress", "item", "item", "done"]
+    # 確認ごとのセッションは閉じる。リクエストのセッションは所有者の確認後に閉じる
+    assert len(opened) == 1 and not opened[0].in_transaction()
+    assert not db.in_transaction()
+    assert client.get("/api/v1/ai/jobs/missing/events").status_code == 404
+
+
+def test_stop_requeues_the_running_item_off_the_event_loop(session_factory, monkeypatch):
+    db = session_factory()
+    job = AnalysisJobService(db).create(1, _requests("パン"))
+    started = asyncio.Event()
+    requeue_threads: list[int] = []
+    original = AnalysisJobService.requeue_item
+
+    def requeue_item(self, item_id):
+        requeue_threads.append(threading.get_ident())
+        time.sleep(0.05)  # stop() の待機中に処理が終わらなくても途中で捨てない
+        original(self, item_id)
+
+    monkeypatch.setattr(AnalysisJobService, "requeue_item", requeue_item)
+
+    async def analyze(request, _db):
+        started.set()
+        await asyncio.sleep(10)
+
+    async def scenario():
+        runner = AnalysisJobRunner(workers=1, analyze=analyze, session_factory=session_factory)
+        runner.start()
+        runner.notify()
+        await asyncio.wait_for(started.wait(), 5)
+        await runner.stop()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+
+    assert requeue_threads and requeue_threads[0] != loop_thread
+    item = db.query(AnalysisJobItem).filter(AnalysisJobItem.job_id == job.id).one()
+    assert (item.status, item.attempts, item.started_at) == ("queued", 0, None)
+
+
+def test_job_events_report_an_error_when_the_job_disappears(client, db, engine, monkeypatch):
+    job = AnalysisJobService(db).create(1, _requests("パン"))
+    original = AnalysisJobService.get
+    calls: list[str] = []
+
+    def get(self, job_id, owner_id):
+        calls.append(job_id)
+        # 所有者の確認の後に削除された
+        return original(self, job_id, owner_id) if len(calls) == 1 else None
+
+    monkeypatch.setattr(AnalysisJobService, "get", get)
+    monkeypatch.setattr(routes_ai_jobs, "SessionLocal", sessionmaker(bind=engine))
+    response = client.get(f"/api/v1/ai/jobs/{job.id}/events")
+
+    assert response.status_code == 200
+    assert response.text == 'event: error\ndata: {"error": "Job not found"}\n\n'
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from app.db.models.file import File
+from app.schemas.ai import AIAnalysisRequest
+from app.services import analysis_session_service
+from app.services.analysis_service import cache_namespace, generate_answer
+from app.services.analysis_session_service import AnalysisSessionStore
+from app.services.llm_service import LLMService
+
+DOCS = [
+    {"file_id": "a", "original_name": "a.xlsx", "content": "生地のひび割れ。原因は水分不足。", "score": 2.0},
+    {"file_id": "b", "original_name": "b.pdf", "content": "No.2 を採用。焼成温度を下げた。", "score": 1.0},
+]
+
+
+@pytest.fixture()
+def db(db):
+    for doc in DOCS:
+        db.add(File(id=doc["file_id"], blob_path=f"files/{doc['original_name']}", original_name=doc["original_name"]))
+    db.commit()
+    return db
+
+
+def test_store_expires_idle_sessions_and_evicts_least_recently_used():
+    clock = [1000.0]
+    store = AnalysisSessionStore(max_entries=2, ttl_seconds=60, clock=lambda: clock[0])
+
+    first = store.create(1, DOCS, {"mode": "content"})
+    second = store.create(1, DOCS, {"mode": "content"})
+    # 他のユーザーのセッションは使えない
+    assert store.get(first.id, owner_id=2) is None
+
+    clock[0] += 30
+    assert store.get(first.id, owner_id=1) is first  # 利用すると期限が延び、LRU の先頭に戻る
+    store.create(1, DOCS, {"mode": "content"})
+    assert store.get(second.id, owner_id=1) is None  # 最も長く使われていない second が破棄される
+
+    clock[0] += 61
+    assert store.get(first.id, owner_id=1) is None
+    assert len(store) == 1
+
+
+def test_prompt_history_keeps_recent_turns_within_budget(monkeypatch):
+    monkeypatch.setattr(analysis_session_service.settings, "analysis_session_history_tokens", 60)
+    monkeypatch.setattr(analysis_session_service.settings, "analysis_session_max_turns", 3)
+    session = AnalysisSessionStore().create(1, DOCS, {})
+    for i in range(5):
+        session.add_turn(f"質問{i}", "回答" * (5 if i != 3 else 100))
+
+    assert [q for q, _ in session.history] == ["質問2", "質問3", "質問4"]
+    turns = session.prompt_history()
+    # 長い回答は切り詰め、予算に収まらない古いやり取りから落とす
+    assert [q for q, _ in turns][-1] == "質問4"
+    assert all(len(a) < 100 for _, a in turns)
+
+
+def test_follow_ups_reuse_packed_documents_as_a_stable_prompt_prefix():
+    llm = LLMService()
+    session = AnalysisSessionStore().create(1, DOCS, {})
+    context_text = session.ensure_context(llm, "失敗の原因は？")
+    assert session.ensure_context(llm, "別の質問") is context_text
+
+    _, first = llm.create_prompt_with_search_results("失敗の原因は？", DOCS, context_text=context_text)
+    _, follow_up = llm.create_prompt_with_search_results(
+        "採用した配合は？", DOCS, context_text=context_text, history=[("失敗の原因は？", "水分不足です")]
+    )
+    prefix = first.split("質問: ")[0]
+    assert "ひび割れ" in prefix
+    assert follow_up.startswith(prefix)
+    assert follow_up.rstrip().endswith("質問: 採用した配合は？")
+    assert "過去の回答: 水分不足です" in follow_up
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls: list[dict] = []
+
+    def pack_context(self, question, docs, **kwargs):
+        return LLMService().pack_context(question, docs, **kwargs)
+
+    render_context = staticmethod(LLMService.render_context)
+
+    async def generate_response(self, question, docs, *, context_text=None, history=None, **kwargs):
+        self.calls.append({"question": question, "context_text": context_text, "history": history})
+        return {"answer": f"{question} の回答", "usage": {}, "error": None}
+
+
+def test_generate_answer_passes_session_context_and_history(db):
+    llm = FakeLLM()
+    session = AnalysisSessionStore().create(1, DOCS, {})
+
+    request = AIAnalysisRequest(question="失敗の原因は？")
+    result, status = asyncio.run(generate_answer(request, db, llm, DOCS, session))
+    session.add_turn(request.question, result["answer"])
+    follow_up = AIAnalysisRequest(question="採用した配合は？", session_id=session.id)
+    asyncio.run(generate_answer(follow_up, db, llm, DOCS, session))
+
+    assert status == "miss"
+    assert llm.calls[0]["context_text"] == llm.calls[1]["context_text"] == session.context_text
+    assert llm.calls[0]["history"] == []
+    assert llm.calls[1]["history"] == [("失敗の原因は？", "失敗の原因は？ の回答")]
+    # 会話の続きは履歴ごとに別の回答キャッシュのキーになる
+    assert cache_namespace(follow_up, session.history) != cache_namespace(follow_up)
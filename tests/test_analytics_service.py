@@ -0,0 +1,111 @@
+from datetime import date, datetime
+
+from app.db.models.daily_rollup import FileStatsDaily
+from app.db.models.file import File
+from app.db.models.file_download import FileDownload
+from app.schemas.file import FileCreate, FileMetadataUpdate
+from app.services.analytics_service import AnalyticsCache, AnalyticsQuery, AnalyticsService, period_of
+from app.services.daily_rollup_service import DailyRollupService
+from app.services.file_service import FileService
+
+
+def _cube(db) -> dict:
+    return {
+        (r.day, r.application, r.customer, r.ingredient): (r.registrations, r.downloads)
+        for r in db.query(FileStatsDaily).all()
+        if r.registrations or r.downloads
+    }
+
+
+def test_cube_follows_file_changes_and_matches_rebuild(db):
+    service = FileService(db)
+    service.create(FileCreate(id="a", blob_path="a", original_name="a.pdf", application="パン", customer="A社"))
+    service.create(FileCreate(id="b", blob_path="b", original_name="b.pdf", application="パン"))
+    for file_id in ("a", "a", "b"):
+        service.record_download(file_id, user_id=1)
+    today = db.query(File.created_at).filter(File.id == "a").scalar().date()
+    assert _cube(db) == {(today, "パン", "A社", ""): (1, 2), (today, "パン", "", ""): (1, 1)}
+
+    # 用途を変えるとダウンロード数も移し替える。無効にすると登録数だけ外す
+    service.update_metadata("a", FileMetadataUpdate(application="麺"))
+    service.update_metadata("b", FileMetadataUpdate(status="archived"))
+    expected = {(today, "麺", "A社", ""): (1, 2), (today, "パン", "", ""): (0, 1)}
+    assert _cube(db) == expected
+
+    service.create(FileCreate(id="c", blob_path="c", original_name="c.pdf", application="麺"))
+    service.delete("c")
+    assert _cube(db) == expected
+
+    AnalyticsService(db).rebuild(batch_size=1)
+    assert _cube(db) == expected
+
+
+def test_compute_groups_by_period_and_dimensions(db):
+    rows = [
+        ("x", "パン", "A社", datetime(2025, 1, 15)),
+        ("y", "パン", "B社", datetime(2025, 2, 3)),
+        ("z", "麺", None, datetime(2025, 4, 1)),
+        ("w", "麺", None, datetime(2024, 12, 31)),
+    ]
+    for file_id, application, customer, created_at in rows:
+        db.add(File(id=file_id, blob_path=file_id, original_name=file_id, application=application, customer=customer,
+                    created_at=created_at))
+    db.add(FileDownload(file_id="x", user_id=1, downloaded_at=datetime(2025, 3, 31, 23)))
+    db.commit()
+    DailyRollupService(db).rebuild()
+    service = AnalyticsService(db)
+    service.rebuild()
+
+    result = service.compute(AnalyticsQuery(start=date(2025, 1, 1), end=date(2025, 12, 31), granularity="quarter"))
+    assert result["rows"] == [
+        {"period": "2025-Q1", "registrations": 2, "downloads": 1},
+        {"period": "2025-Q2", "registrations": 1, "downloads": 0},
+    ]
+    assert (result["total_registrations"], result["total_downloads"]) == (3, 1)
+
+    result = service.compute(
+        AnalyticsQuery(start=date(2024, 1, 1), end=date(2025, 12, 31), granularity="year", group_by=("application", "customer"))
+    )
+    assert result["rows"] == [
+        {"period": "2024", "application": "麺", "customer": None, "registrations": 1, "downloads": 0},
+        {"period": "2025", "application": "パン", "customer": "A社", "registrations": 1, "downloads": 1},
+        {"period": "2025", "application": "パン", "customer": "B社", "registrations": 1, "downloads": 0},
+        {"period": "2025", "application": "麺", "customer": None, "registrations": 1, "downloads": 0},
+    ]
+
+    result = service.compute(
+        AnalyticsQuery(start=date(2025, 1, 1), end=date(2025, 3, 31), granularity="month", customer="A社")
+    )
+    assert result["rows"] == [
+        {"period": "2025-01", "registrations": 1, "downloads": 0},
+        {"period": "2025-03", "registrations": 0, "downloads": 1},
+    ]
+
+
+def test_period_labels():
+    day = date(2026, 10, 18)  # 日曜日
+    assert [period_of(day, g) for g in ("day", "week", "month", "quarter", "year")] == [
+        "2026-10-18", "2026-10-12", "2026-10", "2026-Q4", "2026",
+    ]
+
+
+def test_cache_reuses_results_until_ttl_and_evicts_oldest():
+    cache = AnalyticsCache(max_entries=2, ttl_seconds=60)
+    calls = []
+
+    def compute(key):
+        return lambda: calls.append(key) or {"key": key}
+
+    keys = [AnalyticsQuery(start=date(2025, 1, 1), end=date(2025, 1, d)) for d in (1, 2, 3)]
+    assert cache.get_or_compute(keys[0], compute(0)) == {"key": 0}
+    assert cache.get_or_compute(keys[0], compute(0)) == {"key": 0}
+    cache.get_or_compute(keys[1], compute(1))
+    cache.get_or_compute(keys[2], compute(2))
+    cache.get_or_compute(keys[0], compute(0))
+    assert calls == [0, 1, 2, 0]
+    assert len(cache) == 2
+
+    expired = AnalyticsCache(max_entries=2, ttl_seconds=0)
+    expired.get_or_compute(keys[0], compute(0))
+    expired.get_or_compute(keys[0], compute(0))
+    assert calls == [0, 1, 2, 0, 0, 0]
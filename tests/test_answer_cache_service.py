@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event
+
+from app.db.models.file import File
+from app.db.models.llm_answer_cache import LLMAnswerCache
+from app.services.answer_cache_service import AnswerCacheService
+from app.services.extraction_service import upsert_extraction
+
+
+@pytest.fixture()
+def db(db):
+    db.add(File(id="f1", blob_path="files/f1.xlsx", original_name="f1.xlsx"))
+    db.commit()
+    return db
+
+
+def test_answer_cache_coalesces_hits_and_follows_source_versions(db):
+    calls: list[str] = []
+
+    async def generate():
+        calls.append("llm")
+        await asyncio.sleep(0.01)
+        return {"answer": f"answer-{len(calls)}", "usage": {"prompt_tokens": 10, "completion_tokens": 2}, "error": None}
+
+    docs = [{"file_id": "f1", "original_name": "f1.xlsx", "content": "本文"}]
+    cache = AnswerCacheService(db)
+
+    async def scenario():
+        first = await asyncio.gather(
+            cache.get_or_generate("失敗の原因は？", docs, generate),
+            cache.get_or_generate("失敗の原因は？", docs, generate),
+        )
+        again = await cache.get_or_generate(" 失敗の原因は? ", docs, generate)
+        return first, again
+
+    (a, b), again = asyncio.run(scenario())
+    assert sorted([a[1], b[1]]) == ["coalesced", "miss"]
+    assert again == ({"answer": "answer-1", "usage": {}, "error": None}, "hit")
+    assert calls == ["llm"]
+
+    # 再抽出で版が変わると別キーになる
+    upsert_extraction(db, "f1", {"meta": {"trial_id": "TR1"}})
+    result, status = asyncio.run(cache.get_or_generate("失敗の原因は？", docs, generate))
+    assert status == "miss"
+    assert result["answer"] == "answer-2"
+
+
+def test_hits_are_counted_without_a_write_and_flushed_on_the_next_store(db):
+    docs = [{"file_id": "f1", "original_name": "f1.xlsx", "content": "本文"}]
+    cache = AnswerCacheService(db)
+    AnswerCacheService._pending_hits.clear()
+    key = cache.make_key("原因は？", docs)
+    cache.store(key, "原因は？", docs, {"answer": "水分", "usage": {"prompt_tokens": 10, "completion_tokens": 2}})
+
+    statements: list[str] = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    for _ in range(3):
+        assert cache.lookup(key)["answer"] == "水分"
+    assert all(s.lstrip().upper().startswith("SELECT") for s in statements)
+
+    other = cache.make_key("別の質問", docs)
+    cache.store(other, "別の質問", docs, {"answer": "別", "usage": {}})
+    assert db.get(LLMAnswerCache, key).hit_count == 3
+    assert db.get(LLMAnswerCache, other).hit_count == 0
+    assert not AnswerCacheService._pending_hits
+
+
+def test_cancelled_leader_does_not_cancel_coalesced_followers(db):
+    calls: list[str] = []
+
+    async def generate():
+        calls.append("llm")
+        await asyncio.sleep(0.05)
+        return {"answer": f"answer-{len(calls)}", "usage": {}, "error": None}
+
+    docs = [{"file_id": "f1", "original_name": "f1.xlsx", "content": "本文"}]
+    cache = AnswerCacheService(db)
+
+    async def scenario():
+        leader = asyncio.create_task(cache.get_or_generate("切断された質問", docs, generate))
+        while not calls:
+            await asyncio.sleep(0.001)
+        follower = asyncio.create_task(cache.get_or_generate("切断された質問", docs, generate))
+        await asyncio.sleep(0.01)
+        leader.cancel()  # 先行リクエストのクライアントが切断した
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        return results
+
+    leader, follower = asyncio.run(scenario())
+    assert isinstance(leader, asyncio.CancelledError)
+    assert follower == ({"answer": "answer-2", "usage": {}, "error": None}, "miss")
+    assert calls == ["llm", "llm"]
+
+
+def test_store_prunes_expired_entries_at_most_once_per_interval(db, monkeypatch):
+    docs = [{"file_id": "f1", "original_name": "f1.xlsx", "content": "本文"}]
+    cache = AnswerCacheService(db)
+    monkeypatch.setattr(AnswerCacheService, "_last_pruned", float("-inf"))
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.add(LLMAnswerCache(cache_key="old", question="古い", source_file_ids="f1", answer="古い", expires_at=expired))
+    db.commit()
+
+    statements: list[str] = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    cache.store(cache.make_key("一回目", docs), "一回目", docs, {"answer": "a", "usage": {}})
+    assert db.get(LLMAnswerCache, "old") is None
+
+    statements.clear()
+    cache.store(cache.make_key("二回目", docs), "二回目", docs, {"answer": "b", "usage": {}})
+    assert not any(s.lstrip().upper().startswith("DELETE") for s in statements)
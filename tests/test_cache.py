@@ -0,0 +1,35 @@
+from app.core.cache import LRUCache
+from app.core.metrics import metrics
+
+
+def test_lru_cache_evicts_least_recently_used_and_expires_entries():
+    metrics.reset()
+    clock = [0.0]
+    cache = LRUCache(max_entries=2, ttl_seconds=10, clock=lambda: clock[0], metrics_prefix="test_cache")
+
+    cache.set_many({"a": 1, "b": 2})
+    assert cache.get("a") == 1  # a を使ったので b が最も古くなる
+    cache.set("c", 3)
+    assert cache.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+
+    clock[0] = 10
+    assert cache.get("a") is None  # 保存から数える（取得しても延びない）
+    assert len(cache) == 1
+
+    cache.discard_where(lambda key: key == "c")
+    assert len(cache) == 0
+    counters = metrics.snapshot()["counters"]
+    assert (counters["test_cache.evicted"], counters["test_cache.expired"]) == (1, 1)
+
+
+def test_sliding_ttl_counts_from_last_use():
+    clock = [0.0]
+    cache = LRUCache(max_entries=2, ttl_seconds=10, sliding=True, clock=lambda: clock[0])
+    cache.set("a", 1)
+
+    clock[0] = 8
+    assert cache.get("a") == 1
+    clock[0] = 16
+    assert cache.get("a") == 1
+    clock[0] = 26
+    assert cache.get("a") is None
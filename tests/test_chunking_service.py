@@ -0,0 +1,83 @@
+import pytest
+
+from app.db.models.file import File
+from app.db.models.file_chunk import FileChunk
+from app.services.chunking_service import ChunkIndexQueue, ChunkService, format_passages, split_passages
+
+
+@pytest.fixture()
+def db(db):
+    for fid in ("a", "b"):
+        db.add(File(id=fid, blob_path=f"files/{fid}.pdf", original_name=f"{fid}.pdf"))
+    db.commit()
+    return db
+
+
+def test_split_passages_overlaps_and_tracks_pages():
+    page1 = "".join(f"{i}行目の記録です。" for i in range(40))
+    passages = split_passages(f"{page1}\f表紙以外の2ページ目。", size=100, overlap=30)
+
+    assert [p.page for p in passages][-1] == 2
+    assert all(len(p.text) <= 100 for p in passages)
+    first, second = passages[0], passages[1]
+    assert first.text.endswith("。")
+    assert second.start < first.end  # 重なりがある
+    assert passages[-1].text == "表紙以外の2ページ目。"
+
+
+def test_best_passages_picks_relevant_text_without_writing(db):
+    filler = "".join(f"概要{i}。" for i in range(300))
+    contents = {
+        "a": f"{filler}\fひび割れの原因は生地の水分不足と考えられる。\f{filler}",
+        "b": filler,
+    }
+    service = ChunkService(db)
+    selected = service.best_passages("ひび割れの原因", contents, per_doc=1)
+
+    assert "水分不足" in selected["a"][0]["text"]
+    assert selected["a"][0]["page"] == 2
+    assert format_passages(selected["a"]).startswith("[p.2]\n")
+    assert selected["b"][0]["chunk_no"] == 0  # 一致しないファイルは先頭
+
+    # 分析時は索引が無くてもその場で分割するだけで、保存しない
+    assert db.query(FileChunk).count() == 0
+
+    service.ensure_chunks(contents)
+    count = db.query(FileChunk).count()
+    assert service.best_passages("ひび割れの原因", contents, per_doc=1) == selected
+    assert db.query(FileChunk).count() == count
+
+    service.ensure_chunks({"b": "差し替え後の本文"})
+    assert [c.text for c in db.query(FileChunk).filter(FileChunk.file_id == "b")] == ["差し替え後の本文"]
+
+
+def test_ensure_chunks_fills_missing_terms_and_load_chunks_does_not(db):
+    service = ChunkService(db)
+    service.ensure_chunks({"a": "ひび割れの原因は生地の水分不足。"})
+    db.query(FileChunk).update({"terms": None})
+    db.commit()
+
+    chunks, _ = service.load_chunks(["a"])
+    assert "ひび割れ" in chunks["a"][0]["terms"]
+    assert db.query(FileChunk).filter(FileChunk.terms.is_(None)).count() == 1
+
+    service.ensure_chunks({"a": "ひび割れの原因は生地の水分不足。"})
+    assert db.query(FileChunk).filter(FileChunk.terms.is_(None)).count() == 0
+
+
+def test_passages_for_queues_unindexed_files_for_background_indexing(session_factory):
+    db = session_factory()
+    db.add(File(id="a", blob_path="files/a.pdf", original_name="a.pdf"))
+    db.commit()
+    queue = ChunkIndexQueue(session_factory)
+    service = ChunkService(db, index_queue=queue)
+    contents = {"a": "ひび割れの原因は生地の水分不足。"}
+
+    chunks = service.passages_for(contents)
+    assert chunks["a"][0]["terms"]["ひび割れ"] == 1
+    queue.join(timeout=10)
+
+    # 索引はリクエストとは別のセッションで作られ、次の分析からは読み出すだけになる
+    assert db.query(FileChunk).filter(FileChunk.file_id == "a").count() == 1
+    assert service.passages_for(contents)["a"][0]["text"] == chunks["a"][0]["text"]
+    db.close()
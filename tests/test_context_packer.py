@@ -0,0 +1,33 @@
+from app.services import context_packer
+from app.services.context_packer import (
+    ContextPacker,
+    allocate_budget,
+    estimate_tokens,
+    truncate_to_tokens,
+)
+
+
+def test_estimate_tokens_counts_wide_chars_individually(monkeypatch):
+    monkeypatch.setattr(context_packer, "_tiktoken_encoding", lambda: None)
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("砂糖を増やす") == 6
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_allocate_budget_redistributes_surplus_of_short_docs():
+    alloc = allocate_budget([100, 5000, 5000], [1.0, 1.0, 1.0], 3000)
+    assert alloc[0] == 100
+    assert alloc[1] == alloc[2] == 1450
+    assert sum(allocate_budget([5000, 5000], [2.0, 1.0], 3000)) <= 3000
+
+
+def test_pack_fits_window_and_prefers_higher_ranked_docs():
+    packer = ContextPacker(context_window=1200, reserved_output_tokens=200, counter=estimate_tokens)
+    docs = [{"file_id": f"f{i}", "content": "\n".join(f"{i}行目の記録{n}" for n in range(400))} for i in range(3)]
+    packed = packer.pack("質問: 原因は？", docs)
+
+    assert packed.prompt_tokens <= 1200 - 200
+    assert packed.truncated == ["f0", "f1", "f2"]
+    lengths = [estimate_tokens(d["content"]) for d in packed.docs]
+    assert lengths[0] > lengths[1] > lengths[2]
+    assert truncate_to_tokens("短い", 10) == "短い"
@@ -0,0 +1,95 @@
+from datetime import date, datetime, timedelta
+
+from app.db.models.daily_rollup import FileDownloadDaily, FileRegistrationDaily
+from app.db.models.file import File
+from app.db.models.file_download import FileDownload
+from app.schemas.file import FileCreate, FileMetadataUpdate
+from app.services.daily_rollup_service import DailyRollupService
+from app.services.dashboard_service import DashboardService
+from app.services.file_service import FileService
+
+
+def _create_file(db, file_id: str) -> File:
+    return FileService(db).create(
+        FileCreate(id=file_id, blob_path=f"files/{file_id}.pdf", original_name=f"{file_id}.pdf")
+    )
+
+
+def _registrations(db) -> dict:
+    return {r.day: r.count for r in db.query(FileRegistrationDaily).all() if r.count}
+
+
+def _downloads(db) -> dict:
+    return {(r.file_id, r.day): r.count for r in db.query(FileDownloadDaily).all()}
+
+
+def test_rollups_follow_downloads_and_file_changes(db):
+    service = FileService(db)
+    for file_id in ("a", "b", "c"):
+        _create_file(db, file_id)
+    for file_id in ("a", "a", "b"):
+        service.record_download(file_id, user_id=1)
+    today = db.query(File.created_at).filter(File.id == "a").scalar().date()
+
+    rollups = DailyRollupService(db)
+    assert _registrations(db) == {today: 3}
+    assert rollups.download_counts(["a", "b", "c"]) == {"a": 2, "b": 1}
+    assert rollups.total_downloads(today) == 3
+    assert rollups.download_ranking(today) == [{"name": "a.pdf", "count": 2}, {"name": "b.pdf", "count": 1}]
+
+    # 無効にしたファイルは登録数から外し、有効に戻すと加える
+    service.update_metadata("c", FileMetadataUpdate(status="archived"))
+    assert _registrations(db) == {today: 2}
+    service.update_metadata("c", FileMetadataUpdate(status="active"))
+    service.delete("c")
+    assert _registrations(db) == {today: 2}
+
+
+def test_dashboard_reads_rollups(db):
+    db.add(File(id="x", blob_path="files/x.pdf", original_name="x.pdf", created_at=datetime.now() - timedelta(days=3)))
+    db.add(File(id="y", blob_path="files/y.pdf", original_name="y.pdf", created_at=datetime.now() - timedelta(days=60)))
+    today = date.today()
+    last_monday = datetime.combine(today - timedelta(days=today.weekday() + 7), datetime.min.time())
+    # 先週月曜日 0:00・先週日曜日 23:00（先週）と、その直前（先々週の日曜日）
+    for file_id, at in [
+        ("x", last_monday),
+        ("y", last_monday + timedelta(days=6, hours=23)),
+        ("y", last_monday - timedelta(seconds=1)),
+    ]:
+        db.add(FileDownload(file_id=file_id, user_id=1, downloaded_at=at))
+    db.commit()
+    DailyRollupService(db).rebuild()
+
+    dashboard = DashboardService(db)
+    assert dashboard._get_top_downloads_last_week() == [{"name": "x.pdf", "count": 1}, {"name": "y.pdf", "count": 1}]
+    assert dashboard._get_download_ranking() == [{"name": "y.pdf", "count": 2}, {"name": "x.pdf", "count": 1}]
+    assert dashboard._get_registration_trend() == [
+        {"date": (datetime.now() - timedelta(days=3)).strftime("%Y-%m-%d"), "count": 1}
+    ]
+
+
+def test_rebuild_matches_incremental_and_survives_compaction(db):
+    service = FileService(db)
+    for file_id in ("a", "b"):
+        _create_file(db, file_id)
+    for file_id in ("a", "b", "b"):
+        service.record_download(file_id, user_id=1)
+    old = datetime.now() - timedelta(days=400)
+    db.add_all([FileDownload(file_id="a", user_id=1, downloaded_at=old) for _ in range(4)])
+    db.commit()
+
+    rollups = DailyRollupService(db)
+    assert rollups.download_counts(["a", "b"]) == {"a": 1, "b": 2}  # 直接追加した行はまだ反映されていない
+    before = _downloads(db)
+    registrations = _registrations(db)
+
+    rollups.rebuild(batch_size=2)
+    assert rollups.download_counts(["a", "b"]) == {"a": 5, "b": 2}
+    assert _registrations(db) == registrations
+    assert {k: n for k, n in _downloads(db).items() if k[1] != old.date()} == before
+
+    # 圧縮した古い行は集計に残り、その後の作り直しでも消えない
+    assert rollups.compact(date.today() - timedelta(days=30)) == 4
+    assert db.query(FileDownload).count() == 3
+    rollups.rebuild()
+    assert rollups.download_counts(["a", "b"]) == {"a": 5, "b": 2}
@@ -0,0 +1,66 @@
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from app.core.metrics import metrics
+from app.schemas.file import FileCreate, FileMetadataUpdate
+from app.services import dashboard_service
+from app.services.dashboard_service import DASHBOARD_SECTIONS, DashboardService
+from app.services.file_service import FileService
+
+
+def _seed(db) -> None:
+    service = FileService(db)
+    for i in range(6):
+        service.create(
+            FileCreate(id=f"f{i}", blob_path=f"f{i}", original_name=f"f{i}.pdf", application=["パン", "麺"][i % 2],
+                       ingredient="砂糖", issue="生地のひび割れ")
+        )
+    for file_id in ("f0", "f0", "f1"):
+        service.record_download(file_id, user_id=1)
+    service.update_metadata("f5", FileMetadataUpdate(status="archived"))
+
+
+def test_parallel_sections_match_sequential(session_factory, monkeypatch):
+    # セクションは別スレッド・別セッションで実行するため、ファイルの DB を使う
+    db = session_factory()
+    _seed(db)
+
+    threads = set()
+
+    def recording(section):
+        def run(service):
+            threads.add(threading.current_thread().name)
+            return section(service)
+        return run
+
+    sections = {name: recording(section) for name, section in DASHBOARD_SECTIONS.items()}
+    monkeypatch.setattr(dashboard_service, "DASHBOARD_SECTIONS", sections)
+    metrics.reset()
+
+    sequential = DashboardService(db).compute_dashboard_data()
+    assert threads == {threading.current_thread().name}
+    threads.clear()
+    parallel = DashboardService(db).compute_dashboard_data(session_factory=session_factory, max_workers=4)
+    assert threads and all(name.startswith("dashboard") for name in threads)
+
+    assert parallel == sequential
+    assert sequential["total_files"] == 5 and sequential["new_files_last_month"] == 5
+    assert sequential["total_downloads_last_month"] == 3 and sequential["downloads_this_month"] == 3
+    assert sequential["usage_ranking"] == [{"name": "パン", "count": 3}, {"name": "麺", "count": 2}]
+    assert sequential["issue_word_cloud"] == {"生地": 5, "ひび割れ": 5}
+    histograms = metrics.snapshot()["histograms"]
+    assert all(histograms[f"dashboard.section_ms.{name}"]["count"] == 2 for name in sections)
+    db.close()
+
+
+def test_single_connection_pool_runs_sequentially(engine):
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    _seed(db)
+    data = DashboardService(db).compute_dashboard_data(session_factory=factory, max_workers=4)
+    assert data["total_files"] == 5
+    assert data["registration_trend"][-1]["count"] == 5
+    assert datetime.strptime(data["registration_trend"][-1]["date"], "%Y-%m-%d") > datetime.now() - timedelta(days=2)
+    db.close()
@@ -0,0 +1,141 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.metrics import metrics
+from app.db import pool as db_pool
+from app.db.pool import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    engine_options,
+    instrument_engine,
+    pool_status,
+)
+
+
+@pytest.fixture(autouse=True)
+def small_pool(monkeypatch):
+    monkeypatch.setattr(db_pool.settings, "db_pool_size", 2)
+    monkeypatch.setattr(db_pool.settings, "db_pool_max_overflow", 1)
+    monkeypatch.setattr(db_pool.settings, "db_pool_timeout_seconds", 0.05)
+    monkeypatch.setattr(db_pool.settings, "db_pool_recycle_seconds", 1500)
+    monkeypatch.setattr(db_pool.settings, "db_pool_pre_ping", False)
+    metrics.reset()
+
+
+def _engine(uri: str):
+    engine = create_engine(uri, **engine_options(uri))
+    instrument_engine(engine, "db_pool")
+    return engine
+
+
+def test_pool_metrics_track_checkouts_overflow_and_hold_time(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = _engine(uri)
+    assert type(engine.pool) is InstrumentedQueuePool
+
+    connections = [engine.connect() for _ in range(3)]
+    assert pool_status(engine.pool) | {"pool": None} == {
+        "pool": None, "size": 2, "checked_out": 3, "idle": 0, "overflow": 1, "max_overflow": 1,
+    }
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    for conn in connections:
+        conn.close()
+    assert pool_status(engine.pool)["idle"] == 2
+
+    assert metrics.counter("db_pool.checkouts") == 3
+    assert metrics.counter("db_pool.overflow_checkouts") == 1
+    assert metrics.counter("db_pool.exhausted_checkouts") == 1
+    assert metrics.counter("db_pool.connects") == 3
+    assert metrics.snapshot()["histograms"]["db_pool.hold_ms"]["count"] == 3
+    engine.dispose()
+
+
+def test_pool_metrics_track_wait_time_and_timeouts(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = _engine(uri)
+    connections = [engine.connect() for _ in range(3)]
+    assert metrics.counter("db_pool.timeouts") == 0
+    for _ in range(2):
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    assert metrics.counter("db_pool.timeouts") == 2
+    for conn in connections:
+        conn.close()
+    with engine.connect():
+        pass
+
+    wait_ms = metrics.snapshot()["histograms"]["db_pool.wait_ms"]
+    # 取り出し6回（タイムアウトの2回を含む）。タイムアウトした取り出しは pool_timeout（0.05秒）待っている
+    assert wait_ms["count"] == 6
+    assert wait_ms["max"] >= 50
+    assert metrics.counter("db_pool.timeouts") == 2
+    engine.dispose()
+
+
+def test_exhausted_checkouts_use_the_pools_own_max_overflow(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = create_engine(uri, **{**engine_options(uri), "max_overflow": 0})
+    instrument_engine(engine, "db_pool")
+    connections = [engine.connect() for _ in range(2)]
+    assert metrics.counter("db_pool.exhausted_checkouts") == 1
+    assert pool_status(engine.pool)["max_overflow"] == 0
+    for conn in connections:
+        conn.close()
+    engine.dispose()
+
+
+def test_listeners_survive_pool_recreation_without_duplicates(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = _engine(uri)
+    for _ in range(3):
+        engine.dispose()
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    assert metrics.counter("db_pool.connects") == 3
+    assert metrics.counter("db_pool.checkouts") == 3
+    assert metrics.snapshot()["histograms"]["db_pool.wait_ms"]["count"] == 3
+    assert pool_status(engine.pool)["max_overflow"] == 1
+    engine.dispose()
+
+
+def test_recycle_replaces_old_connections_without_ping(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_pool.settings, "db_pool_recycle_seconds", 0.05)
+    uri = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = _engine(uri)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert metrics.counter("db_pool.connects") == 1
+    time.sleep(0.1)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert metrics.counter("db_pool.connects") == 2
+    # 取り出し時の ping（pool_pre_ping）は行わない
+    assert statements == ["SELECT 1"] * 3
+    engine.dispose()
+
+
+def test_in_memory_sqlite_keeps_default_pool():
+    assert engine_options("sqlite://") == {}
+    assert engine_options("sqlite:///:memory:") == {}
+    assert pool_status(create_engine("sqlite://").pool) == {"pool": "SingletonThreadPool"}
+
+
+async def test_async_pool_is_instrumented(tmp_path):
+    uri = f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}"
+    engine = create_async_engine(uri, **engine_options(uri, use_async=True))
+    instrument_engine(engine.sync_engine, "db_pool_async")
+    assert isinstance(engine.pool, InstrumentedAsyncQueuePool)
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        assert pool_status(engine.pool)["checked_out"] == 1
+    assert metrics.counter("db_pool_async.checkouts") == 1
+    assert metrics.snapshot()["histograms"]["db_pool_async.wait_ms"]["count"] == 1
+    await engine.dispose()
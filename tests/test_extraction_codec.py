@@ -0,0 +1,31 @@
+import importlib.util
+from pathlib import Path
+
+from app.services.extraction_codec import decode_extraction, encode_extraction, is_encoded
+
+
+def test_codec_roundtrip_and_section_projection():
+    data = {
+        "meta": {"trial_id": "TR01", "issue": "食感"},
+        "log": [{"variant_id": "No.1", "result": "良"}] * 50,
+        "formulation": {"variants": ["No.1"], "rows": []},
+        "template_version": "step3",
+    }
+    payload = encode_extraction(data)
+
+    assert is_encoded(payload)
+    assert decode_extraction(payload) == data
+    assert decode_extraction(payload, ["meta", "missing"]) == {"meta": data["meta"]}
+
+
+def test_compress_migration_writes_payloads_the_app_can_read():
+    # マイグレーションは変換処理を固定して持つ。アプリは既存の NCX1 の行を読めること
+    path = Path(__file__).parents[1] / "app/db/migrations/versions/compress_file_extractions.py"
+    spec = importlib.util.spec_from_file_location("compress_file_extractions", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    data = {"meta": {"trial_id": "TR01"}, "log": [{"variant_id": "No.1", "result": "良"}], "template_version": "step3"}
+    payload = migration._encode(data)
+    assert decode_extraction(payload) == data
+    assert migration._decode(encode_extraction(data)) == data
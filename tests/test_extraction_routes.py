@@ -0,0 +1,79 @@
+import pytest
+
+from app.db.models.file import File
+from app.services.extraction_service import ExtractionCache, upsert_extraction
+
+DATA = {
+    "meta": {"trial_id": "TR01", "issue": "ひび割れ"},
+    "log": [{"variant_id": f"No.{i}", "result": f"結果{i}"} for i in range(1, 6)],
+    "formulation": {"variants": ["No.1", "No.2"], "rows": [{"ingredient": f"原料{i}"} for i in range(4)]},
+    "derived": {"selected_variant": "No.2"},
+    "template_version": "step3",
+}
+
+
+@pytest.fixture()
+def client(client, db, user):
+    db.add(File(id="f1", blob_path="files/f1.xlsx", original_name="f1.xlsx", owner_id=user.id))
+    db.add(File(id="other", blob_path="files/other.xlsx", original_name="other.xlsx", owner_id=2))
+    db.add(File(id="plain", blob_path="files/plain.pdf", original_name="plain.pdf", owner_id=user.id))
+    db.commit()
+    upsert_extraction(db, "f1", DATA)
+    yield client
+    ExtractionCache.clear()
+
+
+def _get(client, query: str = "", file_id: str = "f1"):
+    return client.get(f"/api/v1/files/{file_id}/extraction{query}")
+
+
+def test_without_parameters_returns_the_whole_extraction(client):
+    response = _get(client)
+    assert response.status_code == 200
+    assert response.json() == DATA
+
+
+def test_sections_project_only_the_requested_parts(client):
+    assert _get(client, "?sections=meta").json() == {"meta": DATA["meta"], "template_version": "step3"}
+    assert _get(client, "?sections=meta&sections=derived").json() == {
+        "meta": DATA["meta"],
+        "derived": DATA["derived"],
+        "template_version": "step3",
+    }
+
+
+def test_log_and_formulation_rows_are_paged(client):
+    data = _get(client, "?sections=log&log_offset=1&log_limit=2").json()
+    assert data["log"] == DATA["log"][1:3]
+    assert data["paging"] == {"log": {"offset": 1, "limit": 2, "total": 5}}
+    assert "formulation" not in data
+
+    data = _get(client, "?formulation_offset=3&formulation_limit=5").json()
+    assert data["formulation"] == {"variants": ["No.1", "No.2"], "rows": DATA["formulation"]["rows"][3:]}
+    assert data["paging"] == {"formulation": {"offset": 3, "limit": 5, "total": 4}}
+    assert data["log"] == DATA["log"]
+
+    # 範囲外のページは空で、total は全件数
+    data = _get(client, "?sections=log&log_offset=10&log_limit=2").json()
+    assert data["log"] == []
+    assert data["paging"]["log"]["total"] == 5
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["?log_limit=0", "?log_limit=501", "?log_offset=-1", "?formulation_limit=0", "?formulation_offset=-1"],
+)
+def test_paging_parameters_are_bounded(client, query):
+    assert _get(client, query).status_code == 422
+
+
+def test_unknown_sections_are_rejected(client):
+    response = _get(client, "?sections=meta&sections=secret&sections=raw")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown sections: secret, raw"
+
+
+def test_missing_extraction_and_other_owners(client):
+    assert _get(client, file_id="plain").status_code == 404
+    assert _get(client, "?sections=meta", file_id="plain").status_code == 404
+    assert _get(client, file_id="other").status_code == 403
@@ -0,0 +1,169 @@
+import pytest
+from sqlalchemy import event
+
+from app.db.models.file import File
+from app.db.models.file_extraction import FileExtraction
+from app.services import extraction_service
+from app.services.extraction_service import (
+    LLM_CONTEXT_VERSION,
+    ExtractionCache,
+    get_extraction,
+    get_extractions,
+    get_llm_context_terms,
+    get_llm_contexts,
+    refresh_llm_contexts,
+    upsert_extraction,
+)
+from app.services.file_service import FileService
+
+
+class FakeBlobs:
+    """抽出結果の退避先（Blob）の代わり"""
+
+    def __init__(self):
+        self.blobs: dict[str, bytes] = {}
+
+    def upload_bytes_sync(self, blob_name, data, *, content_type=None):
+        self.blobs[f"extractions/{blob_name}"] = data
+        return f"extractions/{blob_name}"
+
+    def download_bytes_sync(self, blob_path):
+        return self.blobs[blob_path]
+
+    def delete_blob_sync(self, blob_path):
+        del self.blobs[blob_path]
+
+
+@pytest.fixture()
+def db(db, engine):
+    for i in range(10):
+        db.add(File(id=f"f{i}", blob_path=f"files/f{i}.xlsx", original_name=f"f{i}.xlsx"))
+        db.flush()
+        upsert_extraction(db, f"f{i}", {"meta": {"trial_id": f"TR{i}"}, "log": [], "formulation": {}})
+    ExtractionCache.clear()
+
+    statements: list[str] = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    db.statements = statements
+    yield db
+    ExtractionCache.clear()
+
+
+@pytest.fixture()
+def blobs(monkeypatch):
+    fake = FakeBlobs()
+    monkeypatch.setattr(extraction_service, "_extraction_blob_service", lambda: fake)
+    monkeypatch.setattr(extraction_service.settings, "extraction_inline_max_bytes", 200)
+    return fake
+
+
+LARGE = {
+    "meta": {"trial_id": "TR0"},
+    "log": [{"variant_id": f"No.{i}", "result": f"結果{i}", "quote": "焼成後にひび割れ" * i} for i in range(30)],
+    "formulation": {"rows": []},
+}
+
+
+@pytest.mark.parametrize("top", [1, 3, 10])
+def test_get_llm_contexts_uses_single_query_regardless_of_top(db, top):
+    ids = [f"f{i}" for i in range(top)]
+    contexts = get_llm_contexts(db, ids + ["missing"])
+
+    assert set(contexts) == set(ids)
+    assert f"trial_id: TR{top - 1}" in contexts[f"f{top - 1}"]
+    assert len(db.statements) == 1
+
+
+def test_get_llm_contexts_serves_cache_until_upsert(db):
+    get_llm_contexts(db, ["f0", "f1"])
+    db.statements.clear()
+
+    assert get_llm_contexts(db, ["f0", "f1"])["f0"].startswith("【メタ】")
+    assert db.statements == []
+
+    upsert_extraction(db, "f0", {"meta": {"trial_id": "NEW"}})
+    db.statements.clear()
+    contexts = get_llm_contexts(db, ["f0", "f1"])
+    assert "trial_id: NEW" in contexts["f0"]
+    assert len(db.statements) == 1
+
+
+def test_cached_extractions_are_not_shared_with_callers(db):
+    first = get_extractions(db, ["f0"])["f0"]
+    first["meta"]["trial_id"] = "changed"
+    second = get_extractions(db, ["f0"])["f0"]
+    second["log"].append({"variant_id": "No.9"})
+
+    db.statements.clear()
+    assert get_extractions(db, ["f0"])["f0"] == {"meta": {"trial_id": "TR0"}, "log": [], "formulation": {}}
+    assert db.statements == []
+
+
+def test_stale_llm_contexts_are_built_in_memory_without_writing(db):
+    row = db.query(FileExtraction).filter(FileExtraction.file_id == "f3").one()
+    row.llm_context, row.llm_context_version, row.llm_context_terms = "古い形式", LLM_CONTEXT_VERSION - 1, None
+    db.commit()
+    ExtractionCache.clear()
+    db.statements.clear()
+
+    assert "trial_id: TR3" in get_llm_contexts(db, ["f3"])["f3"]
+    terms = get_llm_context_terms(db, ["f3", "f4"])
+    assert "trial" in terms["f3"] and "f4" in terms
+    assert all(s.lstrip().upper().startswith("SELECT") for s in db.statements)
+    db.refresh(row)
+    assert row.llm_context == "古い形式" and row.llm_context_terms is None
+
+
+def test_large_extraction_spills_to_blob_and_moves_back_inline(db, blobs):
+    upsert_extraction(db, "f0", LARGE)
+    row = db.query(FileExtraction).filter(FileExtraction.file_id == "f0").one()
+    assert row.payload is None and row.blob_path == "extractions/f0.ncx"
+    assert row.payload_size == len(blobs.blobs["extractions/f0.ncx"]) > 200
+    assert get_extraction(db, "f0") == LARGE
+    assert get_extraction(db, "f0", ["meta", "missing"]) == {"meta": LARGE["meta"]}
+
+    # 小さくなった場合は行内に戻し、退避していた Blob を削除する
+    upsert_extraction(db, "f0", {"meta": {"trial_id": "TR0"}})
+    db.refresh(row)
+    assert row.blob_path is None and row.payload is not None
+    assert blobs.blobs == {}
+    assert get_extraction(db, "f0") == {"meta": {"trial_id": "TR0"}}
+
+
+def test_legacy_json_rows_are_decoded(db):
+    legacy = {"meta": {"trial_id": "OLD"}, "log": [{"variant_id": "No.1"}], "template_version": "step3"}
+    row = db.query(FileExtraction).filter(FileExtraction.file_id == "f1").one()
+    row.data, row.payload, row.payload_size = legacy, None, None
+    db.commit()
+    ExtractionCache.clear()
+
+    assert get_extraction(db, "f1") == legacy
+    assert get_extraction(db, "f1", ["meta", "derived"]) == {"meta": legacy["meta"]}
+    assert "trial_id: OLD" in extraction_service.build_llm_context(get_extraction(db, "f1"))
+
+
+def test_deleting_a_file_removes_its_extraction_and_spilled_blob(db, blobs):
+    upsert_extraction(db, "f2", LARGE)
+    assert "extractions/f2.ncx" in blobs.blobs
+
+    FileService(db).delete("f2")
+    assert blobs.blobs == {}
+    assert db.query(FileExtraction).filter(FileExtraction.file_id == "f2").count() == 0
+    assert get_extraction(db, "f2") is None
+
+
+def test_refresh_llm_contexts_rebuilds_only_missing_or_stale_rows(db):
+    rows = {row.file_id: row for row in db.query(FileExtraction).filter(FileExtraction.file_id.in_(["f0", "f1", "f2"]))}
+    rows["f0"].llm_context = rows["f0"].llm_context_version = rows["f0"].llm_context_terms = None
+    rows["f1"].llm_context, rows["f1"].llm_context_version = "古い形式", LLM_CONTEXT_VERSION - 1
+    rows["f2"].llm_context_terms = None
+    db.commit()
+
+    assert refresh_llm_contexts(db, batch_size=2) == 3
+    for file_id, row in rows.items():
+        db.refresh(row)
+        assert row.llm_context_version == LLM_CONTEXT_VERSION
+        assert f"trial_id: TR{file_id[1:]}" in row.llm_context
+        assert row.llm_context_terms
+    assert refresh_llm_contexts(db) == 0
+    assert refresh_llm_contexts(db, force=True) == 10
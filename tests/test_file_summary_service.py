@@ -0,0 +1,197 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from app.db.models.file_chunk import FileChunk
+from app.db.models.file_summary import FileSummary
+from app.schemas.ai import AIAnalysisRequest
+from app.schemas.file import FileCreate, FileMetadataUpdate
+from app.services.analysis_service import build_docs_for_llm
+from app.services.extraction_service import upsert_extraction
+from app.services.file_service import FileService
+from app.services.file_summary_service import FileSummaryRunner, FileSummaryService, build_summary_source
+
+
+def _create_file(db, file_id: str, **metadata) -> None:
+    FileService(db).create(
+        FileCreate(id=file_id, blob_path=f"files/{file_id}.pdf", original_name=f"{file_id}.pdf", **metadata)
+    )
+
+
+def _row(db, file_id: str) -> FileSummary:
+    db.expire_all()
+    return db.query(FileSummary).filter(FileSummary.file_id == file_id).one()
+
+
+def test_changes_during_generation_discard_the_stale_summary(session_factory):
+    db = session_factory()
+    _create_file(db, "a", application="パン")
+    service = FileSummaryService(db)
+    assert _row(db, "a").status == "pending"
+
+    summary_id, file_id, revision = service.claim_next()
+    assert file_id == "a" and _row(db, "a").status == "running"
+    assert service.claim_next() is None
+
+    # 生成中にメタデータが更新された場合、古い内容の要約は保存しない
+    FileService(db).update_metadata("a", FileMetadataUpdate(customer="A社"))
+    assert service.finish(summary_id, revision, "古い要約", "gpt-4") is False
+    assert service.get_summaries(["a"]) == {}
+
+    summary_id, _, revision = service.claim_next()
+    assert service.finish(summary_id, revision, "【主な結果】\n- 合格", "gpt-4") is True
+    assert service.get_summaries(["a", "b"]) == {"a": "【主な結果】\n- 合格"}
+
+    # 再抽出でも作り直しになる
+    upsert_extraction(db, "a", {"meta": {"outcome": "不合格"}, "log": [], "formulation": {}})
+    assert _row(db, "a").status == "pending"
+    assert service.get_summaries(["a"]) == {}
+
+    FileService(db).delete("a")
+    assert db.query(FileSummary).count() == 0
+    db.close()
+
+
+def test_failures_are_retried_with_backoff_then_marked_failed(session_factory, monkeypatch):
+    from app.services import file_summary_service
+
+    monkeypatch.setattr(file_summary_service.settings, "file_summary_max_attempts", 2)
+    db = session_factory()
+    _create_file(db, "a")
+    service = FileSummaryService(db)
+
+    summary_id, _, revision = service.claim_next()
+    service.finish(summary_id, revision, error="file content is not available yet")
+    row = _row(db, "a")
+    assert row.status == "pending" and row.next_attempt_at is not None
+    # 再試行の時刻までは取得しない
+    assert service.claim_next() is None
+
+    row.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+    summary_id, _, revision = service.claim_next()
+    service.finish(summary_id, revision, error="quota")
+    assert _row(db, "a").status == "failed"
+
+    # enqueue_missing は失敗した要約を登録し直す
+    assert service.enqueue_missing() == 1
+    assert _row(db, "a").status == "pending"
+    db.close()
+
+
+def test_summary_source_uses_full_extraction_and_metadata(session_factory):
+    db = session_factory()
+    _create_file(db, "a", application="パン", customer="A社")
+    logs = [{"variant_id": f"No.{i}", "judgement": "NG", "failure_symptoms": f"症状{i}"} for i in range(1, 6)]
+    upsert_extraction(db, "a", {"meta": {"selected_variant": "No.5"}, "log": logs, "formulation": {}})
+    _create_file(db, "b")
+
+    doc = build_summary_source(db, "a", None)
+    assert "用途: パン" in doc["content"] and "顧客: A社" in doc["content"]
+    # AI分析用のコンテキスト（LOG 3行）と違い、すべての LOG 行を要約の元にする
+    assert "症状5" in doc["content"]
+
+    assert build_summary_source(db, "b", lambda ids: {"b": "本文です"})["content"].endswith("本文です")
+    assert build_summary_source(db, "b", lambda ids: {})["content"] == ""
+    # ワーカーは本文を取得した時にパッセージ索引も作る
+    assert db.query(FileChunk).filter(FileChunk.file_id == "b").count() == 0
+    build_summary_source(db, "b", lambda ids: {"b": "本文です"}, index_passages=True)
+    assert [c.text for c in db.query(FileChunk).filter(FileChunk.file_id == "b")] == ["本文です"]
+    assert build_summary_source(db, "missing", None) is None
+    db.close()
+
+
+def test_runner_generates_summaries_in_background(session_factory):
+    db = session_factory()
+    for fid in ("a", "b", "c"):
+        _create_file(db, fid)
+
+    async def summarize(_db, file_id):
+        await asyncio.sleep(0.01)
+        if file_id == "c":
+            raise RuntimeError("quota")
+        return {"summary": f"{file_id} の要約", "model": "fake"}
+
+    async def scenario():
+        runner = FileSummaryRunner(workers=2, summarize=summarize, session_factory=session_factory)
+        runner.start()
+        runner.notify()
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            db.expire_all()
+            settled = db.query(FileSummary).filter(
+                (FileSummary.status == "ready") | FileSummary.next_attempt_at.is_not(None)
+            )
+            if settled.count() == 3:
+                break
+        await runner.stop()
+
+    asyncio.run(scenario())
+    assert FileSummaryService(db).get_summaries(["a", "b", "c"]) == {"a": "a の要約", "b": "b の要約"}
+    row = _row(db, "c")
+    assert row.status == "pending" and row.error == "quota"
+    db.close()
+
+
+def test_metadata_update_from_a_route_thread_wakes_the_runner(session_factory):
+    db = session_factory()
+
+    async def summarize(_db, file_id):
+        return {"summary": f"{file_id} の要約", "model": "fake"}
+
+    def update_file_metadata():
+        # sync のルートと同様にスレッドプールで更新して起こす
+        _create_file(db, "a", application="パン")
+        runner.notify()
+
+    async def scenario():
+        runner.poll_seconds = 30
+        runner.start()
+        await asyncio.sleep(0.05)  # ワーカーが待機に入る
+        await asyncio.to_thread(update_file_metadata)
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            db.expire_all()
+            if _row(db, "a").status == "ready":
+                break
+        await runner.stop()
+
+    runner = FileSummaryRunner(workers=1, summarize=summarize, session_factory=session_factory)
+    asyncio.run(scenario(), debug=True)
+    assert _row(db, "a").status == "ready"
+    db.close()
+
+
+class FakeSearch:
+    def __init__(self):
+        self.content_requests: list[list[str]] = []
+
+    def search_for_rag(self, **kwargs):
+        return [{"id": fid, "original_name": f"{fid}.pdf"} for fid in ("a", "b")]
+
+    def get_contents(self, file_ids):
+        self.content_requests.append(list(file_ids))
+        return {fid: f"{fid} の本文" for fid in file_ids}
+
+
+def test_analysis_prefers_ready_summaries(session_factory):
+    db = session_factory()
+    for fid in ("a", "b"):
+        _create_file(db, fid)
+    service = FileSummaryService(db)
+    summary_id, _, revision = service.claim_next()
+    service.finish(summary_id, revision, "a の要約", "fake")
+
+    search = FakeSearch()
+    docs, info = asyncio.run(build_docs_for_llm(AIAnalysisRequest(question="失敗の原因は？", top=2), db, search))
+    contents = {d["file_id"]: d["content"] for d in docs}
+    assert contents["a"] == "a の要約" and contents["b"].endswith("b の本文")
+    assert info["mode"] == "mixed" and info["summary_count"] == 1 and info["content_count"] == 1
+    # 要約があるファイルの本文は取得しない
+    assert search.content_requests == [["b"]]
+
+    docs, info = asyncio.run(
+        build_docs_for_llm(AIAnalysisRequest(question="失敗の原因は？", top=2, use_summaries=False), db, search)
+    )
+    assert all(d["content"].endswith(f"{d['file_id']} の本文") for d in docs)
+    assert info["mode"] == "content"
+    db.close()
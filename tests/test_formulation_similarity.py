@@ -0,0 +1,90 @@
+import pytest
+
+from app.db.models.file import File
+from app.db.models.file_extraction import FileExtraction
+from app.services.extraction_service import ExtractionCache, upsert_extraction
+from app.services.formulation_similarity_service import (
+    FormulationIndex,
+    get_formulation_index,
+    vectorize_formulation,
+)
+
+
+def _formulation(variants: dict[str, dict[str, float | None]]) -> dict:
+    ingredients = sorted({ing for v in variants.values() for ing in v})
+    return {
+        "variants": list(variants),
+        "rows": [
+            {
+                "row_no": i,
+                "ingredient": ing,
+                "variants": {vid: {"pct": v.get(ing), "g": None} for vid, v in variants.items()},
+            }
+            for i, ing in enumerate(ingredients, 1)
+        ],
+    }
+
+
+def test_vectorize_formulation_skips_empty_cells_and_normalizes_names():
+    form = _formulation({"No.1": {"砂糖": 10, "ＡＢＣ粉": "5.5%"}, "No.2": {"砂糖": None}})
+    vectors = vectorize_formulation(form)
+    assert vectors == {"No.1": {"砂糖": 10.0, "abc粉": 5.5}}
+
+
+def test_index_query_ranks_by_cosine_and_supports_incremental_updates():
+    index = FormulationIndex()
+    index.bulk_load([])
+    index.add_file("a", {"formulation": _formulation({"No.1": {"砂糖": 10, "小麦粉": 50}})})
+    index.add_file("b", {"formulation": _formulation({"No.1": {"塩": 3, "小麦粉": 10}})})
+    index.add_file("c", {"formulation": _formulation({"No.1": {"油": 20}})})
+
+    matches = index.query({"砂糖": 11, "小麦粉": 49}, top_k=5)
+    assert [m["file_id"] for m in matches] == ["a", "b"]
+    assert matches[0]["score"] > 0.99
+
+    index.remove_file("a")
+    matches = index.query({"砂糖": 11, "小麦粉": 49}, top_k=5, exclude_file_id="b")
+    assert matches == []
+
+
+def _add_file(db, file_id: str, owner_id: int, variants: dict) -> None:
+    db.add(File(id=file_id, blob_path=f"files/{file_id}.xlsx", original_name=f"{file_id}.xlsx", owner_id=owner_id))
+    db.commit()
+    upsert_extraction(db, file_id, {"formulation": _formulation(variants)})
+    db.commit()
+
+
+def test_index_picks_up_changes_made_by_other_workers(db):
+    _add_file(db, "a", 1, {"No.1": {"砂糖": 10, "小麦粉": 50}})
+    index = FormulationIndex()
+    index.ensure_loaded(db)
+    assert [m["file_id"] for m in index.query({"砂糖": 10, "小麦粉": 50})] == ["a"]
+
+    # 別のワーカーでの追加・削除（このプロセスの add_file / remove_file は呼ばれない）
+    _add_file(db, "b", 1, {"No.1": {"砂糖": 11, "小麦粉": 49}})
+    index.ensure_loaded(db)
+    assert {m["file_id"] for m in index.query({"砂糖": 10, "小麦粉": 50})} == {"a", "b"}
+
+    db.query(FileExtraction).filter(FileExtraction.file_id == "a").delete()
+    db.commit()
+    index.ensure_loaded(db)
+    assert [m["file_id"] for m in index.query({"砂糖": 10, "小麦粉": 50})] == ["b"]
+
+
+@pytest.fixture()
+def similar_client(client, db, user):
+    get_formulation_index.cache_clear()
+    _add_file(db, "mine", user.id, {"No.1": {"砂糖": 10, "小麦粉": 50}})
+    _add_file(db, "mine2", user.id, {"No.1": {"砂糖": 12, "小麦粉": 48}})
+    _add_file(db, "others", 2, {"No.1": {"砂糖": 10, "小麦粉": 50}})
+    yield client
+    get_formulation_index.cache_clear()
+    ExtractionCache.clear()
+
+
+def test_similar_formulations_are_limited_to_the_callers_files(similar_client):
+    response = similar_client.get("/api/v1/files/mine/similar-formulations")
+    assert response.status_code == 200
+    assert [(m["file_id"], m["original_name"]) for m in response.json()["matches"]] == [("mine2", "mine2.xlsx")]
+
+    assert similar_client.get("/api/v1/files/others/similar-formulations").status_code == 403
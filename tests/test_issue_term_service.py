@@ -0,0 +1,54 @@
+from app.db.models.issue_term import FileIssueTerms
+from app.schemas.file import FileCreate, FileMetadataUpdate
+from app.services.dashboard_service import DashboardService
+from app.services.file_service import FileService
+from app.services.issue_term_service import IssueTermService, issue_terms
+
+
+def _create_file(db, file_id: str, issue: str | None) -> None:
+    FileService(db).create(
+        FileCreate(id=file_id, blob_path=f"files/{file_id}.pdf", original_name=f"{file_id}.pdf", issue=issue)
+    )
+
+
+def test_counts_follow_create_update_and_delete(db):
+    service = IssueTermService(db)
+    _create_file(db, "a", "生地の離水と生地のひび割れ")
+    _create_file(db, "b", "生地の離水")
+    _create_file(db, "c", None)
+    assert service.top_terms() == {"生地": 3, "離水": 2, "ひび割れ": 1}
+
+    FileService(db).update_metadata("b", FileMetadataUpdate(issue="風味の劣化"))
+    assert service.top_terms() == {"生地": 2, "ひび割れ": 1, "劣化": 1, "離水": 1, "風味": 1}
+
+    # 無効にしたファイルは集計から外し、有効に戻すと加える
+    FileService(db).update_metadata("a", FileMetadataUpdate(status="archived"))
+    assert service.top_terms() == {"劣化": 1, "風味": 1}
+    FileService(db).update_metadata("a", FileMetadataUpdate(status="active"))
+    assert service.top_terms()["生地"] == 2
+
+    FileService(db).delete("a")
+    FileService(db).delete("c")
+    assert service.top_terms() == {"劣化": 1, "風味": 1}
+    assert db.query(FileIssueTerms).count() == 1
+    assert service.top_terms(limit=1) == {"劣化": 1}
+
+
+def test_rebuild_matches_incremental_counts_and_dashboard_uses_them(db):
+    issues = ["生地が硬くなる", "焼成後にひび割れが発生する", "生地のひび割れ", None, "保存中に風味が劣化する"]
+    for i, issue in enumerate(issues):
+        _create_file(db, f"f{i}", issue)
+    FileService(db).update_metadata("f2", FileMetadataUpdate(issue="生地の離水"))
+    service = IssueTermService(db)
+    incremental = service.top_terms()
+
+    assert service.rebuild(batch_size=2) == 4
+    assert service.top_terms() == incremental
+    assert incremental["生地"] == 2 and incremental["離水"] == 1 and incremental["ひび割れ"] == 1
+    assert DashboardService(db)._generate_word_cloud() == incremental
+
+
+def test_issue_terms_keeps_nouns_only():
+    # 名詞のみ（数字・1文字の語・ストップワードは除く）
+    assert issue_terms("生地が硬くなる、2024年の試作") == ["生地", "試作"]
+    assert issue_terms(None) == []
@@ -0,0 +1,229 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.metrics import metrics
+from app.services.llm_providers import Completion, GeminiProvider, LLMProvider
+from app.services.llm_service import LLMBusyError, LLMService, PriorityLimiter, background_priority
+
+
+def test_slot_queues_requests_beyond_concurrency_and_times_out():
+    async def scenario():
+        service = LLMService()
+        service._limiter = PriorityLimiter(1)
+        service.queue_timeout = 0.05
+
+        order: list[str] = []
+
+        async def job(name: str, hold: float) -> None:
+            async with service._slot():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        # 2件目は1件目の完了を待ってから実行される
+        await asyncio.gather(job("a", 0.01), job("b", 0))
+        assert order == ["a", "b"]
+
+        # 実行枠が空かないまま queue_timeout を超えると LLMBusyError
+        holder = asyncio.create_task(job("c", 0.2))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMBusyError):
+            await job("d", 0)
+        await holder
+        assert service.stats() == {"in_flight": 0, "waiting": 0, "waiting_background": 0}
+
+    asyncio.run(scenario())
+
+
+def test_slot_prefers_interactive_requests_over_background_jobs():
+    async def scenario():
+        service = LLMService()
+        service._limiter = PriorityLimiter(1)
+        service.queue_timeout = 1.0
+        order: list[str] = []
+
+        async def job(name: str, background: bool = False) -> None:
+            if background:
+                with background_priority():
+                    async with service._slot():
+                        order.append(name)
+                        await asyncio.sleep(0.01)
+            else:
+                async with service._slot():
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+
+        holder = asyncio.create_task(job("first"))
+        await asyncio.sleep(0)
+        batch = [asyncio.create_task(job(f"bg{i}", background=True)) for i in range(2)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(job("user"))
+        await asyncio.gather(holder, interactive, *batch)
+
+        # 後から来た対話的なリクエストが待機中のジョブより先に実行される
+        assert order == ["first", "user", "bg0", "bg1"]
+        assert service._limiter.in_use == 0
+
+    asyncio.run(scenario())
+
+
+class FakeProvider(LLMProvider):
+    def __init__(self, name: str, delay: float, fail: bool = False, part_delay: float = 0) -> None:
+        self.name = name
+        self.delay = delay
+        self.part_delay = part_delay
+        self.fail = fail
+        self.cancelled = False
+        self.closed_streams = 0
+
+    async def complete(self, system_prompt, user_message, max_tokens, temperature):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        return Completion(text=f"answer from {self.name}", prompt_tokens=10, completion_tokens=5)
+
+    async def stream(self, system_prompt, user_message, max_tokens, temperature, usage=None):
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError(f"{self.name} failed")
+            for part in ("a", "b", "c"):
+                yield f"{self.name}:{part} "
+                await asyncio.sleep(self.part_delay)
+            if usage is not None:
+                usage.prompt_tokens, usage.completion_tokens = 10, 3
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            self.closed_streams += 1
+
+
+def _hedged_service(primary: FakeProvider, secondary: FakeProvider | None, hedge_delay: float = 0.05) -> LLMService:
+    service = LLMService()
+    service.primary = primary
+    service.secondary = secondary
+    service.enabled = True
+    service.hedge_delay = hedge_delay
+    return service
+
+
+DOCS = [{"file_id": "1", "original_name": "a.pdf", "content": "本文"}]
+
+
+def test_generate_response_hedges_slow_primary_to_secondary():
+    async def scenario():
+        primary = FakeProvider("primary", delay=1.0)
+        service = _hedged_service(primary, FakeProvider("secondary", delay=0))
+        result = await service.generate_response("質問", DOCS)
+
+        assert result["error"] is None
+        assert result["answer"] == "secondary:a secondary:b secondary:c "
+        assert result["provider"] == "secondary"
+        assert result["usage"]["prompt_tokens"] == 10 and result["usage"]["completion_tokens"] == 3
+        # 負けた主プロバイダの呼び出しは取り消される。実行枠は1つだけ使う
+        assert primary.cancelled
+        assert service._limiter.in_use == 0
+
+    asyncio.run(scenario())
+
+
+def test_generate_response_does_not_hedge_fast_primary_and_falls_back_on_failure():
+    async def scenario():
+        secondary = FakeProvider("secondary", delay=0)
+        service = _hedged_service(FakeProvider("primary", delay=0), secondary, hedge_delay=1.0)
+        result = await service.generate_response("質問", DOCS)
+        assert result["provider"] == "primary"
+
+        # 主プロバイダが失敗した場合は遅延を待たずに副プロバイダへ送る
+        service = _hedged_service(FakeProvider("primary", delay=0, fail=True), secondary, hedge_delay=10.0)
+        result = await asyncio.wait_for(service.generate_response("質問", DOCS), timeout=1.0)
+        assert result["provider"] == "secondary"
+
+        # 両方失敗した場合はエラーを返す
+        service = _hedged_service(
+            FakeProvider("primary", delay=0, fail=True), FakeProvider("secondary", delay=0, fail=True)
+        )
+        result = await service.generate_response("質問", DOCS)
+        assert result["error"]
+
+    asyncio.run(scenario())
+
+
+def test_generate_response_hedges_on_first_token_not_on_total_time():
+    async def scenario():
+        # 最初の断片は早いが回答全体は hedge_delay より長くかかる: ヘッジしない
+        secondary = FakeProvider("secondary", delay=0)
+        service = _hedged_service(FakeProvider("primary", delay=0, part_delay=0.05), secondary, hedge_delay=0.02)
+        result = await service.generate_response("質問", DOCS)
+
+        assert result["provider"] == "primary"
+        assert result["answer"] == "primary:a primary:b primary:c "
+        assert secondary.closed_streams == 0
+
+        # 副プロバイダが無い場合は通常の（非ストリーミングの）呼び出し
+        service = _hedged_service(FakeProvider("primary", delay=0), None)
+        result = await service.generate_response("質問", DOCS)
+        assert result["answer"] == "answer from primary"
+
+    asyncio.run(scenario())
+
+
+def test_stream_response_hedges_on_first_token():
+    metrics.reset()
+
+    async def scenario():
+        primary = FakeProvider("primary", delay=1.0)
+        secondary = FakeProvider("secondary", delay=0)
+        service = _hedged_service(primary, secondary)
+        chunks = [chunk async for chunk in service.stream_response("質問", DOCS)]
+
+        assert "".join(chunks) == "secondary:a secondary:b secondary:c "
+        assert primary.cancelled
+        assert primary.closed_streams == 1 and secondary.closed_streams == 1
+        assert service._limiter.in_use == 0
+
+        # ヘッジの待ち時間（hedge_delay=0.05秒）を含めて、勝ったプロバイダの分として記録する
+        histograms = metrics.snapshot()["histograms"]
+        assert histograms["llm.stream.first_token_ms.secondary"]["count"] == 1
+        assert histograms["llm.stream.first_token_ms.secondary"]["p50"] >= 50
+        assert histograms["llm.stream.total_ms.secondary"]["count"] == 1
+        assert "llm.stream.first_token_ms.primary" not in histograms
+
+    asyncio.run(scenario())
+
+
+def test_gemini_stream_cancels_the_upstream_read_when_closed_early():
+    state = {"cancelled": False, "finished": False}
+
+    class Response:
+        async def __aiter__(self):
+            try:
+                yield SimpleNamespace(text="最初の断片", usage_metadata=None)
+                await asyncio.sleep(10)  # 上流が生成を続けている
+                yield SimpleNamespace(text="残り", usage_metadata=None)
+                state["finished"] = True
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+    class Client:
+        async def generate_content_async(self, *args, **kwargs):
+            return Response()
+
+    provider = GeminiProvider.__new__(GeminiProvider)
+    provider.client = Client()
+
+    async def scenario():
+        tokens = provider.stream("system", "user", 100, 0.0)
+        first = await tokens.__anext__()
+        await tokens.aclose()  # クライアントの切断
+        return first
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == "最初の断片"
+    assert state == {"cancelled": True, "finished": False}
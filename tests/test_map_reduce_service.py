@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.db.models.file import File
+from app.services import map_reduce_service
+from app.services.map_reduce_service import MAP_SYSTEM_PROMPT, NOT_RELEVANT, MapReduceAnalyzer
+
+
+@pytest.fixture()
+def db(db):
+    for i in range(4):
+        db.add(File(id=f"f{i}", blob_path=f"files/f{i}.xlsx", original_name=f"f{i}.xlsx"))
+    db.commit()
+    return db
+
+
+class FakeLLM:
+    def __init__(self):
+        self.maps: list[str] = []
+        self.reduces: list[list[dict]] = []
+        self.running = 0
+        self.peak = 0
+
+    async def generate_response(self, question, docs, *, system_prompt=None, max_tokens=None, history=None):
+        if system_prompt == MAP_SYSTEM_PROMPT:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            await asyncio.sleep(0.01)
+            self.running -= 1
+            self.maps.append(docs[0]["file_id"])
+            content = docs[0]["content"]
+            return {"answer": f"- {content}" if "割れ" in content else NOT_RELEVANT, "usage": {}, "error": None}
+        self.reduces.append(docs)
+        return {"answer": "統合した回答", "usage": {}, "error": None}
+
+
+def _docs(ids):
+    return [
+        {"file_id": f"f{i}", "original_name": f"f{i}.xlsx", "content": "割れが発生" if i % 2 == 0 else "問題なし"}
+        for i in ids
+    ]
+
+
+def test_map_reduce_limits_concurrency_and_reuses_cached_maps(db, monkeypatch):
+    monkeypatch.setattr(map_reduce_service.settings, "rag_map_concurrency", 2)
+    llm = FakeLLM()
+
+    result = asyncio.run(MapReduceAnalyzer(db, llm).analyze("割れの原因", _docs([0, 1, 2])))
+    assert result["answer"] == "統合した回答"
+    assert result["relevant_count"] == 2
+    assert sorted(llm.maps) == ["f0", "f1", "f2"]
+    assert llm.peak == 2
+    # 関係する記載があった文書だけを元の順で統合する
+    assert [d["file_id"] for d in llm.reduces[0]] == ["f0", "f2"]
+
+    # 対象が一部重なる場合は新しい文書だけ map する
+    llm.maps.clear()
+    result = asyncio.run(MapReduceAnalyzer(db, llm).analyze("割れの原因", _docs([1, 2, 3])))
+    assert llm.maps == ["f3"]
+    assert result["map_cache_hits"] == 2
+
+
+def test_map_reduce_skips_reduce_when_nothing_relevant(db):
+    llm = FakeLLM()
+    result = asyncio.run(MapReduceAnalyzer(db, llm).analyze("割れの原因", _docs([1, 3])))
+
+    assert result["answer"] == map_reduce_service.NO_RELEVANT_ANSWER
+    assert llm.reduces == []
+
+
+def test_closing_map_documents_early_cancels_and_awaits_pending_maps(db, monkeypatch):
+    monkeypatch.setattr(map_reduce_service.settings, "rag_map_concurrency", 1)
+    llm = FakeLLM()
+    analyzer = MapReduceAnalyzer(db, llm)
+
+    async def scenario():
+        maps = analyzer.map_documents("割れの原因", _docs([0, 1, 2, 3]))
+        await maps.__anext__()
+        await maps.aclose()
+        # 取り消した map は aclose() の時点で終わっている（"Task was destroyed but it is pending" にならない）
+        others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        assert others == []
+
+    asyncio.run(scenario())
+    assert llm.maps == ["f0"]
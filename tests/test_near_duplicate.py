@@ -0,0 +1,27 @@
+import numpy as np
+
+from app.services.near_duplicate import MinHasher, collapse_near_duplicates
+
+
+def test_minhash_estimates_jaccard():
+    hasher = MinHasher(num_perm=128)
+    a = "- No.1 砂糖増量: 判定=NG, 結果=生地が硬い, 失敗=ひび割れ, 仮説=水分不足"
+    sigs = hasher.signatures([a, a + "。", "まったく関係のない別の文章がここに入ります"])
+    assert np.mean(sigs[0] == sigs[1]) > 0.8
+    assert np.mean(sigs[0] == sigs[2]) < 0.2
+
+
+def test_collapse_near_duplicates_merges_citations_and_drops_fully_duplicated_docs():
+    row = "- No.1 砂糖増量: 判定=NG, 結果=生地が硬い, 失敗=ひび割れ, 仮説=水分不足で焼成時に収縮"
+    other = "- No.2 水分追加: 判定=OK, 結果=しっとり, 失敗=なし, 仮説=保水性が改善した"
+    docs = [
+        {"file_id": "a", "original_name": "A.xlsx", "content": f"【LOG】\n{row}"},
+        {"file_id": "b", "original_name": "B_rev2.xlsx", "content": f"【LOG】\n{row.replace('収縮', '収縮。')}"},
+        {"file_id": "c", "original_name": "C.xlsx", "content": f"【LOG】\n{row}\n{other}"},
+    ]
+    collapsed, removed = collapse_near_duplicates(docs, threshold=0.8)
+
+    assert removed == 2
+    assert [d["file_id"] for d in collapsed] == ["a", "c"]
+    assert collapsed[0]["citations"] == ["B_rev2.xlsx", "C.xlsx"]
+    assert collapsed[1]["content"] == f"【LOG】\n{other}"
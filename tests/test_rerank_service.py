@@ -0,0 +1,57 @@
+import pytest
+
+from app.db.models.file import File
+from app.services.bm25 import bm25_scores, tokenize
+from app.services.chunking_service import ChunkService
+from app.services.rerank_service import rerank_candidates
+
+
+@pytest.fixture()
+def db(db):
+    for fid in ("a", "b", "c"):
+        db.add(File(id=fid, blob_path=f"files/{fid}.pdf", original_name=f"{fid}.pdf"))
+    db.commit()
+    return db
+
+
+def test_tokenize_normalizes_and_keeps_content_words():
+    terms = tokenize("生地のひび割れが発生した。ＰＨを測定する")
+
+    assert "ひび割れ" in terms
+    assert "発生" in terms
+    assert "ph" in terms
+    assert "する" not in terms
+
+
+def test_bm25_prefers_rare_terms_and_shorter_docs():
+    docs = [["生地", "水分"], ["生地", "ひび割れ"], ["生地", "ひび割れ"] + ["概要"] * 20]
+    scores = bm25_scores(["生地", "ひび割れ"], docs)
+
+    assert scores[1] > scores[2] > scores[0]
+    assert bm25_scores([], docs) == [0.0, 0.0, 0.0]
+
+
+def test_rerank_uses_stored_passages_and_fetches_only_chosen_contents(db):
+    contents = {
+        "a": "配合と焼成条件の記録。",
+        "b": "ひび割れの原因は生地の水分不足と考えられる。",
+    }
+    ChunkService(db).ensure_chunks(contents)
+    db.commit()
+    candidates = [
+        {"id": "a", "original_name": "a.pdf"},
+        {"id": "b", "original_name": "b.pdf"},
+        {"id": "c", "original_name": "ひび割れ対策.pdf"},
+    ]
+    fetched = []
+
+    def fetch(ids):
+        fetched.append(list(ids))
+        return {fid: contents.get(fid, "") for fid in ids}
+
+    chosen = rerank_candidates(db, "ひび割れの原因", candidates, 2, fetch)
+
+    assert [d["id"] for d in chosen] == ["b", "c"]
+    assert chosen[0]["score"] > 0
+    assert chosen[0]["content"] == contents["b"]
+    assert fetched == [["b", "c"]]
@@ -0,0 +1,150 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from app.core.metrics import metrics
+from app.db.models.cache_snapshot import CacheSnapshot
+from app.services.snapshot_cache import SnapshotCache
+
+
+class Counter:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def __call__(self, db):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("db is down")
+        return {"version": n}
+
+
+def _cache(session_factory, compute, ttl=60.0, key="dashboard"):
+    return SnapshotCache(
+        key, compute, ttl_seconds=ttl, max_stale_seconds=3600, lease_seconds=30, session_factory=session_factory
+    )
+
+
+def _wait_until(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_concurrent_misses_compute_once(session_factory):
+    metrics.reset()
+    compute = Counter(delay=0.1)
+    cache = _cache(session_factory, compute)
+    results = []
+
+    def request():
+        db = session_factory()
+        try:
+            results.append(cache.get(db))
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert compute.calls == 1
+    assert results == [{"version": 1}] * 8
+    assert metrics.counter("snapshot_cache.dashboard.miss") == 8
+    assert metrics.counter("snapshot_cache.dashboard.coalesced") == 7
+
+
+def test_stale_value_is_served_while_one_background_refresh_runs(session_factory):
+    metrics.reset()
+    compute = Counter(delay=0.2)
+    cache = _cache(session_factory, compute, ttl=0.05)
+    db = session_factory()
+    assert cache.get(db) == {"version": 1}
+    time.sleep(0.1)
+
+    started = time.perf_counter()
+    served = [cache.get(db) for _ in range(5)]
+    assert time.perf_counter() - started < 0.15
+    assert served == [{"version": 1}] * 5
+    assert metrics.counter("snapshot_cache.dashboard.stale") == 5
+
+    assert _wait_until(lambda: not cache.stats()["refreshing"] and compute.calls == 2)
+    assert cache.get(db) == {"version": 2}
+    assert compute.calls == 2
+    db.close()
+
+
+def test_workers_share_snapshots_and_refresh_lease(session_factory):
+    metrics.reset()
+    db = session_factory()
+    first_compute, second_compute = Counter(), Counter()
+    worker_a = _cache(session_factory, first_compute)
+    worker_b = _cache(session_factory, second_compute)
+    assert worker_a.get(db) == {"version": 1}
+    # 他のワーカーは計算せずに保存済みのスナップショットを使う
+    assert worker_b.get(db) == {"version": 1}
+    assert second_compute.calls == 0
+    assert metrics.counter("snapshot_cache.dashboard.adopted") == 1
+
+    # 別のワーカーが再計算中（リース中）なら計算しない
+    row = db.get(CacheSnapshot, "dashboard")
+    row.refreshing_until = datetime.now(timezone.utc) + timedelta(seconds=30)
+    row.computed_at = datetime.now(timezone.utc) - timedelta(seconds=120)
+    db.commit()
+    worker_c = _cache(session_factory, Counter(), ttl=60)
+    assert worker_c.refresh(min_age=60) is False
+    assert metrics.counter("snapshot_cache.dashboard.lease_busy") == 1
+    db.close()
+
+
+def test_failed_background_refresh_keeps_stale_value(session_factory):
+    compute = Counter()
+    cache = _cache(session_factory, compute, ttl=0.05)
+    db = session_factory()
+    cache.get(db)
+    compute.fail = True
+    time.sleep(0.1)
+    assert cache.get(db) == {"version": 1}
+    assert _wait_until(lambda: cache.stats()["last_error"] == "db is down")
+    assert cache.get(db) == {"version": 1}
+
+    # 失敗したのでリースは返されている（上の get() が始めた再計算の失敗も待つ）
+    def lease_released():
+        db.expire_all()
+        return cache._refreshing is None and db.get(CacheSnapshot, "dashboard").refreshing_until is None
+
+    assert _wait_until(lease_released)
+    db.close()
+
+
+def test_stale_checks_read_the_snapshot_payload_only_when_newer(session_factory):
+    db = session_factory()
+    worker_a = _cache(session_factory, Counter())
+    worker_b = _cache(session_factory, Counter(), ttl=0)
+    worker_a.get(db)
+    worker_b.refresh(db, min_age=3600)  # 保存済みのスナップショットを取り込む
+
+    statements: list[str] = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert worker_b._adopt_shared(db) is False
+    # 同じ版なら computed_at だけを読み、data は転送しない
+    assert len(statements) == 1 and "data" not in statements[0].split("FROM")[0]
+
+    row = db.get(CacheSnapshot, "dashboard")
+    row.data, row.computed_at = '{"version": 9}', datetime.now(timezone.utc) + timedelta(seconds=1)
+    db.commit()
+    statements.clear()
+    assert worker_b._adopt_shared(db) is True
+    assert worker_b._current()[0] == {"version": 9}
+    db.close()
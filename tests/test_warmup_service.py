@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+from app.core.metrics import metrics
+from app.services import bm25
+from app.services.warmup_service import warm_up
+
+
+def test_tokenizer_is_shared_across_threads(monkeypatch):
+    monkeypatch.setattr(bm25, "_tokenizer", None)
+    seen = []
+
+    def worker():
+        seen.append(bm25.get_tokenizer())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(t) for t in seen}) == 1
+    assert bm25.get_tokenizer() is seen[0]
+
+
+def test_warm_up_runs_components_concurrently_and_tolerates_failures():
+    metrics.reset()
+    calls = []
+
+    async def ok():
+        await asyncio.sleep(0.05)
+        calls.append("ok")
+
+    async def broken():
+        raise RuntimeError("search is down")
+
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def scenario():
+        return await warm_up({"tokenizer": ok, "search": broken, "llm": slow}, timeout=0.2)
+
+    results = asyncio.run(scenario())
+    assert results == {"tokenizer": "ok", "search": "failed", "llm": "timeout"}
+    assert calls == ["ok"]
+    histograms = metrics.snapshot()["histograms"]
+    assert "startup.warmup_ms.tokenizer" in histograms and "startup.warmup_ms.search" in histograms
+    assert histograms["startup.warmup_ms.total"]["max"] < 1000
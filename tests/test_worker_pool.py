@@ -0,0 +1,54 @@
+import asyncio
+
+from app.services.worker_pool import PollingWorkerPool
+
+
+class ListPool(PollingWorkerPool):
+    name = "test-worker"
+
+    def __init__(self, items):
+        super().__init__(workers=1, poll_seconds=0.01, session_factory=lambda: None)
+        self.items = list(items)
+        self.done: list[str] = []
+
+    def claim(self):
+        return self.items.pop(0) if self.items else None
+
+    async def run_item(self, claimed):
+        if claimed == "bad":
+            raise RuntimeError("boom")
+        self.done.append(claimed)
+
+
+def test_worker_keeps_running_after_an_item_fails():
+    async def scenario():
+        pool = ListPool(["a", "bad", "b"])
+        pool.start()
+        for _ in range(100):
+            if pool.done == ["a", "b"]:
+                break
+            await asyncio.sleep(0.01)
+        assert all(not task.done() for task in pool._tasks)
+        await pool.stop()
+        return pool.done
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+
+
+def test_notify_from_another_thread_wakes_a_waiting_worker():
+    async def scenario():
+        pool = ListPool([])
+        pool.poll_seconds = 30
+        pool.start()
+        await asyncio.sleep(0.05)  # ワーカーが claim して待機に入る
+        pool.items.append("a")
+        # sync のルートと同様にスレッドプールから起こす
+        await asyncio.to_thread(pool.notify)
+        for _ in range(100):
+            if pool.done:
+                break
+            await asyncio.sleep(0.01)
+        await pool.stop()
+        return pool.done
+
+    assert asyncio.run(scenario(), debug=True) == ["a"]